@@ -1,13 +1,92 @@
-from fastapi import FastAPI
+import asyncio
+import functools
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import ocr, scanner
+from fastapi.responses import PlainTextResponse
+from app.core.config import settings
+from app.prefork import memory_mb
+from app.routers import jobs, ocr, scanner
+from app.services.cascade import CascadeRouter
+from app.services.executor import InferenceExecutor
+from app.services.jobs import JobManager, SQLiteJobStore
+from app.services.metrics import (
+    BATCH_QUEUE_DEPTH, HTTP_REQUEST_SECONDS, HTTP_REQUESTS, INFERENCE_JOBS, MODELS_LOADED, REGISTRY
+)
+from app.services.model_registry import ModelRegistry
+from app.services.perceptual_index import NearDuplicateIndex
+from app.services.result_cache import ResultCache
+from app.services.sane_devices import SaneDeviceManager
+from app.services.uploads import UploadGuardMiddleware
+
+# The services log through module loggers; uvicorn only configures its own
+logging.basicConfig(level=logging.INFO)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Models are loaded once per process and shared by all requests;
+    # their blocking inference runs on a bounded worker pool. Pre-fork
+    # workers get the registry their parent already loaded
+    registry = getattr(app.state, "model_registry", None)
+    if registry is None:
+        registry = ModelRegistry(executor=InferenceExecutor.from_settings())
+        app.state.model_registry = registry
+    executor = registry.executor
+    cascade = CascadeRouter(registry)
+    app.state.cascade_router = cascade
+    if settings.RESULT_CACHE_ENABLED:
+        near_duplicates = None
+        if settings.NEAR_DUPLICATE_ENABLED:
+            near_duplicates = NearDuplicateIndex(hash_method=settings.NEAR_DUPLICATE_HASH)
+            app.state.near_duplicate_index = near_duplicates
+        # Evicted and expired results are dropped from the near-duplicate index
+        app.state.result_cache = ResultCache.from_settings(
+            on_remove=near_duplicates.discard if near_duplicates is not None else None
+        )
+    job_manager = None
+    if settings.JOBS_ENABLED:
+        job_manager = JobManager(
+            SQLiteJobStore(settings.JOB_DB_PATH),
+            functools.partial(jobs.process_job_task, registry, cascade),
+            workers=settings.JOB_WORKERS,
+            max_attempts=settings.JOB_MAX_ATTEMPTS,
+            retry_backoff=settings.JOB_RETRY_BACKOFF
+        )
+        # With pre-fork workers only the first one runs queued tasks
+        await job_manager.start(process_tasks=getattr(app.state, "worker_id", 0) == 0)
+        app.state.job_manager = job_manager
+    # One SANE session for the process; the device list is enumerated in the background
+    sane_devices = SaneDeviceManager.from_settings()
+    await sane_devices.start()
+    app.state.sane_devices = sane_devices
+    if settings.WARMUP_MODELS:
+        print(f"Warming up models: {settings.WARMUP_MODELS}")
+        await registry.warm_up(settings.WARMUP_MODELS, use_gpu=settings.USE_GPU)
+    yield
+    await sane_devices.close()
+    if job_manager is not None:
+        await job_manager.stop()
+    await registry.unload_all()
+    executor.shutdown()
+    if settings.RESULT_CACHE_ENABLED:
+        app.state.result_cache.close()
+
 
 app = FastAPI(
     title="OCR API with Phi-3 and Qwen2.5",
     description="OCR system that integrates Microsoft Phi-3 and Qwen2.5 models for enhanced text extraction",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Reject oversized or non-image uploads while they are still being received
+app.add_middleware(UploadGuardMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -17,6 +96,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# OCR job API
+app.include_router(
+    jobs.router,
+    prefix="/api/v1/ocr",
+    tags=["OCR Jobs API v1"]
+)
+
 # Scanner API
 app.include_router(
     scanner.router,
@@ -32,6 +118,77 @@ app.include_router(
 )
 
 
+@app.middleware("http")
+async def count_requests(request: Request, call_next):
+    app.state.requests_served = getattr(app.state, "requests_served", 0) + 1
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Route templates, not raw paths, keep the label values bounded
+    route = request.scope.get("route")
+    path = getattr(route, "path", "unmatched")
+    HTTP_REQUESTS.labels(method=request.method, path=path, status=str(response.status_code)).inc()
+    HTTP_REQUEST_SECONDS.labels(method=request.method, path=path).observe(time.perf_counter() - start)
+    worker_id = getattr(app.state, "worker_id", None)
+    if worker_id is not None:
+        response.headers["X-Worker"] = str(worker_id)
+    return response
+
+
+# /health reports the memory read at most a second earlier by a worker thread:
+# reading smaps_rollup walks every mapping of the process, which takes
+# milliseconds with model weights mapped and more while they are in use
+_memory: Dict[str, Any] = {"value": None, "read_at": 0.0, "reading": False}
+
+
+def _read_memory():
+    try:
+        _memory["value"] = memory_mb()
+    finally:
+        _memory["read_at"] = time.monotonic()
+        _memory["reading"] = False
+
+
+async def _process_memory() -> Dict[str, float]:
+    if _memory["value"] is None:
+        await asyncio.to_thread(_read_memory)
+    elif not _memory["reading"] and time.monotonic() - _memory["read_at"] > 1.0:
+        _memory["reading"] = True
+        asyncio.get_running_loop().run_in_executor(None, _read_memory)
+    return _memory["value"]
+
+
+@app.get("/health")
+async def health():
+    """Liveness of this process, with its memory and the models it holds"""
+    registry = getattr(app.state, "model_registry", None)
+    return {
+        "status": "ok",
+        "worker": getattr(app.state, "worker_id", None),
+        "pid": os.getpid(),
+        "requests_served": getattr(app.state, "requests_served", 0),
+        "memory": await _process_memory(),
+        "models": registry.loaded() if registry is not None else [],
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Stage latencies, token rates, queue waits and model loads of this process, in Prometheus text format"""
+    registry = getattr(app.state, "model_registry", None)
+    if registry is not None:
+        executor = registry.executor.stats()
+        for state in ("running", "queued"):
+            INFERENCE_JOBS.labels(state=state).set(executor[state])
+        MODELS_LOADED.clear()
+        BATCH_QUEUE_DEPTH.clear()
+        for entry, service in zip(registry.loaded(), registry.services()):
+            MODELS_LOADED.labels(model=entry["name"], device=entry["device"], dtype=entry["dtype"]).set(1)
+            batcher = getattr(service, "batcher", None)
+            if batcher is not None:
+                BATCH_QUEUE_DEPTH.labels(queue=batcher.name).set(batcher.queue_depth)
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/")
 async def root():
     return {
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 import os
 
 class Settings(BaseModel):
@@ -15,13 +15,197 @@ class Settings(BaseModel):
     # AI Models settings
     PHI3_MODEL_NAME: str = "microsoft/phi-3-vision-128k-instruct"
     QWEN25_MODEL_NAME: str = "Qwen/Qwen2.5-7B-Instruct"
+    # Models loaded at startup so the first request does not pay for from_pretrained
+    WARMUP_MODELS: List[str] = []
+    # Seconds an unload or reload waits for the requests using the model to
+    # finish; past that it is refused with 409 and the model stays loaded
+    MODEL_UNLOAD_TIMEOUT: float = 30.0
+    # Precision of the weights on CPU: "fp32", "bf16", "int8" (dynamic
+    # quantization of the linear layers) or "int4" (weight-only, needs torchao;
+    # int8 is used without it). GPU instances always load in float16
+    PHI3_CPU_PRECISION: str = "fp32"
+    QWEN25_CPU_PRECISION: str = "fp32"
+    # Qwen2.5 corrects on CUDA whenever it is available, whatever the request's
+    # use_gpu (which picks Phi-3's device); false makes it follow use_gpu too
+    QWEN25_USE_GPU: bool = True
+    # Compiled snapshots written by compile_models.py; a model with a snapshot
+    # for its dtype loads through mmap, so worker processes share the weights'
+    # page-cache pages. Others load with from_pretrained
+    MODEL_SNAPSHOT_DIR: str = os.path.join(os.path.expanduser("~"), ".cache", "ocr-backend", "snapshots")
+    # Check run on every snapshot load: "none", "size" or "sha256" (reads every file)
+    MODEL_SNAPSHOT_VERIFY: str = "size"
+    # Measure the weight memory and decode speed of each model after loading it
+    LOAD_REPORT: bool = True
+    LOAD_REPORT_TOKENS: int = 16
+
+    # Observability: GET /metrics serves per-stage latency histograms, token
+    # rates, queue waits and model loads in the Prometheus text format. With
+    # TRACE_EXPORT_PATH set, the span tree of every /extract-text request is
+    # appended to that file as one JSON line
+    TRACE_EXPORT_PATH: Optional[str] = None
+
+    # Server processes. With more than one, main.py pre-forks them after
+    # loading WARMUP_MODELS once in the parent, so they share the weights
+    SERVER_WORKERS: int = 1
+    # First port of the per-worker sockets (default: the server port + 1)
+    SERVER_WORKER_PORT_BASE: Optional[int] = None
+    SERVER_HEALTH_INTERVAL: float = 5.0  # seconds
+    # Failed health checks in a row before a worker is replaced
+    SERVER_HEALTH_FAILURES: int = 3
+    # Seconds a new worker may take to answer its first health check
+    SERVER_STARTUP_TIMEOUT: float = 120.0
+    # torch intra-op threads of each pre-forked worker (0: the parent's
+    # thread count divided between the workers)
+    SERVER_WORKER_THREADS: int = 0
+
+    # Inference worker pool. "thread" workers share the loaded weights,
+    # "process" workers each load their own copy of the model
+    INFERENCE_EXECUTOR: str = "thread"
+    INFERENCE_WORKERS: int = 1
+    # Requests allowed to wait for a worker before new ones get a 503
+    INFERENCE_MAX_QUEUE: int = 16
+    INFERENCE_RETRY_AFTER: int = 5  # seconds
+
+    # Generation parameters. PROMPT_VERSION must be bumped whenever a prompt
+    # changes so cached results from the old prompt are not reused
+    PROMPT_VERSION: str = "1"
+    PHI3_MAX_NEW_TOKENS: int = 512
+    PHI3_TEMPERATURE: float = 0.7
+    PHI3_TOP_P: float = 0.9
+    QWEN25_MAX_NEW_TOKENS: int = 1024
+    # Adaptive generation budgets: instead of always allowing *_MAX_NEW_TOKENS,
+    # max_new_tokens is sized per request from the text the output should hold,
+    # estimated from the text lines found in the image for Phi-3 (at about
+    # PHI3_TOKENS_PER_CHAR tokens per character) and from the raw OCR text's
+    # tokens for Qwen2.5, times GENERATION_BUDGET_MARGIN plus
+    # GENERATION_BUDGET_EXTRA tokens, up to *_MAX_NEW_TOKENS_LIMIT. Dense pages
+    # may get more than *_MAX_NEW_TOKENS, short texts stop early. A Phi-3 page
+    # gets at least PHI3_MIN_NEW_TOKENS, and a page without any text line found
+    # (a photo, a blank scan) keeps PHI3_MAX_NEW_TOKENS
+    ADAPTIVE_MAX_NEW_TOKENS: bool = True
+    GENERATION_BUDGET_MARGIN: float = 1.5
+    GENERATION_BUDGET_EXTRA: int = 48
+    PHI3_TOKENS_PER_CHAR: float = 0.35
+    PHI3_MIN_NEW_TOKENS: int = 128
+    PHI3_MAX_NEW_TOKENS_LIMIT: int = 2048
+    QWEN25_MAX_NEW_TOKENS_LIMIT: int = 4096
+    # Generation stops once the last tokens repeat one span of at most
+    # REPETITION_MAX_PERIOD tokens four times or more, over at least
+    # REPETITION_MIN_TOKENS tokens; the repeats are dropped. 0 turns it off
+    REPETITION_MAX_PERIOD: int = 32
+    REPETITION_MIN_TOKENS: int = 48
+    # Keep the key/values of the fixed system prompts so only the per-request
+    # part of the prompt is prefilled
+    PROMPT_PREFIX_CACHE: bool = True
+    # Speculative decoding of the Qwen2.5 correction: "off", "prompt_lookup"
+    # (drafts copied from the raw OCR text in the prompt) or "draft_model" (a
+    # small Qwen2.5 sharing the tokenizer drafts them). Each forward pass checks
+    # up to QWEN25_SPECULATIVE_LOOKAHEAD drafted tokens; the output is the same
+    QWEN25_SPECULATIVE: str = "off"
+    QWEN25_DRAFT_MODEL_NAME: str = "Qwen/Qwen2.5-0.5B-Instruct"
+    QWEN25_SPECULATIVE_LOOKAHEAD: int = 8
+    # Longest n-gram matched against the prompt in "prompt_lookup" mode
+    QWEN25_PROMPT_LOOKUP_NGRAM: int = 3
+
+    # Layout tiling for Phi-3: the page is cut into text blocks along blank
+    # gaps of its ink projection profiles, the blocks are read in batches and
+    # their texts joined in reading order. Gaps are measured in text-line
+    # heights. Blocks are split to hold at most LAYOUT_MAX_BLOCK_CHARS
+    # (estimated from the line widths), so that at about three characters per
+    # token a block's text fits in PHI3_MAX_NEW_TOKENS
+    PHI3_LAYOUT_TILING: bool = False
+    LAYOUT_MAX_BLOCK_CHARS: int = 1200
+    LAYOUT_COLUMN_GAP: float = 1.5
+    LAYOUT_BLOCK_GAP: float = 0.9
+    # Width the page is binarized at for segmentation
+    LAYOUT_WORK_WIDTH: int = 1000
+
+    # Phi-3 micro-batching: concurrent requests share one generate call
+    PHI3_MAX_BATCH_SIZE: int = 4
+    PHI3_BATCH_MAX_WAIT_MS: float = 10.0
 
     # File upload settings
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10 MB
+    # Uploads are hashed and checked in chunks of this size instead of being read whole
+    UPLOAD_CHUNK_SIZE: int = 64 * 1024
     ALLOWED_EXTENSIONS: List[str] = ["jpg", "jpeg", "png", "bmp", "tiff", "pdf"]
 
+    # Multi-page documents
+    PDF_RENDER_DPI: int = 200
+    DOCUMENT_MAX_PAGES: int = 500
+    # Pages decoded ahead of, and in flight through, the model
+    DOCUMENT_PIPELINE_DEPTH: int = 2
+
+    # Image preprocessing before the Phi-3 processor, applied in this order.
+    # Available steps: exif_orientation, grayscale, downscale, deskew,
+    # normalize_contrast, binarize, crop_margins
+    # Off by default: the steps are measured for speed, not yet for accuracy,
+    # and can hurt clean born-digital pages. Margins are cropped before deskew
+    # turns the scanner's straight border shadows into slanted ones
+    PREPROCESS_ENABLED: bool = False
+    PREPROCESS_STEPS: List[str] = [
+        "exif_orientation", "grayscale", "downscale", "crop_margins", "deskew", "normalize_contrast"
+    ]
+    PREPROCESS_TARGET_DPI: int = 150
+    # Upper bound on the long side; Phi-3's 16-crop HD transform never keeps more than 1344 px
+    PREPROCESS_MAX_SIDE: int = 1344
+    PREPROCESS_MAX_SKEW: float = 5.0  # degrees
+
+    # Asynchronous OCR jobs, queued in a SQLite file
+    JOBS_ENABLED: bool = True
+    JOB_DB_PATH: str = os.path.join(os.path.expanduser("~"), ".cache", "ocr-backend", "jobs.db")
+    JOB_WORKERS: int = 1
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BACKOFF: float = 2.0  # seconds before the first retry, doubled per attempt
+    JOB_MAX_FILES: int = 1000
+
+    # OCR result cache: in-memory LRU plus an optional SQLite file
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # 64 MB
+    RESULT_CACHE_TTL: Optional[float] = 7 * 24 * 3600  # seconds
+    RESULT_CACHE_PATH: Optional[str] = None
+    # Rows kept in the SQLite file; the oldest are dropped past it
+    RESULT_CACHE_DISK_MAX_ROWS: int = 100_000
+    # Perceptual-hash index so rescans of a page can reuse its cached result
+    NEAR_DUPLICATE_ENABLED: bool = True
+    NEAR_DUPLICATE_HASH: str = "phash"  # "phash" or "dhash"
+    # Upper bound on the similarity_threshold (Hamming distance) callers may ask for.
+    # Up to 3 bits a lookup probes one exact bucket per 16-bit chunk: about 0.1 ms
+    # p99 over 2M pages (benchmarks.phash_index). 4 to 7 bits probe 1-bit
+    # neighbourhoods, 17 buckets per chunk, and cost about 0.3 ms p99
+    NEAR_DUPLICATE_MAX_DISTANCE: int = 3
+
+    # SANE scanners: one session for the process, with a cached device list
+    # refreshed in the background and opened devices kept for reuse
+    SANE_DEVICE_LIST_TTL: float = 60.0  # seconds
+    SANE_IDLE_TIMEOUT: float = 120.0  # seconds an unused device stays open
+    SANE_WORKERS: int = 4
+
     # OCR settings
     DEFAULT_OCR_LANGUAGES: List[str] = ["en"]
+    # The qwen25 model corrects Tesseract's text; pages Tesseract reads with at
+    # least this mean word confidence (0 to 1) skip the LLM pass
+    OCR_SKIP_LLM_CONFIDENCE: float = 0.92
+
+    # Cascade used by model "auto": each route lists its tiers from the cheapest
+    # to the most expensive, and a tier's result is kept when its confidence
+    # reaches min_confidence. "tesseract" recognizes the page, "qwen25" corrects
+    # Tesseract's text and "phi3" reads the image itself
+    CASCADE_DEFAULT_ROUTE: str = "default"
+    CASCADE_ROUTES: Dict[str, List[Dict[str, Any]]] = {
+        "default": [
+            {"model": "tesseract", "min_confidence": 0.92},
+            {"model": "qwen25", "min_confidence": 0.6},
+            {"model": "phi3", "min_confidence": 0.0},
+        ],
+        "fast": [
+            {"model": "tesseract", "min_confidence": 0.8},
+            {"model": "qwen25", "min_confidence": 0.0},
+        ],
+        "vision": [
+            {"model": "phi3", "min_confidence": 0.0},
+        ],
+    }
     USE_GPU: bool = True
 
 # Create global settings object
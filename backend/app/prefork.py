@@ -0,0 +1,220 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import time
+import urllib.request
+from typing import Any, Dict, Optional
+
+import torch
+import uvicorn
+
+from .core.config import settings
+from .services.executor import InferenceExecutor
+from .services.model_registry import ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+
+def memory_mb(pid: Any = "self") -> Dict[str, float]:
+    """RSS and PSS of a process; PSS splits shared pages between the processes mapping them"""
+    values: Dict[str, float] = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss"):
+                    values[key.lower() + "_mb"] = int(rest.split()[0]) / 1024
+    except OSError:
+        # Not Linux, or the process is gone
+        pass
+    return values
+
+
+def _listen(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+class PreforkServer:
+    """
+    Pre-fork serving: the parent loads the models once, then forks workers
+    that share the weights copy-on-write (and, for compiled snapshots, through
+    the page cache).
+
+    All workers accept connections from one listening socket, so the kernel
+    spreads requests between them. Each worker also listens on a port of its
+    own (port + 1 + worker id by default) to reach one worker directly, e.g.
+    for its ``/health``. The parent polls every worker's health and replaces
+    workers that exit or stop answering.
+    """
+
+    def __init__(
+        self,
+        app: Any,
+        host: str = "0.0.0.0",
+        port: int = 8000,
+        workers: int = 2,
+        registry: Optional[ModelRegistry] = None,
+        preload: bool = True,
+        worker_port_base: Optional[int] = None,
+        health_interval: Optional[float] = None,
+        health_failures: Optional[int] = None
+    ):
+        """
+        Args:
+            app: The FastAPI application served by every worker.
+            host (str): Address of the shared and the per-worker sockets.
+            port (int): Shared port.
+            workers (int): Number of worker processes.
+            registry (ModelRegistry): Registry handed to the workers; a new one by default.
+            preload (bool): Load settings.WARMUP_MODELS in the parent before forking.
+                Without it every worker loads its own copy, as ``uvicorn --workers`` would.
+            worker_port_base (int): First per-worker port; defaults to port + 1.
+            health_interval (float): Seconds between health checks of each worker.
+            health_failures (int): Failed checks in a row before a worker is replaced.
+        """
+        if settings.INFERENCE_EXECUTOR == "process":
+            raise ValueError("Pre-fork serving needs INFERENCE_EXECUTOR=thread to share the loaded weights")
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = max(1, workers)
+        self.registry = registry or ModelRegistry(executor=InferenceExecutor.from_settings())
+        self.preload = preload
+        self.worker_port_base = worker_port_base or port + 1
+        self.health_interval = health_interval or settings.SERVER_HEALTH_INTERVAL
+        self.health_failures = health_failures or settings.SERVER_HEALTH_FAILURES
+        self._pids: Dict[int, int] = {}
+        self._failures: Dict[int, int] = {}
+        self._started: Dict[int, float] = {}
+        self._stopping = False
+        self.worker_threads = settings.SERVER_WORKER_THREADS or max(1, torch.get_num_threads() // self.workers)
+
+    def _preload(self):
+        if not settings.WARMUP_MODELS:
+            return
+        start = time.perf_counter()
+        # The threads of an OpenMP pool started here would be missing from the
+        # forked workers, whose next parallel op then hangs. The parent loads on
+        # one intra-op thread and skips the load report's test generation; each
+        # worker sets its own thread count in _spawn.
+        torch.set_num_threads(1)
+        load_report = settings.LOAD_REPORT
+        settings.LOAD_REPORT = False
+        try:
+            # CUDA cannot be used across fork, so the shared instances are the CPU ones
+            loaded = asyncio.run(self.registry.warm_up(settings.WARMUP_MODELS, use_gpu=False))
+        finally:
+            settings.LOAD_REPORT = load_report
+        logger.info(
+            f"Loaded {[key.model_id for key in loaded]} in the parent in {time.perf_counter() - start:.1f} s, "
+            f"RSS {memory_mb().get('rss_mb', 0.0):.0f} MB"
+        )
+
+    def _worker_port(self, worker_id: int) -> int:
+        return self.worker_port_base + worker_id
+
+    def _spawn(self, worker_id: int, shared: socket.socket):
+        pid = os.fork()
+        if pid:
+            self._pids[worker_id] = pid
+            self._failures[worker_id] = 0
+            self._started[worker_id] = time.time()
+            return
+
+        # Worker process
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        status = 0
+        try:
+            torch.set_num_threads(self.worker_threads)
+            own = _listen(self.host, self._worker_port(worker_id))
+            self.app.state.model_registry = self.registry
+            self.app.state.worker_id = worker_id
+            server = uvicorn.Server(uvicorn.Config(self.app, lifespan="on", access_log=False))
+            server.run(sockets=[shared, own])
+        except BaseException as e:
+            logger.error(f"Worker {worker_id} failed: {str(e)}")
+            status = 1
+        finally:
+            os._exit(status)
+
+    def _healthy(self, worker_id: int) -> bool:
+        host = "127.0.0.1" if self.host in ("0.0.0.0", "") else "::1" if self.host == "::" else self.host
+        url = f"http://{host}:{self._worker_port(worker_id)}/health"
+        try:
+            with urllib.request.urlopen(url, timeout=self.health_interval) as response:
+                return json.load(response).get("status") == "ok"
+        except Exception:
+            return False
+
+    def _check_workers(self, shared: socket.socket):
+        # Replace workers that exited
+        while self._pids:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            for worker_id, worker_pid in list(self._pids.items()):
+                if worker_pid == pid:
+                    del self._pids[worker_id]
+                    if not self._stopping:
+                        logger.warning(f"Worker {worker_id} (pid {pid}) exited with status {status}; restarting it")
+                        self._spawn(worker_id, shared)
+
+        # Replace workers that stopped answering, once they had time to start
+        for worker_id, pid in list(self._pids.items()):
+            if self._healthy(worker_id):
+                self._failures[worker_id] = 0
+                continue
+            if time.time() - self._started[worker_id] < settings.SERVER_STARTUP_TIMEOUT:
+                continue
+            self._failures[worker_id] += 1
+            if self._failures[worker_id] >= self.health_failures:
+                logger.warning(
+                    f"Worker {worker_id} (pid {pid}) failed {self._failures[worker_id]} health checks; killing it"
+                )
+                os.kill(pid, signal.SIGKILL)
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+
+    def run(self):
+        logging.basicConfig(level=logging.INFO)
+        shared = _listen(self.host, self.port)
+        if self.preload:
+            self._preload()
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        for worker_id in range(self.workers):
+            self._spawn(worker_id, shared)
+        logger.info(
+            f"Serving on {self.host}:{self.port} with {self.workers} workers of {self.worker_threads} threads "
+            f"(pids {list(self._pids.values())})"
+        )
+
+        while not self._stopping:
+            self._check_workers(shared)
+            time.sleep(self.health_interval)
+
+        for pid in self._pids.values():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in self._pids.values():
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        shared.close()
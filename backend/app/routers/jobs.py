@@ -0,0 +1,121 @@
+import asyncio
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Request, UploadFile, WebSocket, WebSocketDisconnect
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+from ..core.config import settings
+from ..services.cascade import CascadeRouter
+from ..services.documents import iter_pages, prefetch_pages
+from ..services.jobs import TERMINAL_STATES, JobManager, ProgressCallback
+from ..services.model_registry import ModelRegistry
+from .ocr import build_response, check_model, parse_languages, read_upload, run_model
+
+router = APIRouter(tags=["OCR Jobs"])
+
+
+async def process_job_task(
+    registry: ModelRegistry,
+    cascade: Optional[CascadeRouter],
+    task: Dict[str, Any],
+    progress: ProgressCallback
+) -> Dict[str, Any]:
+    """OCR every page of one uploaded file, reporting progress after each page"""
+    params = task["params"]
+    model = params["model"]
+    pages = []
+    async for index, page in prefetch_pages(iter_pages(task["payload"])):
+        results = await run_model(
+            registry, model, params["use_gpu"], params["languages"], image=page,
+            cascade=cascade, route=params.get("route"), layout=params.get("layout")
+        )
+        if "error" in results:
+            raise RuntimeError(f"Page {index + 1}: {results['error']}")
+        pages.append(build_response(model, results).model_dump(mode="json"))
+        await progress(index + 1, None, pages[-1])
+    await progress(len(pages), len(pages))
+    return {"filename": task["filename"], "pages": pages}
+
+
+def get_job_manager(request: Request) -> JobManager:
+    manager = getattr(request.app.state, "job_manager", None)
+    if manager is None:
+        raise HTTPException(status_code=503, detail="Job queue is not running")
+    return manager
+
+
+@router.post("/jobs", status_code=202)
+async def create_job(
+    files: List[UploadFile] = File(...),
+    model: str = Form("phi3"),
+    languages: Union[str, List[str]] = Form(None),
+    use_gpu: bool = Form(False),
+    priority: int = Form(0),
+    tenant: str = Form("default"),
+    route: Optional[str] = Form(None),
+    layout: Optional[bool] = Form(None),
+    manager: JobManager = Depends(get_job_manager)
+):
+    """
+    Queue one or many files (images, PDFs or TIFFs) for OCR and return a job id
+    right away. Poll GET /jobs/{job_id} or subscribe to /jobs/{job_id}/ws for
+    progress and results. Higher priorities run first; tenants with the same
+    priority are served in turn.
+    """
+    check_model(model, use_gpu, route)
+    if len(files) > settings.JOB_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.JOB_MAX_FILES} files per job")
+
+    async def read_files() -> AsyncIterator[Tuple[str, bytes]]:
+        for file in files:
+            upload = await read_upload(file, images_only=False)
+            yield file.filename, await asyncio.to_thread(upload.read)
+
+    params = {"model": model, "languages": parse_languages(languages), "use_gpu": use_gpu, "route": route, "layout": layout}
+    return await manager.submit(read_files(), params, tenant=tenant, priority=priority)
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, manager: JobManager = Depends(get_job_manager)):
+    """Job status, per-file progress and the results finished so far"""
+    job = await manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
+@router.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str, manager: JobManager = Depends(get_job_manager)):
+    """Cancel a job; queued files are dropped and a running file stops after its current page"""
+    job = await manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
+@router.websocket("/jobs/{job_id}/ws")
+async def job_updates(websocket: WebSocket, job_id: str):
+    """
+    Send the job, then its state on every change with the result of each page
+    as it is done, and the job with all results once it finishes
+    """
+    await websocket.accept()
+    manager: Optional[JobManager] = getattr(websocket.app.state, "job_manager", None)
+    if manager is None:
+        await websocket.close(code=1011, reason="Job queue is not running")
+        return
+
+    updates = manager.subscribe(job_id)
+    try:
+        job = await manager.get(job_id)
+        if job is None:
+            await websocket.send_json({"status": "error", "message": f"Job {job_id} not found"})
+        else:
+            await websocket.send_json(job)
+            while job["status"] not in TERMINAL_STATES:
+                job = await updates.get()
+                if job["status"] in TERMINAL_STATES:
+                    job = await manager.get(job_id)
+                await websocket.send_json(job)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.unsubscribe(job_id, updates)
@@ -1,9 +1,25 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from typing import List, Dict, Optional, Any, Union
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, Form
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import AsyncIterator, Iterator, List, Dict, Optional, Any, Union
 from pydantic import BaseModel, ConfigDict
-from ..services.phi3_service import Phi3VisionService
-from ..services.qwen_service import Qwen25Service
+from ..core.config import settings
+from ..services.cascade import CascadeRouter
+from ..services.documents import iter_pages, prefetch_pages
+from ..services.executor import InferenceQueueFull
+from ..services.model_registry import ModelBusy, ModelRegistry
+from ..services.ocr_pipeline import qwen_use_gpu, recognize_and_correct, stream_recognize_and_correct
+from ..services.perceptual_index import NearDuplicateIndex
+from ..services.quantization import dtype_name, resolve_runtime
+from ..services.result_cache import ResultCache, make_cache_key, make_context_key
+from ..services import tracing
+from ..services.tracing import Span, stage
+from ..services.uploads import SpooledUpload, UploadRejected, allowed_formats, detach_upload, spool_upload
+from PIL import Image
+import asyncio
 import base64
+import io
+import json
+import time
 import torch
 
 router = APIRouter(tags=["OCR"])
@@ -39,9 +55,153 @@ class OCRResponse(BaseModel):
     model_details: Optional[ModelDetails] = None
     languages: Optional[List[str]] = None
     raw_response: Optional[str] = None
+    cache_hit: bool = False
+    # Hamming distance to the stored page when a near-duplicate result was reused
+    duplicate_distance: Optional[int] = None
+    # Image preprocessing step timings and sizes, for image models
+    preprocessing: Optional[Dict[str, Any]] = None
+    # Timing breakdown: per-stage latencies in ms, prefill time and prompt
+    # tokens, of which prefix_tokens_reused came from the prompt prefix cache
+    timings: Optional[Dict[str, Any]] = None
+    # For model "auto": the route, the tier that handled the request and every tier tried
+    cascade: Optional[Dict[str, Any]] = None
+    # With layout tiling: the text blocks in reading order, with their boxes in
+    # the preprocessed image, text, confidence and timings
+    layout: Optional[Dict[str, Any]] = None
+    # The model used up its token budget before finishing, so the end of the
+    # text may be missing; timings has the budget and why generation stopped
+    truncated: bool = False
+    # With trace=true: the request's span tree, each span with its start and
+    # duration in ms from the start of the request and the stages inside it
+    trace: Optional[Dict[str, Any]] = None
 
 
-# Initialize OCR services
+class LoadedModel(BaseModel):
+    model_config = ConfigDict(protected_namespaces=())
+
+    name: str
+    model_id: str
+    device: str
+    dtype: str
+
+
+def get_model_registry(request: Request) -> ModelRegistry:
+    """Return the process-wide model registry created in the app lifespan"""
+    registry = getattr(request.app.state, "model_registry", None)
+    if registry is None:
+        registry = ModelRegistry()
+        request.app.state.model_registry = registry
+    return registry
+
+
+def get_cascade_router(request: Request) -> CascadeRouter:
+    """Return the cascade router behind model "auto", created in the app lifespan"""
+    cascade = getattr(request.app.state, "cascade_router", None)
+    if cascade is None:
+        cascade = CascadeRouter(get_model_registry(request))
+        request.app.state.cascade_router = cascade
+    return cascade
+
+
+def get_result_cache(request: Request) -> Optional[ResultCache]:
+    """Return the shared OCR result cache, or None when caching is disabled"""
+    if not settings.RESULT_CACHE_ENABLED:
+        return None
+    cache = getattr(request.app.state, "result_cache", None)
+    if cache is None:
+        cache = ResultCache.from_settings()
+        request.app.state.result_cache = cache
+    return cache
+
+
+def get_near_duplicate_index(
+    request: Request,
+    cache: Optional[ResultCache] = Depends(get_result_cache)
+) -> Optional[NearDuplicateIndex]:
+    """Return the shared perceptual-hash index, or None when it is disabled"""
+    if cache is None or not settings.NEAR_DUPLICATE_ENABLED:
+        return None
+    index = getattr(request.app.state, "near_duplicate_index", None)
+    if index is None:
+        index = NearDuplicateIndex(hash_method=settings.NEAR_DUPLICATE_HASH)
+        request.app.state.near_duplicate_index = index
+        cache.on_remove = index.discard
+    return index
+
+
+def _perceptual_hash(index: NearDuplicateIndex, upload: SpooledUpload) -> Optional[int]:
+    try:
+        return index.hash_image(upload.open_image())
+    except Exception as e:
+        print(f"Could not compute perceptual hash: {str(e)}")
+        return None
+
+
+def _runtime(use_gpu: bool, cpu_precision: str) -> Dict[str, str]:
+    """Device and dtype a model actually runs with for a GPU preference"""
+    device, precision, torch_dtype = resolve_runtime(use_gpu, cpu_precision)
+    return {"device": device, "dtype": dtype_name(precision, torch_dtype)}
+
+
+def generation_params(
+    model: str,
+    route: Optional[str] = None,
+    layout: Optional[bool] = None,
+    use_gpu: bool = False
+) -> Dict[str, Any]:
+    """Parameters that change a model's output, used in the result cache key"""
+    if model == "auto":
+        route = route or settings.CASCADE_DEFAULT_ROUTE
+        return {
+            "route": route,
+            "tiers": settings.CASCADE_ROUTES.get(route),
+            "phi3": generation_params("phi3", use_gpu=use_gpu),
+            "qwen25": generation_params("qwen25", use_gpu=use_gpu),
+        }
+    stopping = {
+        "adaptive": {
+            "margin": settings.GENERATION_BUDGET_MARGIN,
+            "extra": settings.GENERATION_BUDGET_EXTRA,
+            "phi3_tokens_per_char": settings.PHI3_TOKENS_PER_CHAR,
+            "phi3_limit": settings.PHI3_MAX_NEW_TOKENS_LIMIT,
+            "qwen25_limit": settings.QWEN25_MAX_NEW_TOKENS_LIMIT,
+        } if settings.ADAPTIVE_MAX_NEW_TOKENS else None,
+        "repetition": [settings.REPETITION_MAX_PERIOD, settings.REPETITION_MIN_TOKENS],
+    }
+    preprocess = {
+        "steps": settings.PREPROCESS_STEPS,
+        "target_dpi": settings.PREPROCESS_TARGET_DPI,
+        "max_side": settings.PREPROCESS_MAX_SIDE,
+        "max_skew": settings.PREPROCESS_MAX_SKEW,
+        # Preprocessed Phi-3 pages are read with the crops they cover
+        "num_crops": "covered",
+    } if settings.PREPROCESS_ENABLED else None
+    if model == "phi3":
+        return {
+            "prompt_version": settings.PROMPT_VERSION,
+            "max_new_tokens": settings.PHI3_MAX_NEW_TOKENS,
+            "temperature": settings.PHI3_TEMPERATURE,
+            "top_p": settings.PHI3_TOP_P,
+            "runtime": _runtime(use_gpu, settings.PHI3_CPU_PRECISION),
+            "preprocess": preprocess,
+            "stopping": stopping,
+            "layout": {
+                "max_block_chars": settings.LAYOUT_MAX_BLOCK_CHARS,
+                "column_gap": settings.LAYOUT_COLUMN_GAP,
+                "block_gap": settings.LAYOUT_BLOCK_GAP,
+                "work_width": settings.LAYOUT_WORK_WIDTH,
+            } if (settings.PHI3_LAYOUT_TILING if layout is None else layout) else None,
+        }
+    return {
+        "prompt_version": settings.PROMPT_VERSION,
+        "max_new_tokens": settings.QWEN25_MAX_NEW_TOKENS,
+        "runtime": _runtime(qwen_use_gpu(use_gpu), settings.QWEN25_CPU_PRECISION),
+        "ocr": "tesseract",
+        "skip_llm_confidence": settings.OCR_SKIP_LLM_CONFIDENCE,
+        "preprocess": preprocess,
+        "stopping": stopping,
+    }
+
 
 @router.get("/models", response_model=Dict[str, List[ModelInfo]])
 async def get_models():
@@ -64,7 +224,7 @@ async def get_models():
             ModelInfo(
                 id="qwen25",
                 name="Qwen2.5",
-                description="Advanced OCR model with high accuracy and language understanding",
+                description="Tesseract OCR followed by Qwen2.5 correction of the recognized text",
                 capabilities=[
                     "High-accuracy text extraction",
                     "Multi-language support",
@@ -72,73 +232,508 @@ async def get_models():
                     "Complex layout handling"
                 ],
                 gpu_required=True
+            ),
+            ModelInfo(
+                id="auto",
+                name="Cascade",
+                description="Tries the cheapest model of the route first and escalates to larger models when confidence is low",
+                capabilities=[
+                    "Confidence-based model selection",
+                    "Per-route thresholds",
+                    "Reports the model that handled each page"
+                ],
+                gpu_required=False
             )
         ]
         return {"models": models}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/models/loaded", response_model=Dict[str, List[LoadedModel]])
+async def get_loaded_models(registry: ModelRegistry = Depends(get_model_registry)):
+    """List the model instances currently held in memory"""
+    return {"models": registry.loaded()}
+
+
+@router.get("/stats")
+async def get_stats(request: Request, registry: ModelRegistry = Depends(get_model_registry)):
+    """Runtime statistics of the loaded models, e.g. batch sizes and queue wait times"""
+    cache = getattr(request.app.state, "result_cache", None)
+    near_duplicates = getattr(request.app.state, "near_duplicate_index", None)
+    cascade = getattr(request.app.state, "cascade_router", None)
+    return {
+        "executor": registry.executor.stats(),
+        "cache": cache.stats() if cache is not None else None,
+        "near_duplicates": near_duplicates.stats() if near_duplicates is not None else None,
+        "cascade": cascade.stats() if cascade is not None else None,
+        "models": registry.stats()
+    }
+
+
+@router.post("/models/{model_name}/load", response_model=LoadedModel)
+async def load_model(
+    model_name: str,
+    use_gpu: bool = False,
+    registry: ModelRegistry = Depends(get_model_registry)
+):
+    """Load a model ahead of the first request"""
+    try:
+        service = await registry.get(model_name, use_gpu=use_gpu)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading model: {str(e)}")
+    key = registry.key_for(service)
+    return {"name": model_name.lower(), **key._asdict()}
+
+
+@router.post("/models/{model_name}/reload", response_model=LoadedModel)
+async def reload_model(
+    model_name: str,
+    use_gpu: bool = False,
+    registry: ModelRegistry = Depends(get_model_registry)
+):
+    """Unload and load a model again"""
+    try:
+        key = await registry.reload(model_name, use_gpu=use_gpu)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except ModelBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reloading model: {str(e)}")
+    return {"name": model_name.lower(), **key._asdict()}
+
+
+@router.delete("/models/{model_name}", response_model=Dict[str, List[LoadedModel]])
+async def unload_model(
+    model_name: str,
+    use_gpu: Optional[bool] = None,
+    registry: ModelRegistry = Depends(get_model_registry)
+):
+    """Unload a model and free its memory, once the requests using it are done"""
+    try:
+        keys = await registry.unload(model_name, use_gpu=use_gpu)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except ModelBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"unloaded": [{"name": model_name.lower(), **key._asdict()} for key in keys]}
+
+
+def parse_languages(languages: Union[str, List[str], None]) -> Optional[List[str]]:
+    """Accept languages as a JSON list, a single language string or a list"""
+    if isinstance(languages, list) and len(languages) == 1:
+        # A single form field arrives as a one-item list, e.g. ['["en", "fr"]']
+        languages = languages[0]
+    if isinstance(languages, str):
+        try:
+            # Try to parse as JSON first
+            return json.loads(languages)
+        except json.JSONDecodeError:
+            # If not JSON, treat as single language
+            return [languages]
+    return languages
+
+
+async def read_upload(file: UploadFile, images_only: bool = True) -> SpooledUpload:
+    """
+    Hash, measure and sniff an upload from its spooled file, in chunks.
+    Raises 413 when it exceeds MAX_UPLOAD_SIZE and 415 when its content is
+    not an accepted format, whatever its declared content type.
+    """
+    try:
+        return await asyncio.to_thread(spool_upload, file, allowed_formats(images_only))
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+
+def check_model(model: str, use_gpu: bool, route: Optional[str] = None):
+    if model.lower() not in ["phi3", "qwen25", "auto"]:
+        raise HTTPException(status_code=400, detail="Invalid model specified. Use 'phi3', 'qwen25' or 'auto'")
+    if model.lower() == "auto" and (route or settings.CASCADE_DEFAULT_ROUTE) not in settings.CASCADE_ROUTES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid route specified. Use one of {list(settings.CASCADE_ROUTES)}"
+        )
+
+    # Check if GPU is required but not available
+    if not torch.cuda.is_available() and use_gpu:
+        raise HTTPException(
+            status_code=400,
+            detail="GPU is required for this model but not available on your system"
+        )
+
+
+async def run_model(
+    registry: ModelRegistry,
+    model: str,
+    use_gpu: bool,
+    languages: Optional[List[str]],
+    image_bytes: Optional[bytes] = None,
+    image: Optional[Image.Image] = None,
+    cascade: Optional[CascadeRouter] = None,
+    route: Optional[str] = None,
+    layout: Optional[bool] = None
+) -> Dict[str, Any]:
+    """
+    Run the selected model on encoded image bytes or an already decoded image.
+    ``layout`` turns Phi-3's layout tiling on or off (default: PHI3_LAYOUT_TILING).
+    """
+    if model.lower() == "auto":
+        if image is None:
+            image = Image.open(io.BytesIO(image_bytes))
+        cascade = cascade or CascadeRouter(registry)
+        return await cascade.run(image, languages, use_gpu=use_gpu, route=route)
+
+    if model.lower() == "phi3":
+        async with registry.use("phi3", use_gpu=use_gpu) as phi3_service:
+            if image is not None:
+                return await phi3_service.process_image(image, languages, layout=layout)
+            return await phi3_service.process_text_and_image("", image_bytes, languages, layout=layout)
+
+    if image is None:
+        image = Image.open(io.BytesIO(image_bytes))
+    return await recognize_and_correct(registry, image, languages, use_gpu=use_gpu)
+
+
+def build_response(model: str, results: Dict[str, Any]) -> OCRResponse:
+    # Convert model details if available
+    model_details = None
+    if "model_info" in results:
+        model_details = ModelDetails(**results["model_info"])
+
+    return OCRResponse(
+        # Only the two-stage pipeline has a separate raw text; for the others they are the same
+        raw_text=results.get("raw_text", results["text"]),
+        enhanced_text=results["text"],
+        model_used=results.get("model_used", model),
+        confidence=results.get("confidence", 0.0),
+        processing_time=results.get("processing_time", 0.0),
+        scanner_info={},  # Add empty dict for non-scanner uploads
+        model_details=model_details,
+        languages=results.get("languages"),
+        raw_response=results.get("raw_response"),
+        preprocessing=results.get("preprocessing"),
+        timings=results.get("timings"),
+        cascade=results.get("cascade"),
+        layout=results.get("layout"),
+        truncated=results.get("truncated", False)
+    )
+
+
+def _json_response(payload: Dict[str, Any], root: Optional[Span] = None) -> JSONResponse:
+    """The response body, with the request's span tree when one is given"""
+    if root is not None:
+        payload = {**payload, "trace": root.to_dict()}
+    return JSONResponse(payload)
+
+
 @router.post("/extract-text", response_model=OCRResponse)
 async def extract_text(
     file: UploadFile = File(...),
     model: str = Form("phi3"),
     languages: Union[str, List[str]] = Form(None),
-    use_gpu: bool = Form(False)
+    use_gpu: bool = Form(False),
+    use_cache: bool = Form(True),
+    similarity_threshold: Optional[int] = Form(None),
+    route: Optional[str] = Form(None),
+    layout: Optional[bool] = Form(None),
+    trace: bool = Form(False),
+    registry: ModelRegistry = Depends(get_model_registry),
+    cascade: CascadeRouter = Depends(get_cascade_router),
+    cache: Optional[ResultCache] = Depends(get_result_cache),
+    near_duplicates: Optional[NearDuplicateIndex] = Depends(get_near_duplicate_index)
 ):
     # Convert string input to list if necessary
-    if isinstance(languages, str):
-        try:
-            # Try to parse as JSON first
-            import json
-            languages = json.loads(languages)
-        except json.JSONDecodeError:
-            # If not JSON, treat as single language
-            languages = [languages]
+    languages = parse_languages(languages)
 
     if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
 
     try:
-        image_bytes = await file.read()
-        results = None
-
-        # Check if GPU is required but not available
-        if model.lower() in ["phi3", "qwen25"] and not torch.cuda.is_available() and use_gpu:
-            raise HTTPException(
-                status_code=400,
-                detail="GPU is required for this model but not available on your system"
+        with tracing.trace("extract_text", enabled=trace, model=model.lower()) as root:
+            # The span tree goes into the response only when it was asked for
+            response_trace = root if trace else None
+            with stage("upload_read", model.lower()):
+                upload = await read_upload(file)
+
+            # Identical uploads with identical parameters reuse the stored response
+            cache_key = None
+            context_key = None
+            image_phash = None
+            if cache is not None:
+                params = generation_params(model.lower(), route, layout, use_gpu)
+                context_key = make_context_key(model, languages, params)
+                cache_key = make_cache_key(upload.sha256, model, languages, params)
+                if use_cache:
+                    cached = cache.get(cache_key)
+                    if cached is not None:
+                        cached["cache_hit"] = True
+                        with stage("serialize", model.lower()):
+                            payload = OCRResponse.model_validate(cached).model_dump(mode="json")
+                        return _json_response(payload, response_trace)
+                else:
+                    cache.record_bypass()
+
+                # Hashing a page costs more than the lookup, so only callers
+                # asking for near-duplicates pay for it
+                if near_duplicates is not None and similarity_threshold is not None:
+                    image_phash = await asyncio.to_thread(_perceptual_hash, near_duplicates, upload)
+
+                # Rescans never match byte for byte; callers may opt in to reusing
+                # the result of a perceptually near-identical page
+                if use_cache and similarity_threshold is not None and image_phash is not None:
+                    max_distance = max(0, min(similarity_threshold, settings.NEAR_DUPLICATE_MAX_DISTANCE))
+                    for distance, key in near_duplicates.candidates(image_phash, context_key, max_distance):
+                        cached = cache.get(key)
+                        if cached is None:
+                            # Gone from the cache without passing through on_remove
+                            near_duplicates.discard(key)
+                            continue
+                        cached["cache_hit"] = True
+                        cached["duplicate_distance"] = distance
+                        with stage("serialize", model.lower()):
+                            payload = OCRResponse.model_validate(cached).model_dump(mode="json")
+                        return _json_response(payload, response_trace)
+
+            # Process with the specified model
+            check_model(model, use_gpu, route)
+            # Only the header is read here; the pixels are decoded from the
+            # spooled upload when the model first uses them
+            try:
+                image = upload.open_image()
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=f"Invalid image: {str(e)}")
+            results = await run_model(
+                registry, model, use_gpu, languages, image=image, cascade=cascade, route=route, layout=layout
             )
+            # Serialized once, for the cache and the response
+            with stage("serialize", model.lower()):
+                payload = build_response(model, results).model_dump(mode="json")
 
-        # Process with the specified model
-        if model.lower() == "phi3":
-            phi3_service = Phi3VisionService(use_gpu=use_gpu)
-            results = await phi3_service.process_text_and_image("", image_bytes, languages)
-        elif model.lower() == "qwen25":
-            qwen_service = Qwen25Service()
-            results = await qwen_service.process_text("", languages)
-        else:
-            raise HTTPException(status_code=400, detail="Invalid model specified. Use 'phi3' or 'qwen25'")
-
-        # Convert model details if available
-        model_details = None
-        if "model_info" in results:
-            model_details = ModelDetails(**results["model_info"])
+            # Failed generations are not cached so the next upload retries them
+            if cache_key is not None and "error" not in results:
+                cache.set(cache_key, payload)
+                if image_phash is not None:
+                    near_duplicates.add(image_phash, context_key, cache_key)
 
-        return {
-            "raw_text": results["text"],
-            "enhanced_text": results["text"],  # For non-enhancement models, raw and enhanced are the same
-            "model_used": model,
-            "confidence": results.get("confidence", 0.0),
-            "processing_time": results.get("processing_time", 0.0),
-            "scanner_info": {},  # Add empty dict for non-scanner uploads
-            "model_details": model_details,
-            "languages": results.get("languages"),
-            "raw_response": results.get("raw_response")
-        }
+            return _json_response(payload, response_trace)
 
+    except HTTPException:
+        raise
+    except InferenceQueueFull as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
 
+async def stream_model(
+    registry: ModelRegistry,
+    model: str,
+    use_gpu: bool,
+    languages: Optional[List[str]],
+    image: Image.Image,
+    layout: Optional[bool] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """Stream ``{"delta": text}`` events from the selected model, then its final result"""
+    if model.lower() == "phi3":
+        async with registry.use("phi3", use_gpu=use_gpu) as phi3_service:
+            async for event in phi3_service.stream_image(image, languages, layout=layout):
+                yield event
+        return
+
+    async for event in stream_recognize_and_correct(registry, image, languages, use_gpu=use_gpu):
+        yield event
+
+
+def _stream_line(event: str, payload: Dict[str, Any], sse: bool) -> str:
+    if sse:
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+    return json.dumps(payload) + "\n"
+
+
+@router.post("/extract-text/stream")
+async def extract_text_stream(
+    file: UploadFile = File(...),
+    model: str = Form("phi3"),
+    languages: Union[str, List[str]] = Form(None),
+    use_gpu: bool = Form(False),
+    use_cache: bool = Form(True),
+    format: str = Form("ndjson"),
+    layout: Optional[bool] = Form(None),
+    registry: ModelRegistry = Depends(get_model_registry),
+    cache: Optional[ResultCache] = Depends(get_result_cache)
+):
+    """
+    Same as /extract-text, but the text is sent while it is being generated.
+
+    Emits ``{"delta": "..."}`` events as tokens are decoded, then one
+    ``{"done": true, ...}`` event with the OCRResponse fields plus
+    time_to_first_token, generated_tokens and tokens_per_second, or an
+    ``{"error": "..."}`` event. ``format`` selects newline-delimited JSON
+    ("ndjson") or server-sent events ("sse"). Requests rejected before the
+    first token still get a proper status code, e.g. 503 with Retry-After.
+    """
+    languages = parse_languages(languages)
+
+    if not file.content_type or not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="File must be an image")
+    if format not in ("ndjson", "sse"):
+        raise HTTPException(status_code=400, detail="Invalid format specified. Use 'ndjson' or 'sse'")
+    check_model(model, use_gpu)
+    if model.lower() == "auto":
+        # The cascade only knows which tier to keep once a tier has finished
+        raise HTTPException(status_code=400, detail="Streaming is not available for model 'auto'")
+
+    sse = format == "sse"
+    media_type = "text/event-stream" if sse else "application/x-ndjson"
+    upload = await read_upload(file)
+
+    cache_key = None
+    if cache is not None:
+        params = generation_params(model.lower(), layout=layout, use_gpu=use_gpu)
+        cache_key = make_cache_key(upload.sha256, model, languages, params)
+        cached = cache.get(cache_key) if use_cache else None
+        if not use_cache:
+            cache.record_bypass()
+        if cached is not None:
+            cached["cache_hit"] = True
+            lines = [
+                _stream_line("delta", {"delta": cached["enhanced_text"]}, sse),
+                _stream_line("done", {"done": True, **cached}, sse),
+            ]
+            return StreamingResponse(iter(lines), media_type=media_type)
+
+    # The upload is closed once this handler returns, before the stream is consumed
+    try:
+        image = await asyncio.to_thread(upload.load_image)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {str(e)}")
+    events = stream_model(registry, model, use_gpu, languages, image, layout)
+    try:
+        # Wait for the first token so admission and load errors keep their status code
+        first = await events.__anext__()
+    except InferenceQueueFull as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
+
+    async def body():
+        event = first
+        try:
+            while "delta" in event:
+                yield _stream_line("delta", event, sse)
+                event = await events.__anext__()
+
+            if "error" in event:
+                yield _stream_line("error", {"error": event["error"]}, sse)
+                return
+
+            response = build_response(model, event).model_dump(mode="json")
+            if cache_key is not None:
+                cache.set(cache_key, response)
+            timings = {
+                key: event.get(key)
+                for key in ("time_to_first_token", "generated_tokens", "tokens_per_second")
+            }
+            yield _stream_line("done", {"done": True, **response, **timings}, sse)
+        except Exception as e:
+            yield _stream_line("error", {"error": str(e)}, sse)
+        finally:
+            # Also reached when the client disconnects; stops the generation
+            await events.aclose()
+
+    return StreamingResponse(body(), media_type=media_type)
+
+
+@router.post("/extract-document")
+async def extract_document(
+    file: UploadFile = File(...),
+    model: str = Form("phi3"),
+    languages: Union[str, List[str]] = Form(None),
+    use_gpu: bool = Form(False),
+    route: Optional[str] = Form(None),
+    layout: Optional[bool] = Form(None),
+    registry: ModelRegistry = Depends(get_model_registry),
+    cascade: CascadeRouter = Depends(get_cascade_router)
+):
+    """
+    OCR a multi-page PDF or TIFF (or a single image) page by page.
+
+    Results are streamed as newline-delimited JSON: one line per page as soon as
+    it is done, in page order, then a final summary line. Pages are decoded
+    lazily from the uploaded file and at most DOCUMENT_PIPELINE_DEPTH pages
+    are decoded ahead of, or in flight through, the model.
+    """
+    languages = parse_languages(languages)
+    check_model(model, use_gpu, route)
+    upload = await read_upload(file, images_only=False)
+    # Pages are rendered while the response streams, after the request's form
+    # is closed, so the spooled file is kept open until the stream ends
+    detach_upload(file)
+    depth = settings.DOCUMENT_PIPELINE_DEPTH
+
+    def document_pages() -> Iterator[Image.Image]:
+        try:
+            yield from iter_pages(upload.file)
+        finally:
+            upload.close()
+
+    async def page_results():
+        start_time = time.time()
+        pages_done = 0
+        in_flight: List[asyncio.Task] = []
+        # A slot per page from its decoding until its model call is done
+        slots = asyncio.Semaphore(depth)
+        pages = prefetch_pages(document_pages(), depth, slots)
+
+        async def emit(task: asyncio.Task) -> str:
+            index, results = await task
+            page = build_response(model, results).model_dump(mode="json")
+            return json.dumps({"page": index + 1, **page}) + "\n"
+
+        async def ocr_page(index: int, page: Image.Image):
+            try:
+                return index, await run_model(
+                    registry, model, use_gpu, languages, image=page, cascade=cascade, route=route, layout=layout
+                )
+            finally:
+                slots.release()
+
+        try:
+            # Several pages in flight lets concurrent pages share a Phi-3 batch
+            async for index, page in pages:
+                in_flight.append(asyncio.create_task(ocr_page(index, page)))
+                if len(in_flight) >= depth:
+                    yield await emit(in_flight.pop(0))
+                    pages_done += 1
+            while in_flight:
+                yield await emit(in_flight.pop(0))
+                pages_done += 1
+        except Exception as e:
+            yield json.dumps({"error": str(e), "page": pages_done + 1}) + "\n"
+        finally:
+            # Also reached when the client disconnects mid-stream
+            for task in in_flight:
+                task.cancel()
+            await pages.aclose()
+
+        yield json.dumps({
+            "done": True,
+            "pages": pages_done,
+            "processing_time": time.time() - start_time
+        }) + "\n"
+
+    return StreamingResponse(page_results(), media_type="application/x-ndjson")
+
 # @router.post("/scanner/extract-text", response_model=OCRResponse)
 # async def scanner_extract_text(
 #     image_data: str = Form(...),
@@ -1,23 +1,30 @@
-from fastapi import APIRouter, HTTPException
-import sane
+from fastapi import APIRouter, Depends, HTTPException, Request
 from PIL import Image
 import io
 import base64
 from fastapi.responses import JSONResponse
-from typing import List, Dict
-import contextlib
+from typing import Any, Dict, List
+
+from ..services.sane_devices import DeviceNotFound, SaneDeviceManager
 
 router = APIRouter()
 
+
+async def get_device_manager(request: Request) -> SaneDeviceManager:
+    """Return the process-wide SANE device manager created in the app lifespan"""
+    manager = getattr(request.app.state, "sane_devices", None)
+    if manager is None:
+        manager = SaneDeviceManager.from_settings()
+        request.app.state.sane_devices = manager
+    await manager.start()
+    return manager
+
+
 @router.get("/list", response_model=List[Dict[str, str]])
-async def list_scanners():
-    """List all available scanners"""
+async def list_scanners(refresh: bool = False, manager: SaneDeviceManager = Depends(get_device_manager)):
+    """List all available scanners; ``refresh`` enumerates again instead of using the cached list"""
     try:
-        # initialize scanner
-        sane.init()
-
-        # Get available devices
-        devices = sane.get_devices()
+        devices = await manager.list_devices(refresh=refresh)
 
         # Format devices for frontend
         scanner_list = [
@@ -31,48 +38,26 @@ async def list_scanners():
             for device in devices
         ]
 
-        # close scanner
-        sane.exit()
-
         return scanner_list
     except Exception as e:
         print(f"Error listing scanners: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/stats")
+async def scanner_stats(manager: SaneDeviceManager = Depends(get_device_manager)) -> Dict[str, Any]:
+    """Device cache state, open devices and list, open and scan latencies"""
+    return manager.stats()
+
+
 @router.get("/scan/{scanner_id}")
-async def scan_document(scanner_id: str):
+async def scan_document(scanner_id: str, manager: SaneDeviceManager = Depends(get_device_manager)):
     """Scan a document using the specified scanner"""
     try:
-        # initialize scanner
-        sane.init()
-
-        # Get available devices
-        devices = sane.get_devices()
-
-        # Verify scanner exists
-        scanner_exists = any(device[0] == scanner_id for device in devices)
-        if not scanner_exists:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Scanner {scanner_id} not found. Available devices: {[device[0] for device in devices]}"
-            )
-
-        # Open the scanner
-        scanner = sane.open(scanner_id)
-
-        # Set scanning parameters
-        scanner.mode = 'color'
-        scanner.resolution = 300  # DPI
-
-        # Start the scan
         print(f"Starting scan with scanner {scanner_id}...")
-        image = scanner.scan()
+        image = await manager.scan(scanner_id, resolution=300, mode="color")
         print("Scan completed")
 
-        # close scanner
-        sane.exit()
-
         # Convert PIL Image to base64
         img_byte_arr = io.BytesIO()
         image.save(img_byte_arr, format='PNG')
@@ -83,6 +68,8 @@ async def scan_document(scanner_id: str):
 
         return JSONResponse(content={"image": img_base64})
 
+    except DeviceNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         print(f"Scanning error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,191 @@
+import asyncio
+import contextvars
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from .executor import InferenceQueueFull
+from .metrics import QUEUE_WAIT_SECONDS
+
+
+BatchHandler = Callable[[List[Any]], Awaitable[List[Any]]]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class MicroBatcher:
+    """
+    Dynamic micro-batching queue.
+
+    Concurrent ``submit`` calls are collected until either ``max_batch_size``
+    items are waiting or the oldest item has waited ``max_wait_ms``; the batch
+    is then handed to ``handler`` in one call and the results are routed back
+    to the individual callers in submission order.
+    """
+
+    def __init__(
+        self,
+        handler: BatchHandler,
+        max_batch_size: int = 4,
+        max_wait_ms: float = 10.0,
+        max_queue_size: Optional[int] = None,
+        name: str = "batcher",
+        stats_window: int = 1024
+    ):
+        """
+        Args:
+            handler: Coroutine function receiving a list of items and returning
+                one result per item, in the same order.
+            max_batch_size (int): Largest batch passed to the handler.
+            max_wait_ms (float): How long the first item of a batch may wait for
+                more items to arrive.
+            max_queue_size (int): Reject submissions with InferenceQueueFull once
+                this many items are waiting. None means unbounded.
+            name (str): Name used in logs and stats.
+            stats_window (int): Number of recent wait times kept for percentiles.
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_queue_size = max_queue_size
+        self.name = name
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # The batch the handler is working on; close() fails its callers
+        self._in_flight: List[Tuple[Any, asyncio.Future, float]] = []
+
+        self._batch_sizes: Dict[int, int] = {}
+        self._wait_times: Deque[float] = deque(maxlen=stats_window)
+        self._total_items = 0
+        self._total_batches = 0
+        self._rejected = 0
+        self._max_wait_seen = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            # In an empty context, so the worker does not keep the tracing
+            # span of the request that happened to start it
+            self._worker = contextvars.Context().run(asyncio.get_running_loop().create_task, self._run())
+
+    async def submit(self, item: Any) -> Any:
+        """Queue an item and wait for its result"""
+        if self.max_queue_size is not None and self.queue_depth >= self.max_queue_size:
+            self._rejected += 1
+            raise InferenceQueueFull(f"{self.name} queue is full ({self.queue_depth} waiting)")
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self) -> List[Tuple[Any, asyncio.Future, float]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _record(self, batch: List[Tuple[Any, asyncio.Future, float]], started: float):
+        size = len(batch)
+        self._batch_sizes[size] = self._batch_sizes.get(size, 0) + 1
+        self._total_batches += 1
+        self._total_items += size
+        for _, _, enqueued in batch:
+            waited = started - enqueued
+            self._wait_times.append(waited)
+            QUEUE_WAIT_SECONDS.labels(queue=self.name).observe(waited)
+            self._max_wait_seen = max(self._max_wait_seen, waited)
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Callers that gave up (e.g. client disconnected) are dropped here
+            batch = [entry for entry in batch if not entry[1].done()]
+            if not batch:
+                continue
+
+            self._record(batch, time.perf_counter())
+            self._in_flight = batch
+            try:
+                results = await self.handler([item for item, _, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f"{self.name}: handler returned {len(results)} results for {len(batch)} items"
+                    )
+                for (_, future, _), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+            except Exception as e:
+                self._fail(batch, e)
+            finally:
+                # A worker cancelled by close() must not clear the batch of its replacement
+                if self._in_flight is batch:
+                    self._in_flight = []
+
+    @staticmethod
+    def _fail(batch: List[Tuple[Any, asyncio.Future, float]], error: BaseException):
+        for _, future, _ in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    def close(self):
+        """
+        Stop the worker and fail every request still waiting for a result,
+        both the queued ones and those of the batch being processed
+        """
+        closed = RuntimeError(f"{self.name} was closed")
+        if self._worker is not None:
+            # Cancelling the worker raises CancelledError inside the handler
+            # call, which never reaches the callers of the batch
+            self._worker.cancel()
+            self._worker = None
+        self._fail(self._in_flight, closed)
+        self._in_flight = []
+        if self._queue is not None:
+            while not self._queue.empty():
+                self._fail([self._queue.get_nowait()], closed)
+            self._queue = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, batch-size histogram and queue wait times (in milliseconds)"""
+        waits = list(self._wait_times)
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queue_depth": self.queue_depth,
+            "total_batches": self._total_batches,
+            "total_items": self._total_items,
+            "rejected": self._rejected,
+            "mean_batch_size": self._total_items / self._total_batches if self._total_batches else 0.0,
+            "batch_size_histogram": {str(size): count for size, count in sorted(self._batch_sizes.items())},
+            "wait_ms": {
+                "mean": 1000.0 * sum(waits) / len(waits) if waits else 0.0,
+                "p50": 1000.0 * _percentile(waits, 0.50),
+                "p95": 1000.0 * _percentile(waits, 0.95),
+                "p99": 1000.0 * _percentile(waits, 0.99),
+                "max": 1000.0 * self._max_wait_seen,
+            },
+        }
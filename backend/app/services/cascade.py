@@ -0,0 +1,169 @@
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from PIL import Image
+
+from ..core.config import settings
+from .model_registry import ModelRegistry
+from .ocr_pipeline import correct, recognize, stage_result
+
+logger = logging.getLogger(__name__)
+
+CASCADE_MODELS = ("tesseract", "qwen25", "phi3")
+
+
+class _TierStats:
+    def __init__(self):
+        self.attempts = 0
+        self.accepted = 0
+        self.handled = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.total_confidence = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "attempts": self.attempts,
+            "accepted": self.accepted,
+            "escalated": self.attempts - self.accepted,
+            "handled": self.handled,
+            "errors": self.errors,
+            "mean_ms": self.total_ms / self.attempts if self.attempts else 0.0,
+            "mean_confidence": self.total_confidence / self.attempts if self.attempts else 0.0,
+        }
+
+
+class CascadeRouter:
+    """
+    Model cascade behind model "auto".
+
+    A route is a list of tiers ordered from the cheapest to the most expensive
+    model. Each request runs the tiers in order and stops at the first result
+    whose confidence reaches the tier's ``min_confidence``; the last tier's
+    result is returned when none does. The tier that handled each request is
+    returned with the result and counted per route, so the share of traffic
+    each model handles can be weighed against its latency.
+    """
+
+    def __init__(self, registry: ModelRegistry, routes: Optional[Dict[str, List[Dict[str, Any]]]] = None):
+        """
+        Args:
+            registry (ModelRegistry): Registry the tier models are loaded from.
+            routes (dict): Route name to its tiers; defaults to settings.CASCADE_ROUTES.
+        """
+        self.registry = registry
+        self.routes = routes if routes is not None else settings.CASCADE_ROUTES
+        for route, tiers in self.routes.items():
+            if not tiers:
+                raise ValueError(f"Cascade route '{route}' has no tiers")
+            for tier in tiers:
+                if tier.get("model") not in CASCADE_MODELS:
+                    raise ValueError(f"Unknown model '{tier.get('model')}' in cascade route '{route}'")
+        self._requests: Dict[str, int] = {route: 0 for route in self.routes}
+        self._stats: Dict[str, List[_TierStats]] = {
+            route: [_TierStats() for _ in tiers] for route, tiers in self.routes.items()
+        }
+
+    def resolve(self, route: Optional[str] = None) -> str:
+        """Route name for a request, raising KeyError for unknown routes"""
+        route = route or settings.CASCADE_DEFAULT_ROUTE
+        if route not in self.routes:
+            raise KeyError(route)
+        return route
+
+    async def _run_tier(
+        self,
+        model: str,
+        image: Image.Image,
+        languages: Optional[List[str]],
+        use_gpu: bool,
+        state: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        # Tesseract's output is kept in ``state`` so the qwen25 tier corrects it
+        # without recognizing the page again
+        if model in ("tesseract", "qwen25") and "recognized" not in state:
+            state["recognized"] = await recognize(self.registry, image, languages)
+        if model in ("tesseract", "qwen25"):
+            recognized, timings = state["recognized"]
+            if model == "tesseract" or "error" in recognized:
+                return stage_result(recognized, None, dict(timings, llm_skipped=True), languages, time.time())
+            return await correct(self.registry, recognized, timings, languages, use_gpu)
+
+        async with self.registry.use("phi3", use_gpu=use_gpu) as phi3_service:
+            return await phi3_service.process_image(image, languages)
+
+    async def run(
+        self,
+        image: Image.Image,
+        languages: Optional[List[str]] = None,
+        use_gpu: bool = False,
+        route: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Run an image through the tiers of a route.
+        Args:
+            image (Image.Image): Page to read.
+            languages (list): Languages of the page.
+            use_gpu (bool): Whether the LLM tiers may use the GPU.
+            route (str): Name of the route; defaults to settings.CASCADE_DEFAULT_ROUTE.
+        Returns:
+            The handling tier's result, with ``model_used`` and a ``cascade``
+            record of every tier tried.
+        """
+        route = self.resolve(route)
+        tiers = self.routes[route]
+        start_time = time.time()
+        state: Dict[str, Any] = {}
+        attempts = []
+        self._requests[route] += 1
+
+        for index, tier in enumerate(tiers):
+            tier_start = time.perf_counter()
+            result = await self._run_tier(tier["model"], image, languages, use_gpu, state)
+            elapsed_ms = (time.perf_counter() - tier_start) * 1000.0
+            failed = "error" in result
+            accepted = not failed and result["confidence"] >= tier.get("min_confidence", 0.0)
+
+            tier_stats = self._stats[route][index]
+            tier_stats.attempts += 1
+            tier_stats.accepted += accepted
+            tier_stats.errors += failed
+            tier_stats.total_ms += elapsed_ms
+            tier_stats.total_confidence += result["confidence"]
+            attempts.append({
+                "model": tier["model"],
+                "confidence": result["confidence"],
+                "min_confidence": tier.get("min_confidence", 0.0),
+                "accepted": accepted,
+                "ms": elapsed_ms,
+                **({"error": result["error"]} if failed else {}),
+            })
+            if accepted:
+                break
+
+        tier_stats.handled += 1
+        result = dict(result)
+        result["model_used"] = tier["model"]
+        result["processing_time"] = time.time() - start_time
+        result["cascade"] = {
+            "route": route,
+            "tier": index,
+            "model": tier["model"],
+            "escalations": len(attempts) - 1,
+            "attempts": attempts,
+        }
+        logger.info(f"Cascade route '{route}' handled by {tier['model']} (tier {index}, confidence {result['confidence']:.2f})")
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            route: {
+                "requests": self._requests[route],
+                "tiers": [
+                    {"model": tier["model"], "min_confidence": tier.get("min_confidence", 0.0), **tier_stats.stats()}
+                    for tier, tier_stats in zip(tiers, self._stats[route])
+                ],
+            }
+            for route, tiers in self.routes.items()
+        }
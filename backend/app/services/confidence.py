@@ -0,0 +1,80 @@
+import math
+from typing import Any, Iterable, List, Optional, Set
+
+import torch
+from transformers import LogitsProcessor
+
+
+class TokenLogprobs(LogitsProcessor):
+    """
+    Logits processor recording the log-probability the model assigned to
+    every generated token, without keeping the scores of the whole vocabulary
+    for every step (``output_scores`` would, and for Qwen2.5's 152k vocabulary
+    that is hundreds of megabytes per request).
+
+    At each step the token chosen at the previous step is the last column of
+    ``input_ids``; the last generated token is collected by ``confidences``.
+    Custom processors run before temperature and top-p, so these are the
+    model's own probabilities. The scores are returned unchanged.
+    """
+
+    def __init__(self):
+        self._previous: Optional[torch.Tensor] = None
+        self._steps: List[torch.Tensor] = []
+
+    def _collect(self, tokens: torch.Tensor):
+        if self._previous is not None:
+            self._steps.append(self._previous.gather(1, tokens[:, None].to(self._previous.device)).squeeze(1).cpu())
+            self._previous = None
+
+    def __call__(self, input_ids, scores):
+        self._collect(input_ids[:, -1])
+        self._previous = torch.log_softmax(scores.float(), dim=-1)
+        return scores
+
+    def token_logprobs(self, sequences: torch.Tensor, eos_token_ids: Iterable[int] = ()) -> List[List[float]]:
+        """
+        Per-row log-probabilities of the generated tokens of ``sequences``
+        (the output of generate), up to and including each row's first
+        end-of-sequence token.
+        """
+        self._collect(sequences[:, -1])
+        if not self._steps:
+            return [[] for _ in range(sequences.shape[0])]
+        logprobs = torch.stack(self._steps, dim=1)
+        generated = sequences[:, -logprobs.shape[1]:].cpu()
+        eos = set(eos_token_ids)
+
+        rows = []
+        for row_tokens, row_logprobs in zip(generated.tolist(), logprobs.tolist()):
+            row = []
+            for token, logprob in zip(row_tokens, row_logprobs):
+                row.append(logprob)
+                if token in eos:
+                    # Later steps only pad the finished row
+                    break
+            rows.append(row)
+        return rows
+
+    def confidences(self, sequences: torch.Tensor, eos_token_ids: Iterable[int] = ()) -> List[float]:
+        return [sequence_confidence(row) for row in self.token_logprobs(sequences, eos_token_ids)]
+
+
+def sequence_confidence(logprobs: List[float]) -> float:
+    """Geometric mean probability of the generated tokens, between 0 and 1"""
+    logprobs = [logprob for logprob in logprobs if math.isfinite(logprob)]
+    if not logprobs:
+        return 0.0
+    return math.exp(sum(logprobs) / len(logprobs))
+
+
+def eos_token_ids(model: Any, tokenizer: Any) -> Set[int]:
+    """Every id that ends generation, from the generation config and the tokenizer"""
+    ids: Set[int] = set()
+    for value in (getattr(getattr(model, "generation_config", None), "eos_token_id", None),
+                  getattr(tokenizer, "eos_token_id", None)):
+        if isinstance(value, int):
+            ids.add(value)
+        elif value is not None:
+            ids.update(value)
+    return ids
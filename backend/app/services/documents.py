@@ -0,0 +1,142 @@
+import asyncio
+import io
+from typing import AsyncIterator, BinaryIO, Iterator, Optional, Tuple, Union
+
+from PIL import Image, ImageSequence
+
+from ..core.config import settings
+
+
+def detect_document_type(data: bytes) -> str:
+    """Classify an upload as "pdf", "tiff" or a single "image" by its magic bytes"""
+    if data[:5] == b"%PDF-":
+        return "pdf"
+    if data[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    return "image"
+
+
+class _ReadInto:
+    """
+    A file with the readinto() pypdfium2 reads through; SpooledTemporaryFile
+    only has it from Python 3.11.
+    """
+
+    def __init__(self, file: BinaryIO):
+        self.file = file
+        self.seek = file.seek
+        self.tell = file.tell
+        self.read = file.read
+
+    def readinto(self, buffer) -> int:
+        view = memoryview(buffer).cast("B")
+        data = self.file.read(len(view))
+        view[:len(data)] = data
+        return len(data)
+
+
+def _iter_pdf_pages(file: BinaryIO, dpi: int) -> Iterator[Image.Image]:
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        raise RuntimeError("PDF support requires pypdfium2: pip install pypdfium2")
+
+    # Pages are read from the file as they are rendered, not copied into memory
+    pdf = pdfium.PdfDocument(file if callable(getattr(file, "readinto", None)) else _ReadInto(file))
+    try:
+        for index in range(len(pdf)):
+            page = pdf[index]
+            try:
+                # PDF user space is 72 units per inch
+                yield page.render(scale=dpi / 72).to_pil()
+            finally:
+                page.close()
+    finally:
+        pdf.close()
+
+
+def _iter_image_frames(file: BinaryIO) -> Iterator[Image.Image]:
+    with Image.open(file) as image:
+        for frame in ImageSequence.Iterator(image):
+            # Frames share one decoder; copy so the page outlives the next seek
+            yield frame.copy()
+
+
+def iter_pages(
+    data: Union[bytes, BinaryIO],
+    max_pages: Optional[int] = None,
+    dpi: Optional[int] = None
+) -> Iterator[Image.Image]:
+    """
+    Lazily yield the pages of a PDF, multi-frame TIFF or single image, given
+    as bytes or as a seekable file. Only the page being yielded is decoded,
+    so memory does not grow with the number of pages.
+    """
+    max_pages = max_pages or settings.DOCUMENT_MAX_PAGES
+    file = io.BytesIO(data) if isinstance(data, bytes) else data
+    file.seek(0)
+    kind = detect_document_type(file.read(8))
+    file.seek(0)
+    if kind == "pdf":
+        pages = _iter_pdf_pages(file, dpi or settings.PDF_RENDER_DPI)
+    else:
+        pages = _iter_image_frames(file)
+
+    for index, page in enumerate(pages):
+        if index >= max_pages:
+            raise ValueError(f"Document has more than {max_pages} pages")
+        yield page
+
+
+async def prefetch_pages(
+    pages: Iterator[Image.Image],
+    depth: Optional[int] = None,
+    slots: Optional[asyncio.Semaphore] = None
+) -> AsyncIterator[Tuple[int, Image.Image]]:
+    """
+    Decode pages on a worker thread, at most ``depth`` pages ahead of the consumer.
+    The bounded queue is what keeps peak memory proportional to the pipeline
+    depth instead of the document size. When ``slots`` is given, one is
+    taken before each page is decoded and the consumer releases it once done
+    with the page, which bounds the pages queued and still in use together.
+    """
+    depth = depth or settings.DOCUMENT_PIPELINE_DEPTH
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=depth)
+    done = object()
+    decoding = []
+
+    async def produce():
+        try:
+            index = 0
+            while True:
+                if slots is not None:
+                    await slots.acquire()
+                decoding[:] = [loop.run_in_executor(None, next, pages, done)]
+                # Shielded so that a cancelled producer still knows when the thread is done
+                page = await asyncio.shield(decoding[0])
+                if page is done:
+                    break
+                await queue.put((index, page))
+                index += 1
+            await queue.put(done)
+        except Exception as e:
+            await queue.put(e)
+
+    producer = loop.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        producer.cancel()
+        if decoding and not decoding[0].done():
+            # The worker thread is still inside next(); close the pages, and
+            # with them the file they are read from, once that call returns
+            decoding[0].add_done_callback(lambda _: pages.close())
+        else:
+            pages.close()
@@ -0,0 +1,186 @@
+import asyncio
+import functools
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from ..core.config import settings
+from .metrics import QUEUE_WAIT_SECONDS
+
+
+class InferenceQueueFull(Exception):
+    """Raised when the inference queue cannot admit more work"""
+
+    def __init__(self, message: str = "Inference queue is full", retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.retry_after = retry_after if retry_after is not None else settings.INFERENCE_RETRY_AFTER
+
+
+# Services created inside process-pool workers, one per (class, init kwargs)
+_worker_services: Dict[Tuple[type, Tuple], Any] = {}
+
+
+def _call_in_worker(service_cls: type, init_kwargs: Dict[str, Any], method: str, args: Tuple) -> Any:
+    """Run a service method inside a worker process, loading the model on first use"""
+    key = (service_cls, tuple(sorted(init_kwargs.items())))
+    service = _worker_services.get(key)
+    if service is None:
+        service = service_cls(**init_kwargs)
+        service._load_model_sync()
+        _worker_services[key] = service
+    return getattr(service, method)(*args)
+
+
+def _waited(enqueued: float, fn: Callable, *args, **kwargs) -> Tuple[float, Any]:
+    """Run ``fn``, returning how long the call waited for a worker and its result"""
+    # The monotonic clock is shared by the worker processes of one host
+    return time.monotonic() - enqueued, fn(*args, **kwargs)
+
+
+class InferenceExecutor:
+    """
+    Bounded worker pool for blocking model inference.
+
+    Keeps ``generate`` calls off the asyncio event loop and applies admission
+    control: at most ``max_workers`` jobs run and ``max_queue`` more may wait.
+    Anything beyond that is rejected with ``InferenceQueueFull`` instead of
+    piling up.
+
+    With ``kind="thread"`` the workers share the weights loaded in this process
+    (torch releases the GIL while generating). With ``kind="process"`` every
+    worker process loads its own copy of each model it is asked to run.
+    """
+
+    def __init__(
+        self,
+        kind: str = "thread",
+        max_workers: int = 1,
+        max_queue: int = 8,
+        retry_after: Optional[int] = None
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind '{kind}'. Use 'thread' or 'process'")
+        self.kind = kind
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.retry_after = retry_after if retry_after is not None else settings.INFERENCE_RETRY_AFTER
+        self._pool: Optional[Executor] = None
+        # Slots are released from the pool's done callbacks, on worker threads
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+
+    @classmethod
+    def from_settings(cls) -> "InferenceExecutor":
+        return cls(
+            kind=settings.INFERENCE_EXECUTOR,
+            max_workers=settings.INFERENCE_WORKERS,
+            max_queue=settings.INFERENCE_MAX_QUEUE,
+            retry_after=settings.INFERENCE_RETRY_AFTER
+        )
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.kind == "process":
+                # spawn, not fork: forked children cannot reuse the parent's CUDA context
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="inference"
+                )
+        return self._pool
+
+    def _tracked(self, fn: Callable, *args, **kwargs) -> Any:
+        self._running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._running -= 1
+
+    def _release(self, future: Future):
+        with self._lock:
+            self._pending -= 1
+            if not future.cancelled():
+                self._completed += 1
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run a blocking callable in the pool, or raise InferenceQueueFull.
+        The slot is held until the pooled call ends, not until the caller
+        stops waiting: a cancelled caller's call keeps running or stays
+        queued in the pool and still counts against the bound.
+        """
+        with self._lock:
+            if self._pending >= self.capacity:
+                self._rejected += 1
+                raise InferenceQueueFull(
+                    f"Inference queue is full ({self._pending} jobs pending)",
+                    retry_after=self.retry_after
+                )
+            self._pending += 1
+
+        if self.kind == "process":
+            call = functools.partial(_waited, time.monotonic(), fn, *args, **kwargs)
+        else:
+            call = functools.partial(self._tracked, _waited, time.monotonic(), fn, *args, **kwargs)
+        try:
+            future = self._get_pool().submit(call)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._release)
+        # Cancelling the caller cancels the call too while it is still queued
+        waited, result = await asyncio.wrap_future(future)
+        QUEUE_WAIT_SECONDS.labels(queue="inference").observe(waited)
+        return result
+
+    async def run_service(self, service: Any, method: str, *args) -> Any:
+        """
+        Run a synchronous service method in the pool.
+        In process mode the call is re-dispatched to a copy of the service
+        living in the worker process, built from ``service.init_kwargs``.
+        """
+        if self.kind == "process":
+            return await self.run(_call_in_worker, type(service), service.init_kwargs, method, args)
+        return await self.run(getattr(service, method), *args)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            "running": self._running if self.kind == "thread" else min(self._pending, self.max_workers),
+            "queued": max(0, self._pending - self.max_workers),
+            "completed": self._completed,
+            "rejected": self._rejected,
+        }
+
+    def shutdown(self, wait: bool = False):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+
+
+_default_executor: Optional[InferenceExecutor] = None
+
+
+def get_default_executor() -> InferenceExecutor:
+    """Executor shared by services that were not given one explicitly"""
+    global _default_executor
+    if _default_executor is None:
+        _default_executor = InferenceExecutor.from_settings()
+    return _default_executor
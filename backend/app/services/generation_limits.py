@@ -0,0 +1,125 @@
+import math
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import torch
+from transformers import StoppingCriteria
+
+from ..core.config import settings
+from .layout import TextBlock
+
+
+def token_budget(estimated_tokens: float, limit: int, minimum: int = 1) -> int:
+    """
+    max_new_tokens for an output estimated at ``estimated_tokens``: with
+    GENERATION_BUDGET_MARGIN and GENERATION_BUDGET_EXTRA tokens of headroom,
+    at least ``minimum`` and at most ``limit``.
+    """
+    budget = math.ceil(estimated_tokens * settings.GENERATION_BUDGET_MARGIN) + settings.GENERATION_BUDGET_EXTRA
+    return max(1, minimum, min(limit, budget))
+
+
+def image_text_tokens(blocks: Iterable[TextBlock]) -> float:
+    """Tokens of the text of segmented blocks, from their estimated characters plus a line break per line"""
+    blocks = list(blocks)
+    characters = sum(block.characters for block in blocks)
+    lines = sum(block.lines for block in blocks)
+    return characters * settings.PHI3_TOKENS_PER_CHAR + lines
+
+
+class GenerationStop(StoppingCriteria):
+    """
+    Per-row stopping criteria for generate and speculative_generate. A row
+    stops once it has produced its own token budget, so the rows of a batch
+    sized for different pages stop separately, or once its last tokens
+    repeat one span of at most ``max_period`` tokens at least
+    ``min_repeats`` times and over at least ``min_tokens`` tokens: a model
+    stuck in a loop or emitting the same token over and over.
+
+    ``finish`` tells why each row stopped and how many of its generated
+    tokens to keep, which drops the repeats of a loop.
+    """
+
+    def __init__(
+        self,
+        prompt_length: int,
+        budgets: List[int],
+        max_period: Optional[int] = None,
+        min_tokens: Optional[int] = None,
+        min_repeats: int = 4
+    ):
+        self.prompt_length = prompt_length
+        self.budgets = budgets
+        self.max_period = settings.REPETITION_MAX_PERIOD if max_period is None else max_period
+        self.min_tokens = settings.REPETITION_MIN_TOKENS if min_tokens is None else min_tokens
+        self.min_repeats = min_repeats
+        # Per row: (generated length, period, span) when a loop was first seen
+        self.loops: List[Optional[Tuple[int, int, int]]] = [None] * len(budgets)
+        self._budgets: Optional[torch.Tensor] = None
+
+    def _span(self, period: int) -> int:
+        return period * max(self.min_repeats, math.ceil(self.min_tokens / period))
+
+    def __call__(self, input_ids, scores, **kwargs) -> torch.BoolTensor:
+        generated = input_ids[:, self.prompt_length:]
+        length = generated.shape[1]
+        if self._budgets is None:
+            self._budgets = torch.tensor(self.budgets, device=input_ids.device)
+        done = self._budgets <= length
+
+        periods, looping = [], []
+        for period in range(1, self.max_period + 1):
+            span = self._span(period)
+            if span > length:
+                continue
+            tail = generated[:, -span:]
+            periods.append(period)
+            looping.append((tail[:, period:] == tail[:, :-period]).all(dim=1))
+        if looping:
+            # One device sync per step; shorter periods win
+            for index, rows in enumerate(torch.stack(looping).tolist()):
+                for row, found in enumerate(rows):
+                    if found and self.loops[row] is None:
+                        self.loops[row] = (length, periods[index], self._span(periods[index]))
+        for row, loop in enumerate(self.loops):
+            if loop is not None:
+                done[row] = True
+        return done
+
+    def finish(self, sequences: torch.Tensor, eos_token_ids: Iterable[int] = ()) -> List[Dict[str, Any]]:
+        """
+        Why each row of ``sequences`` (the output of generate) stopped:
+        "eos", "repetition", "length" (its budget ran out, so its text may be
+        cut off) or "stopped" (another criterion, e.g. a cancelled stream).
+        Returns per row the stop reason, whether the text is truncated, the
+        number of generated tokens and ``keep``, the generated tokens to keep.
+        """
+        eos = set(eos_token_ids)
+        rows = []
+        for row, tokens in enumerate(sequences[:, self.prompt_length:].tolist()):
+            # Earliest stop wins; on a tie, in this order
+            candidates = []
+            end_of_sequence = next((index for index, token in enumerate(tokens) if token in eos), None)
+            if end_of_sequence is not None:
+                candidates.append((end_of_sequence + 1, "eos"))
+            loop = self.loops[row]
+            if loop is not None:
+                candidates.append((loop[0], "repetition"))
+            if self.budgets[row] <= len(tokens):
+                candidates.append((self.budgets[row], "length"))
+            end, reason = min(candidates, key=lambda candidate: candidate[0]) if candidates else (len(tokens), "stopped")
+
+            keep = end
+            if reason == "repetition":
+                # Keep the first round of the loop, wherever it started
+                _, period, span = loop
+                start = end - span
+                while start > 0 and tokens[start - 1] == tokens[start - 1 + period]:
+                    start -= 1
+                keep = start + period
+            rows.append({
+                "stop_reason": reason,
+                "truncated": reason == "length",
+                "generated_tokens": end,
+                "keep": keep,
+            })
+        return rows
@@ -0,0 +1,576 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from .executor import InferenceQueueFull
+
+logger = logging.getLogger(__name__)
+
+# Task states; a job's state is derived from the states of its tasks
+UPLOADING = "uploading"
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+TERMINAL_STATES = (COMPLETED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a running task once its job has been cancelled"""
+
+
+class JobStore(ABC):
+    """
+    Persistent queue of OCR jobs. Every uploaded file is one task of its job.
+    Subclass this to back the queue with something other than SQLite.
+    """
+
+    @abstractmethod
+    def create_job(self, tenant: str, priority: int, params: Dict[str, Any]) -> str:
+        """Create a job without files; none of its tasks run before ``queue_job``"""
+
+    @abstractmethod
+    def add_file(self, job_id: str, position: int, filename: str, data: bytes):
+        """Store one uploaded file of a job created by ``create_job`` as its task"""
+
+    @abstractmethod
+    def queue_job(self, job_id: str):
+        """Make the tasks of a job whose files are all stored runnable"""
+
+    @abstractmethod
+    def discard_job(self, job_id: str):
+        """Delete a job whose upload did not complete, with the files stored so far"""
+
+    @abstractmethod
+    def claim_task(self, now: float) -> Optional[Dict[str, Any]]:
+        """Mark the next runnable task as running and return it with its payload"""
+
+    @abstractmethod
+    def update_progress(self, task_id: int, pages_done: int, pages_total: Optional[int]):
+        pass
+
+    @abstractmethod
+    def complete_task(self, task_id: int, result: Dict[str, Any]):
+        pass
+
+    @abstractmethod
+    def fail_task(self, task_id: int, error: str, retry_at: Optional[float], count_attempt: bool = True):
+        """Requeue the task at ``retry_at``, or mark it failed when retry_at is None"""
+
+    @abstractmethod
+    def cancel_task(self, task_id: int):
+        pass
+
+    @abstractmethod
+    def cancel_job(self, job_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def is_cancelled(self, job_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def get_job(self, job_id: str, results: bool = True) -> Optional[Dict[str, Any]]:
+        """The job and its tasks, without the tasks' results when ``results`` is False"""
+
+    @abstractmethod
+    def requeue_running(self) -> int:
+        """
+        Return tasks left running by a previous process to the queue and drop
+        the jobs it did not finish uploading
+        """
+
+    @abstractmethod
+    def next_retry_at(self) -> Optional[float]:
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteJobStore(JobStore):
+    """Job queue kept in a SQLite file, so queued work survives restarts"""
+
+    def __init__(self, path: str):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                tenant TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                params TEXT NOT NULL,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL REFERENCES jobs(id),
+                tenant TEXT NOT NULL DEFAULT '',
+                priority INTEGER NOT NULL DEFAULT 0,
+                position INTEGER NOT NULL,
+                filename TEXT,
+                payload BLOB,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                pages_done INTEGER NOT NULL DEFAULT 0,
+                pages_total INTEGER,
+                result TEXT,
+                error TEXT,
+                updated REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS tasks_runnable ON tasks (status, next_attempt_at);
+            CREATE INDEX IF NOT EXISTS tasks_job ON tasks (job_id);
+            CREATE TABLE IF NOT EXISTS tenants (
+                tenant TEXT PRIMARY KEY,
+                last_served REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS tenants_served ON tenants (last_served);
+        """)
+        self._migrate()
+        # claim_task walks this index instead of sorting the queue
+        self._db.execute("CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (status, priority, tenant, id)")
+        self._db.commit()
+
+    def _migrate(self):
+        """Copy each job's tenant and priority onto its tasks in stores made before they were"""
+        columns = {row["name"] for row in self._db.execute("PRAGMA table_info(tasks)")}
+        if "priority" in columns:
+            return
+        self._db.executescript("""
+            ALTER TABLE tasks ADD COLUMN tenant TEXT NOT NULL DEFAULT '';
+            ALTER TABLE tasks ADD COLUMN priority INTEGER NOT NULL DEFAULT 0;
+            UPDATE tasks SET
+                tenant = (SELECT tenant FROM jobs WHERE jobs.id = tasks.job_id),
+                priority = (SELECT priority FROM jobs WHERE jobs.id = tasks.job_id);
+            INSERT OR IGNORE INTO tenants (tenant, last_served) SELECT DISTINCT tenant, 0 FROM jobs;
+        """)
+
+    def create_job(self, tenant, priority, params):
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, tenant, priority, params, created) VALUES (?, ?, ?, ?, ?)",
+                (job_id, tenant, priority, json.dumps(params), time.time())
+            )
+            # Tenants not served yet go first among those of their priority
+            self._db.execute("INSERT OR IGNORE INTO tenants (tenant, last_served) VALUES (?, 0)", (tenant,))
+            self._db.commit()
+        return job_id
+
+    def add_file(self, job_id, position, filename, data):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO tasks (job_id, tenant, priority, position, filename, payload, status, "
+                "next_attempt_at, updated) "
+                "SELECT id, tenant, priority, ?, ?, ?, ?, ?, ? FROM jobs WHERE id = ?",
+                (position, filename, sqlite3.Binary(data), UPLOADING, now, now, job_id)
+            )
+            self._db.commit()
+
+    def queue_job(self, job_id):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE tasks SET status = ?, next_attempt_at = ?, updated = ? WHERE job_id = ? AND status = ?",
+                (QUEUED, now, now, job_id, UPLOADING)
+            )
+            self._db.commit()
+
+    def discard_job(self, job_id):
+        with self._lock:
+            self._db.execute("DELETE FROM tasks WHERE job_id = ?", (job_id,))
+            self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self._db.commit()
+
+    def claim_task(self, now):
+        runnable = (
+            "status = ? AND next_attempt_at <= ? AND NOT EXISTS "
+            "(SELECT 1 FROM jobs WHERE jobs.id = tasks.job_id AND jobs.cancel_requested)"
+        )
+        with self._lock:
+            # Highest priority first; within a priority, the tenant served longest
+            # ago goes next so one tenant's burst cannot starve the others. Each
+            # step reads one task per tenant through tasks_claim instead of
+            # sorting the whole queue.
+            top = self._db.execute(
+                f"SELECT priority FROM tasks INDEXED BY tasks_claim WHERE {runnable} "
+                "ORDER BY priority DESC LIMIT 1",
+                (QUEUED, now)
+            ).fetchone()
+            if top is None:
+                return None
+            row = self._db.execute(f"""
+                SELECT t.id, t.job_id, t.position, t.filename, t.payload, t.attempts,
+                       t.tenant, j.params
+                FROM tenants n
+                JOIN tasks t ON t.id = (
+                    SELECT id FROM tasks INDEXED BY tasks_claim
+                    WHERE priority = ? AND tenant = n.tenant AND {runnable}
+                    ORDER BY id LIMIT 1
+                )
+                JOIN jobs j ON j.id = t.job_id
+                ORDER BY n.last_served, t.id
+                LIMIT 1
+            """, (top["priority"], QUEUED, now)).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE tasks SET status = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                (RUNNING, now, row["id"])
+            )
+            self._db.execute(
+                "INSERT INTO tenants (tenant, last_served) VALUES (?, ?) "
+                "ON CONFLICT(tenant) DO UPDATE SET last_served = excluded.last_served",
+                (row["tenant"], now)
+            )
+            self._db.commit()
+        task = dict(row)
+        task["params"] = json.loads(task["params"])
+        task["attempts"] += 1
+        return task
+
+    def update_progress(self, task_id, pages_done, pages_total):
+        with self._lock:
+            self._db.execute(
+                "UPDATE tasks SET pages_done = ?, pages_total = ?, updated = ? WHERE id = ?",
+                (pages_done, pages_total, time.time(), task_id)
+            )
+            self._db.commit()
+
+    def complete_task(self, task_id, result):
+        with self._lock:
+            # The payload is no longer needed once the result is stored
+            self._db.execute(
+                "UPDATE tasks SET status = ?, result = ?, error = NULL, payload = NULL, updated = ? WHERE id = ?",
+                (COMPLETED, json.dumps(result), time.time(), task_id)
+            )
+            self._db.commit()
+
+    def fail_task(self, task_id, error, retry_at, count_attempt=True):
+        with self._lock:
+            if retry_at is None:
+                self._db.execute(
+                    "UPDATE tasks SET status = ?, error = ?, payload = NULL, updated = ? WHERE id = ?",
+                    (FAILED, error, time.time(), task_id)
+                )
+            else:
+                self._db.execute(
+                    "UPDATE tasks SET status = ?, error = ?, next_attempt_at = ?, "
+                    "attempts = attempts - ?, updated = ? WHERE id = ?",
+                    (QUEUED, error, retry_at, 0 if count_attempt else 1, time.time(), task_id)
+                )
+            self._db.commit()
+
+    def cancel_task(self, task_id):
+        with self._lock:
+            self._db.execute(
+                "UPDATE tasks SET status = ?, payload = NULL, updated = ? WHERE id = ?",
+                (CANCELLED, time.time(), task_id)
+            )
+            self._db.commit()
+
+    def cancel_job(self, job_id):
+        with self._lock:
+            cursor = self._db.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            if cursor.rowcount == 0:
+                return False
+            # Running tasks notice the flag at their next progress update
+            self._db.execute(
+                "UPDATE tasks SET status = ?, payload = NULL, updated = ? WHERE job_id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED)
+            )
+            self._db.commit()
+            return True
+
+    def is_cancelled(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def get_job(self, job_id, results=True):
+        columns = "id, position, filename, status, attempts, pages_done, pages_total, error"
+        if results:
+            columns += ", result"
+        with self._lock:
+            job = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            tasks = self._db.execute(
+                f"SELECT {columns} FROM tasks WHERE job_id = ? ORDER BY position", (job_id,)
+            ).fetchall()
+        return _describe_job(dict(job), [dict(task) for task in tasks])
+
+    def requeue_running(self):
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE tasks SET status = ?, next_attempt_at = ?, updated = ? WHERE status = ?",
+                (QUEUED, time.time(), time.time(), RUNNING)
+            )
+            uploading = "SELECT job_id FROM tasks WHERE status = ?"
+            self._db.execute(
+                f"DELETE FROM jobs WHERE id IN ({uploading}) OR id NOT IN (SELECT job_id FROM tasks)", (UPLOADING,)
+            )
+            self._db.execute(f"DELETE FROM tasks WHERE job_id IN ({uploading})", (UPLOADING,))
+            self._db.commit()
+            return cursor.rowcount
+
+    def next_retry_at(self):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT MIN(next_attempt_at) AS at FROM tasks WHERE status = ?", (QUEUED,)
+            ).fetchone()
+        return row["at"] if row else None
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _describe_job(job: Dict[str, Any], tasks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    states = [task["status"] for task in tasks]
+    if job["cancel_requested"]:
+        status = CANCELLED
+    elif all(state == QUEUED for state in states):
+        status = QUEUED
+    elif all(state in TERMINAL_STATES for state in states):
+        status = FAILED if all(state == FAILED for state in states) else COMPLETED
+    else:
+        status = RUNNING
+
+    pages_done = sum(task["pages_done"] for task in tasks)
+    known_totals = [task["pages_total"] for task in tasks if task["pages_total"] is not None]
+    return {
+        "job_id": job["id"],
+        "tenant": job["tenant"],
+        "priority": job["priority"],
+        "status": status,
+        "created": job["created"],
+        "tasks_total": len(tasks),
+        "tasks_done": sum(state in TERMINAL_STATES for state in states),
+        "pages_done": pages_done,
+        "pages_total": sum(known_totals) if len(known_totals) == len(tasks) else None,
+        "tasks": [_describe_task(task) for task in tasks],
+    }
+
+
+def _describe_task(task: Dict[str, Any]) -> Dict[str, Any]:
+    described = {
+        "position": task["position"],
+        "filename": task["filename"],
+        "status": task["status"],
+        "attempts": task["attempts"],
+        "pages_done": task["pages_done"],
+        "pages_total": task["pages_total"],
+    }
+    if "result" in task:
+        described["result"] = json.loads(task["result"]) if task["result"] else None
+    described["error"] = task["error"]
+    return described
+
+
+# Reports a task's progress: (pages_done, pages_total, result of the page just done)
+ProgressCallback = Callable[[int, Optional[int], Optional[Dict[str, Any]]], Awaitable[None]]
+
+# Processes one task: receives the claimed task and a progress callback,
+# and returns the task's JSON result
+TaskProcessor = Callable[[Dict[str, Any], ProgressCallback], Awaitable[Dict[str, Any]]]
+
+
+class JobManager:
+    """
+    Runs queued job tasks on a fixed number of asyncio workers and publishes
+    job updates to subscribers (e.g. WebSocket clients).
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        processor: TaskProcessor,
+        workers: int = 1,
+        max_attempts: int = 3,
+        retry_backoff: float = 2.0,
+        poll_interval: float = 1.0
+    ):
+        """
+        Args:
+            store (JobStore): Persistent queue backend.
+            processor: Coroutine function running one task.
+            workers (int): Number of tasks processed concurrently.
+            max_attempts (int): Attempts per task before it is marked failed.
+            retry_backoff (float): Delay before the first retry, doubled per attempt.
+            poll_interval (float): Longest idle wait between queue checks.
+        """
+        self.store = store
+        self.processor = processor
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_backoff = retry_backoff
+        self.poll_interval = poll_interval
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    async def start(self, process_tasks: bool = True):
+        """
+        Args:
+            process_tasks (bool): Run queued tasks in this process. Other
+                processes sharing the store (pre-fork workers) only accept jobs
+                and poll the store for the updates of subscribed jobs.
+        """
+        self._wakeup = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        if not process_tasks:
+            self._tasks = [loop.create_task(self._watch())]
+            return
+        requeued = await asyncio.to_thread(self.store.requeue_running)
+        if requeued:
+            logger.info(f"Requeued {requeued} job tasks interrupted by a restart")
+        self._tasks = [loop.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.store.close()
+
+    async def submit(
+        self,
+        files: AsyncIterator[Tuple[str, bytes]],
+        params: Dict[str, Any],
+        tenant: str = "default",
+        priority: int = 0
+    ) -> Dict[str, Any]:
+        """
+        Queue a job for the (filename, content) pairs of ``files``. Each file
+        is stored as soon as it is read, so only one is held in memory; none
+        of them runs unless all are stored.
+        """
+        job_id = await asyncio.to_thread(self.store.create_job, tenant, priority, params)
+        try:
+            position = 0
+            async for filename, data in files:
+                await asyncio.to_thread(self.store.add_file, job_id, position, filename, data)
+                position += 1
+        except BaseException:
+            await asyncio.to_thread(self.store.discard_job, job_id)
+            raise
+        await asyncio.to_thread(self.store.queue_job, job_id)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return await self.get(job_id)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.get_job, job_id)
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if not await asyncio.to_thread(self.store.cancel_job, job_id):
+            return None
+        await self._publish(job_id)
+        return await self.get(job_id)
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(job_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[job_id]
+
+    async def _publish(self, job_id: str, page: Optional[Dict[str, Any]] = None):
+        """
+        Send subscribers the job's state without the results of its tasks,
+        plus ``page``, the result of the page just done, if any
+        """
+        if job_id not in self._subscribers:
+            return
+        job = await asyncio.to_thread(self.store.get_job, job_id, False)
+        if page is not None:
+            job["page"] = page
+        for queue in list(self._subscribers.get(job_id, ())):
+            queue.put_nowait(job)
+
+    async def _watch(self):
+        """Publish the state of the subscribed jobs that another process updated"""
+        last: Dict[str, Any] = {}
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            for job_id in list(self._subscribers):
+                job = await asyncio.to_thread(self.store.get_job, job_id, False)
+                if job != last.get(job_id):
+                    last[job_id] = job
+                    for queue in list(self._subscribers.get(job_id, ())):
+                        queue.put_nowait(job)
+            last = {job_id: job for job_id, job in last.items() if job_id in self._subscribers}
+
+    async def _idle(self):
+        timeout = self.poll_interval
+        retry_at = await asyncio.to_thread(self.store.next_retry_at)
+        if retry_at is not None:
+            timeout = min(timeout, max(0.0, retry_at - time.time()))
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _work(self):
+        while True:
+            task = await asyncio.to_thread(self.store.claim_task, time.time())
+            if task is None:
+                await self._idle()
+                continue
+            await self._run(task)
+
+    async def _run(self, task: Dict[str, Any]):
+        job_id = task["job_id"]
+
+        async def progress(pages_done: int, pages_total: Optional[int], result: Optional[Dict[str, Any]] = None):
+            await asyncio.to_thread(self.store.update_progress, task["id"], pages_done, pages_total)
+            page = None
+            if result is not None:
+                page = {"position": task["position"], "page": pages_done, "result": result}
+            await self._publish(job_id, page)
+            if await asyncio.to_thread(self.store.is_cancelled, job_id):
+                raise JobCancelled()
+
+        await self._publish(job_id)
+        try:
+            result = await self.processor(task, progress)
+            await asyncio.to_thread(self.store.complete_task, task["id"], result)
+        except JobCancelled:
+            await asyncio.to_thread(self.store.cancel_task, task["id"])
+        except InferenceQueueFull as e:
+            # Back-pressure from the inference pool is not the task's fault
+            await asyncio.to_thread(
+                self.store.fail_task, task["id"], str(e), time.time() + e.retry_after, False
+            )
+        except Exception as e:
+            retry_at = None
+            if task["attempts"] < self.max_attempts:
+                retry_at = time.time() + self.retry_backoff * 2 ** (task["attempts"] - 1)
+            logger.warning(f"Job {job_id} task {task['position']} failed (attempt {task['attempts']}): {str(e)}")
+            await asyncio.to_thread(self.store.fail_task, task["id"], str(e), retry_at)
+        await self._publish(job_id)
@@ -0,0 +1,233 @@
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from ..core.config import settings
+from .preprocessing import _gray, _otsu_threshold
+
+
+class TextBlock(NamedTuple):
+    # (left, top, right, bottom) in pixels of the segmented image
+    box: Tuple[int, int, int, int]
+    lines: int
+    # Estimated from the width of the lines: a character is about half a line high
+    characters: int
+
+
+class PageLayout(NamedTuple):
+    blocks: List[TextBlock]
+    line_height: float
+    segment_ms: float
+
+
+def _runs(mask: np.ndarray) -> np.ndarray:
+    """(start, end) pairs of the runs of True in a 1-D boolean array"""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return edges.reshape(-1, 2)
+
+
+def _cuts(ink: np.ndarray, min_gap: float) -> List[Tuple[int, int]]:
+    """
+    Spans of ``ink`` (a profile that is True where there is ink) separated by
+    blank gaps of at least ``min_gap``; blank edges are trimmed.
+    """
+    runs = _runs(ink)
+    if len(runs) == 0:
+        return []
+    spans = [[int(runs[0][0]), int(runs[0][1])]]
+    for start, end in runs[1:]:
+        if start - spans[-1][1] >= min_gap:
+            spans.append([int(start), int(end)])
+        else:
+            spans[-1][1] = int(end)
+    return [(start, end) for start, end in spans]
+
+
+def _widest_gap(spans: List[Tuple[int, int]]) -> Optional[Tuple[int, int]]:
+    """Width of the widest gap between consecutive spans, and the index of the span before it"""
+    if len(spans) < 2:
+        return None
+    widths = [spans[index + 1][0] - spans[index][1] for index in range(len(spans) - 1)]
+    index = int(np.argmax(widths))
+    return widths[index], index
+
+
+class _Segmenter:
+    """Recursive XY-cut of a binarized page along the blank gaps of its projection profiles"""
+
+    def __init__(self, dark: np.ndarray, line_height: float, column_gap: float, block_gap: float, max_characters: int):
+        self.dark = dark
+        self.line_height = line_height
+        self.column_gap = column_gap
+        self.block_gap = block_gap
+        self.max_characters = max_characters
+        # A stray speck does not make a row or column count as ink
+        self.noise = 1
+        self.groups = 0
+        # (left, top, right, bottom, group, lines, characters) in reading order
+        self.leaves: List[List[int]] = []
+
+    def _profile(self, region: np.ndarray, axis: int) -> np.ndarray:
+        return region.sum(axis=axis) > self.noise
+
+    def cut(self, top: int, bottom: int, left: int, right: int, group: int = 0, depth: int = 0):
+        region = self.dark[top:bottom, left:right]
+        rows = _runs(self._profile(region, 1))
+        cols = _runs(self._profile(region, 0))
+        if len(rows) == 0 or len(cols) == 0:
+            return
+        # Trim the blank margins of the region
+        top, bottom = top + int(rows[0][0]), top + int(rows[-1][1])
+        left, right = left + int(cols[0][0]), left + int(cols[-1][1])
+        region = self.dark[top:bottom, left:right]
+        if depth >= 64:
+            self._add_leaf(top, bottom, left, right, group)
+            return
+
+        # One cut at a time, along the widest gap relative to its threshold. A
+        # heading is set further apart than the paragraphs under it, so it is
+        # cut off before the columns below are split, even when it leaves some
+        # of their gutters clear
+        columns = _cuts(self._profile(region, 0), self.column_gap)
+        blocks = _cuts(self._profile(region, 1), self.block_gap)
+        column_gap, block_gap = _widest_gap(columns), _widest_gap(blocks)
+        if column_gap and (not block_gap or column_gap[0] / self.column_gap >= block_gap[0] / self.block_gap):
+            index = column_gap[1]
+            for start, end in ((0, columns[index][1]), (columns[index + 1][0], right - left)):
+                self.groups += 1
+                self.cut(top, bottom, left + start, left + end, self.groups, depth + 1)
+        elif block_gap:
+            # Blocks of one column stay in its group, so they may be joined again
+            index = block_gap[1]
+            self.cut(top, top + blocks[index][1], left, right, group, depth + 1)
+            self.cut(top + blocks[index + 1][0], bottom, left, right, group, depth + 1)
+        else:
+            self._add_leaf(top, bottom, left, right, group)
+
+    def _add_leaf(self, top: int, bottom: int, left: int, right: int, group: int):
+        """Add a block, split between text lines when it has more than max_characters"""
+        region = self.dark[top:bottom, left:right]
+        chunk: List[int] = []
+        for start, end in _cuts(self._profile(region, 1), max(1.0, self.line_height * 0.15)):
+            ink = np.flatnonzero(region[start:end].any(axis=0))
+            characters = int(np.ceil((ink[-1] + 1 - ink[0]) / (0.5 * self.line_height))) if len(ink) else 0
+            if chunk and chunk[6] + characters > self.max_characters:
+                self.leaves.append(chunk)
+                chunk = []
+            if not chunk:
+                chunk = [left, top + start, right, top + end, group, 0, 0]
+            chunk[3] = top + end
+            chunk[5] += 1
+            chunk[6] += characters
+        if chunk:
+            self.leaves.append(chunk)
+
+
+def _line_height(dark: np.ndarray, strips: int = 8) -> float:
+    """
+    Median height of a text line: of the ink runs of the row profiles of
+    narrow vertical strips, so lines of side-by-side columns do not merge.
+    """
+    width = max(1, dark.shape[1] // strips)
+    heights = []
+    for left in range(0, dark.shape[1], width):
+        runs = _runs(dark[:, left:left + width].sum(axis=1) > 1)
+        heights.extend(runs[:, 1] - runs[:, 0])
+    return float(np.median(heights)) if heights else 0.0
+
+
+def _merge(leaves: List[List[int]], max_characters: int) -> List[List[int]]:
+    """
+    Join consecutive leaves of the same column while the result keeps at most
+    ``max_characters``, so short paragraphs and headings do not each cost a
+    model call.
+    """
+    merged: List[List[int]] = []
+    for left, top, right, bottom, group, lines, characters in leaves:
+        previous = merged[-1] if merged else None
+        if previous is not None and previous[4] == group and previous[6] + characters <= max_characters:
+            previous[0], previous[1] = min(previous[0], left), min(previous[1], top)
+            previous[2], previous[3] = max(previous[2], right), max(previous[3], bottom)
+            previous[5] += lines
+            previous[6] += characters
+        else:
+            merged.append([left, top, right, bottom, group, lines, characters])
+    return merged
+
+
+def segment_page(
+    image: Image.Image,
+    max_characters: Optional[int] = None,
+    work_width: Optional[int] = None
+) -> PageLayout:
+    """
+    Split a page into text blocks in reading order: columns from left to
+    right, and within a column blocks from top to bottom.
+
+    The page is binarized at ``work_width`` pixels wide and cut recursively
+    along blank gaps of its row and column ink profiles: gaps wider than
+    LAYOUT_COLUMN_GAP text-line heights separate columns, gaps taller than
+    LAYOUT_BLOCK_GAP line heights separate blocks. Blocks estimated to hold
+    more than ``max_characters`` are split between lines, and consecutive
+    small blocks of a column are joined up to that size.
+    Args:
+        image: Page to segment.
+        max_characters (int): Most characters per block. Defaults to LAYOUT_MAX_BLOCK_CHARS.
+        work_width (int): Width the page is binarized at. Defaults to LAYOUT_WORK_WIDTH.
+    Returns:
+        PageLayout with the blocks, in the pixel coordinates of ``image``, the
+        median text-line height and the segmentation time.
+    """
+    max_characters = max_characters or settings.LAYOUT_MAX_BLOCK_CHARS
+    work_width = work_width or settings.LAYOUT_WORK_WIDTH
+    started = time.perf_counter()
+
+    gray = _gray(image)
+    scale = 1.0
+    if gray.width > work_width:
+        scale = gray.width / work_width
+        gray = gray.resize((work_width, max(1, round(gray.height / scale))), Image.Resampling.BILINEAR)
+    # Otsu's threshold is the darkest level of the lighter class
+    dark = np.asarray(gray) <= _otsu_threshold(gray.histogram())
+    # Ink covers a small part of a page; when most of it is dark the page is
+    # light text on a dark background
+    if dark.mean() > 0.5:
+        dark = ~dark
+    # Borders and lid shadows along the edges are ink in almost every row or
+    # column; they are not text
+    for axis in (0, 1):
+        solid = dark.mean(axis=axis) > 0.9
+        edge = max(1, solid.size // 20)
+        solid[edge:-edge] = False
+        if axis == 0:
+            dark[:, solid] = False
+        else:
+            dark[solid, :] = False
+
+    line_height = _line_height(dark)
+    if line_height == 0:
+        return PageLayout([], 0.0, (time.perf_counter() - started) * 1000.0)
+    segmenter = _Segmenter(
+        dark,
+        line_height,
+        column_gap=max(2.0, line_height * settings.LAYOUT_COLUMN_GAP),
+        block_gap=max(2.0, line_height * settings.LAYOUT_BLOCK_GAP),
+        max_characters=max_characters
+    )
+    segmenter.cut(0, dark.shape[0], 0, dark.shape[1])
+
+    # Leaves come out in reading order; a margin keeps glyph edges inside the crop
+    margin = line_height * 0.5
+    blocks = []
+    for left, top, right, bottom, _, lines, characters in _merge(segmenter.leaves, max_characters):
+        box = (
+            max(0, int((left - margin) * scale)),
+            max(0, int((top - margin) * scale)),
+            min(image.width, int(np.ceil((right + margin) * scale))),
+            min(image.height, int(np.ceil((bottom + margin) * scale))),
+        )
+        blocks.append(TextBlock(box, lines, characters))
+    return PageLayout(blocks, line_height * scale, (time.perf_counter() - started) * 1000.0)
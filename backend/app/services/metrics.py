@@ -0,0 +1,208 @@
+import math
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Seconds, from a fast preprocessing step to a long generation
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+
+    def labels(self, **labels: str) -> "_Metric":
+        """The series of this metric with the given label values"""
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._child())
+        return child
+
+    def clear(self):
+        """Drop every series, e.g. before a gauge is set from the current state"""
+        with self._lock:
+            self._children = {}
+
+    def _child(self) -> "_Metric":
+        raise NotImplementedError
+
+    def _render_series(self, name: str, labelnames: Sequence[str], key: Tuple[str, ...]) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(child._render_series(self.name, self.labelnames, key))
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonic count, e.g. of generated tokens or model loads"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+
+    def _child(self) -> "Counter":
+        return Counter(self.name, self.documentation)
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def _render_series(self, name: str, labelnames: Sequence[str], key: Tuple[str, ...]) -> List[str]:
+        return [f"{name}{_format_labels(labelnames, key)} {_format_value(self.value)}"]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, e.g. the number of queued requests"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+
+    def _child(self) -> "Gauge":
+        return Gauge(self.name, self.documentation)
+
+    def set(self, value: float):
+        self.value = float(value)
+
+    def _render_series(self, name: str, labelnames: Sequence[str], key: Tuple[str, ...]) -> List[str]:
+        return [f"{name}{_format_labels(labelnames, key)} {_format_value(self.value)}"]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets, with their sum and count"""
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def _child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value: float):
+        with self._lock:
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[index] += 1
+                    break
+            self.sum += value
+            self.count += 1
+
+    def _render_series(self, name: str, labelnames: Sequence[str], key: Tuple[str, ...]) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labelnames, key, ('le', _format_value(bound)))} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labelnames, key, ('le', '+Inf'))} {self.count}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, key)} {_format_value(self.sum)}")
+        lines.append(f"{name}_count{_format_labels(labelnames, key)} {self.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Process-wide metrics rendered in the Prometheus text exposition format.
+    Values are recorded on the series of a label combination, from
+    ``metric.labels(...)``, which appears once it is first used.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "ocr_stage_duration_seconds",
+    "Time spent in each stage of a request: upload_read, decode and the other preprocessing steps, "
+    "encode (processor and tokenizer), queue_wait, prefill, decode_tokens, postprocess, serialize, "
+    "and model_load when a request loads a model",
+    ["model", "stage"]
+)
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "ocr_queue_wait_seconds",
+    "Time a job waited before it started: in the Phi-3 micro-batcher or for an inference worker",
+    ["queue"]
+)
+TOKENS_PER_SECOND = REGISTRY.histogram(
+    "ocr_decode_tokens_per_second",
+    "Generated tokens per second of decoding, after the prefill",
+    ["model"],
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+)
+GENERATED_TOKENS = REGISTRY.counter("ocr_generated_tokens_total", "Tokens generated", ["model"])
+PROMPT_TOKENS = REGISTRY.counter("ocr_prompt_tokens_total", "Prompt tokens prefilled or reused from the prefix cache", ["model"])
+MODEL_LOADS = REGISTRY.counter("ocr_model_loads_total", "Model loads, by outcome", ["model", "status"])
+MODEL_UNLOADS = REGISTRY.counter("ocr_model_unloads_total", "Model unloads", ["model"])
+HTTP_REQUESTS = REGISTRY.counter("ocr_http_requests_total", "HTTP requests served", ["method", "path", "status"])
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "ocr_http_request_duration_seconds",
+    "Time to the response start of an HTTP request",
+    ["method", "path"]
+)
+INFERENCE_JOBS = REGISTRY.gauge("ocr_inference_jobs", "Jobs running on or waiting for the inference executor", ["state"])
+BATCH_QUEUE_DEPTH = REGISTRY.gauge("ocr_batch_queue_depth", "Items waiting in a micro-batcher", ["queue"])
+MODELS_LOADED = REGISTRY.gauge("ocr_models_loaded", "Loaded model instances", ["model", "device", "dtype"])
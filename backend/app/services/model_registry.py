@@ -0,0 +1,246 @@
+import asyncio
+import logging
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from ..core.config import settings
+from .executor import InferenceExecutor, get_default_executor
+from .metrics import MODEL_LOADS, MODEL_UNLOADS
+from .phi3_service import Phi3VisionService
+from .qwen_service import Qwen25Service
+from .tesseract_service import TesseractService
+from .tracing import stage
+
+logger = logging.getLogger(__name__)
+
+
+class ModelKey(NamedTuple):
+    """Identity of a loaded model instance"""
+    model_id: str
+    device: str
+    dtype: str
+
+
+# A factory builds an (unloaded) service for the requested GPU preference,
+# running its inference on the given executor
+ServiceFactory = Callable[[bool, InferenceExecutor], Any]
+
+DEFAULT_FACTORIES: Dict[str, ServiceFactory] = {
+    "phi3": lambda use_gpu, executor: Phi3VisionService(use_gpu=use_gpu, executor=executor),
+    "qwen25": lambda use_gpu, executor: Qwen25Service(use_gpu=use_gpu, executor=executor),
+    "tesseract": lambda use_gpu, executor: TesseractService(),
+}
+
+
+class ModelBusy(Exception):
+    """Raised when a model is still in use after MODEL_UNLOAD_TIMEOUT"""
+
+
+class ModelRegistry:
+    """
+    Process-wide registry of loaded model services.
+
+    Each model is loaded once per (model id, device, dtype) key and the same
+    service instance is handed out to every request that resolves to that key.
+    Services only need to expose ``model_id``, ``device``, ``dtype_name``,
+    an async ``load()`` and a synchronous ``unload()``. Requests take a
+    service with ``use()`` so that unloading it waits for them to finish.
+    """
+
+    def __init__(
+        self,
+        factories: Optional[Dict[str, ServiceFactory]] = None,
+        executor: Optional[InferenceExecutor] = None
+    ):
+        """
+        Args:
+            factories (dict): Maps a public model name (e.g. "phi3") to a factory
+                building its service. Defaults to the Phi-3 and Qwen2.5 services.
+            executor (InferenceExecutor): Bounded worker pool shared by the services.
+        """
+        self._factories = dict(factories or DEFAULT_FACTORIES)
+        self.executor = executor or get_default_executor()
+        self._services: Dict[ModelKey, Any] = {}
+        self._aliases: Dict[Tuple[str, bool], ModelKey] = {}
+        self._locks: Dict[Tuple[str, bool], asyncio.Lock] = {}
+        # Requests using each loaded instance, and the events set when that drops to 0
+        self._in_use: Dict[ModelKey, int] = {}
+        self._idle: Dict[ModelKey, asyncio.Event] = {}
+
+    @property
+    def model_names(self) -> List[str]:
+        return list(self._factories)
+
+    def _lock_for(self, alias: Tuple[str, bool]) -> asyncio.Lock:
+        if alias not in self._locks:
+            self._locks[alias] = asyncio.Lock()
+        return self._locks[alias]
+
+    def _factory_for(self, name: str) -> ServiceFactory:
+        factory = self._factories.get(name.lower())
+        if factory is None:
+            raise KeyError(f"Unknown model '{name}'. Available models: {self.model_names}")
+        return factory
+
+    @staticmethod
+    def key_for(service: Any) -> ModelKey:
+        return ModelKey(service.model_id, service.device, service.dtype_name)
+
+    async def get(self, name: str, use_gpu: bool = False) -> Any:
+        """Return the shared, loaded service for a model, loading it on first use"""
+        alias = (name.lower(), use_gpu)
+        key = self._aliases.get(alias)
+        if key is not None and key in self._services:
+            return self._services[key]
+
+        async with self._lock_for(alias):
+            key = self._aliases.get(alias)
+            if key is not None and key in self._services:
+                return self._services[key]
+
+            service = self._factory_for(name)(use_gpu, self.executor)
+            key = self.key_for(service)
+            existing = self._services.get(key)
+            if existing is not None:
+                # e.g. a GPU request on a CPU-only host resolves to the CPU instance
+                self._aliases[alias] = key
+                return existing
+
+            logger.info(f"Loading model {key.model_id} on {key.device} ({key.dtype})")
+            try:
+                with stage("model_load", name.lower()):
+                    await service.load()
+            except Exception:
+                MODEL_LOADS.labels(model=name.lower(), status="error").inc()
+                raise
+            MODEL_LOADS.labels(model=name.lower(), status="ok").inc()
+            self._services[key] = service
+            self._aliases[alias] = key
+            return service
+
+    @asynccontextmanager
+    async def use(self, name: str, use_gpu: bool = False) -> AsyncIterator[Any]:
+        """Like ``get``, with the service counted as in use until the block exits"""
+        service = await self.get(name, use_gpu=use_gpu)
+        key = self.key_for(service)
+        self._in_use[key] = self._in_use.get(key, 0) + 1
+        try:
+            yield service
+        finally:
+            self._in_use[key] -= 1
+            if not self._in_use[key]:
+                del self._in_use[key]
+                if key in self._idle:
+                    self._idle.pop(key).set()
+
+    async def _wait_idle(self, key: ModelKey, timeout: float):
+        if self._in_use.get(key):
+            event = self._idle.setdefault(key, asyncio.Event())
+            await asyncio.wait_for(event.wait(), timeout)
+
+    async def warm_up(self, names: Iterable[str], use_gpu: bool = False) -> List[ModelKey]:
+        """Eagerly load the given models, skipping (and logging) failures"""
+        loaded = []
+        for name in names:
+            try:
+                service = await self.get(name, use_gpu=use_gpu)
+                loaded.append(self.key_for(service))
+            except Exception as e:
+                logger.warning(f"Error warming up model {name}: {str(e)}")
+        return loaded
+
+    def _matching_keys(self, name: str, use_gpu: Optional[bool]) -> List[ModelKey]:
+        name = name.lower()
+        if use_gpu is not None:
+            key = self._aliases.get((name, use_gpu))
+            return [key] if key in self._services else []
+        return list({
+            key for (alias_name, _), key in self._aliases.items()
+            if alias_name == name and key in self._services
+        })
+
+    async def unload(
+        self,
+        name: str,
+        use_gpu: Optional[bool] = None,
+        timeout: Optional[float] = None
+    ) -> List[ModelKey]:
+        """
+        Unload a model and release its weights, once the requests using it
+        are done. Requests for the model arriving meanwhile wait for the
+        unload and then load it again.
+        Args:
+            name (str): Public model name
+            use_gpu (bool): Only unload the instance for this GPU preference.
+                If None, every loaded instance of the model is unloaded.
+            timeout (float): Seconds to wait for the model to be idle;
+                defaults to settings.MODEL_UNLOAD_TIMEOUT.
+        Raises:
+            ModelBusy: The model was still in use after ``timeout``; it is
+                left loaded.
+        """
+        self._factory_for(name)
+        timeout = settings.MODEL_UNLOAD_TIMEOUT if timeout is None else timeout
+        keys = self._matching_keys(name, use_gpu)
+        async with AsyncExitStack() as stack:
+            # Holding the aliases' locks keeps get() from loading a second copy
+            aliases = sorted(alias for alias, key in self._aliases.items() if key in keys)
+            for alias in aliases:
+                await stack.enter_async_context(self._lock_for(alias))
+            services = {key: self._services.pop(key) for key in keys if key in self._services}
+            try:
+                await asyncio.gather(*(self._wait_idle(key, timeout) for key in services))
+            except asyncio.TimeoutError:
+                self._services.update(services)
+                busy = ", ".join(f"{key.model_id} on {key.device}" for key in services if self._in_use.get(key))
+                raise ModelBusy(f"Model {name} is still in use ({busy}) after {timeout:g}s")
+            except BaseException:
+                self._services.update(services)
+                raise
+            unloaded = []
+            for key, service in services.items():
+                service.unload()
+                MODEL_UNLOADS.labels(model=name.lower()).inc()
+                unloaded.append(key)
+            # Drop aliases that now point to nothing
+            self._aliases = {
+                alias: key for alias, key in self._aliases.items() if key in self._services
+            }
+        return unloaded
+
+    async def reload(self, name: str, use_gpu: bool = False) -> ModelKey:
+        """Unload and load a model again, e.g. after its snapshot changed on disk"""
+        await self.unload(name, use_gpu=use_gpu)
+        service = await self.get(name, use_gpu=use_gpu)
+        return self.key_for(service)
+
+    async def unload_all(self) -> None:
+        for key in list(self._services):
+            self._services.pop(key).unload()
+        self._aliases.clear()
+
+    def loaded(self) -> List[Dict[str, Any]]:
+        """Describe the currently loaded model instances"""
+        names = {key: alias_name for (alias_name, _), key in self._aliases.items()}
+        return [
+            {
+                "name": names.get(key, key.model_id),
+                "model_id": key.model_id,
+                "device": key.device,
+                "dtype": key.dtype,
+            }
+            for key in self._services
+        ]
+
+    def services(self) -> List[Any]:
+        """The loaded services, in the order of ``loaded``"""
+        return list(self._services.values())
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Runtime statistics reported by the loaded services"""
+        stats = []
+        for entry, service in zip(self.loaded(), self._services.values()):
+            if hasattr(service, "stats"):
+                entry.update(service.stats())
+            stats.append(entry)
+        return stats
@@ -0,0 +1,133 @@
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from ..core.config import settings
+from .model_registry import ModelRegistry
+from .tracing import stage
+
+
+def skip_llm(recognized: Dict[str, Any]) -> bool:
+    """
+    Confidence gate: pages Tesseract reads confidently, and pages without any
+    text, are returned as recognized instead of going through the LLM.
+    """
+    return recognized["words"] == 0 or recognized["confidence"] >= settings.OCR_SKIP_LLM_CONFIDENCE
+
+
+async def recognize(
+    registry: ModelRegistry,
+    image: Image.Image,
+    languages: Optional[List[str]] = None
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """First stage: Tesseract's result and the stage timings"""
+    async with registry.use("tesseract") as ocr_service:
+        with stage("recognize", "tesseract"):
+            recognized = await ocr_service.process_image(image, languages)
+    timings = {
+        "ocr_ms": recognized["processing_time"] * 1000.0,
+        "ocr_confidence": recognized["confidence"],
+        "ocr_words": recognized.get("words", 0),
+    }
+    return recognized, timings
+
+
+def stage_result(
+    recognized: Dict[str, Any],
+    corrected: Optional[Dict[str, Any]],
+    timings: Dict[str, Any],
+    languages: Optional[List[str]],
+    start_time: float
+) -> Dict[str, Any]:
+    final = corrected or recognized
+    result = {
+        "text": final["text"],
+        "raw_text": recognized["text"],
+        "confidence": final["confidence"],
+        "processing_time": time.time() - start_time,
+        "languages": languages or settings.DEFAULT_OCR_LANGUAGES,
+        "timings": timings,
+        "truncated": final.get("truncated", False),
+    }
+    if "error" in final:
+        result["error"] = final["error"]
+    return result
+
+
+def qwen_use_gpu(use_gpu: bool) -> bool:
+    """GPU preference of the Qwen2.5 correction for a request's use_gpu"""
+    return use_gpu or settings.QWEN25_USE_GPU
+
+
+async def recognize_and_correct(
+    registry: ModelRegistry,
+    image: Image.Image,
+    languages: Optional[List[str]] = None,
+    use_gpu: bool = False
+) -> Dict[str, Any]:
+    """
+    Two-stage OCR: Tesseract recognizes the page on the CPU, then Qwen2.5
+    corrects the recognized text. Returns both texts and the latency of each
+    stage in ``timings``.
+    """
+    start_time = time.time()
+    recognized, timings = await recognize(registry, image, languages)
+    if "error" in recognized or skip_llm(recognized):
+        timings["llm_skipped"] = True
+        return stage_result(recognized, None, timings, languages, start_time)
+
+    return await correct(registry, recognized, timings, languages, use_gpu, start_time)
+
+
+async def correct(
+    registry: ModelRegistry,
+    recognized: Dict[str, Any],
+    timings: Dict[str, Any],
+    languages: Optional[List[str]] = None,
+    use_gpu: bool = False,
+    start_time: Optional[float] = None
+) -> Dict[str, Any]:
+    """Second stage: Qwen2.5 corrects the text recognized by Tesseract"""
+    start_time = start_time or time.time()
+    async with registry.use("qwen25", use_gpu=qwen_use_gpu(use_gpu)) as qwen_service:
+        corrected = await qwen_service.process_text(recognized["text"], languages)
+    timings = {
+        **timings,
+        "llm_skipped": False,
+        "llm_ms": corrected["processing_time"] * 1000.0,
+        **(corrected.get("timings") or {}),
+    }
+    return stage_result(recognized, corrected, timings, languages, start_time)
+
+
+async def stream_recognize_and_correct(
+    registry: ModelRegistry,
+    image: Image.Image,
+    languages: Optional[List[str]] = None,
+    use_gpu: bool = False
+) -> AsyncIterator[Dict[str, Any]]:
+    """Same as recognize_and_correct, streaming the corrected text as ``{"delta": text}`` events"""
+    start_time = time.time()
+    recognized, timings = await recognize(registry, image, languages)
+    if "error" in recognized or skip_llm(recognized):
+        timings["llm_skipped"] = True
+        if recognized["text"]:
+            yield {"delta": recognized["text"]}
+        yield stage_result(recognized, None, timings, languages, start_time)
+        return
+
+    async with registry.use("qwen25", use_gpu=qwen_use_gpu(use_gpu)) as qwen_service:
+        async for event in qwen_service.stream_text(recognized["text"], languages):
+            if "delta" in event:
+                yield event
+                continue
+            timings.update({
+                "llm_skipped": False,
+                "llm_ms": event["processing_time"] * 1000.0,
+                **(event.get("timings") or {}),
+            })
+            result = stage_result(recognized, event, timings, languages, start_time)
+            for key in ("time_to_first_token", "generated_tokens", "tokens_per_second"):
+                result[key] = event.get(key)
+            yield result
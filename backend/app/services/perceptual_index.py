@@ -0,0 +1,245 @@
+import math
+import threading
+from array import array
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+HASH_BITS = 64
+
+# Number of set bits for every 16-bit value, used for vectorized popcounts
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(1 << 16)], dtype=np.uint8)
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II matrix, so that D @ x @ D.T is the 2D DCT of x"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * math.sqrt(2.0 / n)
+    matrix[0] /= math.sqrt(2.0)
+    return matrix
+
+
+_DCT_CACHE: Dict[int, np.ndarray] = {}
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.astype(np.uint8)).tobytes(), "big")
+
+
+def _grayscale(image: Image.Image, size: Tuple[int, int]) -> np.ndarray:
+    # draft() lets the JPEG decoder downscale while decoding, which is far
+    # cheaper than decoding a full 300 DPI page and resizing afterwards
+    image.draft("L", (size[0] * 4, size[1] * 4))
+    return np.asarray(image.convert("L").resize(size, Image.LANCZOS), dtype=np.float64)
+
+
+def phash(image: Image.Image, hash_size: int = 8, highfreq_factor: int = 4) -> int:
+    """64-bit DCT perceptual hash: low-frequency coefficients above their median"""
+    size = hash_size * highfreq_factor
+    pixels = _grayscale(image, (size, size))
+    if size not in _DCT_CACHE:
+        _DCT_CACHE[size] = _dct_matrix(size)
+    dct = _DCT_CACHE[size]
+    low = (dct @ pixels @ dct.T)[:hash_size, :hash_size]
+    return _bits_to_int((low > np.median(low)).ravel())
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    """64-bit difference hash: sign of horizontal gradients on a tiny thumbnail"""
+    pixels = _grayscale(image, (hash_size + 1, hash_size))
+    return _bits_to_int((pixels[:, 1:] > pixels[:, :-1]).ravel())
+
+
+HASH_FUNCTIONS = {"phash": phash, "dhash": dhash}
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _popcount64(values: np.ndarray) -> np.ndarray:
+    return _POPCOUNT_TABLE[values.view(np.uint16)].reshape(-1, 4).sum(axis=1, dtype=np.uint8)
+
+
+class HammingIndex:
+    """
+    Multi-index hashing over 64-bit hashes.
+
+    Each hash is split into ``num_chunks`` substrings, each indexed in its own
+    table. By the pigeonhole principle, two hashes within Hamming distance r
+    agree within r // num_chunks bits on at least one substring, so a query
+    only probes the buckets at that small radius and verifies the candidates
+    with a vectorized popcount.
+    """
+
+    def __init__(self, num_chunks: int = 4):
+        if HASH_BITS % num_chunks:
+            raise ValueError(f"num_chunks must divide {HASH_BITS}")
+        self.num_chunks = num_chunks
+        self.chunk_bits = HASH_BITS // num_chunks
+        self._chunk_mask = (1 << self.chunk_bits) - 1
+        # chunk value -> compact array of entry ids, one table per chunk
+        self._tables: List[Dict[int, array]] = [{} for _ in range(num_chunks)]
+        self._hashes = np.zeros(1024, dtype=np.uint64)
+        self._payloads: List[Any] = []
+        self._entries: Dict[Tuple[int, Hashable], int] = {}
+        # Ids of removed entries, reused by the next additions
+        self._free: List[int] = []
+        self._flip_masks: Dict[int, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _chunks(self, value: int) -> List[int]:
+        return [
+            (value >> (i * self.chunk_bits)) & self._chunk_mask
+            for i in range(self.num_chunks)
+        ]
+
+    def _masks(self, radius: int) -> List[int]:
+        """All chunk-sized masks with at most ``radius`` bits set"""
+        if radius not in self._flip_masks:
+            masks = [0]
+            frontier = [0]
+            for _ in range(radius):
+                frontier = list({
+                    mask | (1 << bit)
+                    for mask in frontier
+                    for bit in range(self.chunk_bits)
+                    if not mask & (1 << bit)
+                })
+                masks.extend(frontier)
+            self._flip_masks[radius] = masks
+        return self._flip_masks[radius]
+
+    def add(self, value: int, payload: Hashable) -> int:
+        """Index a hash with its payload; re-adding the same pair is a no-op"""
+        existing = self._entries.get((value, payload))
+        if existing is not None:
+            return existing
+
+        if self._free:
+            entry_id = self._free.pop()
+            self._payloads[entry_id] = payload
+        else:
+            entry_id = len(self._payloads)
+            if entry_id == len(self._hashes):
+                self._hashes = np.concatenate([self._hashes, np.zeros_like(self._hashes)])
+            self._payloads.append(payload)
+        self._hashes[entry_id] = value
+        self._entries[(value, payload)] = entry_id
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            bucket = table.get(chunk)
+            if bucket is None:
+                bucket = table[chunk] = array("q")
+            bucket.append(entry_id)
+        return entry_id
+
+    def remove(self, value: int, payload: Hashable) -> bool:
+        """Drop a hash and payload pair; returns False when it was not indexed"""
+        entry_id = self._entries.pop((value, payload), None)
+        if entry_id is None:
+            return False
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            bucket = table[chunk]
+            bucket.remove(entry_id)
+            if not bucket:
+                del table[chunk]
+        self._payloads[entry_id] = None
+        self._free.append(entry_id)
+        return True
+
+    def query(self, value: int, max_distance: int, limit: Optional[int] = None) -> List[Tuple[int, Any]]:
+        """Return (distance, payload) pairs within ``max_distance``, nearest first"""
+        radius = max(0, max_distance) // self.num_chunks
+        masks = self._masks(radius)
+
+        candidates = array("q")
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            for mask in masks:
+                bucket = table.get(chunk ^ mask)
+                if bucket is not None:
+                    candidates += bucket
+        if not candidates:
+            return []
+
+        # An entry found through several chunks is verified more than once;
+        # that is cheaper than sorting every candidate to drop the repeats
+        ids = np.frombuffer(candidates, dtype=np.int64)
+        distances = _popcount64(self._hashes[ids] ^ np.uint64(value))
+        keep = distances <= max_distance
+        ids, first = np.unique(ids[keep], return_index=True)
+        distances = distances[keep][first]
+        order = np.argsort(distances, kind="stable")
+        if limit is not None:
+            order = order[:limit]
+        return [(int(distances[i]), self._payloads[ids[i]]) for i in order]
+
+
+class NearDuplicateIndex:
+    """
+    Perceptual-hash index of previously processed images.
+
+    Payloads are (context, result key) pairs, where the context identifies
+    everything except the image (model, languages, generation parameters), so
+    a near-identical page is only matched to results produced the same way.
+    Entries are dropped with ``discard`` once their result leaves the cache.
+    """
+
+    def __init__(self, hash_method: str = "phash", num_chunks: int = 4):
+        if hash_method not in HASH_FUNCTIONS:
+            raise ValueError(f"Unknown hash method '{hash_method}'. Use one of {list(HASH_FUNCTIONS)}")
+        self.hash_method = hash_method
+        self._hash = HASH_FUNCTIONS[hash_method]
+        self.index = HammingIndex(num_chunks=num_chunks)
+        # result key -> (image hash, context), to find the entry to discard
+        self._keys: Dict[str, Tuple[int, str]] = {}
+        # The result cache discards entries from whichever thread evicts them
+        self._lock = threading.Lock()
+        self._lookups = 0
+        self._matches = 0
+        self._discarded = 0
+
+    def hash_image(self, image: Image.Image) -> int:
+        return self._hash(image)
+
+    def add(self, image_hash: int, context: str, result_key: str):
+        with self._lock:
+            previous = self._keys.get(result_key)
+            if previous is not None and previous != (image_hash, context):
+                self.index.remove(previous[0], (previous[1], result_key))
+            self._keys[result_key] = (image_hash, context)
+            self.index.add(image_hash, (context, result_key))
+
+    def discard(self, result_key: str):
+        """Forget the image of a result that was evicted from or expired in the cache"""
+        with self._lock:
+            entry = self._keys.pop(result_key, None)
+            if entry is not None:
+                image_hash, context = entry
+                self.index.remove(image_hash, (context, result_key))
+                self._discarded += 1
+
+    def candidates(self, image_hash: int, context: str, max_distance: int) -> List[Tuple[int, str]]:
+        """Result keys of indexed images within ``max_distance`` bits, nearest first"""
+        with self._lock:
+            self._lookups += 1
+            matches = [
+                (distance, result_key)
+                for distance, (entry_context, result_key) in self.index.query(image_hash, max_distance)
+                if entry_context == context
+            ]
+            if matches:
+                self._matches += 1
+        return matches
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hash_method": self.hash_method,
+            "entries": len(self.index),
+            "lookups": self._lookups,
+            "matches": self._matches,
+            "discarded": self._discarded,
+        }
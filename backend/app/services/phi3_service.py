@@ -1,150 +1,614 @@
+import asyncio
 import io
+import logging
+import math
+import threading
 import time
-from typing import Dict, Any, List, Optional
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
 from PIL import Image
-from transformers import AutoModelForCausalLM, AutoProcessor
+from transformers import AutoModelForCausalLM, AutoProcessor, BatchFeature, LogitsProcessorList, StoppingCriteriaList
 import torch
+import torch.nn.functional as F
 from huggingface_hub import snapshot_download
 import os
+from ..core.config import settings
+from .batching import MicroBatcher
+from .confidence import TokenLogprobs, eos_token_ids, sequence_confidence
+from .executor import InferenceExecutor, InferenceQueueFull, get_default_executor
+from .generation_limits import GenerationStop, image_text_tokens, token_budget
+from .layout import TextBlock, segment_page
+from .preprocessing import preprocess_image
+from .prompt_cache import PrefillTimer, PromptPrefixCache
+from .quantization import dtype_name, format_report, load_report, quantize_model, resolve_runtime
+from .snapshots import find_snapshot, load_snapshot
+from .streaming import AsyncTokenStreamer, StreamStats
+from .tracing import record_generation, record_stages, stage
+
+logger = logging.getLogger(__name__)
+
+PROMPT = """<|system|>
+You are an expert OCR assistant. Your task is to accurately extract text from the image.
+Ensure the text is coherent, maintains the original formatting, and is free of errors.
+<|user|>
+<|image_1|>
+Extract and enhance the text from this image. If multiple languages are present, identify them.
+<|end|>
+<|assistant|>
+"""
+
+# Prompt for one text block of a page cut up by segment_page
+BLOCK_PROMPT = """<|system|>
+You are an expert OCR assistant. Your task is to accurately extract text from the image.
+Ensure the text is coherent, maintains the original formatting, and is free of errors.
+<|user|>
+<|image_1|>
+Extract the text from this part of a page exactly as written, keeping its line breaks.
+<|end|>
+<|assistant|>
+"""
+
+
+def covered_crops(image: Image.Image) -> int:
+    """336 px crops an image covers at its own resolution, i.e. without the HD transform scaling it up"""
+    return math.ceil(image.width / 336) * math.ceil(image.height / 336)
+
 
 class Phi3VisionService:
-    def __init__(self, use_gpu: bool = False):
+    def __init__(self, use_gpu: bool = False, executor: Optional[InferenceExecutor] = None):
         """
         Initialize the Phi-3 Vision service
         Args:
             use_gpu (bool): Whether to use GPU if available. If False, forces CPU usage.
+            executor (InferenceExecutor): Worker pool running the blocking generate calls.
         """
         self.model_id = "microsoft/phi-3-vision-128k-instruct"
         self.model = None
         self.processor = None
-        self.use_gpu = use_gpu and torch.cuda.is_available()
-        self.device = "cuda" if self.use_gpu else "cpu"
+        self.device, self.precision, self.torch_dtype = resolve_runtime(use_gpu, settings.PHI3_CPU_PRECISION)
+        self.use_gpu = self.device == "cuda"
+        self.load_report: Optional[Dict[str, Any]] = None
         self.model_path = None
+        self.executor = executor or get_default_executor()
+        self.batcher = MicroBatcher(
+            self._process_batch,
+            max_batch_size=settings.PHI3_MAX_BATCH_SIZE,
+            max_wait_ms=settings.PHI3_BATCH_MAX_WAIT_MS,
+            max_queue_size=settings.INFERENCE_MAX_QUEUE,
+            name="phi3-batcher"
+        )
+        self.stream_stats = StreamStats()
+        self.prefix_cache = PromptPrefixCache(name="phi3")
+        self._processor_lock = threading.Lock()
 
-        print(f"Initializing Phi3VisionService with device: {self.device}")
-        print(f"Model ID: {self.model_id}")
+        logger.info(f"Initializing Phi3VisionService with device: {self.device}")
+        logger.info(f"Model ID: {self.model_id}")
 
         if self.use_gpu:
-            print(f"Using GPU: {torch.cuda.get_device_name(0)}")
+            logger.info(f"Using GPU: {torch.cuda.get_device_name(0)}")
         else:
-            print("Using CPU mode")
+            logger.info("Using CPU mode")
+
+    @property
+    def dtype_name(self) -> str:
+        return dtype_name(self.precision, self.torch_dtype)
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.model is not None
+
+    @property
+    def init_kwargs(self) -> Dict[str, Any]:
+        """Arguments to rebuild this service inside an executor worker process"""
+        return {"use_gpu": self.use_gpu}
+
+    async def load(self):
+        """Load the model and processor if they are not loaded yet"""
+        await self._load_model()
 
-    async def _download_model(self):
+    def unload(self):
+        """Release the model weights and processor"""
+        self.batcher.close()
+        self.model = None
+        self.processor = None
+        self.prefix_cache.clear()
+        if self.use_gpu:
+            torch.cuda.empty_cache()
+        logger.info(f"Unloaded {self.model_id} from {self.device}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batching": self.batcher.stats(),
+            "streaming": self.stream_stats.stats(),
+            "prefix_cache": self.prefix_cache.stats(),
+            "load_report": self.load_report
+        }
+
+    def _download_model(self):
         """Download the model files if not already present"""
         try:
-            # Create a directory for the model if it doesn't exist
+            # Copies made by earlier versions, which downloaded into a local directory
             model_dir = os.path.join(os.path.expanduser("~"), ".cache", "huggingface", "hub", "models--microsoft--Phi-3-vision-128k-instruct")
-            os.makedirs(model_dir, exist_ok=True)
-
-            # Download the model files
-            self.model_path = snapshot_download(
-                repo_id=self.model_id,
-                local_dir=model_dir,
-                local_dir_use_symlinks=False,
-                resume_download=True
-            )
-            print(f"Model downloaded to: {self.model_path}")
+            if os.path.isfile(os.path.join(model_dir, "config.json")):
+                self.model_path = model_dir
+            else:
+                # The Hugging Face cache stores each file once and links the snapshot to it
+                self.model_path = snapshot_download(repo_id=self.model_id)
+            logger.info(f"Model downloaded to: {self.model_path}")
         except Exception as e:
-            print(f"Error downloading model: {str(e)}")
+            logger.error(f"Error downloading model: {str(e)}")
             raise
 
     async def _load_model(self):
-        """Lazy loading of the model and processor"""
+        """Lazy loading of the model and processor, off the event loop"""
+        if self.executor.kind == "process":
+            # Each worker process loads its own copy on first use
+            return
+        if self.model is None:
+            await asyncio.to_thread(self._load_model_sync)
+
+    def source_path(self) -> str:
+        """Local directory of the Hugging Face snapshot, downloaded on first use"""
+        if not self.model_path:
+            self._download_model()
+        return self.model_path
+
+    @property
+    def attn_implementation(self) -> str:
+        return "flash_attention_2" if self.use_gpu else "eager"
+
+    def _from_pretrained(self, path: str):
+        return AutoModelForCausalLM.from_pretrained(
+            path,
+            device_map=self.device,
+            trust_remote_code=True,
+            torch_dtype=self.torch_dtype,
+            _attn_implementation=self.attn_implementation
+        )
+
+    def _load_model_sync(self):
         try:
             if self.model is None:
-                # Ensure model is downloaded
-                if not self.model_path:
-                    await self._download_model()
-
-                print(f"Loading model from: {self.model_path}")
-
-                # Configure model loading based on device
-                model_kwargs = {
-                    "device_map": self.device,
-                    "trust_remote_code": True,
-                }
-
-                if self.use_gpu:
-                    model_kwargs.update({
-                        "torch_dtype": torch.float16,
-                        "_attn_implementation": "flash_attention_2"
-                    })
+                start = time.perf_counter()
+                path = find_snapshot("phi3", self.torch_dtype)
+                if path:
+                    logger.info(f"Loading compiled snapshot {path}")
+                    self.model = load_snapshot(path, device=self.device, attn_implementation=self.attn_implementation)
                 else:
-                    model_kwargs.update({
-                        "torch_dtype": torch.float32,
-                        "_attn_implementation": "eager"
-                    })
-
-                self.model = AutoModelForCausalLM.from_pretrained(
-                    self.model_path,
-                    **model_kwargs
-                )
-                print("Model loaded successfully")
+                    path = self.source_path()
+                    logger.info(f"Loading model from: {path}")
+                    self.model = self._from_pretrained(path)
+                if not self.use_gpu:
+                    self.model = quantize_model(self.model, self.precision)
+                logger.info("Model loaded successfully")
 
                 self.processor = AutoProcessor.from_pretrained(
-                    self.model_path,
+                    path,
                     trust_remote_code=True
                 )
-                print("Processor loaded successfully")
+                logger.info("Processor loaded successfully")
+                if settings.LOAD_REPORT:
+                    self._report_load(time.perf_counter() - start)
         except Exception as e:
-            print(f"Error loading model: {str(e)}")
+            logger.error(f"Error loading model: {str(e)}")
             raise
 
+    def _report_load(self, load_seconds: float):
+        """Measure the weight memory and decode speed of the freshly loaded model on the text of the prompt"""
+        try:
+            system_prompt = PROMPT.split("<|user|>")[0]
+            input_ids = torch.tensor([self.processor.tokenizer(system_prompt).input_ids], device=self.device)
+            self.load_report = load_report(
+                self.model, input_ids, self.precision, load_seconds, settings.LOAD_REPORT_TOKENS
+            )
+            logger.info(format_report("Phi-3", self.load_report))
+        except Exception as e:
+            logger.warning(f"Could not measure Phi-3 load report: {str(e)}")
+
+    def _collate(self, encodings: List[BatchFeature], prefix_len: int = 0) -> BatchFeature:
+        """
+        Merge per-image processor outputs into one padded batch.
+        Padding goes right after the first ``prefix_len`` tokens (left padding
+        when 0), so every prompt ends at the same position and the generated
+        tokens of all rows start at the same index. Keeping the shared prefix
+        unpadded lets all rows reuse its cached key/values.
+        """
+        if len(encodings) == 1:
+            return encodings[0]
+
+        pad_token_id = self.processor.tokenizer.pad_token_id
+        max_len = max(enc["input_ids"].shape[1] for enc in encodings)
+        max_crops = max(enc["pixel_values"].shape[1] for enc in encodings)
+
+        def pad_at(tensor: torch.Tensor, count: int, value: int) -> torch.Tensor:
+            padding = torch.full((tensor.shape[0], count), value, dtype=tensor.dtype)
+            return torch.cat([tensor[:, :prefix_len], padding, tensor[:, prefix_len:]], dim=1)
+
+        input_ids, attention_mask, pixel_values = [], [], []
+        for enc in encodings:
+            pad = max_len - enc["input_ids"].shape[1]
+            input_ids.append(pad_at(enc["input_ids"], pad, pad_token_id))
+            attention_mask.append(pad_at(enc["attention_mask"], pad, 0))
+            # pixel_values is (1, crops, channels, height, width); pad the crop axis
+            crops = max_crops - enc["pixel_values"].shape[1]
+            pixel_values.append(F.pad(enc["pixel_values"], (0, 0, 0, 0, 0, 0, 0, crops)))
+
+        return BatchFeature(data={
+            "input_ids": torch.cat(input_ids),
+            "attention_mask": torch.cat(attention_mask),
+            "pixel_values": torch.cat(pixel_values),
+            "image_sizes": torch.cat([enc["image_sizes"] for enc in encodings]),
+        })
+
+    @staticmethod
+    def _text_prefix(input_ids: torch.Tensor) -> List[int]:
+        """Prompt ids before the first image placeholder, which the processor encodes as negative ids"""
+        ids = input_ids[0].tolist()
+        for index, token in enumerate(ids):
+            if token < 0:
+                return ids[:index]
+        # generate needs at least one token that is not in the cache
+        return ids[:-1]
+
+    def _generate_kwargs(
+        self,
+        encodings: List[BatchFeature],
+        processors: List[Any],
+        budgets: List[Optional[int]]
+    ) -> Tuple[Dict[str, Any], Dict[str, Any], GenerationStop]:
+        """
+        generate arguments for a batch, the prompt token counts reported with
+        it, and the stopping criteria holding each row to its own budget
+        (PHI3_MAX_NEW_TOKENS where it is None)
+        """
+        prefix: List[int] = []
+        if settings.PROMPT_PREFIX_CACHE:
+            prefix = self._text_prefix(encodings[0]["input_ids"])
+            if any(enc["input_ids"][0, :len(prefix)].tolist() != prefix for enc in encodings):
+                prefix = []
+        # Cast the pixel values to the weights' dtype, e.g. bfloat16
+        inputs = self._collate(encodings, prefix_len=len(prefix)).to(self.device, dtype=self.torch_dtype)
+
+        budgets = [budget or settings.PHI3_MAX_NEW_TOKENS for budget in budgets]
+        stop = GenerationStop(inputs["input_ids"].shape[1], budgets)
+        kwargs = {
+            **inputs,
+            "max_new_tokens": max(budgets),
+            "temperature": settings.PHI3_TEMPERATURE,
+            "top_p": settings.PHI3_TOP_P,
+            "do_sample": True,
+            "pad_token_id": self.processor.tokenizer.pad_token_id,
+            "eos_token_id": self.processor.tokenizer.eos_token_id,
+            "logits_processor": LogitsProcessorList(processors),
+            "stopping_criteria": StoppingCriteriaList([stop]),
+        }
+        if prefix:
+            kwargs["past_key_values"] = self.prefix_cache.past_key_values(
+                self.model, prefix, batch_size=len(encodings)
+            )
+        return kwargs, {
+            "prompt_tokens": inputs["input_ids"].shape[1],
+            "prefix_tokens_reused": len(prefix),
+            "batch_size": len(encodings),
+        }, stop
+
+    def _encode(self, prompt: str, image: Image.Image, num_crops: Optional[int] = None) -> BatchFeature:
+        """
+        Processor output for one prompt and image. ``num_crops`` lowers the
+        number of 336 px crops the HD transform splits the image into, which
+        otherwise scales every image up to the processor's maximum.
+        """
+        image_processor = getattr(self.processor, "image_processor", None)
+        if num_crops is None or not hasattr(image_processor, "num_crops"):
+            return self.processor(text=prompt, images=image, return_tensors="pt")
+        # num_crops is only read from the image processor's attributes
+        with self._processor_lock:
+            default = image_processor.num_crops
+            image_processor.num_crops = max(1, min(num_crops, default))
+            try:
+                return self.processor(text=prompt, images=image, return_tensors="pt")
+            finally:
+                image_processor.num_crops = default
+
+    def _finish(
+        self,
+        outputs: torch.Tensor,
+        stop: GenerationStop,
+        logprobs: TokenLogprobs,
+        timings: Dict[str, Any]
+    ) -> List[Tuple[torch.Tensor, float, Dict[str, Any]]]:
+        """
+        Per row: its ids without the repeats of a loop, their confidence and
+        ``timings`` with its budget and why it stopped.
+        """
+        eos = eos_token_ids(self.model, self.processor.tokenizer)
+        rows = []
+        for output, row_logprobs, row, budget in zip(
+            outputs, logprobs.token_logprobs(outputs, eos), stop.finish(outputs, eos), stop.budgets
+        ):
+            rows.append((
+                output[:stop.prompt_length + row["keep"]],
+                sequence_confidence(row_logprobs[:row["keep"]]),
+                {
+                    **timings,
+                    "max_new_tokens": budget,
+                    "generated_tokens": row["generated_tokens"],
+                    "stop_reason": row["stop_reason"],
+                },
+            ))
+        return rows
+
+    def _generate_batch(self, items: List[Any]) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """
+        Run one generate call over a batch of (prompt, image, num_crops,
+        max_new_tokens) items; num_crops and max_new_tokens may be None.
+        Returns the decoded output, its token confidence and the timings of
+        every row.
+        """
+        started = time.perf_counter()
+        encodings = [self._encode(prompt, image, num_crops) for prompt, image, num_crops, _ in items]
+        timer = PrefillTimer()
+        logprobs = TokenLogprobs()
+        kwargs, timings, stop = self._generate_kwargs(encodings, [timer, logprobs], [item[3] for item in items])
+
+        timer.start()
+        outputs = self.model.generate(**kwargs)
+        timer.finish()
+
+        timings.update(self._stage_timings(started, timer))
+        rows = [
+            (self.processor.decode(output, skip_special_tokens=True), confidence, row_timings)
+            for output, confidence, row_timings in self._finish(outputs, stop, logprobs, timings)
+        ]
+        postprocess_ms = (time.perf_counter() - timer.finished_at) * 1000.0
+        for _, _, row_timings in rows:
+            row_timings["postprocess_ms"] = postprocess_ms
+            row_timings["inference_ms"] = (time.perf_counter() - started) * 1000.0
+        return rows
+
+    @staticmethod
+    def _stage_timings(started: float, timer: PrefillTimer) -> Dict[str, Any]:
+        """encode (processor, collation and prefix cache), prefill and decode times of a generate call"""
+        return {
+            "encode_ms": (timer.started_at - started) * 1000.0,
+            "prefill_ms": timer.prefill_ms,
+            "decode_ms": timer.decode_ms,
+        }
+
+    async def _process_batch(self, items: List[Any]) -> List[Tuple[str, float, Dict[str, Any]]]:
+        return await self.executor.run_service(self, "_generate_batch", items)
+
+    def _generate_stream(
+        self,
+        prompt: str,
+        image: Image.Image,
+        streamer: AsyncTokenStreamer,
+        max_new_tokens: Optional[int] = None,
+        num_crops: Optional[int] = None
+    ) -> Tuple[float, Dict[str, Any], str]:
+        """
+        Run generate for a single image, handing each new token to
+        ``streamer``. Returns the confidence, the timings and the generated
+        text, which unlike the streamed text has the repeats of a loop dropped.
+        """
+        try:
+            started = time.perf_counter()
+            encodings = [self._encode(prompt, image, num_crops)]
+            timer = PrefillTimer()
+            logprobs = TokenLogprobs()
+            kwargs, timings, stop = self._generate_kwargs(encodings, [timer, logprobs], [max_new_tokens])
+            kwargs["stopping_criteria"].append(streamer.stopping_criteria())
+            timer.start()
+            outputs = self.model.generate(**kwargs, streamer=streamer)
+            timer.finish()
+            timings.update(self._stage_timings(started, timer))
+            output, confidence, timings = self._finish(outputs, stop, logprobs, timings)[0]
+            text = self.processor.decode(output[stop.prompt_length:], **streamer.decode_kwargs)
+            timings["postprocess_ms"] = (time.perf_counter() - timer.finished_at) * 1000.0
+            timings["inference_ms"] = (time.perf_counter() - started) * 1000.0
+            return confidence, timings, text
+        finally:
+            streamer.end()
+
+    @staticmethod
+    def _max_new_tokens(blocks: List[TextBlock]) -> Optional[int]:
+        """
+        Token budget for the text of ``blocks``, at least PHI3_MIN_NEW_TOKENS,
+        or None for PHI3_MAX_NEW_TOKENS. Without any text line segmentation
+        has nothing to go by (a photo, a blank scan), so such a page keeps the
+        fixed budget rather than being cut short.
+        """
+        if not settings.ADAPTIVE_MAX_NEW_TOKENS or not blocks:
+            return None
+        return token_budget(
+            image_text_tokens(blocks), settings.PHI3_MAX_NEW_TOKENS_LIMIT, minimum=settings.PHI3_MIN_NEW_TOKENS
+        )
+
+    async def _page_budget(self, image: Image.Image) -> Tuple[Optional[int], Optional[float]]:
+        """Token budget of a whole page from its segmented text lines, and the segmentation time"""
+        if not settings.ADAPTIVE_MAX_NEW_TOKENS:
+            return None, None
+        with stage("layout", "phi3"):
+            layout = await asyncio.to_thread(segment_page, image)
+        return self._max_new_tokens(layout.blocks), layout.segment_ms
+
+    async def _prepare_image(self, image: Image.Image) -> Tuple[Image.Image, Optional[Dict[str, Any]]]:
+        """Downscale, straighten and clean up the page off the event loop"""
+        if not settings.PREPROCESS_ENABLED:
+            return image, None
+        with stage("preprocess", "phi3"):
+            prepared = await asyncio.to_thread(preprocess_image, image)
+            # Decoding the upload is the first step
+            record_stages("phi3", [(step, ms) for step, ms in prepared.timings_ms.items() if step != "total"])
+        return prepared.image, {
+            "timings_ms": prepared.timings_ms,
+            "original_size": list(prepared.original_size),
+            "size": list(prepared.image.size),
+            "skew_angle": prepared.skew_angle,
+            # A downscaled or cropped page is read at its own resolution, not
+            # scaled back up to the processor's maximum number of crops
+            "num_crops": covered_crops(prepared.image),
+        }
+
+    @staticmethod
+    def _extract_text(response: str) -> str:
+        """The assistant's response from the decoded output"""
+        # This is a simple extraction - might need adjustment based on actual output format
+        if "<|assistant|>" in response:
+            return response.split("<|assistant|>")[-1].strip()
+        return response.strip()
+
+    async def _read_block(self, image: Image.Image, block: TextBlock, slots: asyncio.Semaphore) -> Dict[str, Any]:
+        async with slots:
+            start = time.perf_counter()
+            crop = image.crop(block.box)
+            num_crops = covered_crops(crop)
+            with stage("generate", "phi3", box=list(block.box)):
+                # Timed inside the span, so that its queue_wait child starts within it
+                submitted = time.perf_counter()
+                response, confidence, timings = await self.batcher.submit(
+                    (BLOCK_PROMPT, crop, num_crops, self._max_new_tokens([block]))
+                )
+                record_generation("phi3", timings, (time.perf_counter() - submitted) * 1000.0)
+        return {
+            "box": list(block.box),
+            "lines": block.lines,
+            "characters": block.characters,
+            "text": self._extract_text(response),
+            "confidence": confidence,
+            "ms": (time.perf_counter() - start) * 1000.0,
+            "prefill_ms": timings.get("prefill_ms"),
+            "prompt_tokens": timings.get("prompt_tokens"),
+            "batch_size": timings.get("batch_size"),
+            "max_new_tokens": timings.get("max_new_tokens"),
+            "stop_reason": timings.get("stop_reason"),
+            "raw_response": response,
+        }
+
+    async def _read_layout(
+        self,
+        image: Image.Image,
+        languages: Optional[List[str]],
+        preprocessing: Optional[Dict[str, Any]],
+        start_time: float
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Cut the page into text blocks, read them through the batcher and yield
+        each block's text as ``{"delta": text}`` in reading order, then the
+        stitched result with the box, text and timings of every block.
+        """
+        with stage("layout", "phi3"):
+            layout = await asyncio.to_thread(segment_page, image)
+        # Bounded so one dense page cannot fill the batcher's queue by itself
+        slots = asyncio.Semaphore(settings.PHI3_MAX_BATCH_SIZE)
+        tasks = [asyncio.ensure_future(self._read_block(image, block, slots)) for block in layout.blocks]
+        blocks: List[Dict[str, Any]] = []
+        try:
+            for task in tasks:
+                block = await task
+                if block["text"]:
+                    yield {"delta": ("\n\n" if any(b["text"] for b in blocks) else "") + block["text"]}
+                blocks.append(block)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        texts = [block for block in blocks if block["text"]]
+        characters = sum(len(block["text"]) for block in texts)
+        yield {
+            "text": "\n\n".join(block["text"] for block in texts),
+            # Weighted by the amount of text each block contributed
+            "confidence": sum(block["confidence"] * len(block["text"]) for block in texts) / characters if characters else 0.0,
+            "processing_time": time.time() - start_time,
+            "model_info": self._model_info(),
+            "languages": languages or ["en"],
+            "raw_response": "\n\n".join(block.pop("raw_response") for block in blocks),
+            "preprocessing": preprocessing,
+            "timings": {
+                "layout_ms": layout.segment_ms,
+                "blocks": len(blocks),
+                "prompt_tokens": sum(block["prompt_tokens"] or 0 for block in blocks),
+                "block_ms": sum(block["ms"] for block in blocks),
+            },
+            "truncated": any(block["stop_reason"] == "length" for block in blocks),
+            "layout": {
+                "size": list(image.size),
+                "line_height": layout.line_height,
+                "blocks": blocks,
+            },
+        }
+
+    @staticmethod
+    def _use_layout(layout: Optional[bool]) -> bool:
+        return settings.PHI3_LAYOUT_TILING if layout is None else layout
+
+    def _model_info(self) -> Dict[str, Any]:
+        return {
+            "name": "Phi-3-Vision-128K-Instruct",
+            "version": "1.0",
+            "context_length": "128K",
+            "parameters": "4.2B",
+            "device": self.device,
+            "gpu_enabled": self.use_gpu,
+            "gpu_name": torch.cuda.get_device_name(0) if self.use_gpu else None
+        }
+
     async def process_text_and_image(
         self,
         text: str,
         image_bytes: bytes,
-        languages: Optional[List[str]] = None
+        languages: Optional[List[str]] = None,
+        layout: Optional[bool] = None
     ) -> Dict[str, Any]:
         """Process text and image using Phi-3 Vision model"""
         start_time = time.time()
 
         try:
-            await self._load_model()
-
             # Convert bytes to PIL Image
             image = Image.open(io.BytesIO(image_bytes))
+        except Exception as e:
+            logger.error(f"Error in Phi3VisionService: {str(e)}")
+            return {
+                "text": "",
+                "confidence": 0.0,
+                "processing_time": time.time() - start_time,
+                "error": str(e)
+            }
 
-            # Prepare the prompt
-            prompt = f"""<|system|>
-You are an expert OCR assistant. Your task is to accurately extract text from the image.
-Ensure the text is coherent, maintains the original formatting, and is free of errors.
-<|user|>
-<|image_1|>
-Extract and enhance the text from this image. If multiple languages are present, identify them.
-<|end|>
-<|assistant|>
-"""
-            # Process inputs
-            inputs = self.processor(
-                text=prompt,
-                images=image,
-                return_tensors="pt"
-            ).to(self.device)
-
-            # Generate response
-            outputs = self.model.generate(
-                **inputs,
-                max_new_tokens=512,
-                temperature=0.7,
-                top_p=0.9,
-                do_sample=True,
-                pad_token_id=self.processor.tokenizer.pad_token_id,
-                eos_token_id=self.processor.tokenizer.eos_token_id
-            )
+        return await self.process_image(image, languages, start_time=start_time, layout=layout)
+
+    async def process_image(
+        self,
+        image: Image.Image,
+        languages: Optional[List[str]] = None,
+        start_time: Optional[float] = None,
+        layout: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        """
+        Process an already decoded image, e.g. one page of a document.
+        With ``layout`` (default: PHI3_LAYOUT_TILING) the page is read block by
+        block and the result has a ``layout`` entry describing the blocks.
+        """
+        start_time = start_time or time.time()
 
-            # Decode response
-            response = self.processor.decode(outputs[0], skip_special_tokens=True)
+        try:
+            await self._load_model()
+            image, preprocessing = await self._prepare_image(image)
 
-            # Extract the assistant's response
-            # This is a simple extraction - might need adjustment based on actual output format
-            if "<|assistant|>" in response:
-                enhanced_text = response.split("<|assistant|>")[-1].strip()
-            else:
-                enhanced_text = response.strip()
+            if self._use_layout(layout):
+                async for event in self._read_layout(image, languages, preprocessing, start_time):
+                    results = event
+                return results
 
-            # Calculate confidence score (simplified)
-            confidence = 0.85  # Placeholder confidence score
+            max_new_tokens, layout_ms = await self._page_budget(image)
+            num_crops = preprocessing["num_crops"] if preprocessing else None
+            # Concurrent requests are generated together in one batch
+            with stage("generate", "phi3"):
+                submitted = time.perf_counter()
+                response, confidence, timings = await self.batcher.submit((PROMPT, image, num_crops, max_new_tokens))
+                record_generation("phi3", timings, (time.perf_counter() - submitted) * 1000.0)
+            if layout_ms is not None:
+                timings = {**timings, "layout_ms": layout_ms}
+            enhanced_text = self._extract_text(response)
 
             processing_time = time.time() - start_time
 
@@ -152,24 +616,85 @@ Extract and enhance the text from this image. If multiple languages are present,
                 "text": enhanced_text,
                 "confidence": confidence,
                 "processing_time": processing_time,
-                "model_info": {
-                    "name": "Phi-3-Vision-128K-Instruct",
-                    "version": "1.0",
-                    "context_length": "128K",
-                    "parameters": "4.2B",
-                    "device": self.device,
-                    "gpu_enabled": self.use_gpu,
-                    "gpu_name": torch.cuda.get_device_name(0) if self.use_gpu else None
-                },
+                "model_info": self._model_info(),
                 "languages": languages or ["en"],
-                "raw_response": response
+                "raw_response": response,
+                "preprocessing": preprocessing,
+                "timings": timings,
+                # The budget ran out before the model finished the text
+                "truncated": timings.get("stop_reason") == "length"
             }
 
+        except InferenceQueueFull:
+            raise
         except Exception as e:
-            print(f"Error in Phi3VisionService: {str(e)}")
+            logger.error(f"Error in Phi3VisionService: {str(e)}")
             return {
                 "text": "",
                 "confidence": 0.0,
                 "processing_time": time.time() - start_time,
                 "error": str(e)
             }
+
+    async def stream_image(
+        self,
+        image: Image.Image,
+        languages: Optional[List[str]] = None,
+        layout: Optional[bool] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Generate for one image outside the batcher and yield ``{"delta": text}``
+        as tokens are produced, then the final result with the same keys as
+        process_image plus time_to_first_token, generated_tokens and
+        tokens_per_second. With ``layout`` the text of each block is sent once
+        the block is read, in reading order.
+        """
+        start_time = time.time()
+
+        if self.executor.kind == "process":
+            # The streamer cannot cross a process boundary; send the whole text at once
+            results = await self.process_image(image, languages, start_time=start_time, layout=layout)
+            if results.get("text"):
+                yield {"delta": results["text"]}
+            yield results
+            return
+
+        await self._load_model()
+        image, preprocessing = await self._prepare_image(image)
+        if self._use_layout(layout):
+            async for event in self._read_layout(image, languages, preprocessing, start_time):
+                yield event
+            return
+        max_new_tokens, layout_ms = await self._page_budget(image)
+        num_crops = preprocessing["num_crops"] if preprocessing else None
+        submitted = time.perf_counter()
+        streamer = AsyncTokenStreamer(self.processor.tokenizer)
+        generation = asyncio.ensure_future(
+            self.executor.run_service(self, "_generate_stream", PROMPT, image, streamer, max_new_tokens, num_crops)
+        )
+        # Also ends the stream when the job is rejected before generate starts
+        generation.add_done_callback(lambda _: streamer.end())
+
+        try:
+            async for delta in streamer:
+                yield {"delta": delta}
+            confidence, timings, response = await generation
+        finally:
+            streamer.cancel()
+
+        record_generation("phi3", timings, (time.perf_counter() - submitted) * 1000.0)
+        self.stream_stats.record(streamer)
+        if layout_ms is not None:
+            timings = {**timings, "layout_ms": layout_ms}
+        yield {
+            "text": response.strip(),
+            "confidence": confidence,
+            "processing_time": time.time() - start_time,
+            "model_info": self._model_info(),
+            "languages": languages or ["en"],
+            "raw_response": response,
+            "preprocessing": preprocessing,
+            "timings": timings,
+            "truncated": timings.get("stop_reason") == "length",
+            **streamer.timings()
+        }
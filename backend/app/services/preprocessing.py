@@ -0,0 +1,220 @@
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from ..core.config import settings
+
+
+class PreprocessResult(NamedTuple):
+    image: Image.Image
+    timings_ms: Dict[str, float]
+    original_size: Tuple[int, int]
+    skew_angle: float
+
+
+def _otsu_threshold(histogram: List[int]) -> int:
+    """Otsu threshold of a 256-bin grayscale histogram"""
+    hist = np.asarray(histogram[:256], dtype=np.float64)
+    total = hist.sum()
+    if total == 0:
+        return 128
+    levels = np.arange(256)
+    weight_bg = np.cumsum(hist)
+    weight_fg = total - weight_bg
+    mean_bg = np.cumsum(hist * levels)
+    mean_total = mean_bg[-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (mean_total * weight_bg - mean_bg * total) ** 2 / (weight_bg * weight_fg)
+    # Blank pages have a single grey level and no valid split
+    return int(np.argmax(np.nan_to_num(between)))
+
+
+def _exif_orientation(image: Image.Image) -> Image.Image:
+    # In place avoids copying the full-resolution page when no rotation is needed
+    ImageOps.exif_transpose(image, in_place=True)
+    return image
+
+
+def _gray(image: Image.Image) -> Image.Image:
+    return image if image.mode == "L" else image.convert("L")
+
+
+def target_long_side(image: Image.Image, target_dpi: int, max_side: int) -> Optional[int]:
+    """
+    Long side the image should be reduced to, from its DPI metadata and the
+    max_side cap, or None when it is already small enough.
+    """
+    long_side = max(image.size)
+    scale = 1.0
+    dpi = image.info.get("dpi")
+    if dpi and dpi[0] and float(dpi[0]) > target_dpi:
+        scale = target_dpi / float(dpi[0])
+    if long_side * scale > max_side:
+        scale = max_side / long_side
+    if scale >= 0.95:
+        return None
+    return max(1, int(round(long_side * scale)))
+
+
+def downscale(image: Image.Image, long_side: Optional[int]) -> Image.Image:
+    if long_side is None or max(image.size) <= long_side:
+        return image
+    ratio = long_side / max(image.size)
+    size = (max(1, round(image.width * ratio)), max(1, round(image.height * ratio)))
+    # reducing_gap shrinks by an integer factor first, which is much cheaper
+    return image.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+
+def estimate_skew(image: Image.Image, max_angle: float, sample_width: int = 800) -> float:
+    """
+    Estimate the text skew in degrees with a projection profile: the angle at
+    which the dark pixels fall into the sharpest set of rows. Returns the
+    angle to pass to ``Image.rotate`` to straighten the page.
+    """
+    gray = _gray(image)
+    if gray.width > sample_width:
+        gray = gray.resize(
+            (sample_width, max(1, round(gray.height * sample_width / gray.width))),
+            Image.Resampling.BILINEAR
+        )
+    pixels = np.asarray(gray)
+    ys, xs = np.nonzero(pixels < _otsu_threshold(gray.histogram()))
+    if len(ys) < 100:
+        return 0.0
+    if len(ys) > 40_000:
+        keep = np.random.default_rng(0).choice(len(ys), 40_000, replace=False)
+        ys, xs = ys[keep], xs[keep]
+    ys = ys.astype(np.float64)
+    xs = xs.astype(np.float64)
+    rows = gray.height + gray.width
+
+    def score(angle: float) -> float:
+        theta = np.deg2rad(angle)
+        projected = ys * np.cos(theta) + xs * np.sin(theta)
+        counts = np.bincount((projected + gray.width).astype(np.int64), minlength=rows)
+        return float(np.dot(counts, counts))
+
+    # Coarse search, then refine around the best coarse angle
+    coarse = np.arange(-max_angle, max_angle + 1e-9, 0.5)
+    best = max(coarse, key=score)
+    fine = np.arange(best - 0.5, best + 0.5 + 1e-9, 0.1)
+    return -float(round(max(fine, key=score), 2))
+
+
+def deskew(image: Image.Image, max_angle: float) -> Tuple[Image.Image, float]:
+    angle = estimate_skew(image, max_angle)
+    if abs(angle) < 0.1:
+        return image, 0.0
+    rotated = image.rotate(angle, resample=Image.Resampling.BILINEAR, expand=True, fillcolor="white")
+    return rotated, angle
+
+
+def binarize(image: Image.Image) -> Image.Image:
+    gray = _gray(image)
+    threshold = _otsu_threshold(gray.histogram())
+    return gray.point(lambda v: 255 if v > threshold else 0)
+
+
+def crop_margins(image: Image.Image, padding: float = 0.02) -> Image.Image:
+    """
+    Crop blank margins around the content. Rows and columns that are almost
+    entirely dark (scanner lid shadows and borders) do not count as content.
+    """
+    gray = _gray(image)
+    dark = np.asarray(gray) < _otsu_threshold(gray.histogram())
+    # A border's dark pixels are not content of the lines crossing it either,
+    # or a shadow down one edge would make every row count as content
+    dark[dark.mean(axis=1) >= 0.9, :] = False
+    dark[:, dark.mean(axis=0) >= 0.9] = False
+    content_rows = np.nonzero(dark.mean(axis=1) > 0.002)[0]
+    content_cols = np.nonzero(dark.mean(axis=0) > 0.002)[0]
+    if len(content_rows) == 0 or len(content_cols) == 0:
+        return image
+
+    pad = int(round(padding * max(image.size)))
+    box = (
+        max(0, int(content_cols[0]) - pad),
+        max(0, int(content_rows[0]) - pad),
+        min(image.width, int(content_cols[-1]) + 1 + pad),
+        min(image.height, int(content_rows[-1]) + 1 + pad),
+    )
+    if box == (0, 0, image.width, image.height):
+        return image
+    return image.crop(box)
+
+
+def preprocess_image(
+    image: Image.Image,
+    steps: Optional[List[str]] = None,
+    target_dpi: Optional[int] = None,
+    max_side: Optional[int] = None,
+    max_skew: Optional[float] = None
+) -> PreprocessResult:
+    """
+    Prepare an image for the vision encoder.
+
+    Args:
+        image: Image to process. If it was opened but not decoded yet, JPEG
+            decoding is done at reduced size and in grayscale where the steps allow.
+        steps (List[str]): Steps to apply, in order. Defaults to PREPROCESS_STEPS.
+        target_dpi (int): Resolution the downscale step reduces to.
+        max_side (int): Upper bound on the long side after downscaling.
+        max_skew (float): Largest skew in degrees that deskew searches for.
+    Returns:
+        PreprocessResult with the image, the time of every step in
+        milliseconds, the original size and the skew that was corrected.
+    """
+    steps = settings.PREPROCESS_STEPS if steps is None else steps
+    target_dpi = target_dpi or settings.PREPROCESS_TARGET_DPI
+    max_side = max_side or settings.PREPROCESS_MAX_SIDE
+    max_skew = settings.PREPROCESS_MAX_SKEW if max_skew is None else max_skew
+
+    unknown = set(steps) - set(STEPS)
+    if unknown:
+        raise ValueError(f"Unknown preprocessing steps: {', '.join(sorted(unknown))}")
+
+    timings: Dict[str, float] = {}
+    started = time.perf_counter()
+    original_size = image.size
+    long_side = target_long_side(image, target_dpi, max_side) if "downscale" in steps else None
+
+    # JPEG can decode at 1/2, 1/4 or 1/8 scale and straight to grayscale
+    step_start = time.perf_counter()
+    if image.format == "JPEG" and getattr(image, "tile", None):
+        mode = "L" if "grayscale" in steps else image.mode
+        if long_side is not None:
+            ratio = long_side / max(image.size)
+            image.draft(mode, (int(image.width * ratio), int(image.height * ratio)))
+        elif mode != image.mode:
+            image.draft(mode, image.size)
+    image.load()
+    timings["decode"] = (time.perf_counter() - step_start) * 1000.0
+
+    skew_angle = 0.0
+    for step in steps:
+        step_start = time.perf_counter()
+        if step == "downscale":
+            image = downscale(image, long_side)
+        elif step == "deskew":
+            image, skew_angle = deskew(image, max_skew)
+        else:
+            image = STEPS[step](image)
+        timings[step] = (time.perf_counter() - step_start) * 1000.0
+
+    if image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+    timings["total"] = (time.perf_counter() - started) * 1000.0
+    return PreprocessResult(image, timings, original_size, skew_angle)
+
+
+STEPS: Dict[str, Callable[[Image.Image], Image.Image]] = {
+    "exif_orientation": _exif_orientation,
+    "grayscale": _gray,
+    "downscale": downscale,
+    "deskew": deskew,
+    "normalize_contrast": lambda image: ImageOps.autocontrast(image, cutoff=1),
+    "binarize": binarize,
+    "crop_margins": crop_margins,
+}
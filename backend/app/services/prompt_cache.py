@@ -0,0 +1,123 @@
+import copy
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import torch
+from transformers import LogitsProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class PrefillTimer(LogitsProcessor):
+    """
+    Logits processor that only records when it is first called, i.e. when
+    the prompt prefill has finished. It leaves the scores untouched.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.prefilled_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def start(self):
+        """Restart the clock, e.g. once the inputs are tokenized and generate is about to run"""
+        self.started_at = time.perf_counter()
+
+    def finish(self):
+        """Mark the end of generation"""
+        self.finished_at = time.perf_counter()
+
+    def __call__(self, input_ids, scores):
+        if self.prefilled_at is None:
+            self.prefilled_at = time.perf_counter()
+        return scores
+
+    @property
+    def prefill_ms(self) -> Optional[float]:
+        if self.prefilled_at is None:
+            return None
+        return (self.prefilled_at - self.started_at) * 1000.0
+
+    @property
+    def decode_ms(self) -> Optional[float]:
+        """Time from the end of the prefill to ``finish``"""
+        if self.prefilled_at is None or self.finished_at is None:
+            return None
+        return (self.finished_at - self.prefilled_at) * 1000.0
+
+
+def _repeat_batch(past: Any, batch_size: int) -> Any:
+    if batch_size == 1:
+        return past
+    if hasattr(past, "batch_repeat_interleave"):
+        past.batch_repeat_interleave(batch_size)
+        return past
+    # Legacy tuple-of-tuples cache used by older remote model code
+    return tuple(
+        tuple(tensor.repeat(batch_size, *([1] * (tensor.dim() - 1))) for tensor in layer)
+        for layer in past
+    )
+
+
+class PromptPrefixCache:
+    """
+    Past key/values of a static prompt prefix, computed once per loaded model.
+
+    ``generate`` is then given a copy of these key/values together with the
+    full input ids and only prefills the tokens after the prefix. The prefix
+    must be tokenized exactly as in the full prompt, so callers build their
+    input ids as prefix ids followed by the per-request ids.
+    """
+
+    def __init__(self, name: str = "prefix-cache"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._prefix: Optional[Tuple[int, ...]] = None
+        self._past: Any = None
+        self.build_ms = 0.0
+        self.builds = 0
+        self.hits = 0
+        self.tokens_saved = 0
+
+    def _build(self, model: Any, prefix_ids: Tuple[int, ...]):
+        start = time.perf_counter()
+        input_ids = torch.tensor([prefix_ids], device=model.device)
+        with torch.no_grad():
+            outputs = model(input_ids=input_ids, use_cache=True)
+        self._past = outputs.past_key_values
+        self._prefix = prefix_ids
+        self.build_ms = (time.perf_counter() - start) * 1000.0
+        self.builds += 1
+        logger.info(f"Cached {len(prefix_ids)} prompt prefix tokens for {self.name} in {self.build_ms:.1f} ms")
+
+    def past_key_values(self, model: Any, prefix_ids: Sequence[int], batch_size: int = 1) -> Any:
+        """
+        Return a private copy of the prefix key/values for ``batch_size`` rows,
+        computing them on first use or when the prefix changed.
+        """
+        prefix_ids = tuple(int(token) for token in prefix_ids)
+        with self._lock:
+            if self._prefix != prefix_ids:
+                self._build(model, prefix_ids)
+            # generate appends to the cache in place
+            past = copy.deepcopy(self._past)
+            self.hits += 1
+            self.tokens_saved += len(prefix_ids) * batch_size
+        return _repeat_batch(past, batch_size)
+
+    def clear(self):
+        with self._lock:
+            self._prefix = None
+            self._past = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "prefix_tokens": len(self._prefix) if self._prefix is not None else 0,
+            "build_ms": self.build_ms,
+            "builds": self.builds,
+            "hits": self.hits,
+            "tokens_saved": self.tokens_saved,
+        }
+
@@ -0,0 +1,138 @@
+import functools
+import importlib.util
+import time
+from typing import Any, Dict, Tuple
+
+import torch
+
+# CPU precision modes of the model weights
+PRECISIONS = ("fp32", "bf16", "int8", "int4")
+# Modes whose weights are quantized after loading; the rest only pick a dtype
+QUANTIZED = ("int8", "int4")
+
+
+def resolve_precision(precision: str) -> str:
+    """
+    Validate a precision mode and fall back to int8 when int4 kernels are not
+    installed, so the registry key reflects the weights actually loaded.
+    """
+    precision = precision.lower()
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}'. Use one of {list(PRECISIONS)}")
+    if precision == "int4" and importlib.util.find_spec("torchao") is None:
+        print("int4 weight-only quantization requires torchao (pip install torchao); using int8")
+        return "int8"
+    return precision
+
+
+def load_dtype(precision: str) -> torch.dtype:
+    """dtype passed to from_pretrained; int4 kernels on CPU expect bfloat16 weights"""
+    return torch.bfloat16 if precision in ("bf16", "int4") else torch.float32
+
+
+def dtype_name(precision: str, torch_dtype: torch.dtype) -> str:
+    if precision in QUANTIZED:
+        return precision
+    return str(torch_dtype).replace("torch.", "")
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_runtime(use_gpu: bool, cpu_precision: str) -> Tuple[str, str, torch.dtype]:
+    """
+    Device, precision and load dtype of a model for a GPU preference: fp16 on
+    CUDA when asked for and available, else ``cpu_precision`` on the CPU.
+    """
+    if use_gpu and torch.cuda.is_available():
+        return "cuda", "fp16", torch.float16
+    precision = resolve_precision(cpu_precision)
+    return "cpu", precision, load_dtype(precision)
+
+
+def _int8_dynamic(model: torch.nn.Module) -> torch.nn.Module:
+    try:
+        from torch.ao.quantization import quantize_dynamic
+    except ImportError:
+        from torchao.quantization import Int8DynamicActivationInt8WeightConfig, quantize_
+        quantize_(model, Int8DynamicActivationInt8WeightConfig())
+        return model
+    # int8 weights, activations quantized per batch at run time
+    return quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+def _int4_weight_only(model: torch.nn.Module) -> torch.nn.Module:
+    from torchao.quantization import Int4WeightOnlyConfig, quantize_
+    try:
+        config = Int4WeightOnlyConfig(group_size=128, int4_packing_format="opaque")
+    except TypeError:
+        # torchao releases before the packing format option select the CPU kernel by layout
+        from torchao.dtypes import Int4CPULayout
+        config = Int4WeightOnlyConfig(group_size=128, layout=Int4CPULayout())
+    quantize_(model, config)
+    return model
+
+
+def quantize_model(model: torch.nn.Module, precision: str) -> torch.nn.Module:
+    """Quantize a loaded CPU model in place for the int8 and int4 modes"""
+    if precision == "int8":
+        return _int8_dynamic(model)
+    if precision == "int4":
+        return _int4_weight_only(model)
+    return model
+
+
+def _tensor_bytes(value: Any) -> int:
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+    if isinstance(value, (tuple, list)):
+        # Dynamically quantized linear layers keep (weight, bias) packed in a tuple
+        return sum(_tensor_bytes(item) for item in value)
+    return 0
+
+
+def weights_bytes(model: torch.nn.Module) -> int:
+    """Memory held by the parameters and buffers of a model, quantized or not"""
+    return sum(_tensor_bytes(value) for value in model.state_dict(keep_vars=True).values())
+
+
+def load_report(
+    model: torch.nn.Module,
+    input_ids: torch.Tensor,
+    precision: str,
+    load_seconds: float,
+    new_tokens: int = 16
+) -> Dict[str, Any]:
+    """
+    Weight memory and greedy decode speed of a freshly loaded model.
+    Args:
+        model: The loaded (and possibly quantized) model.
+        input_ids (torch.Tensor): A short text prompt, shape (1, length).
+        precision (str): Precision mode the model was loaded with.
+        load_seconds (float): Time spent loading and quantizing.
+        new_tokens (int): Tokens generated for the speed measurement.
+    """
+    with torch.no_grad():
+        start = time.perf_counter()
+        outputs = model.generate(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            max_new_tokens=new_tokens,
+            min_new_tokens=new_tokens,
+            do_sample=False
+        )
+        elapsed = time.perf_counter() - start
+    generated = outputs.shape[1] - input_ids.shape[1]
+    return {
+        "precision": precision,
+        "weights_mb": weights_bytes(model) / (1024 * 1024),
+        "load_seconds": load_seconds,
+        "prompt_tokens": input_ids.shape[1],
+        "generated_tokens": generated,
+        "tokens_per_second": generated / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def format_report(name: str, report: Dict[str, Any]) -> str:
+    return (
+        f"{name} loaded in {report['precision']}: {report['weights_mb']:.0f} MB of weights, "
+        f"{report['tokens_per_second']:.1f} tokens/s ({report['load_seconds']:.1f} s to load)"
+    )
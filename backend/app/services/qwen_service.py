@@ -1,32 +1,322 @@
+import asyncio
+import logging
 import time
-from typing import Dict, List, Any, Optional
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from huggingface_hub import snapshot_download
+from transformers import AutoModelForCausalLM, AutoTokenizer, LogitsProcessorList, StoppingCriteriaList
+from ..core.config import settings
+from .confidence import TokenLogprobs, eos_token_ids, sequence_confidence
+from .executor import InferenceExecutor, InferenceQueueFull, get_default_executor
+from .generation_limits import GenerationStop, token_budget
+from .prompt_cache import PrefillTimer, PromptPrefixCache
+from .quantization import dtype_name, format_report, load_report, quantize_model, resolve_runtime
+from .snapshots import find_snapshot, load_snapshot
+from .speculative import DraftModelDrafter, PromptLookupDrafter, SpeculativeStats, speculative_generate
+from .streaming import AsyncTokenStreamer, StreamStats
+from .tracing import record_generation, stage
+
+logger = logging.getLogger(__name__)
+
+# Static start of every prompt; its key/values are computed once and reused
+PROMPT_PREFIX = """<|im_start|>system
+You are an expert OCR post-processing assistant. Your task is to correct and enhance raw OCR text.
+Fix any errors, maintain the original formatting, and ensure the text is coherent and accurate."""
 
 class Qwen25Service:
-    def __init__(self):
-        """Initialize the Qwen2.5 model"""
-        try:
-            self.device = "cuda" if torch.cuda.is_available() else "cpu"
-            print(f"Using device: {self.device}")
-
-            # Load Qwen2.5 model
-            # Using Qwen/Qwen2.5-7B-Instruct
-            self.model_name = "Qwen/Qwen2.5-7B-Instruct"
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name, trust_remote_code=True)
-            self.model = AutoModelForCausalLM.from_pretrained(
-                self.model_name,
-                torch_dtype=torch.float16,
-                device_map="auto",
-                trust_remote_code=True
-            )
+    def __init__(self, use_gpu: bool = True, executor: Optional[InferenceExecutor] = None):
+        """
+        Initialize the Qwen2.5 service. The model itself is loaded lazily.
+        Args:
+            use_gpu (bool): Whether to use GPU if available. If False, forces CPU usage.
+            executor (InferenceExecutor): Worker pool running the blocking generate calls.
+        """
+        self.device, self.precision, self.torch_dtype = resolve_runtime(use_gpu, settings.QWEN25_CPU_PRECISION)
+        self.use_gpu = self.device == "cuda"
+        self.load_report: Optional[Dict[str, Any]] = None
+        logger.info(f"Using device: {self.device}")
+
+        # Using Qwen/Qwen2.5-7B-Instruct
+        self.model_id = "Qwen/Qwen2.5-7B-Instruct"
+        self.model = None
+        self.tokenizer = None
+        self.draft_model = None
+        self.speculative = settings.QWEN25_SPECULATIVE
+        self.executor = executor or get_default_executor()
+        self.stream_stats = StreamStats()
+        self.prefix_cache = PromptPrefixCache(name="qwen25")
+        self.speculative_stats = SpeculativeStats()
+
+    @property
+    def dtype_name(self) -> str:
+        return dtype_name(self.precision, self.torch_dtype)
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.model is not None and self.tokenizer is not None
+
+    @property
+    def init_kwargs(self) -> Dict[str, Any]:
+        """Arguments to rebuild this service inside an executor worker process"""
+        return {"use_gpu": self.use_gpu}
+
+    async def load(self):
+        """Load the model and tokenizer if they are not loaded yet"""
+        await self._load_model()
 
-            print("Qwen2.5 model loaded successfully")
+    def unload(self):
+        """Release the model weights and tokenizer"""
+        self.model = None
+        self.tokenizer = None
+        self.draft_model = None
+        self.prefix_cache.clear()
+        if self.use_gpu:
+            torch.cuda.empty_cache()
+        logger.info(f"Unloaded {self.model_id} from {self.device}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "streaming": self.stream_stats.stats(),
+            "prefix_cache": self.prefix_cache.stats(),
+            "speculative": {"mode": self.speculative, **self.speculative_stats.stats()},
+            "load_report": self.load_report
+        }
+
+    async def _load_model(self):
+        """Lazy loading of the Qwen2.5 model and tokenizer, off the event loop"""
+        if self.executor.kind == "process":
+            # Each worker process loads its own copy on first use
+            return
+        if not self.is_loaded:
+            await asyncio.to_thread(self._load_model_sync)
+
+    def source_path(self) -> str:
+        """Local directory of the Hugging Face snapshot, downloaded on first use"""
+        return snapshot_download(repo_id=self.model_id)
+
+    def _from_pretrained(self, path: str):
+        return AutoModelForCausalLM.from_pretrained(
+            path,
+            torch_dtype=self.torch_dtype,
+            device_map="auto" if self.use_gpu else self.device,
+            trust_remote_code=True
+        )
+
+    def _load_model_sync(self):
+        try:
+            if not self.is_loaded:
+                start = time.perf_counter()
+                path = find_snapshot("qwen25", self.torch_dtype)
+                if path:
+                    logger.info(f"Loading compiled snapshot {path}")
+                    self.model = load_snapshot(path, device=self.device)
+                else:
+                    path = self.source_path()
+                    self.model = self._from_pretrained(path)
+                self.tokenizer = AutoTokenizer.from_pretrained(path, trust_remote_code=True)
+                if not self.use_gpu:
+                    self.model = quantize_model(self.model, self.precision)
+                logger.info("Qwen2.5 model loaded successfully")
+                if self.speculative == "draft_model":
+                    self._load_draft_model()
+                if settings.LOAD_REPORT:
+                    self._report_load(time.perf_counter() - start)
         except Exception as e:
-            print(f"Error initializing Qwen2.5 model: {str(e)}")
-            # Fallback to a simplified initialization to avoid breaking the application
+            logger.error(f"Error initializing Qwen2.5 model: {str(e)}")
             self.model = None
             self.tokenizer = None
+            raise
+
+    def _load_draft_model(self):
+        """Load the small draft model, falling back to prompt lookup drafts without it"""
+        try:
+            self.draft_model = self._from_pretrained(snapshot_download(repo_id=settings.QWEN25_DRAFT_MODEL_NAME))
+            if not self.use_gpu:
+                self.draft_model = quantize_model(self.draft_model, self.precision)
+            logger.info(f"Loaded draft model {settings.QWEN25_DRAFT_MODEL_NAME}")
+        except Exception as e:
+            logger.warning(f"Could not load draft model {settings.QWEN25_DRAFT_MODEL_NAME}, using prompt lookup: {str(e)}")
+            self.draft_model = None
+            self.speculative = "prompt_lookup"
+
+    def _report_load(self, load_seconds: float):
+        """Measure the weight memory and decode speed of the freshly loaded model"""
+        try:
+            input_ids = torch.tensor(
+                [self.tokenizer(PROMPT_PREFIX, add_special_tokens=False).input_ids], device=self.device
+            )
+            self.load_report = load_report(
+                self.model, input_ids, self.precision, load_seconds, settings.LOAD_REPORT_TOKENS
+            )
+            logger.info(format_report("Qwen2.5", self.load_report))
+        except Exception as e:
+            logger.warning(f"Could not measure Qwen2.5 load report: {str(e)}")
+
+    def _encode(self, prompt: str) -> Tuple[torch.Tensor, int]:
+        """
+        Tokenize PROMPT_PREFIX and the rest of the prompt separately so the
+        prefix ids are identical in every request, whether or not its cached
+        key/values are used. Returns the input ids and the prefix length.
+        """
+        prefix_ids = self.tokenizer(PROMPT_PREFIX, add_special_tokens=False).input_ids
+        rest_ids = self.tokenizer(prompt[len(PROMPT_PREFIX):], add_special_tokens=False).input_ids
+        input_ids = torch.tensor([prefix_ids + rest_ids], device=self.device)
+        return input_ids, len(prefix_ids)
+
+    def _max_new_tokens(self, prompt_tokens: int) -> int:
+        """
+        Token budget of a correction: about as long as the raw text, whose
+        tokens are those of the prompt after the prefix and the fixed template.
+        """
+        if not settings.ADAPTIVE_MAX_NEW_TOKENS:
+            return settings.QWEN25_MAX_NEW_TOKENS
+        template = self.tokenizer(self._build_prompt("", None)[len(PROMPT_PREFIX):], add_special_tokens=False).input_ids
+        return token_budget(max(0, prompt_tokens - len(template)), settings.QWEN25_MAX_NEW_TOKENS_LIMIT)
+
+    def _generate_kwargs(self, prompt: str, processors: List[Any]) -> Tuple[Dict[str, Any], Dict[str, Any], GenerationStop]:
+        """
+        generate arguments for a prompt, the prompt token counts and budget
+        reported with it, and the stopping criteria telling why it stopped
+        """
+        input_ids, prefix_len = self._encode(prompt)
+        max_new_tokens = self._max_new_tokens(input_ids.shape[1] - prefix_len)
+        stop = GenerationStop(input_ids.shape[1], [max_new_tokens])
+        kwargs = {
+            "input_ids": input_ids,
+            "attention_mask": torch.ones_like(input_ids),
+            "max_new_tokens": max_new_tokens,
+            "do_sample": False,
+            "logits_processor": LogitsProcessorList(processors),
+            "stopping_criteria": StoppingCriteriaList([stop]),
+        }
+        reused = 0
+        if settings.PROMPT_PREFIX_CACHE:
+            kwargs["past_key_values"] = self.prefix_cache.past_key_values(
+                self.model, input_ids[0, :prefix_len].tolist()
+            )
+            reused = prefix_len
+        return kwargs, {
+            "prompt_tokens": input_ids.shape[1],
+            "prefix_tokens_reused": reused,
+            "max_new_tokens": max_new_tokens,
+        }, stop
+
+    def _drafter(self) -> Any:
+        if self.speculative == "draft_model" and self.draft_model is not None:
+            return DraftModelDrafter(self.draft_model, eos_token_ids(self.model, self.tokenizer))
+        return PromptLookupDrafter(max_ngram=settings.QWEN25_PROMPT_LOOKUP_NGRAM)
+
+    def _decode(self, kwargs: Dict[str, Any], timings: Dict[str, Any], **extra) -> torch.Tensor:
+        """
+        Run generate, or speculative decoding when QWEN25_SPECULATIVE is on, in
+        which case its draft and acceptance counts are added to ``timings``.
+        """
+        with torch.no_grad():
+            if self.speculative not in ("prompt_lookup", "draft_model"):
+                return self.model.generate(**kwargs, **extra)
+            outputs, stats = speculative_generate(
+                self.model,
+                kwargs["input_ids"],
+                self._drafter(),
+                kwargs["max_new_tokens"],
+                eos_token_ids(self.model, self.tokenizer),
+                lookahead=settings.QWEN25_SPECULATIVE_LOOKAHEAD,
+                past_key_values=kwargs.get("past_key_values"),
+                logits_processor=kwargs["logits_processor"],
+                stopping_criteria=kwargs["stopping_criteria"],
+                **extra
+            )
+        self.speculative_stats.record(stats)
+        timings["speculative"] = {"mode": self.speculative, **stats}
+        return outputs
+
+    def _finish(
+        self,
+        outputs: torch.Tensor,
+        stop: GenerationStop,
+        logprobs: TokenLogprobs,
+        timings: Dict[str, Any]
+    ) -> Tuple[torch.Tensor, float]:
+        """
+        Drop the repeats of a loop from ``outputs``, add why generation stopped
+        to ``timings`` and return the kept ids with their confidence.
+        """
+        eos = eos_token_ids(self.model, self.tokenizer)
+        row = stop.finish(outputs, eos)[0]
+        timings["generated_tokens"] = row["generated_tokens"]
+        timings["stop_reason"] = row["stop_reason"]
+        confidence = sequence_confidence(logprobs.token_logprobs(outputs, eos)[0][:row["keep"]])
+        return outputs[:, :stop.prompt_length + row["keep"]], confidence
+
+    def _generate(self, prompt: str) -> Tuple[str, float, Dict[str, Any]]:
+        """
+        Blocking generate call, run on the inference executor.
+        Returns the decoded output, its token confidence and the timings.
+        """
+        started = time.perf_counter()
+        timer = PrefillTimer()
+        logprobs = TokenLogprobs()
+        kwargs, timings, stop = self._generate_kwargs(prompt, [timer, logprobs])
+        timer.start()
+        outputs = self._decode(kwargs, timings)
+        timer.finish()
+
+        outputs, confidence = self._finish(outputs, stop, logprobs, timings)
+        # Decode the generated text
+        response = self.tokenizer.decode(outputs[0], skip_special_tokens=False)
+        return response, confidence, {**self._stage_timings(started, timer), **timings}
+
+    def _generate_stream(self, prompt: str, streamer: AsyncTokenStreamer) -> Tuple[float, Dict[str, Any], str]:
+        """
+        Blocking generate call handing each new token to ``streamer``. Returns
+        the confidence, the timings and the generated text, which unlike the
+        streamed text has the repeats of a loop dropped.
+        """
+        try:
+            started = time.perf_counter()
+            timer = PrefillTimer()
+            logprobs = TokenLogprobs()
+            kwargs, timings, stop = self._generate_kwargs(prompt, [timer, logprobs])
+            kwargs["stopping_criteria"].append(streamer.stopping_criteria())
+            timer.start()
+            outputs = self._decode(kwargs, timings, streamer=streamer)
+            timer.finish()
+            outputs, confidence = self._finish(outputs, stop, logprobs, timings)
+            text = self.tokenizer.decode(outputs[0, stop.prompt_length:], **streamer.decode_kwargs)
+            return confidence, {**self._stage_timings(started, timer), **timings}, text
+        finally:
+            streamer.end()
+
+    @staticmethod
+    def _stage_timings(started: float, timer: PrefillTimer) -> Dict[str, Any]:
+        """
+        encode (tokenizer and prefix cache), prefill, decode and postprocess
+        times of a generate call, and the whole call's inference_ms
+        """
+        now = time.perf_counter()
+        return {
+            "encode_ms": (timer.started_at - started) * 1000.0,
+            "prefill_ms": timer.prefill_ms,
+            "decode_ms": timer.decode_ms,
+            "postprocess_ms": (now - timer.finished_at) * 1000.0,
+            "inference_ms": (now - started) * 1000.0,
+        }
+
+    @staticmethod
+    def _build_prompt(text: str, languages: Optional[List[str]]) -> str:
+        language_str = ""
+        if languages and len(languages) > 0:
+            language_str = f" The text is in {', '.join(languages)}."
+
+        return f"""{PROMPT_PREFIX}{language_str}
+<|im_end|>
+<|im_start|>user
+Here is the raw OCR text that needs correction and enhancement:
+
+{text}
+<|im_end|>
+<|im_start|>assistant
+"""
 
     async def process_text(
         self,
@@ -36,44 +326,25 @@ class Qwen25Service:
         """Process text with Qwen2.5 model"""
         start_time = time.time()
 
-        if self.model is None or self.tokenizer is None:
+        try:
+            await self._load_model()
+        except Exception as e:
             return {
                 "text": text,
                 "confidence": 0.0,
                 "processing_time": 0.0,
-                "error": "Model not initialized properly"
+                "error": f"Model not initialized properly: {str(e)}"
             }
 
         try:
             # Create prompt based on the task
-            language_str = ""
-            if languages and len(languages) > 0:
-                language_str = f" The text is in {', '.join(languages)}."
+            prompt = self._build_prompt(text, languages)
 
-            prompt = f"""<|im_start|>system
-You are an expert OCR post-processing assistant. Your task is to correct and enhance raw OCR text.
-Fix any errors, maintain the original formatting, and ensure the text is coherent and accurate.{language_str}
-<|im_end|>
-<|im_start|>user
-Here is the raw OCR text that needs correction and enhancement:
-
-{text}
-<|im_end|>
-<|im_start|>assistant
-"""
-
-            # Generate enhanced text with Qwen2.5
-            inputs = self.tokenizer(prompt, return_tensors="pt").to(self.device)
-
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    **inputs,
-                    max_new_tokens=1024,
-                    do_sample=False
-                )
-
-            # Decode the generated text
-            full_response = self.tokenizer.decode(outputs[0], skip_special_tokens=False)
+            # Generate enhanced text with Qwen2.5 on the inference pool
+            with stage("generate", "qwen25"):
+                submitted = time.perf_counter()
+                full_response, confidence, timings = await self.executor.run_service(self, "_generate", prompt)
+                record_generation("qwen25", timings, (time.perf_counter() - submitted) * 1000.0)
 
             # Extract the assistant's response
             if "<|im_start|>assistant" in full_response:
@@ -87,25 +358,69 @@ Here is the raw OCR text that needs correction and enhancement:
 
             processing_time = time.time() - start_time
 
-            # Evaluate confidence based on changes made
-            # Simple heuristic: more changes = lower confidence
-            # This is a placeholder - a real implementation would be more sophisticated
-            original_words = set(text.lower().split())
-            enhanced_words = set(enhanced_text.lower().split())
-            word_diff_ratio = len(original_words.intersection(enhanced_words)) / max(len(original_words), 1)
-            confidence = min(0.95, max(0.5, word_diff_ratio))
-
             return {
                 "text": enhanced_text,
                 "confidence": confidence,
-                "processing_time": processing_time
+                "processing_time": processing_time,
+                "timings": timings,
+                # The budget ran out before the model finished the text
+                "truncated": timings.get("stop_reason") == "length"
             }
 
+        except InferenceQueueFull:
+            raise
         except Exception as e:
-            print(f"Error processing with Qwen2.5: {str(e)}")
+            logger.error(f"Error processing with Qwen2.5: {str(e)}")
             return {
                 "text": text,  # Return original text on error
                 "confidence": 0.0,
                 "processing_time": time.time() - start_time,
                 "error": str(e)
             }
+
+    async def stream_text(
+        self,
+        text: str,
+        languages: Optional[List[str]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield ``{"delta": text}`` as Qwen2.5 produces tokens, then the final
+        result with the same keys as process_text plus time_to_first_token,
+        generated_tokens and tokens_per_second.
+        """
+        start_time = time.time()
+
+        if self.executor.kind == "process":
+            # The streamer cannot cross a process boundary; send the whole text at once
+            results = await self.process_text(text, languages)
+            if results.get("text"):
+                yield {"delta": results["text"]}
+            yield results
+            return
+
+        await self._load_model()
+        submitted = time.perf_counter()
+        streamer = AsyncTokenStreamer(self.tokenizer)
+        generation = asyncio.ensure_future(
+            self.executor.run_service(self, "_generate_stream", self._build_prompt(text, languages), streamer)
+        )
+        # Also ends the stream when the job is rejected before generate starts
+        generation.add_done_callback(lambda _: streamer.end())
+
+        try:
+            async for delta in streamer:
+                yield {"delta": delta}
+            confidence, timings, text = await generation
+        finally:
+            streamer.cancel()
+
+        record_generation("qwen25", timings, (time.perf_counter() - submitted) * 1000.0)
+        self.stream_stats.record(streamer)
+        yield {
+            "text": text.strip(),
+            "confidence": confidence,
+            "processing_time": time.time() - start_time,
+            "timings": timings,
+            "truncated": timings.get("stop_reason") == "length",
+            **streamer.timings()
+        }
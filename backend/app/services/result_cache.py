@@ -0,0 +1,279 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..core.config import settings
+
+
+def make_context_key(
+    model: str,
+    languages: Optional[List[str]],
+    params: Dict[str, Any]
+) -> str:
+    """
+    Hash of everything that shapes a result apart from the image itself.
+    Args:
+        model (str): Model name the result was produced with
+        languages (list): Requested languages, order-insensitive
+        params (dict): Generation parameters and prompt version
+    """
+    payload = json.dumps(
+        {
+            "model": model.lower(),
+            "languages": sorted(languages or []),
+            "params": params,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def make_cache_key(
+    image_hash: str,
+    model: str,
+    languages: Optional[List[str]],
+    params: Dict[str, Any]
+) -> str:
+    """
+    Build a content-addressed cache key.
+    Args:
+        image_hash (str): SHA-256 hex digest of the uploaded image bytes
+        model, languages, params: See make_context_key
+    """
+    context = make_context_key(model, languages, params)
+    return hashlib.sha256(f"{image_hash}:{context}".encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache for OCR responses.
+
+    The memory tier is an LRU bounded by the serialized size of its entries.
+    The optional disk tier is a SQLite database that survives restarts and
+    holds at most ``disk_max_rows`` entries; disk hits are promoted back into
+    memory. Entries expire after ``ttl_seconds``; expired and excess disk rows
+    are pruned on write.
+    ``on_remove`` is called with the key of every entry that leaves the last
+    tier holding it, by eviction, expiry or ``clear``.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_seconds: Optional[float] = None,
+        disk_path: Optional[str] = None,
+        on_remove: Optional[Callable[[str], None]] = None,
+        disk_max_rows: int = 100_000
+    ):
+        """
+        Args:
+            max_bytes (int): Byte budget of the in-memory tier.
+            ttl_seconds (float): Lifetime of an entry. None keeps entries forever.
+            disk_path (str): SQLite file for the persistent tier. None disables it.
+            on_remove (callable): Called with the key of each entry that is gone from the cache.
+            disk_max_rows (int): Entries kept in the persistent tier.
+        """
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self.on_remove = on_remove
+        self.disk_max_rows = disk_max_rows
+
+        self._memory: "OrderedDict[str, Tuple[Dict[str, Any], int, Optional[float]]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._disk_rows = 0
+
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "bypassed": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "disk_evictions": 0,
+        }
+
+        if disk_path:
+            self._open_disk(disk_path)
+
+    @classmethod
+    def from_settings(cls, on_remove: Optional[Callable[[str], None]] = None) -> "ResultCache":
+        return cls(
+            max_bytes=settings.RESULT_CACHE_MAX_BYTES,
+            ttl_seconds=settings.RESULT_CACHE_TTL,
+            disk_path=settings.RESULT_CACHE_PATH,
+            on_remove=on_remove,
+            disk_max_rows=settings.RESULT_CACHE_DISK_MAX_ROWS
+        )
+
+    def _open_disk(self, path: str):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, expires REAL)"
+        )
+        # Pruning on write finds expired and oldest rows through these
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_expires ON results (expires)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_created ON results (created)")
+        self._db.commit()
+        self._disk_rows = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def _expires_at(self, now: float) -> Optional[float]:
+        return now + self.ttl_seconds if self.ttl_seconds else None
+
+    def _removed(self, key: str):
+        if self.on_remove is not None:
+            self.on_remove(key)
+
+    def _evict(self):
+        while self._memory_bytes > self.max_bytes and self._memory:
+            key, (_, size, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= size
+            self._counters["evictions"] += 1
+            # With a disk tier the entry is still on disk
+            if self._db is None:
+                self._removed(key)
+
+    def _put_memory(self, key: str, value: Dict[str, Any], size: int, expires: Optional[float]):
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key)[1]
+        if size > self.max_bytes:
+            return
+        self._memory[key] = (value, size, expires)
+        self._memory_bytes += size
+        self._evict()
+
+    def _prune_disk(self, now: float):
+        """Delete expired rows, then the oldest rows past disk_max_rows, from both tiers"""
+        expired = [
+            key for (key,) in self._db.execute(
+                "SELECT key FROM results WHERE expires IS NOT NULL AND expires <= ?", (now,)
+            )
+        ]
+        excess = max(0, self._disk_rows - len(expired) - self.disk_max_rows)
+        oldest = [
+            key for (key,) in self._db.execute(
+                "SELECT key FROM results WHERE expires IS NULL OR expires > ? ORDER BY created LIMIT ?",
+                (now, excess)
+            )
+        ] if excess else []
+        if not expired and not oldest:
+            return
+        self._db.executemany("DELETE FROM results WHERE key = ?", [(key,) for key in expired + oldest])
+        self._disk_rows -= len(expired) + len(oldest)
+        self._counters["expirations"] += len(expired)
+        self._counters["disk_evictions"] += len(oldest)
+        for key in expired + oldest:
+            entry = self._memory.pop(key, None)
+            if entry is not None:
+                self._memory_bytes -= entry[1]
+            self._removed(key)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached value, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, size, expires = entry
+                if expires is not None and expires <= now:
+                    self._memory.pop(key)
+                    self._memory_bytes -= size
+                    # With a disk tier the row is counted and removed below
+                    if self._db is None:
+                        self._counters["expirations"] += 1
+                        self._removed(key)
+                else:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return dict(value)
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    raw, expires = row
+                    if expires is not None and expires <= now:
+                        self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                        self._db.commit()
+                        self._disk_rows -= 1
+                        self._counters["expirations"] += 1
+                        self._removed(key)
+                    else:
+                        value = json.loads(raw)
+                        self._put_memory(key, value, len(raw), expires)
+                        self._counters["disk_hits"] += 1
+                        return dict(value)
+
+            self._counters["misses"] += 1
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]):
+        """Store a JSON-serializable value in both tiers"""
+        raw = json.dumps(value)
+        now = time.time()
+        expires = self._expires_at(now)
+        with self._lock:
+            self._put_memory(key, value, len(raw), expires)
+            if self._db is not None:
+                exists = self._db.execute("SELECT 1 FROM results WHERE key = ?", (key,)).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, created, expires) VALUES (?, ?, ?, ?)",
+                    (key, raw, now, expires)
+                )
+                if exists is None:
+                    self._disk_rows += 1
+                self._prune_disk(now)
+                self._db.commit()
+            self._counters["stores"] += 1
+
+    def record_bypass(self):
+        with self._lock:
+            self._counters["bypassed"] += 1
+
+    def clear(self):
+        with self._lock:
+            keys = set(self._memory)
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self._db is not None:
+                keys.update(key for (key,) in self._db.execute("SELECT key FROM results"))
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+                self._disk_rows = 0
+            for key in keys:
+                self._removed(key)
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self._counters["memory_hits"] + self._counters["disk_hits"]
+            lookups = hits + self._counters["misses"]
+            disk_entries = self._disk_rows if self._db is not None else None
+            return {
+                **self._counters,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "max_bytes": self.max_bytes,
+                "disk_entries": disk_entries,
+                "disk_max_rows": self.disk_max_rows if self._db is not None else None,
+            }
@@ -0,0 +1 @@
+../../../scanner_exe/backend/app/services/sane_devices.py
\ No newline at end of file
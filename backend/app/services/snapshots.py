@@ -0,0 +1,229 @@
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import time
+from typing import Any, Dict, Optional
+
+import torch
+
+from ..core.config import settings
+
+MANIFEST = "manifest.json"
+WEIGHTS = "model.safetensors"
+FORMAT_VERSION = 1
+
+# Weight files of a Hugging Face snapshot; everything else (configs, tokenizer,
+# remote code) is copied into the compiled snapshot as is
+_WEIGHT_SUFFIXES = (".safetensors", ".bin", ".pt", ".pth", ".index.json")
+
+_SAFETENSORS_DTYPES = {
+    "F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+    "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8,
+    "U8": torch.uint8, "BOOL": torch.bool,
+}
+
+
+class SnapshotError(RuntimeError):
+    """A compiled snapshot is missing, incomplete or does not match its manifest"""
+
+
+def snapshot_dir(name: str, torch_dtype: torch.dtype) -> str:
+    """Directory of the compiled snapshot of a model in a given dtype, e.g. .../qwen25-float32"""
+    return os.path.join(settings.MODEL_SNAPSHOT_DIR, f"{name}-{str(torch_dtype).replace('torch.', '')}")
+
+
+def find_snapshot(name: str, torch_dtype: torch.dtype) -> Optional[str]:
+    path = snapshot_dir(name, torch_dtype)
+    return path if os.path.isfile(os.path.join(path, MANIFEST)) else None
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(8 * 1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _files_checksum(files: Dict[str, Dict[str, Any]]) -> str:
+    return hashlib.sha256(json.dumps(files, sort_keys=True).encode()).hexdigest()
+
+
+def write_snapshot(model: torch.nn.Module, source_dir: str, output_dir: str, name: str, source: str) -> Dict[str, Any]:
+    """
+    Write a loaded model as a compiled snapshot.
+    Args:
+        model: Model loaded with from_pretrained in the dtype the service uses.
+        source_dir (str): Hugging Face snapshot it was loaded from; its configs,
+            tokenizer files and remote code are copied next to the weights.
+        output_dir (str): Snapshot directory, replaced atomically.
+        name (str): Public model name, e.g. "phi3".
+        source (str): Model id recorded in the manifest.
+    Returns:
+        The manifest.
+    """
+    from safetensors.torch import save_file
+
+    staging = output_dir + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    for root, _, names in os.walk(source_dir):
+        for file_name in names:
+            if file_name.endswith(_WEIGHT_SUFFIXES) or file_name.startswith("."):
+                continue
+            relative = os.path.relpath(os.path.join(root, file_name), source_dir)
+            os.makedirs(os.path.dirname(os.path.join(staging, relative)), exist_ok=True)
+            shutil.copy2(os.path.join(root, file_name), os.path.join(staging, relative))
+
+    # Tied tensors are stored once; their other names are recorded as aliases
+    tensors: Dict[str, torch.Tensor] = {}
+    aliases: Dict[str, str] = {}
+    buffers = []
+    seen: Dict[int, str] = {}
+    named = [(n, t, False) for n, t in model.named_parameters(remove_duplicate=False)]
+    named += [(n, t, True) for n, t in model.named_buffers(remove_duplicate=False)]
+    for tensor_name, tensor, is_buffer in named:
+        if id(tensor) in seen:
+            aliases[tensor_name] = seen[id(tensor)]
+            continue
+        seen[id(tensor)] = tensor_name
+        tensors[tensor_name] = tensor.detach().to("cpu").contiguous()
+        if is_buffer:
+            buffers.append(tensor_name)
+    save_file(tensors, os.path.join(staging, WEIGHTS), metadata={"format": "pt"})
+
+    files = {}
+    for root, _, names in os.walk(staging):
+        for file_name in names:
+            path = os.path.join(root, file_name)
+            files[os.path.relpath(path, staging)] = {"size": os.path.getsize(path), "sha256": _sha256(path)}
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "model": name,
+        "source": source,
+        "dtype": str(model.dtype).replace("torch.", ""),
+        "created": time.time(),
+        "files": files,
+        "buffers": buffers,
+        "aliases": aliases,
+        "checksum": _files_checksum(files),
+    }
+    with open(os.path.join(staging, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(staging, output_dir)
+    return manifest
+
+
+def read_manifest(path: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise SnapshotError(f"Cannot read the manifest of {path}: {str(e)}")
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise SnapshotError(f"{path} has snapshot format {manifest.get('format_version')}, expected {FORMAT_VERSION}")
+    return manifest
+
+
+def verify_snapshot(path: str, manifest: Dict[str, Any], full: bool = False):
+    """
+    Check the files of a compiled snapshot against its manifest: their sizes,
+    and with ``full`` their sha256 digests.
+    """
+    if _files_checksum(manifest["files"]) != manifest["checksum"]:
+        raise SnapshotError(f"Manifest checksum mismatch in {path}")
+    for relative, expected in manifest["files"].items():
+        file_path = os.path.join(path, relative)
+        if not os.path.isfile(file_path) or os.path.getsize(file_path) != expected["size"]:
+            raise SnapshotError(f"{relative} is missing or truncated in {path}")
+        if full and _sha256(file_path) != expected["sha256"]:
+            raise SnapshotError(f"{relative} does not match its checksum in {path}")
+
+
+def mmap_safetensors(path: str) -> Dict[str, torch.Tensor]:
+    """
+    Tensors of a safetensors file as views of a copy-on-write memory map.
+    Nothing is read up front; pages are faulted in from the page cache on
+    first use and shared by every process mapping the same file.
+    """
+    with open(path, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    data_start = 8 + header_size
+    tensors = {}
+    for tensor_name, info in header.items():
+        if tensor_name == "__metadata__":
+            continue
+        dtype = _SAFETENSORS_DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        if end == start:
+            tensors[tensor_name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        count = (end - start) // torch.empty((), dtype=dtype).element_size()
+        tensors[tensor_name] = torch.frombuffer(
+            buffer, dtype=dtype, count=count, offset=data_start + start
+        ).reshape(info["shape"])
+    return tensors
+
+
+def _assign(model: torch.nn.Module, tensor_name: str, tensor: torch.Tensor, is_buffer: bool):
+    module_name, _, leaf = tensor_name.rpartition(".")
+    module = model.get_submodule(module_name)
+    if is_buffer:
+        # Keeps the buffer's persistent / non-persistent flag
+        module._buffers[leaf] = tensor
+    else:
+        setattr(module, leaf, tensor if isinstance(tensor, torch.nn.Parameter) else torch.nn.Parameter(tensor, requires_grad=False))
+
+
+def load_snapshot(path: str, device: str = "cpu", verify: Optional[str] = None, **config_kwargs) -> torch.nn.Module:
+    """
+    Build a model from a compiled snapshot without copying its weights.
+    Args:
+        path (str): Compiled snapshot directory.
+        device (str): Device to move the model to; on "cpu" the weights stay memory-mapped.
+        verify (str): "none", "size" or "sha256"; defaults to settings.MODEL_SNAPSHOT_VERIFY.
+        **config_kwargs: Passed to from_config, e.g. attn_implementation.
+    """
+    from transformers import AutoConfig, AutoModelForCausalLM, GenerationConfig
+
+    manifest = read_manifest(path)
+    verify = verify or settings.MODEL_SNAPSHOT_VERIFY
+    if verify != "none":
+        verify_snapshot(path, manifest, full=verify == "sha256")
+
+    config = AutoConfig.from_pretrained(path, trust_remote_code=True)
+    # The module tree is built on the meta device, so no memory is allocated for weights
+    with torch.device("meta"):
+        model = AutoModelForCausalLM.from_config(
+            config, trust_remote_code=True, torch_dtype=getattr(torch, manifest["dtype"]), **config_kwargs
+        )
+
+    tensors = mmap_safetensors(os.path.join(path, WEIGHTS))
+    buffers = set(manifest["buffers"])
+    for tensor_name, tensor in tensors.items():
+        _assign(model, tensor_name, tensor, tensor_name in buffers)
+    for alias, target in manifest["aliases"].items():
+        module_name, _, leaf = target.rpartition(".")
+        module = model.get_submodule(module_name)
+        shared = module._buffers[leaf] if target in buffers else module._parameters[leaf]
+        _assign(model, alias, shared, target in buffers)
+
+    missing = [n for n, t in list(model.named_parameters()) + list(model.named_buffers()) if t.is_meta]
+    if missing:
+        raise SnapshotError(f"{path} has no weights for {missing[:5]}")
+
+    if os.path.isfile(os.path.join(path, "generation_config.json")):
+        model.generation_config = GenerationConfig.from_pretrained(path)
+    model.eval()
+    if device != "cpu":
+        model.to(device)
+    return model
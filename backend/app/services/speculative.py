@@ -0,0 +1,225 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import torch
+from transformers import DynamicCache, LogitsProcessorList, StoppingCriteriaList
+
+
+class PromptLookupDrafter:
+    """
+    Drafts tokens by prompt lookup: the last ``max_ngram`` (down to
+    ``min_ngram``) tokens are looked up earlier in the sequence and the tokens
+    that followed them there are proposed. A corrected OCR text mostly copies
+    the raw text in the prompt, so most drafts come straight from it. Matches
+    after the previous match are preferred, as the copy runs in order.
+    """
+
+    def __init__(self, max_ngram: int = 3, min_ngram: int = 1):
+        self.max_ngram = max_ngram
+        self.min_ngram = min_ngram
+        # n-gram -> positions right after each of its occurrences, ascending
+        self._index: Dict[Tuple[int, ...], List[int]] = {}
+        self._indexed = 0
+        self._cursor = 0
+        self._start = 0
+
+    def _extend(self, sequence: Sequence[int]):
+        for end in range(self._indexed + 1, len(sequence) + 1):
+            for n in range(self.min_ngram, min(self.max_ngram, end) + 1):
+                self._index.setdefault(tuple(sequence[end - n:end]), []).append(end)
+        self._indexed = len(sequence)
+
+    def draft(self, sequence: Sequence[int], count: int) -> List[int]:
+        self._extend(sequence)
+        length = len(sequence)
+        for n in range(min(self.max_ngram, length), self.min_ngram - 1, -1):
+            # The n-gram's own occurrence at the end has nothing after it
+            ends = [end for end in self._index.get(tuple(sequence[-n:]), ()) if end < length]
+            if ends:
+                self._start = next((end for end in ends if end >= self._cursor), ends[-1])
+                return list(sequence[self._start:self._start + count])
+        return []
+
+    def accepted(self, count: int):
+        self._cursor = self._start + count
+
+
+class DraftModelDrafter:
+    """
+    Drafts tokens greedily with a small model sharing the target's tokenizer,
+    e.g. Qwen2.5-0.5B-Instruct for Qwen2.5-7B-Instruct. Its key/value cache
+    is cut back to the accepted tokens before each draft.
+    """
+
+    def __init__(self, model: Any, eos_token_ids: Iterable[int] = ()):
+        self.model = model
+        self.eos_token_ids = set(eos_token_ids)
+        self._past: Any = DynamicCache()
+
+    def draft(self, sequence: Sequence[int], count: int) -> List[int]:
+        if count <= 0:
+            return []
+        # Every token but the last one of ``sequence`` was either drafted and
+        # accepted or fed before, so their key/values are still valid
+        self._past = _crop(self._past, min(_cache_length(self._past), len(sequence) - 1))
+        feed = list(sequence[_cache_length(self._past):])
+        tokens: List[int] = []
+        with torch.no_grad():
+            while True:
+                outputs = self.model(
+                    input_ids=torch.tensor([feed], device=self.model.device),
+                    past_key_values=self._past,
+                    use_cache=True
+                )
+                self._past = outputs.past_key_values
+                token = int(outputs.logits[0, -1].argmax())
+                tokens.append(token)
+                if len(tokens) == count or token in self.eos_token_ids:
+                    return tokens
+                feed = [token]
+
+    def accepted(self, count: int):
+        pass
+
+
+def _cache_length(past: Any) -> int:
+    if past is None:
+        return 0
+    if hasattr(past, "get_seq_length"):
+        return past.get_seq_length()
+    # Legacy tuple-of-tuples cache used by older remote model code
+    return past[0][0].shape[-2] if len(past) else 0
+
+
+def _crop(past: Any, length: int) -> Any:
+    current = _cache_length(past)
+    if current <= length:
+        return past
+    if hasattr(past, "crop"):
+        # A negative count of tokens to drop works across transformers versions
+        past.crop(length - current)
+        return past
+    return tuple(tuple(tensor[..., :length, :] for tensor in layer) for layer in past)
+
+
+def speculative_generate(
+    model: Any,
+    input_ids: torch.Tensor,
+    drafter: Any,
+    max_new_tokens: int,
+    eos_token_ids: Iterable[int],
+    lookahead: int = 8,
+    past_key_values: Any = None,
+    logits_processor: Optional[LogitsProcessorList] = None,
+    stopping_criteria: Optional[StoppingCriteriaList] = None,
+    streamer: Any = None
+) -> Tuple[torch.Tensor, Dict[str, Any]]:
+    """
+    Greedy decoding for one sequence that checks up to ``lookahead`` drafted
+    tokens per forward pass of ``model``. Each pass keeps the drafted tokens
+    up to the first one the model disagrees with, plus the model's own next
+    token, so the output is the same as ``generate(do_sample=False)``; only
+    the number of forward passes changes. Logits processors, stopping criteria
+    and the streamer are called as generate would. The number of drafted
+    tokens grows after a fully accepted draft and shrinks after a rejection,
+    so wrong drafts cost little.
+    Args:
+        model: Causal LM to decode with.
+        input_ids (torch.Tensor): Prompt ids of shape (1, length).
+        drafter: Object with ``draft(sequence, count)`` returning proposed
+            next tokens and ``accepted(count)``, e.g. PromptLookupDrafter.
+        max_new_tokens (int): Maximum number of generated tokens.
+        eos_token_ids: Ids that end generation.
+        lookahead (int): Maximum number of drafted tokens checked per pass.
+        past_key_values: Key/values of a prefix of ``input_ids``; extended in place.
+    Returns:
+        The prompt and generated ids, like generate, and the draft statistics.
+    """
+    eos = set(eos_token_ids)
+    processors = logits_processor if logits_processor is not None else LogitsProcessorList()
+    prompt_length = input_ids.shape[1]
+    sequence = input_ids[0].tolist()
+    # Views of this buffer are what processors and stopping criteria see
+    ids = torch.empty((1, prompt_length + max_new_tokens), dtype=input_ids.dtype, device=input_ids.device)
+    ids[:, :prompt_length] = input_ids
+    past = past_key_values if past_key_values is not None else DynamicCache()
+    stats = {"drafted": 0, "accepted": 0, "forward_passes": 0}
+    if streamer is not None:
+        streamer.put(input_ids.cpu())
+
+    count = lookahead
+    finished = max_new_tokens <= 0
+    while not finished:
+        remaining = max_new_tokens - (len(sequence) - prompt_length)
+        draft = drafter.draft(sequence, min(count, remaining - 1)) if remaining > 1 else []
+        # The last token of ``sequence`` is not in the cache yet
+        feed = sequence[_cache_length(past):] + draft
+        outputs = model(input_ids=torch.tensor([feed], device=input_ids.device), past_key_values=past, use_cache=True)
+        past = outputs.past_key_values
+        stats["forward_passes"] += 1
+        # Logits after the last token of ``sequence`` and after each drafted token
+        logits = outputs.logits[0, len(feed) - len(draft) - 1:].float()
+
+        new_tokens: List[int] = []
+        accepted = 0
+        for position in range(len(draft) + 1):
+            length = len(sequence)
+            scores = processors(ids[:, :length], logits[position:position + 1])
+            token = int(scores[0].argmax())
+            ids[0, length] = token
+            sequence.append(token)
+            new_tokens.append(token)
+            if position < len(draft) and token == draft[position]:
+                accepted += 1
+            if token in eos or len(sequence) - prompt_length >= max_new_tokens:
+                finished = True
+                break
+            if position < len(draft) and token != draft[position]:
+                break
+        stats["drafted"] += len(draft)
+        stats["accepted"] += accepted
+        drafter.accepted(accepted)
+        if draft:
+            count = min(lookahead, count + 2) if accepted == len(draft) else max(1, count - 1)
+        past = _crop(past, len(sequence) - 1)
+
+        if streamer is not None:
+            streamer.put(torch.tensor(new_tokens))
+        if stopping_criteria is not None:
+            # Also after the last token, as generate does, so criteria that
+            # record why generation stopped see every token
+            stop = stopping_criteria(ids[:, :len(sequence)], None)
+            finished = finished or bool(torch.as_tensor(stop).any())
+
+    if streamer is not None:
+        streamer.end()
+    stats["generated_tokens"] = len(sequence) - prompt_length
+    stats["acceptance_rate"] = stats["accepted"] / stats["drafted"] if stats["drafted"] else 0.0
+    stats["tokens_per_pass"] = stats["generated_tokens"] / stats["forward_passes"] if stats["forward_passes"] else 0.0
+    return ids[:, :len(sequence)], stats
+
+
+class SpeculativeStats:
+    """Draft and acceptance counts over all speculative generations of a service"""
+
+    def __init__(self):
+        self.generations = 0
+        self.drafted = 0
+        self.accepted = 0
+        self.forward_passes = 0
+        self.generated_tokens = 0
+
+    def record(self, stats: Dict[str, Any]):
+        self.generations += 1
+        self.drafted += stats["drafted"]
+        self.accepted += stats["accepted"]
+        self.forward_passes += stats["forward_passes"]
+        self.generated_tokens += stats["generated_tokens"]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "generations": self.generations,
+            "drafted": self.drafted,
+            "accepted": self.accepted,
+            "acceptance_rate": self.accepted / self.drafted if self.drafted else 0.0,
+            "tokens_per_pass": self.generated_tokens / self.forward_passes if self.forward_passes else 0.0,
+        }
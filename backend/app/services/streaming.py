@@ -0,0 +1,162 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from transformers import StoppingCriteria
+
+from .batching import _percentile
+
+
+class _CancelledCriteria(StoppingCriteria):
+    def __init__(self, streamer: "AsyncTokenStreamer"):
+        self.streamer = streamer
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        return self.streamer.cancelled
+
+
+class AsyncTokenStreamer:
+    """
+    Streamer for ``model.generate(streamer=...)`` that hands decoded text
+    deltas to an asyncio consumer.
+
+    ``generate`` runs on an executor thread and calls ``put`` with new token
+    ids; the deltas are pushed onto the event loop with call_soon_threadsafe
+    and read with ``async for delta in streamer``.
+
+    Each token only decodes a window from the last emitted token (plus the
+    one before, whose context decides e.g. a leading space), so streaming a
+    generation costs time linear in its length.
+    """
+
+    def __init__(self, tokenizer: Any, skip_prompt: bool = True, **decode_kwargs):
+        self.tokenizer = tokenizer
+        self.skip_prompt = skip_prompt
+        self.decode_kwargs = {"skip_special_tokens": True, **decode_kwargs}
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._token_ids: List[int] = []
+        # The window decoded per token starts at _prefix_offset; the text of
+        # the tokens before _read_offset has been emitted already
+        self._prefix_offset = 0
+        self._read_offset = 0
+        self._prompt_seen = not skip_prompt
+        self._ended = False
+        self.cancelled = False
+
+        self.started_at = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.generated_tokens = 0
+
+    def _push(self, item: Any):
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+
+    def put(self, value: Any):
+        """Called by generate with the prompt first, then each new token"""
+        if hasattr(value, "tolist"):
+            value = value.tolist()
+        # generate passes (batch, seq) for the prompt and (batch,) per step
+        if value and isinstance(value[0], list):
+            value = value[0]
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.generated_tokens += len(value)
+        self._token_ids.extend(value)
+        self._emit(final=False)
+
+    def _emit(self, final: bool):
+        ids = self._token_ids
+        emitted = self.tokenizer.decode(ids[self._prefix_offset:self._read_offset], **self.decode_kwargs)
+        text = self.tokenizer.decode(ids[self._prefix_offset:], **self.decode_kwargs)
+        # Hold back a trailing partial multi-byte character until it completes
+        if len(text) <= len(emitted) or (text.endswith("�") and not final):
+            return
+        self._push(text[len(emitted):])
+        self._prefix_offset = self._read_offset
+        self._read_offset = len(ids)
+
+    def end(self):
+        """Called by generate when it finishes; safe to call more than once"""
+        if self._ended:
+            return
+        self._ended = True
+        self.finished_at = time.perf_counter()
+        if self._token_ids:
+            self._emit(final=True)
+        self._push(None)
+
+    def cancel(self):
+        """Ask generate to stop after the current step, e.g. when the client went away"""
+        self.cancelled = True
+
+    def stopping_criteria(self) -> StoppingCriteria:
+        """Stopping criterion to pass to generate so ``cancel`` takes effect"""
+        return _CancelledCriteria(self)
+
+    @property
+    def text(self) -> str:
+        return self.tokenizer.decode(self._token_ids, **self.decode_kwargs)
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        if self.first_token_at is None or self.finished_at is None or self.generated_tokens < 2:
+            return None
+        decode_time = self.finished_at - self.first_token_at
+        return (self.generated_tokens - 1) / decode_time if decode_time > 0 else None
+
+    def timings(self) -> Dict[str, Any]:
+        return {
+            "time_to_first_token": self.time_to_first_token,
+            "generated_tokens": self.generated_tokens,
+            "tokens_per_second": self.tokens_per_second,
+        }
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        delta = await self._queue.get()
+        if delta is None:
+            raise StopAsyncIteration
+        return delta
+
+
+class StreamStats:
+    """Rolling time-to-first-token and decode-speed statistics of streamed generations"""
+
+    def __init__(self, window: int = 1024):
+        self._ttft: Deque[float] = deque(maxlen=window)
+        self._tps: Deque[float] = deque(maxlen=window)
+        self.streams = 0
+
+    def record(self, streamer: AsyncTokenStreamer):
+        self.streams += 1
+        if streamer.time_to_first_token is not None:
+            self._ttft.append(streamer.time_to_first_token)
+        if streamer.tokens_per_second is not None:
+            self._tps.append(streamer.tokens_per_second)
+
+    def stats(self) -> Dict[str, Any]:
+        ttft = list(self._ttft)
+        tps = list(self._tps)
+        return {
+            "streams": self.streams,
+            "time_to_first_token_ms": {
+                "p50": 1000.0 * _percentile(ttft, 0.50),
+                "p95": 1000.0 * _percentile(ttft, 0.95),
+                "p99": 1000.0 * _percentile(ttft, 0.99),
+            },
+            "tokens_per_second_mean": sum(tps) / len(tps) if tps else 0.0,
+        }
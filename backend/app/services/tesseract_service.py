@@ -0,0 +1,114 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+from PIL import Image
+
+from ..core.config import settings
+from .preprocessing import preprocess_image
+
+# Tesseract names its language packs with ISO 639-2 codes
+TESSERACT_LANGUAGES = {
+    "en": "eng", "fr": "fra", "de": "deu", "es": "spa", "it": "ita", "pt": "por",
+    "nl": "nld", "pl": "pol", "ru": "rus", "uk": "ukr", "tr": "tur", "ar": "ara",
+    "zh": "chi_sim", "ja": "jpn", "ko": "kor", "hi": "hin", "sv": "swe", "da": "dan",
+    "no": "nor", "fi": "fin", "cs": "ces", "el": "ell", "he": "heb", "hu": "hun",
+}
+
+
+class TesseractService:
+    def __init__(self, use_gpu: bool = False, executor: Any = None):
+        """
+        Fast CPU text recognition with Tesseract, the first stage before the
+        Qwen2.5 correction pass.
+        Args:
+            use_gpu (bool): Ignored; Tesseract runs on the CPU.
+            executor: Ignored; recognition runs on a thread, not on the model pool.
+        """
+        self.model_id = "tesseract"
+        self.device = "cpu"
+        self.dtype_name = "n/a"
+        self.version = None
+        self._pytesseract = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._pytesseract is not None
+
+    async def load(self):
+        """Check that pytesseract and the tesseract binary are installed"""
+        if self.is_loaded:
+            return
+        try:
+            import pytesseract
+        except ImportError:
+            raise RuntimeError("Tesseract OCR requires pytesseract: pip install pytesseract")
+        self.version = str(await asyncio.to_thread(pytesseract.get_tesseract_version))
+        self._pytesseract = pytesseract
+        print(f"Using Tesseract {self.version}")
+
+    def unload(self):
+        self._pytesseract = None
+
+    @staticmethod
+    def _lang(languages: Optional[List[str]]) -> str:
+        codes = [TESSERACT_LANGUAGES.get(lang.lower(), lang) for lang in languages or settings.DEFAULT_OCR_LANGUAGES]
+        return "+".join(dict.fromkeys(codes))
+
+    def _recognize(self, image: Image.Image, languages: Optional[List[str]]) -> Dict[str, Any]:
+        if settings.PREPROCESS_ENABLED:
+            # Tesseract reads best near the scan resolution, so no downscaling here
+            steps = [step for step in settings.PREPROCESS_STEPS if step != "downscale"]
+            image = preprocess_image(image, steps=steps).image
+
+        data = self._pytesseract.image_to_data(
+            image,
+            lang=self._lang(languages),
+            output_type=self._pytesseract.Output.DICT
+        )
+
+        # Rebuild lines and paragraphs from the word boxes
+        lines: Dict[tuple, List[str]] = {}
+        confidences = []
+        for i, word in enumerate(data["text"]):
+            confidence = float(data["conf"][i])
+            if confidence < 0 or not word.strip():
+                continue
+            key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            lines.setdefault(key, []).append(word)
+            confidences.append(confidence)
+
+        text = ""
+        previous = None
+        for key, words in lines.items():
+            if previous is not None:
+                text += "\n\n" if key[:2] != previous[:2] else "\n"
+            text += " ".join(words)
+            previous = key
+
+        return {
+            "text": text,
+            "confidence": sum(confidences) / len(confidences) / 100.0 if confidences else 0.0,
+            "words": len(confidences),
+        }
+
+    async def process_image(
+        self,
+        image: Image.Image,
+        languages: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Recognize the text of an image; confidence is the mean word confidence (0 to 1)"""
+        start_time = time.time()
+        try:
+            await self.load()
+            results = await asyncio.to_thread(self._recognize, image, languages)
+        except Exception as e:
+            print(f"Error in TesseractService: {str(e)}")
+            return {
+                "text": "",
+                "confidence": 0.0,
+                "processing_time": time.time() - start_time,
+                "error": str(e)
+            }
+        results["processing_time"] = time.time() - start_time
+        return results
@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from ..core.config import settings
+from .metrics import GENERATED_TOKENS, PROMPT_TOKENS, STAGE_SECONDS, TOKENS_PER_SECOND
+
+logger = logging.getLogger(__name__)
+
+# Span that stages of the running request are added to; asyncio tasks and
+# asyncio.to_thread calls started by the request inherit it
+_current: ContextVar[Optional["Span"]] = ContextVar("ocr_current_span", default=None)
+_export_lock = threading.Lock()
+
+
+class Span:
+    """A timed stage of a request, with the stages that ran inside it"""
+
+    __slots__ = ("name", "start", "end", "attributes", "children")
+
+    def __init__(self, name: str, start: Optional[float] = None, **attributes: Any):
+        self.name = name
+        self.start = time.perf_counter() if start is None else start
+        self.end: Optional[float] = None
+        self.attributes = attributes
+        self.children: List["Span"] = []
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000.0
+
+    def to_dict(self, origin: Optional[float] = None) -> Dict[str, Any]:
+        """The span tree, with start times in ms from the start of the root span"""
+        origin = self.start if origin is None else origin
+        span = {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000.0, 3),
+            "duration_ms": round(self.duration_ms, 3),
+        }
+        if self.attributes:
+            span["attributes"] = self.attributes
+        if self.children:
+            span["children"] = [child.to_dict(origin) for child in sorted(self.children, key=lambda c: c.start)]
+        return span
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+@contextmanager
+def trace(name: str, enabled: bool = True, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Root span of a request. Stages entered inside it become its children, and
+    on exit the tree is appended to TRACE_EXPORT_PATH when that is set. Yields
+    None, and records nothing, unless ``enabled`` or exporting.
+    """
+    if not (enabled or settings.TRACE_EXPORT_PATH):
+        yield None
+        return
+    root = Span(name, **attributes)
+    token = _current.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.attributes["error"] = type(e).__name__
+        raise
+    finally:
+        root.end = time.perf_counter()
+        _current.reset(token)
+        if settings.TRACE_EXPORT_PATH:
+            export(root, settings.TRACE_EXPORT_PATH)
+
+
+@contextmanager
+def stage(name: str, model: str = "", **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Time a stage of a request: observed in ocr_stage_duration_seconds and,
+    inside a trace, added to the current span as a child that the stages
+    entered within it are added to.
+    """
+    parent = _current.get()
+    span = None
+    token = None
+    if parent is not None:
+        span = Span(name, **attributes)
+        parent.children.append(span)
+        token = _current.set(span)
+    start = time.perf_counter()
+    try:
+        yield span
+    finally:
+        end = time.perf_counter()
+        if span is not None:
+            span.end = end
+            _current.reset(token)
+        STAGE_SECONDS.labels(model=model, stage=name).observe(end - start)
+
+
+def record_stages(model: str, stages: Sequence[Tuple[str, Optional[float]]], end: Optional[float] = None):
+    """
+    Record stages timed elsewhere, e.g. inside an executor worker, given as
+    (name, milliseconds) pairs that ran one after the other and finished at
+    ``end`` (now by default). Stages without a time are skipped.
+    """
+    stages = [(name, ms) for name, ms in stages if ms is not None and ms >= 0]
+    parent = _current.get()
+    end = time.perf_counter() if end is None else end
+    start = end - sum(ms for _, ms in stages) / 1000.0
+    for name, ms in stages:
+        STAGE_SECONDS.labels(model=model, stage=name).observe(ms / 1000.0)
+        if parent is not None:
+            span = Span(name, start=start)
+            span.end = start + ms / 1000.0
+            parent.children.append(span)
+        start += ms / 1000.0
+
+
+def record_generation(model: str, timings: Dict[str, Any], elapsed_ms: float):
+    """
+    Record a generation from the timings its executor worker reported: the
+    time it waited for a batch and a worker (``elapsed_ms`` from submitting
+    it, less the worker's ``inference_ms``), then its encode, prefill,
+    decode_tokens and postprocess stages, its token counts and decode rate.
+    """
+    inference_ms = timings.get("inference_ms")
+    record_stages(model, [
+        ("queue_wait", elapsed_ms - inference_ms if inference_ms is not None else None),
+        ("encode", timings.get("encode_ms")),
+        ("prefill", timings.get("prefill_ms")),
+        ("decode_tokens", timings.get("decode_ms")),
+        ("postprocess", timings.get("postprocess_ms")),
+    ])
+    generated = timings.get("generated_tokens") or 0
+    GENERATED_TOKENS.labels(model=model).inc(generated)
+    PROMPT_TOKENS.labels(model=model).inc(timings.get("prompt_tokens") or 0)
+    decode_ms = timings.get("decode_ms")
+    if generated and decode_ms:
+        TOKENS_PER_SECOND.labels(model=model).observe(generated / (decode_ms / 1000.0))
+
+
+def export(root: Span, path: str):
+    """Append a span tree to ``path`` as one JSON line"""
+    record = {
+        "trace_id": uuid.uuid4().hex,
+        "timestamp": time.time() - root.duration_ms / 1000.0,
+        **root.to_dict(),
+    }
+    line = json.dumps(record, default=str) + "\n"
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with _export_lock, open(path, "a", encoding="utf-8") as file:
+            file.write(line)
+    except OSError as e:
+        logger.warning(f"Could not export trace to {path}: {str(e)}")
@@ -0,0 +1,320 @@
+import hashlib
+import io
+from contextvars import ContextVar
+from typing import Any, BinaryIO, Iterable, List, NamedTuple, Optional, Set
+
+from fastapi import UploadFile
+from fastapi.responses import JSONResponse
+from PIL import Image
+from starlette.datastructures import Headers
+
+from ..core.config import settings
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+# Leading bytes of each accepted format; WebP also needs "WEBP" at offset 8
+SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+    (b"BM", "bmp"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"RIFF", "webp"),
+    (b"%PDF-", "pdf"),
+)
+SNIFF_BYTES = 16
+_EXTENSION_FORMATS = {"jpg": "jpeg", "jpeg": "jpeg", "tif": "tiff", "tiff": "tiff"}
+
+
+class ReceivedPart(NamedTuple):
+    """Size and sha256 of a file part, computed as the body was received"""
+    filename: str
+    size: int
+    sha256: str
+
+
+# File parts of the request being handled, hashed by UploadGuardMiddleware;
+# spool_upload takes their digests instead of reading the spooled files again
+_received_parts: ContextVar[Optional[List[ReceivedPart]]] = ContextVar("ocr_received_parts", default=None)
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """Format of a file from its first bytes, or None if it is not a known image or PDF"""
+    for signature, name in SIGNATURES:
+        if head.startswith(signature):
+            if name == "webp" and head[8:12] != b"WEBP":
+                continue
+            return name
+    return None
+
+
+def allowed_formats(images_only: bool = False) -> Set[str]:
+    """Formats accepted by settings.ALLOWED_EXTENSIONS, optionally without PDF"""
+    formats = {_EXTENSION_FORMATS.get(ext.lower(), ext.lower()) for ext in settings.ALLOWED_EXTENSIONS}
+    if images_only:
+        formats.discard("pdf")
+    return formats
+
+
+class UploadRejected(Exception):
+    """An upload is too large or not in an accepted format"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _check_size(size: int, max_size: int, filename: Optional[str]):
+    if size > max_size:
+        raise UploadRejected(413, f"{filename or 'Upload'} exceeds the maximum upload size of {max_size} bytes")
+
+
+def _check_format(head: bytes, formats: Set[str], filename: Optional[str]) -> str:
+    detected = sniff_format(head)
+    if detected not in formats:
+        raise UploadRejected(
+            415, f"{filename or 'Upload'} is not a supported file type (accepted: {', '.join(sorted(formats))})"
+        )
+    return detected
+
+
+class UploadGuard:
+    """
+    Checks a multipart/form-data body while it is being received: every file
+    part must start with the magic bytes of an accepted format and stay within
+    ``max_size``. ``write`` raises UploadRejected as soon as either check
+    fails, so the rest of the body never has to be read. The size and sha256
+    of every complete file part are added to ``parts``.
+    """
+
+    def __init__(self, boundary: bytes, max_size: int, formats: Set[str]):
+        self.max_size = max_size
+        self.formats = formats
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._filename: Optional[str] = None
+        self._head = b""
+        self._size = 0
+        self._digest = None
+        self.parts: List[ReceivedPart] = []
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def write(self, chunk: bytes):
+        self._parser.write(chunk)
+
+    def _on_part_begin(self):
+        self._disposition = b""
+        self._filename = None
+        self._head = b""
+        self._size = 0
+        self._digest = None
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        if b"filename" in options:
+            self._filename = options[b"filename"].decode("utf-8", "replace")
+            self._digest = hashlib.sha256()
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._filename is None:
+            return
+        self._size += end - start
+        _check_size(self._size, self.max_size, self._filename)
+        if len(self._head) < SNIFF_BYTES:
+            self._head += data[start:min(end, start + SNIFF_BYTES)]
+            if len(self._head) >= SNIFF_BYTES:
+                _check_format(self._head, self.formats, self._filename)
+        self._digest.update(data[start:end])
+
+    def _on_part_end(self):
+        if self._filename is None:
+            return
+        if len(self._head) < SNIFF_BYTES:
+            _check_format(self._head, self.formats, self._filename)
+        self.parts.append(ReceivedPart(self._filename, self._size, self._digest.hexdigest()))
+
+
+class UploadGuardMiddleware:
+    """
+    ASGI middleware running an UploadGuard over multipart request bodies as
+    they arrive. A rejected upload is answered right away with 413 or 415 and
+    the application sees the client as disconnected; without it the whole body
+    would be received and spooled before the endpoint could look at it. The
+    files are hashed in the same pass, for spool_upload.
+    """
+
+    def __init__(self, app: Any, max_size: Optional[int] = None, formats: Optional[Iterable[str]] = None):
+        self.app = app
+        self.max_size = max_size or settings.MAX_UPLOAD_SIZE
+        self.formats = set(formats) if formats is not None else allowed_formats()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        content_type = Headers(scope=scope).get("content-type", "")
+        _, options = parse_options_header(content_type)
+        if not content_type.startswith("multipart/form-data") or b"boundary" not in options:
+            await self.app(scope, receive, send)
+            return
+
+        guard = UploadGuard(options[b"boundary"], self.max_size, self.formats)
+        rejected: Optional[UploadRejected] = None
+        response_started = False
+
+        async def guarded_receive():
+            nonlocal rejected
+            if rejected is not None:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                try:
+                    guard.write(message.get("body", b""))
+                except UploadRejected as e:
+                    rejected = e
+                    if not response_started:
+                        response = JSONResponse({"detail": e.detail}, status_code=e.status_code)
+                        await response(scope, receive, send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if rejected is not None:
+                return
+            response_started = True
+            await send(message)
+
+        token = _received_parts.set(guard.parts)
+        try:
+            await self.app(scope, guarded_receive, guarded_send)
+        except Exception:
+            # The application failing on the cut-off body is expected
+            if rejected is None:
+                raise
+        finally:
+            _received_parts.reset(token)
+
+
+class SpooledUpload:
+    """
+    An upload kept in its spooled temporary file (in memory up to a size, on
+    disk beyond it) together with its size, sha256 and sniffed format. Images
+    are decoded from the file on demand, without copying it into bytes.
+    """
+
+    def __init__(self, file: BinaryIO, filename: Optional[str], size: int, sha256: str, format: str):
+        self.file = file
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+        self.format = format
+
+    def open_image(self) -> Image.Image:
+        """Lazily decoded image: only the header is read until the pixels are used"""
+        self.file.seek(0)
+        return Image.open(self.file)
+
+    def load_image(self) -> Image.Image:
+        """Fully decoded image, still usable after the upload is closed"""
+        image = self.open_image()
+        image.load()
+        return image
+
+    def read(self) -> bytes:
+        self.file.seek(0)
+        return self.file.read()
+
+    def close(self):
+        self.file.close()
+
+
+def detach_upload(upload: UploadFile):
+    """
+    Take the spooled file away from ``upload``, so that it stays open after
+    the request's form is closed, e.g. while a streaming response reads it.
+    The SpooledUpload made from it then has to be closed by the caller.
+    """
+    upload.file = io.BytesIO()
+
+
+def _received_digest(filename: Optional[str], size: int) -> Optional[str]:
+    """
+    sha256 of the file part of the current request with this filename and
+    size, hashed while it was received. None without UploadGuardMiddleware,
+    or when another unclaimed part has the same filename and size.
+    """
+    parts = _received_parts.get()
+    matches = [part for part in parts or [] if part.filename == filename and part.size == size]
+    if len(matches) != 1:
+        return None
+    parts.remove(matches[0])
+    return matches[0].sha256
+
+
+def spool_upload(upload: UploadFile, formats: Optional[Set[str]] = None, max_size: Optional[int] = None) -> SpooledUpload:
+    """
+    Measure and sniff an upload and hash it, in chunks from its spooled file
+    unless UploadGuardMiddleware hashed it as it was received. Blocking; run
+    it on a worker thread.
+    Args:
+        upload (UploadFile): The received upload.
+        formats (Set[str]): Accepted formats; defaults to allowed_formats().
+        max_size (int): Maximum size in bytes; defaults to settings.MAX_UPLOAD_SIZE.
+    Raises:
+        UploadRejected: With status 413 or 415.
+    """
+    formats = formats if formats is not None else allowed_formats()
+    max_size = max_size or settings.MAX_UPLOAD_SIZE
+    upload.file.seek(0, io.SEEK_END)
+    size = upload.file.tell()
+    sha256 = _received_digest(upload.filename, size)
+    if sha256 is not None:
+        _check_size(size, max_size, upload.filename)
+        upload.file.seek(0)
+        detected = _check_format(upload.file.read(SNIFF_BYTES), formats, upload.filename)
+        upload.file.seek(0)
+        return SpooledUpload(upload.file, upload.filename, size, sha256, detected)
+
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    upload.file.seek(0)
+    for chunk in iter(lambda: upload.file.read(settings.UPLOAD_CHUNK_SIZE), b""):
+        if len(head) < SNIFF_BYTES:
+            head += chunk[:SNIFF_BYTES - len(head)]
+            if len(head) >= SNIFF_BYTES:
+                _check_format(head, formats, upload.filename)
+        size += len(chunk)
+        _check_size(size, max_size, upload.filename)
+        digest.update(chunk)
+    detected = _check_format(head, formats, upload.filename)
+    upload.file.seek(0)
+    return SpooledUpload(upload.file, upload.filename, size, digest.hexdigest(), detected)
@@ -0,0 +1,199 @@
+"""
+Check of the Phi-3 micro-batching path against a fake model.
+
+Concurrent requests for pages of different sizes go through
+Phi3VisionService's MicroBatcher into one generate call per batch. A fake
+processor and model (no download) record the shape of every batch and check
+that each row is its own prompt, padded on the left to the longest prompt of
+the batch, with its crops padded to the largest crop count, and that every
+caller gets the answer to its own page. A second run closes the batcher
+while a batch is being generated and checks that its callers fail instead of
+waiting forever.
+
+Usage (from the backend directory):
+    python -m benchmarks.batching --requests 32 --batch-size 4
+"""
+import argparse
+import asyncio
+import json
+import math
+import threading
+import time
+
+import torch
+from PIL import Image
+from transformers import BatchFeature
+
+from app.core.config import settings
+from app.services.executor import InferenceExecutor
+from app.services.phi3_service import PROMPT, Phi3VisionService
+
+CROP = 336
+PAD, EOS = 0, 2
+
+
+class FakeTokenizer:
+    pad_token_id = PAD
+    eos_token_id = EOS
+
+
+class FakeImageProcessor:
+    num_crops = 16
+
+
+class FakeProcessor:
+    """One id per prompt word, then one negative placeholder id per 336 px crop of the image"""
+    tokenizer = FakeTokenizer()
+    image_processor = FakeImageProcessor()
+
+    def __call__(self, text, images, return_tensors=None):
+        crops = min(self.image_processor.num_crops, math.ceil(images.width / CROP) * math.ceil(images.height / CROP))
+        ids = [10 + len(word) for word in text.split()] + [-1] * crops
+        return BatchFeature(data={
+            "input_ids": torch.tensor([ids]),
+            "attention_mask": torch.ones(1, len(ids), dtype=torch.long),
+            # The global image plus the crops
+            "pixel_values": torch.ones(1, crops + 1, 3, 2, 2),
+            "image_sizes": torch.tensor([[images.height, images.width]]),
+        })
+
+    def decode(self, ids, skip_special_tokens=False):
+        return " ".join(str(token) for token in ids.tolist() if token > EOS)
+
+
+class FakeModel:
+    """
+    Checks the collated batch, then generates each row's image width a few
+    times and ends it. ``release``, when set, holds generate until it is set.
+    """
+
+    def __init__(self, tokens: int = 3):
+        self.tokens = tokens
+        self.batches = []
+        self.errors = []
+        self.started = threading.Event()
+        self.release = None
+
+    def _check(self, input_ids, attention_mask, pixel_values, image_sizes):
+        rows, length = input_ids.shape
+        if attention_mask.shape != (rows, length) or pixel_values.shape[0] != rows or image_sizes.shape[0] != rows:
+            self.errors.append(f"rows differ: {input_ids.shape} {attention_mask.shape} {pixel_values.shape}")
+        expected = FakeProcessor()
+        for row in range(rows):
+            pad = int(length - attention_mask[row].sum())
+            if attention_mask[row, :pad].any() or not attention_mask[row, pad:].all():
+                self.errors.append(f"row {row} is not left padded: {attention_mask[row].tolist()}")
+            if (input_ids[row, :pad] != PAD).any():
+                self.errors.append(f"row {row} is padded with other ids than the pad id")
+            height, width = image_sizes[row].tolist()
+            encoding = expected(PROMPT, Image.new("L", (width, height)))
+            if input_ids[row, pad:].tolist() != encoding["input_ids"][0].tolist():
+                self.errors.append(f"row {row} is not the prompt of its {width}x{height} image")
+            crops = encoding["pixel_values"].shape[1]
+            if pixel_values[row, crops:].any() or not pixel_values[row, :crops].all():
+                self.errors.append(f"row {row} crops are not padded with zeros after its {crops} crops")
+        if pixel_values.shape[1] != max(
+            expected(PROMPT, Image.new("L", (w, h)))["pixel_values"].shape[1] for h, w in image_sizes.tolist()
+        ):
+            self.errors.append(f"crop axis {pixel_values.shape[1]} is not the largest crop count of the batch")
+
+    def generate(self, input_ids, attention_mask, pixel_values, image_sizes, logits_processor=None,
+                 stopping_criteria=None, max_new_tokens=None, **kwargs):
+        self.started.set()
+        if self.release is not None:
+            self.release.wait()
+        self.batches.append({"rows": input_ids.shape[0], "length": input_ids.shape[1], "crops": pixel_values.shape[1]})
+        self._check(input_ids, attention_mask, pixel_values, image_sizes)
+        widths = image_sizes[:, 1]
+        sequences = input_ids
+        for step in range(self.tokens + 1):
+            scores = torch.zeros(sequences.shape[0], 4096)
+            scores[torch.arange(sequences.shape[0]), widths if step < self.tokens else EOS] = 1.0
+            for processor in logits_processor or []:
+                scores = processor(sequences, scores)
+            sequences = torch.cat([sequences, scores.argmax(dim=-1, keepdim=True)], dim=1)
+        return sequences
+
+
+def _service(model: FakeModel, batch_size: int, wait_ms: float, queue: int = 16) -> Phi3VisionService:
+    settings.PHI3_MAX_BATCH_SIZE = batch_size
+    settings.INFERENCE_MAX_QUEUE = queue
+    settings.PHI3_BATCH_MAX_WAIT_MS = wait_ms
+    settings.PROMPT_PREFIX_CACHE = False
+    service = Phi3VisionService(use_gpu=False, executor=InferenceExecutor("thread", 2, queue, 5))
+    service.model = model
+    service.processor = FakeProcessor()
+    return service
+
+
+async def _shapes(requests: int, batch_size: int, wait_ms: float) -> dict:
+    model = FakeModel()
+    service = _service(model, batch_size, wait_ms, queue=requests)
+    # Widths are unique, so each answer names the page it was generated for
+    pages = [Image.new("L", (300 + 97 * index, 200 + 331 * (index % 5))) for index in range(requests)]
+    answers = await asyncio.gather(*(service.batcher.submit((PROMPT, page, None, None)) for page in pages))
+    routed = all(
+        text.split()[-model.tokens:] == [str(page.width)] * model.tokens
+        for page, (text, _, _) in zip(pages, answers)
+    )
+    service.unload()
+    return {
+        "requests": requests,
+        "batches": len(model.batches),
+        "largest_batch": max(batch["rows"] for batch in model.batches),
+        "batch_sizes": service.batcher.stats()["batch_size_histogram"],
+        "shape_errors": model.errors,
+        "answers_routed": routed,
+    }
+
+
+async def _close_in_flight(batch_size: int, wait_ms: float) -> dict:
+    model = FakeModel()
+    model.release = threading.Event()
+    service = _service(model, batch_size, wait_ms)
+    page = Image.new("L", (400, 300))
+    calls = [asyncio.ensure_future(service.batcher.submit((PROMPT, page, None, None))) for _ in range(batch_size)]
+    await asyncio.to_thread(model.started.wait)
+    started = time.perf_counter()
+    service.unload()
+    done, _ = await asyncio.wait(calls, timeout=5.0)
+    failed_ms = (time.perf_counter() - started) * 1000.0
+    # Let the worker thread finish the generate call nobody waits for any more
+    model.release.set()
+    for call in calls:
+        call.cancel()
+    return {
+        "callers": len(calls),
+        "failed": sum(isinstance(call.exception(), RuntimeError) for call in done),
+        "failed_after_ms": round(failed_ms, 2),
+    }
+
+
+def run(requests: int, batch_size: int, wait_ms: float) -> dict:
+    async def both():
+        return await _shapes(requests, batch_size, wait_ms), await _close_in_flight(batch_size, wait_ms)
+
+    shapes, closed = asyncio.run(both())
+    return {"batching": shapes, "close_in_flight": closed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--wait-ms", type=float, default=20.0)
+    args = parser.parse_args()
+    result = run(args.requests, args.batch_size, args.wait_ms)
+    print(json.dumps(result, indent=2))
+    if result["batching"]["shape_errors"]:
+        raise SystemExit("A batch was not collated as expected")
+    if result["batching"]["largest_batch"] > args.batch_size:
+        raise SystemExit("A batch was larger than the batch size")
+    if not result["batching"]["answers_routed"]:
+        raise SystemExit("A caller got the answer to another page")
+    if result["close_in_flight"]["failed"] != result["close_in_flight"]["callers"]:
+        raise SystemExit("Closing the batcher left callers of the batch in flight waiting")
+
+
+if __name__ == "__main__":
+    main()
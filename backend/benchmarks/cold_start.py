@@ -0,0 +1,150 @@
+"""
+Startup benchmark: from_pretrained against a compiled, memory-mapped snapshot.
+
+Starts --workers processes at once for each loading mode. Every worker loads
+the model, runs a forward pass so all the weights are paged in, and reports
+its load time, its RSS and its PSS (proportional set size: shared pages are
+split between the processes mapping them) while all workers are alive.
+Weights loaded with from_pretrained are private copies in every worker;
+snapshot weights are page-cache pages shared by all of them.
+
+By default the model is a randomly initialized Qwen2 written to a temporary
+directory and compiled there; --source points at a real Hugging Face
+snapshot directory instead. Each mode runs once untimed first so both
+measure a warm page cache.
+
+Usage (from the backend directory):
+    python -m benchmarks.cold_start --workers 4 --hidden-size 1024 --layers 8
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import torch
+
+MODES = ("from_pretrained", "snapshot")
+
+
+def _memory_mb() -> Dict[str, float]:
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                values[key.lower() + "_mb"] = int(rest.split()[0]) / 1024
+    return values
+
+
+def worker(mode: str, path: str):
+    """Runs in a child process: load, touch every weight, then report when asked"""
+    from transformers import AutoModelForCausalLM
+    from app.services.snapshots import load_snapshot
+
+    start = time.perf_counter()
+    if mode == "snapshot":
+        model = load_snapshot(path, verify="size")
+    else:
+        model = AutoModelForCausalLM.from_pretrained(path, torch_dtype=torch.float32)
+    load_seconds = time.perf_counter() - start
+    with torch.no_grad():
+        model(input_ids=torch.tensor([[1, 2, 3]]))
+    print("ready", flush=True)
+    # Measure only once every worker has loaded, so PSS sees all the sharing
+    sys.stdin.readline()
+    print(json.dumps({"load_seconds": load_seconds, **_memory_mb()}), flush=True)
+
+
+def _run_workers(mode: str, path: str, workers: int) -> List[dict]:
+    env = dict(os.environ, PYTHONWARNINGS="ignore", TRANSFORMERS_VERBOSITY="error")
+    procs = [
+        subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.cold_start", "--worker", mode, path],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, env=env
+        )
+        for _ in range(workers)
+    ]
+    for proc in procs:
+        line = proc.stdout.readline()
+        if line.strip() != "ready":
+            raise RuntimeError(f"{mode} worker failed to load: {line!r}")
+    results = []
+    for proc in procs:
+        proc.stdin.write("measure\n")
+        proc.stdin.flush()
+        results.append(json.loads(proc.stdout.readline()))
+    for proc in procs:
+        proc.wait()
+    return results
+
+
+def _tiny_source(directory: str, hidden_size: int, layers: int) -> str:
+    from transformers import Qwen2Config, Qwen2ForCausalLM
+
+    torch.manual_seed(0)
+    config = Qwen2Config(
+        vocab_size=32000,
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 3,
+        num_hidden_layers=layers,
+        num_attention_heads=8,
+        num_key_value_heads=4,
+    )
+    path = os.path.join(directory, "source")
+    Qwen2ForCausalLM(config).save_pretrained(path)
+    return path
+
+
+def run(source: str, workers: int, hidden_size: int, layers: int) -> dict:
+    from transformers import AutoModelForCausalLM
+    from app.services.snapshots import write_snapshot
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = source or _tiny_source(directory, hidden_size, layers)
+        compiled = os.path.join(directory, "compiled")
+        start = time.perf_counter()
+        model = AutoModelForCausalLM.from_pretrained(source, torch_dtype=torch.float32, trust_remote_code=True)
+        manifest = write_snapshot(model, source, compiled, "benchmark", source)
+        compile_seconds = time.perf_counter() - start
+        del model
+
+        paths = {"from_pretrained": source, "snapshot": compiled}
+        report = {}
+        for mode in MODES:
+            _run_workers(mode, paths[mode], 1)
+            results = _run_workers(mode, paths[mode], workers)
+            report[mode] = {
+                "load_seconds": round(statistics.mean(r["load_seconds"] for r in results), 3),
+                "rss_mb_per_worker": round(statistics.mean(r["rss_mb"] for r in results), 1),
+                "pss_mb_per_worker": round(statistics.mean(r["pss_mb"] for r in results), 1),
+                "pss_mb_total": round(sum(r["pss_mb"] for r in results), 1),
+            }
+    return {
+        "workers": workers,
+        "weights_mb": round(manifest["files"]["model.safetensors"]["size"] / 2**20, 1),
+        "compile_seconds": round(compile_seconds, 2),
+        **report,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", help="Hugging Face snapshot directory (default: a random Qwen2 model)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--hidden-size", type=int, default=1024)
+    parser.add_argument("--layers", type=int, default=8)
+    parser.add_argument("--worker", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(*args.worker)
+        return
+    print(json.dumps(run(args.source, args.workers, args.hidden_size, args.layers), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+Check of the document endpoint: page order, errors and client disconnects.
+
+Serves the API on a local port with a stub "phi3" model that reads the page
+number back from the page's grey level and takes longer on earlier pages,
+so pages finish out of order. Pages are counted as they are decoded from
+the upload and as the model finishes them. The run fails unless:
+
+- every page of a TIFF and of a PDF comes back once, in page order,
+- at most DOCUMENT_PIPELINE_DEPTH decoded pages are held at any time,
+- a corrupt PDF and a model error on one page end the stream with an error
+  line for the right page, after the pages before it,
+- a client that disconnects after the first page stops the decoding and the
+  model calls, and the document is closed.
+
+Usage (from the backend directory):
+    python -m benchmarks.documents --pages 12 --page-ms 20
+"""
+import argparse
+import asyncio
+import io
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from app.core.config import settings
+from app.services import documents
+from app.services.executor import InferenceExecutor
+from app.services.model_registry import ModelRegistry
+
+from .load import BOUNDARY, InProcessServer
+
+# Grey level of page n is n * LEVEL_STEP, which survives the PDF's JPEG encoding
+LEVEL_STEP = 16
+
+
+class PageCounter:
+    """Pages decoded from the upload and finished by the model, and whether the document was closed"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.decoded = 0
+        self.finished = 0
+        self.most_held = 0
+        self.closed = 0
+
+    def on_decoded(self):
+        self.decoded += 1
+        self.most_held = max(self.most_held, self.decoded - self.finished)
+
+    def wrap(self, iter_frames):
+        def counting(*args, **kwargs):
+            try:
+                for page in iter_frames(*args, **kwargs):
+                    self.on_decoded()
+                    yield page
+            finally:
+                self.closed += 1
+        return counting
+
+
+class PageNumberService:
+    """Stands in for Phi3VisionService: answers with the page number of the page"""
+
+    def __init__(self, counter: PageCounter, pages: int, page_ms: float, fail_page: Optional[int]):
+        self.model_id = "page-number"
+        self.device = "cpu"
+        self.dtype_name = "float32"
+        self.counter = counter
+        self.pages = pages
+        self.page_ms = page_ms
+        self.fail_page = fail_page
+
+    async def load(self):
+        pass
+
+    def unload(self):
+        pass
+
+    async def process_image(self, image: Image.Image, languages: Optional[List[str]] = None, layout=None):
+        start = time.time()
+        number = round(sum(image.convert("L").resize((8, 8)).getdata()) / 64 / LEVEL_STEP)
+        try:
+            # Earlier pages take longer, so later pages are done first
+            await asyncio.sleep((self.pages - number + 1) * self.page_ms / 1000.0)
+            if number == self.fail_page:
+                raise RuntimeError(f"model failed on page {number}")
+        finally:
+            self.counter.finished += 1
+        return {"text": f"page {number}", "confidence": 1.0, "processing_time": time.time() - start}
+
+
+def _document(pages: int, format: str) -> bytes:
+    frames = [Image.new("L", (160, 120), number * LEVEL_STEP) for number in range(1, pages + 1)]
+    buffer = io.BytesIO()
+    frames[0].save(buffer, format.upper(), save_all=True, append_images=frames[1:])
+    return buffer.getvalue()
+
+
+def _request(document: bytes, filename: str) -> bytes:
+    body = (
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="model"\r\n\r\nphi3\r\n'
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode() + document + f"\r\n--{BOUNDARY}--\r\n".encode()
+    headers = (
+        "POST /api/v1/ocr/extract-document HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n"
+        f"Content-Type: multipart/form-data; boundary={BOUNDARY}\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n"
+    ).encode()
+    return headers + body
+
+
+async def _lines(port: int, request: bytes, max_lines: Optional[int] = None) -> Tuple[int, List[Dict[str, Any]]]:
+    """Status and NDJSON lines of a chunked response, disconnecting after ``max_lines`` of them"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write(request)
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        while (await reader.readline()) not in (b"\r\n", b""):
+            pass
+        if status != 200:
+            print((await reader.read()).decode(errors="replace"))
+            return status, []
+        lines, pending = [], b""
+        while max_lines is None or len(lines) < max_lines:
+            size = int((await reader.readline()).strip() or b"0", 16)
+            if size == 0:
+                break
+            pending += await reader.readexactly(size)
+            await reader.readexactly(2)
+            while b"\n" in pending:
+                line, pending = pending.split(b"\n", 1)
+                lines.append(json.loads(line))
+        return status, lines
+    finally:
+        writer.close()
+
+
+class Scenario:
+    """Sends a document to the API served with a given stub service"""
+
+    def __init__(self, counter: PageCounter, app: Any):
+        self.counter = counter
+        self.app = app
+        self.executor = InferenceExecutor("thread", 1, 4)
+
+    async def run(
+        self,
+        port: int,
+        service: PageNumberService,
+        document: bytes,
+        filename: str,
+        max_lines: Optional[int] = None,
+        settle_s: float = 0.0
+    ) -> Dict[str, Any]:
+        self.counter.reset()
+        self.app.state.model_registry = ModelRegistry(
+            factories={"phi3": lambda use_gpu, executor: service}, executor=self.executor
+        )
+        status, lines = await _lines(port, _request(document, filename), max_lines)
+        if max_lines is not None:
+            decoded, finished = self.counter.decoded, self.counter.finished
+            await asyncio.sleep(settle_s)
+        pages = [line["page"] for line in lines if "enhanced_text" in line]
+        result = {
+            "status": status,
+            "pages": pages,
+            "texts_match": all(
+                line["enhanced_text"] == f"page {line['page']}" for line in lines if "enhanced_text" in line
+            ),
+            "errors": [(line["page"], line["error"]) for line in lines if "error" in line],
+            "done": next((line["pages"] for line in lines if line.get("done")), None),
+            "decoded": self.counter.decoded,
+            "most_held": self.counter.most_held,
+            "closed": self.counter.closed,
+        }
+        if max_lines is not None:
+            # What the server did after the client went away
+            result["decoded_after_disconnect"] = self.counter.decoded - decoded
+            result["finished_after_disconnect"] = self.counter.finished - finished
+        return result
+
+
+def _app(counter: PageCounter, depth: int) -> Any:
+    settings.RESULT_CACHE_ENABLED = False
+    settings.NEAR_DUPLICATE_ENABLED = False
+    settings.JOBS_ENABLED = False
+    settings.WARMUP_MODELS = []
+    settings.LOAD_REPORT = False
+    settings.DOCUMENT_PIPELINE_DEPTH = depth
+    documents._iter_image_frames = counter.wrap(documents._iter_image_frames)
+    documents._iter_pdf_pages = counter.wrap(documents._iter_pdf_pages)
+
+    from app.app import app
+
+    return app
+
+
+async def _runs(port: int, scenario: Scenario, args: argparse.Namespace) -> Dict[str, Any]:
+    def service(fail_page: Optional[int] = None, page_ms: float = args.page_ms) -> PageNumberService:
+        return PageNumberService(scenario.counter, args.pages, page_ms, fail_page)
+
+    results = {}
+    for format in ("tiff", "pdf"):
+        results[f"{format}_order"] = await scenario.run(
+            port, service(), _document(args.pages, format), f"scan.{format}"
+        )
+    results["corrupt_pdf"] = await scenario.run(port, service(), b"%PDF-1.7\n" + b"\x00" * 4096, "broken.pdf")
+    results["model_error"] = await scenario.run(
+        port, service(fail_page=args.fail_page), _document(args.pages, "tiff"), "scan.tiff"
+    )
+    # Each page takes long enough that the stream is far from done at the disconnect
+    results["disconnect"] = await scenario.run(
+        port, service(page_ms=args.page_ms * 5), _document(args.pages * 4, "pdf"), "scan.pdf",
+        max_lines=1, settle_s=args.pages * 4 * args.page_ms * 5 / 1000.0
+    )
+    return results
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    counter = PageCounter()
+    app = _app(counter, args.depth)
+    with InProcessServer(app) as server:
+        return asyncio.run(_runs(server.port, Scenario(counter, app), args))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=12, help="Pages of the test documents")
+    parser.add_argument("--page-ms", type=float, default=20.0, help="Model time of the last page")
+    parser.add_argument("--depth", type=int, default=settings.DOCUMENT_PIPELINE_DEPTH, help="DOCUMENT_PIPELINE_DEPTH")
+    parser.add_argument("--fail-page", type=int, default=4, help="Page the model fails on in the error run")
+    args = parser.parse_args()
+    result = run(args)
+    print(json.dumps(result, indent=2))
+
+    failures = []
+    expected = list(range(1, args.pages + 1))
+    for format in ("tiff", "pdf"):
+        check = result[f"{format}_order"]
+        if check["pages"] != expected or not check["texts_match"] or check["done"] != args.pages:
+            failures.append(f"{format}: pages came back as {check['pages']}")
+        if check["most_held"] > args.depth:
+            failures.append(f"{format}: {check['most_held']} decoded pages held at once, depth is {args.depth}")
+    corrupt = result["corrupt_pdf"]
+    if corrupt["pages"] or [page for page, _ in corrupt["errors"]] != [1] or corrupt["done"] != 0:
+        failures.append(f"corrupt PDF: expected an error on page 1, got {corrupt}")
+    failed = result["model_error"]
+    if failed["pages"] != expected[:args.fail_page - 1] or [page for page, _ in failed["errors"]] != [args.fail_page]:
+        failures.append(f"model error: expected pages before {args.fail_page} then an error, got {failed}")
+    if failed["closed"] != 1:
+        failures.append("model error: the document was not closed")
+    gone = result["disconnect"]
+    if gone["decoded_after_disconnect"] > args.depth or gone["finished_after_disconnect"] > args.depth:
+        failures.append(f"disconnect: work went on after the client left: {gone}")
+    if gone["decoded"] >= args.pages * 4 or gone["closed"] != 1:
+        failures.append(f"disconnect: the document was not closed early: {gone}")
+    if failures:
+        raise SystemExit("\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Check that /health stays responsive while the models are busy.
+
+Serves the API with the stub models of benchmarks.load and probes GET
+/health every --interval-ms: first with the server idle, then while
+--concurrency clients keep the stub model generating. Model calls run on the
+inference executor, off the event loop, so probes under load should answer
+about as fast as idle ones; a model call made on the event loop would hold
+every probe for the length of a generation. Fails when the p99 probe latency
+under load exceeds --max-health-ms.
+
+Usage (from the backend directory):
+    python -m benchmarks.health --concurrency 8 --seconds 5 --decode-ms 20
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Dict, List
+
+from .load import InProcessServer, _page, _percentile, _request, _send, _stub_app, add_stub_arguments, summarize
+
+HEALTH = b"GET /health HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n"
+
+
+async def _probe(port: int, seconds: float, interval: float) -> List[float]:
+    """Latencies in seconds of /health requests sent every ``interval`` for ``seconds``"""
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        status = await _send(port, HEALTH)
+        if status != 200:
+            raise RuntimeError(f"/health answered {status}")
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+    return latencies
+
+
+def _latency_ms(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "probes": len(latencies),
+        "mean": round(1000.0 * sum(latencies) / len(latencies), 2),
+        "p50": round(1000.0 * _percentile(latencies, 0.50), 2),
+        "p95": round(1000.0 * _percentile(latencies, 0.95), 2),
+        "p99": round(1000.0 * _percentile(latencies, 0.99), 2),
+        "max": round(1000.0 * max(latencies), 2),
+    }
+
+
+async def _runs(port: int, args: argparse.Namespace) -> Dict[str, Any]:
+    request = _request(_page(), args.model)
+    interval = args.interval_ms / 1000.0
+    # Loads the stub model
+    await _send(port, request)
+    idle = await _probe(port, args.seconds, interval)
+
+    probes = asyncio.ensure_future(_probe(port, args.seconds, interval))
+    samples = []
+
+    async def client():
+        while not probes.done():
+            start = time.perf_counter()
+            status = await _send(port, request)
+            samples.append((start, time.perf_counter() - start, status))
+
+    await asyncio.gather(probes, *(client() for _ in range(args.concurrency)))
+    return {
+        "health_idle_ms": _latency_ms(idle),
+        "health_busy_ms": _latency_ms(probes.result()),
+        "load": summarize(samples),
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    with InProcessServer(_stub_app(args)) as server:
+        result = asyncio.run(_runs(server.port, args))
+    result["config"] = vars(args)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=["phi3", "qwen25", "auto"], default="phi3")
+    parser.add_argument("--concurrency", type=int, default=8, help="Clients keeping the model busy")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Length of the idle and of the busy probe run")
+    parser.add_argument("--interval-ms", type=float, default=20.0, help="Pause between /health probes")
+    parser.add_argument("--max-health-ms", type=float, default=50.0, help="Highest p99 /health latency under load")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    result = run(args)
+    print(json.dumps(result, indent=2))
+    if result["load"]["statuses"].get("200", 0) == 0:
+        raise SystemExit("No request was answered while probing, so the model was not kept busy")
+    if result["health_busy_ms"]["p99"] > args.max_health_ms:
+        raise SystemExit(
+            f"/health p99 latency under load is {result['health_busy_ms']['p99']} ms, above {args.max_health_ms} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Check of the job queue: claim order, retries, cancellation, restarts and
+the cost of a claim.
+
+Runs JobManager on a SQLite file in a temporary directory, with a stub
+processor in place of the OCR of a file, and fails unless:
+
+- tasks are claimed by priority, then tenant by tenant in turn,
+- a failing task is retried after JOB_RETRY_BACKOFF, then twice that, and
+  fails for good after --max-attempts attempts,
+- cancelling a job stops its running task at the next page and cancels its
+  queued tasks, while other jobs still run,
+- a restart requeues the tasks left running and drops unfinished uploads,
+- a claim stays under --max-claim-ms with --queued tasks in the queue.
+
+Usage (from the backend directory):
+    python -m benchmarks.jobs --queued 50000
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.services.jobs import CANCELLED, COMPLETED, FAILED, QUEUED, RUNNING, JobManager, SQLiteJobStore
+
+
+async def _files(names: List[str]):
+    for name in names:
+        yield name, name.encode()
+
+
+class StubProcessor:
+    """Records the files it runs; fails or slows down the ones it is told to"""
+
+    def __init__(self, failures: Optional[Dict[str, int]] = None, pages: int = 1, page_s: float = 0.0):
+        self.failures = dict(failures or {})
+        self.pages = pages
+        self.page_s = page_s
+        self.runs: List[Tuple[str, float]] = []
+
+    async def __call__(self, task: Dict[str, Any], progress) -> Dict[str, Any]:
+        filename = task["filename"]
+        self.runs.append((filename, time.time()))
+        if self.failures.get(filename, 0) > 0:
+            self.failures[filename] -= 1
+            raise RuntimeError(f"{filename} failed")
+        for page in range(1, self.pages + 1):
+            await asyncio.sleep(self.page_s)
+            await progress(page, None, {"text": f"{filename} page {page}"})
+        return {"filename": filename, "pages": self.pages}
+
+
+async def _wait_for(manager: JobManager, job_ids: List[str], timeout: float) -> List[Dict[str, Any]]:
+    deadline = time.time() + timeout
+    while True:
+        jobs = [await manager.get(job_id) for job_id in job_ids]
+        if all(job["status"] in (COMPLETED, FAILED, CANCELLED) for job in jobs) or time.time() > deadline:
+            return jobs
+        await asyncio.sleep(0.02)
+
+
+async def claim_order(path: str) -> Dict[str, Any]:
+    processor = StubProcessor()
+    manager = JobManager(SQLiteJobStore(path), processor, poll_interval=0.05)
+    # Queued before the workers start, so the order is the store's alone
+    submitted = [
+        ("a", 0, ["a1", "a2", "a3"]),
+        ("b", 0, ["b1", "b2"]),
+        ("c", 5, ["c1"]),
+        ("a", 5, ["a4"]),
+        ("d", -1, ["d1"]),
+    ]
+    job_ids = []
+    for tenant, priority, names in submitted:
+        job = await manager.submit(_files(names), {"model": "stub"}, tenant=tenant, priority=priority)
+        job_ids.append(job["job_id"])
+    await manager.start()
+    await _wait_for(manager, job_ids, 10.0)
+    await manager.stop()
+    return {"order": [name for name, _ in processor.runs]}
+
+
+async def retries(path: str, backoff: float, max_attempts: int) -> Dict[str, Any]:
+    processor = StubProcessor(failures={"flaky": max_attempts - 1, "broken": max_attempts})
+    manager = JobManager(
+        SQLiteJobStore(path), processor, max_attempts=max_attempts, retry_backoff=backoff, poll_interval=0.05
+    )
+    await manager.start()
+    flaky = await manager.submit(_files(["flaky"]), {"model": "stub"})
+    broken = await manager.submit(_files(["broken"]), {"model": "stub"})
+    jobs = await _wait_for(manager, [flaky["job_id"], broken["job_id"]], backoff * 2 ** max_attempts + 5.0)
+    await manager.stop()
+    starts = [at for name, at in processor.runs if name == "flaky"]
+    return {
+        "flaky": {"status": jobs[0]["status"], "attempts": jobs[0]["tasks"][0]["attempts"]},
+        "broken": {
+            "status": jobs[1]["status"],
+            "attempts": jobs[1]["tasks"][0]["attempts"],
+            "error": jobs[1]["tasks"][0]["error"],
+        },
+        "flaky_gaps_s": [round(later - earlier, 3) for earlier, later in zip(starts, starts[1:])],
+    }
+
+
+async def cancellation(path: str) -> Dict[str, Any]:
+    processor = StubProcessor(pages=50, page_s=0.02)
+    manager = JobManager(SQLiteJobStore(path), processor, poll_interval=0.05)
+    await manager.start()
+    cancelled = await manager.submit(_files(["x1", "x2", "x3"]), {"model": "stub"})
+    other = await manager.submit(_files(["y1"]), {"model": "stub"}, tenant="other")
+    while not processor.runs:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.1)
+    await manager.cancel(cancelled["job_id"])
+    jobs = await _wait_for(manager, [cancelled["job_id"], other["job_id"]], 10.0)
+    await manager.stop()
+    return {
+        "cancelled_job": jobs[0]["status"],
+        "cancelled_tasks": [(task["filename"], task["status"], task["pages_done"]) for task in jobs[0]["tasks"]],
+        "other_job": jobs[1]["status"],
+        "runs": [name for name, _ in processor.runs],
+    }
+
+
+async def restart(path: str) -> Dict[str, Any]:
+    # The first process claims a task and dies without finishing it
+    store = SQLiteJobStore(path)
+    first = JobManager(store, StubProcessor())
+    interrupted = await first.submit(_files(["r1", "r2"]), {"model": "stub"})
+    store.claim_task(time.time())
+    unfinished = store.create_job("default", 0, {"model": "stub"})
+    store.add_file(unfinished, 0, "partial", b"partial")
+    running = [task["status"] for task in store.get_job(interrupted["job_id"])["tasks"]]
+    store.close()
+
+    processor = StubProcessor()
+    manager = JobManager(SQLiteJobStore(path), processor, poll_interval=0.05)
+    await manager.start()
+    jobs = await _wait_for(manager, [interrupted["job_id"]], 10.0)
+    dropped = await manager.get(unfinished) is None
+    await manager.stop()
+    return {
+        "before_restart": running,
+        "after_restart": jobs[0]["status"],
+        "attempts": [task["attempts"] for task in jobs[0]["tasks"]],
+        "unfinished_upload_dropped": dropped,
+        "runs": sorted(name for name, _ in processor.runs),
+    }
+
+
+def claim_cost(path: str, queued: int, claims: int) -> Dict[str, Any]:
+    store = SQLiteJobStore(path)
+    per_job = 10
+    for index in range(queued // per_job):
+        job_id = store.create_job(f"tenant-{index % 50}", index % 3, {"model": "stub"})
+        for position in range(per_job):
+            store.add_file(job_id, position, f"f{position}", b"x")
+        store.queue_job(job_id)
+    times = []
+    for _ in range(claims):
+        start = time.perf_counter()
+        store.claim_task(time.time())
+        times.append((time.perf_counter() - start) * 1000.0)
+    store.close()
+    times.sort()
+    return {
+        "queued": queued,
+        "claim_p50_ms": round(times[len(times) // 2], 3),
+        "claim_p99_ms": round(times[min(len(times) - 1, int(0.99 * len(times)))], 3),
+    }
+
+
+async def _runs(directory: str, args: argparse.Namespace) -> Dict[str, Any]:
+    return {
+        "claim_order": await claim_order(os.path.join(directory, "order.db")),
+        "retries": await retries(os.path.join(directory, "retries.db"), args.backoff, args.max_attempts),
+        "cancellation": await cancellation(os.path.join(directory, "cancel.db")),
+        "restart": await restart(os.path.join(directory, "restart.db")),
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as directory:
+        result = asyncio.run(_runs(directory, args))
+        result["claim_cost"] = claim_cost(os.path.join(directory, "cost.db"), args.queued, args.claims)
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backoff", type=float, default=0.2, help="retry_backoff of the retry run, in seconds")
+    parser.add_argument("--max-attempts", type=int, default=3, help="max_attempts of the retry run")
+    parser.add_argument("--queued", type=int, default=50000, help="Queued tasks of the claim cost run")
+    parser.add_argument("--claims", type=int, default=500, help="Claims timed in the claim cost run")
+    parser.add_argument("--max-claim-ms", type=float, default=5.0, help="Slowest p99 claim")
+    args = parser.parse_args()
+    result = run(args)
+    print(json.dumps(result, indent=2))
+
+    failures = []
+    # Priority 5 first, c before a as neither was served and c queued first;
+    # at priority 0 b goes first since a was just served, then a and b in turn
+    expected = ["c1", "a4", "b1", "a1", "b2", "a2", "a3", "d1"]
+    if result["claim_order"]["order"] != expected:
+        failures.append(f"claim order: {result['claim_order']['order']}, expected {expected}")
+    retried = result["retries"]
+    if retried["flaky"] != {"status": COMPLETED, "attempts": args.max_attempts}:
+        failures.append(f"retries: the flaky task did not complete on its last attempt: {retried['flaky']}")
+    if retried["broken"]["status"] != FAILED or retried["broken"]["attempts"] != args.max_attempts:
+        failures.append(f"retries: the broken task did not fail after {args.max_attempts} attempts: {retried}")
+    for attempt, gap in enumerate(retried["flaky_gaps_s"]):
+        if gap < args.backoff * 2 ** attempt:
+            failures.append(f"retries: retry {attempt + 1} came after {gap}s, backoff is {args.backoff * 2 ** attempt}s")
+    cancel = result["cancellation"]
+    statuses = [status for _, status, _ in cancel["cancelled_tasks"]]
+    if cancel["cancelled_job"] != CANCELLED or statuses != [CANCELLED] * 3 or cancel["other_job"] != COMPLETED:
+        failures.append(f"cancellation: {cancel}")
+    if cancel["cancelled_tasks"][0][2] >= 50 or "x2" in cancel["runs"]:
+        failures.append(f"cancellation: the job kept running after it was cancelled: {cancel}")
+    restarted = result["restart"]
+    if restarted["before_restart"] != [RUNNING, QUEUED] or restarted["after_restart"] != COMPLETED:
+        failures.append(f"restart: the interrupted task was not requeued: {restarted}")
+    if restarted["runs"] != ["r1", "r2"] or not restarted["unfinished_upload_dropped"]:
+        failures.append(f"restart: {restarted}")
+    cost = result["claim_cost"]
+    if cost["claim_p99_ms"] > args.max_claim_ms:
+        failures.append(f"claim cost: {cost}")
+    if failures:
+        raise SystemExit("\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Check and benchmark of the layout segmentation used for Phi-3 tiling.
+
+Renders synthetic dense pages (a full-width heading over one to three
+columns of paragraphs, at the size preprocessing hands to Phi-3, and one
+page inverted to light text on a dark background) whose text
+lines are known, segments them with segment_page and reports the
+segmentation time, whether every line landed in exactly one block and in
+reading order, and what tiling does to the model's work, estimated without
+the model:
+
+- output tokens of the whole page against PHI3_MAX_NEW_TOKENS, i.e. how much
+  text a single generate call would cut off, and the largest block's tokens;
+- decode steps: a single call stops at the budget (and would need one step
+  per token without it), blocks run in batches of PHI3_MAX_BATCH_SIZE whose
+  length is their longest block;
+- image tokens of the page against the blocks with their own crop counts.
+
+Usage (from the backend directory):
+    python -m benchmarks.layout --repeat 5
+"""
+import argparse
+import json
+import math
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageOps
+
+from app.core.config import settings
+from app.services.layout import segment_page
+from benchmarks.preprocessing import phi3_image_tokens
+
+# Rough Phi-3 tokens per character of English text
+TOKENS_PER_CHAR = 0.3
+
+
+def _dense_page(columns: int, width: int = 950, height: int = 1344, seed: int = 0) -> Tuple[Image.Image, List[Tuple]]:
+    """
+    A page of word-like boxes set like 11 pt text at the page's resolution.
+    Returns it with its text lines in reading order, as (left, top, right,
+    bottom, characters).
+    """
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    rng = np.random.default_rng(seed)
+    glyph, advance, pitch, paragraph, margin, gutter = 16, 8, 22, 14, 50, 30
+    lines = []
+
+    def line(left: int, right: int, y: int):
+        x, characters = left, 0
+        while True:
+            word = int(rng.integers(2, 10))
+            if x + word * advance > right:
+                break
+            draw.rectangle([x, y, x + word * advance, y + glyph], fill=0)
+            x += (word + 1) * advance
+            characters += word + 1
+        lines.append((left, y, x, y + glyph, characters))
+
+    line(margin, width // 2, margin)
+    column_width = (width - 2 * margin - gutter * (columns - 1)) // columns
+    for column in range(columns):
+        left = margin + column * (column_width + gutter)
+        y = margin + pitch + 2 * glyph
+        while y < height - margin - pitch:
+            for _ in range(int(rng.integers(3, 9))):
+                if y >= height - margin - pitch:
+                    break
+                line(left, left + column_width, y)
+                y += pitch
+            y += paragraph
+    return image, lines
+
+
+def _tokens(characters: int) -> int:
+    return int(math.ceil(characters * TOKENS_PER_CHAR))
+
+
+def _evaluate(image: Image.Image, lines: List[Tuple], repeat: int) -> Dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        layout = segment_page(image)
+        timings.append((time.perf_counter() - start) * 1000.0)
+
+    # The block each text line falls in, from the centre of the line
+    owners = []
+    for left, top, right, bottom, _ in lines:
+        cx, cy = (left + right) / 2, (top + bottom) / 2
+        owners.append([
+            index for index, block in enumerate(layout.blocks)
+            if block.box[0] <= cx < block.box[2] and block.box[1] <= cy < block.box[3]
+        ])
+    placed = [owner[0] for owner in owners if len(owner) == 1]
+    block_tokens = [0] * len(layout.blocks)
+    for owner, line in zip(owners, lines):
+        if len(owner) == 1:
+            block_tokens[owner[0]] += _tokens(line[4])
+
+    budget = settings.PHI3_MAX_NEW_TOKENS
+    batch = settings.PHI3_MAX_BATCH_SIZE
+    page_tokens = sum(_tokens(line[4]) for line in lines)
+    page_image_tokens, _ = phi3_image_tokens(*image.size)
+    block_image_tokens = 0
+    for block in layout.blocks:
+        width, height = block.box[2] - block.box[0], block.box[3] - block.box[1]
+        block_image_tokens += phi3_image_tokens(width, height, math.ceil(width / 336) * math.ceil(height / 336))[0]
+
+    return {
+        "segment_ms": round(float(np.median(timings)), 1),
+        "lines": len(lines),
+        "blocks": len(layout.blocks),
+        "lines_in_one_block": len(placed),
+        "reading_order": placed == sorted(placed) and len(placed) == len(lines),
+        "output_tokens": {
+            "page": page_tokens,
+            "largest_block": max(block_tokens, default=0),
+            "budget": budget,
+            "page_truncated_tokens": max(0, page_tokens - budget),
+            "blocks_over_budget": sum(tokens > budget for tokens in block_tokens),
+        },
+        "decode_steps": {
+            "page": min(page_tokens, budget),
+            "page_without_budget": page_tokens,
+            "blocks": sum(max(block_tokens[i:i + batch]) for i in range(0, len(block_tokens), batch)),
+        },
+        "image_tokens": {"page": page_image_tokens, "blocks": block_image_tokens},
+    }
+
+
+def run(repeat: int) -> Dict:
+    results = {}
+    for columns in (1, 2, 3):
+        image, lines = _dense_page(columns)
+        results[f"{columns}_columns"] = _evaluate(image, lines, repeat)
+    # Light text on a dark background must segment like the same page in print
+    image, lines = _dense_page(2)
+    results["2_columns_inverted"] = _evaluate(ImageOps.invert(image), lines, repeat)
+    return {"max_block_chars": settings.LAYOUT_MAX_BLOCK_CHARS, "pages": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    result = run(args.repeat)
+    print(json.dumps(result, indent=2))
+    if not all(page["reading_order"] for page in result["pages"].values()):
+        raise SystemExit("Text lines were lost or read out of order")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,542 @@
+"""
+Load test of the OCR API with stub models: latency percentiles, throughput
+and memory of POST /api/v1/ocr/extract-text under closed- and open-loop load.
+
+Serves app.app:app with uvicorn on a thread of this process, on a local
+port, with stub "phi3", "qwen25" and "tesseract" models. The stubs are the
+real services with only the model calls replaced, so uploads, preprocessing,
+the page budget, the Phi-3 micro-batcher, the inference executor and its
+admission control run as in production. A generation holds its inference
+worker for the encode, the prefill of every prompt token and one decode step
+per generated token of the longest row of its batch (see StubCosts).
+
+Load generators:
+- closed: --concurrency clients, each sending its next request once the
+  previous one is answered, so the offered load follows the server's pace.
+- open: requests start at --rate per second with Poisson arrivals whatever
+  the server's pace. Latency is counted from the scheduled start, so time
+  spent waiting behind a slow server is not hidden.
+
+Each run reports the mean, p50, p95, p99 and max latency of answered
+requests, the throughput, the status codes, the RSS of the process (server
+and load generator) before and at its peak, and the mean time per server
+stage from /metrics. The report is written to --output as JSON with the git
+commit; --baseline compares it with an earlier report and --max-regression
+fails the run when p95 latency or throughput got worse by more than that.
+
+CPU only, no network and no model downloads. --serve PORT only serves the
+API with the stub models, e.g. as the OCR backend of the scanner load test
+(scanner_exe/backend/benchmarks/load.py --ocr-url).
+
+Usage (from the backend directory):
+    python -m benchmarks.load --mode closed --concurrency 8 --requests 200
+    python -m benchmarks.load --mode open --rate 10 --requests 200 --output load.json
+    python -m benchmarks.load --model qwen25 --baseline load.json --max-regression 0.2
+    python -m benchmarks.load --serve 8000
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import re
+import socket
+import subprocess
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import uvicorn
+
+from app.core.config import settings
+from app.prefork import memory_mb
+from app.services.executor import InferenceExecutor
+from app.services.model_registry import ModelRegistry
+from app.services.phi3_service import Phi3VisionService
+from app.services.qwen_service import Qwen25Service
+from app.services.tesseract_service import TesseractService
+
+from .layout import _dense_page
+
+BOUNDARY = uuid.uuid4().hex
+# A sample is (start, latency in seconds, status or None on a connection error)
+Sample = Tuple[float, float, Optional[int]]
+
+
+class StubCosts:
+    """
+    Simulated cost of a generate call. A batch holds its inference worker for
+    ``encode_ms`` per row, ``prefill_ms_per_token`` per prompt token of every
+    row, then ``decode_ms`` per step for as many steps as its longest row
+    generates: decode steps cost about the same for one row or a batch, the
+    prefill grows with the batch. Rows generate ``tokens`` tokens, varied by
+    up to ``jitter`` of that, and at most their budget.
+
+    Workers sleep instead of computing: torch releases the GIL in its
+    kernels, so a sleeping worker holds the server like a real one.
+    """
+
+    def __init__(
+        self,
+        encode_ms: float = 5.0,
+        prefill_ms_per_token: float = 0.05,
+        decode_ms: float = 5.0,
+        tokens: int = 64,
+        jitter: float = 0.25,
+        seed: int = 0
+    ):
+        self.encode_ms = encode_ms
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.decode_ms = decode_ms
+        self.tokens = tokens
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _generated(self, budget: int) -> int:
+        with self._lock:
+            scale = 1.0 + self._random.uniform(-self.jitter, self.jitter)
+        return max(1, min(budget, int(round(self.tokens * scale))))
+
+    def generate(self, prompt_tokens: List[int], budgets: List[int]) -> List[Dict[str, Any]]:
+        """Sleep for a batch with these prompt lengths and budgets. Returns the timings of every row"""
+        started = time.perf_counter()
+        time.sleep(self.encode_ms * len(prompt_tokens) / 1000.0)
+        encoded = time.perf_counter()
+        time.sleep(self.prefill_ms_per_token * sum(prompt_tokens) / 1000.0)
+        prefilled = time.perf_counter()
+        generated = [self._generated(budget) for budget in budgets]
+        time.sleep(self.decode_ms * max(generated) / 1000.0)
+        finished = time.perf_counter()
+        return [
+            {
+                "encode_ms": (encoded - started) * 1000.0,
+                "prefill_ms": (prefilled - encoded) * 1000.0,
+                "decode_ms": (finished - prefilled) * 1000.0,
+                "postprocess_ms": 0.0,
+                "inference_ms": (finished - started) * 1000.0,
+                "prompt_tokens": tokens,
+                "prefix_tokens_reused": 0,
+                "batch_size": len(prompt_tokens),
+                "max_new_tokens": budget,
+                "generated_tokens": count,
+                "stop_reason": "length" if count >= budget else "eos",
+            }
+            for tokens, budget, count in zip(prompt_tokens, budgets, generated)
+        ]
+
+
+def _text(tokens: int) -> str:
+    return " ".join("token" for _ in range(tokens))
+
+
+class StubPhi3Service(Phi3VisionService):
+    """Phi3VisionService with the processor and generate call replaced by StubCosts"""
+
+    def __init__(self, costs: StubCosts, prompt_tokens: int, executor: InferenceExecutor):
+        super().__init__(use_gpu=False, executor=executor)
+        self.model_id = "stub-phi3"
+        self.costs = costs
+        self.prompt_tokens = prompt_tokens
+
+    def _load_model_sync(self):
+        self.model = self.processor = "stub"
+
+    def _generate_batch(self, items: List[Any]) -> List[Tuple[str, float, Dict[str, Any]]]:
+        budgets = [item[3] or settings.PHI3_MAX_NEW_TOKENS for item in items]
+        rows = self.costs.generate([self.prompt_tokens] * len(items), budgets)
+        return [(_text(timings["generated_tokens"]), 1.0, timings) for timings in rows]
+
+
+class StubQwenService(Qwen25Service):
+    """Qwen25Service with the tokenizer and generate call replaced by StubCosts"""
+
+    def __init__(self, costs: StubCosts, executor: InferenceExecutor):
+        super().__init__(use_gpu=False, executor=executor)
+        self.model_id = "stub-qwen25"
+        self.costs = costs
+
+    def _load_model_sync(self):
+        self.model = self.tokenizer = "stub"
+
+    def _generate(self, prompt: str) -> Tuple[str, float, Dict[str, Any]]:
+        # About four characters per token
+        timings = self.costs.generate([len(prompt) // 4], [settings.QWEN25_MAX_NEW_TOKENS])[0]
+        return f"{prompt}{_text(timings['generated_tokens'])}<|im_end|>", 1.0, timings
+
+
+class StubTesseractService(TesseractService):
+    """TesseractService that takes ``ocr_ms`` to read ``words`` words at ``confidence``"""
+
+    def __init__(self, ocr_ms: float, confidence: float, words: int = 200):
+        super().__init__()
+        self.ocr_ms = ocr_ms
+        self.confidence = confidence
+        self.words = words
+
+    async def load(self):
+        self.version = "stub"
+
+    def _recognize(self, image, languages) -> Dict[str, Any]:
+        time.sleep(self.ocr_ms / 1000.0)
+        return {"text": _text(self.words), "confidence": self.confidence, "words": self.words}
+
+
+class InProcessServer:
+    """app.app:app served by uvicorn on a thread of this process, on ``port`` or a free one"""
+
+    def __init__(self, app: Any, port: int = 0):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.bind(("127.0.0.1", port))
+        self.port = self.socket.getsockname()[1]
+        self.server = uvicorn.Server(uvicorn.Config(app, lifespan="on", access_log=False, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, kwargs={"sockets": [self.socket]}, daemon=True)
+
+    def __enter__(self) -> "InProcessServer":
+        self.thread.start()
+        deadline = time.time() + 60
+        while not self.server.started:
+            if not self.thread.is_alive() or time.time() > deadline:
+                raise RuntimeError("Server did not start")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self.thread.join(timeout=30)
+        self.socket.close()
+
+
+def _request(page: bytes, model: str) -> bytes:
+    """A complete extract-text request, sent as is by every client"""
+    body = (
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="model"\r\n\r\n{model}\r\n'
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="page.png"\r\n'
+        'Content-Type: image/png\r\n\r\n'
+    ).encode() + page + f"\r\n--{BOUNDARY}--\r\n".encode()
+    headers = (
+        "POST /api/v1/ocr/extract-text HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n"
+        f"Content-Type: multipart/form-data; boundary={BOUNDARY}\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n"
+    ).encode()
+    return headers + body
+
+
+async def _send(port: int, request: bytes) -> Optional[int]:
+    """Send a request on a new connection and read the whole response. Returns its status"""
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    except OSError:
+        return None
+    try:
+        writer.write(request)
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+        return int(status_line.split()[1]) if status_line.startswith(b"HTTP/") else None
+    except (OSError, IndexError, ValueError):
+        return None
+    finally:
+        writer.close()
+
+
+async def closed_loop(send: Callable[[], Awaitable[Optional[int]]], concurrency: int, requests: int) -> List[Sample]:
+    """``concurrency`` clients sending ``requests`` requests in all, each waiting for its previous answer"""
+    samples: List[Sample] = []
+    remaining = requests
+
+    async def client():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            status = await send()
+            samples.append((start, time.perf_counter() - start, status))
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return samples
+
+
+async def open_loop(send: Callable[[], Awaitable[Optional[int]]], rate: float, requests: int, seed: int = 0) -> List[Sample]:
+    """``requests`` requests started at ``rate`` per second on average, with exponential gaps"""
+    arrivals = random.Random(seed)
+    samples: List[Sample] = []
+
+    async def timed(scheduled: float):
+        status = await send()
+        samples.append((scheduled, time.perf_counter() - scheduled, status))
+
+    tasks = []
+    scheduled = time.perf_counter()
+    for _ in range(requests):
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(timed(scheduled)))
+        scheduled += arrivals.expovariate(rate)
+    await asyncio.gather(*tasks)
+    return samples
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples: List[Sample]) -> Dict[str, Any]:
+    """Latency of the answered (status 200) requests, throughput and status counts of a run"""
+    latencies = [latency * 1000.0 for _, latency, status in samples if status == 200]
+    statuses: Dict[str, int] = {}
+    for _, _, status in samples:
+        key = str(status) if status is not None else "connection_error"
+        statuses[key] = statuses.get(key, 0) + 1
+    first = min(start for start, _, _ in samples)
+    last = max(start + latency for start, latency, _ in samples)
+    return {
+        "requests": len(samples),
+        "statuses": statuses,
+        "seconds": round(last - first, 3),
+        "throughput_rps": round(len(latencies) / (last - first), 3) if last > first else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 1) if latencies else 0.0,
+            "p50": round(_percentile(latencies, 0.50), 1),
+            "p95": round(_percentile(latencies, 0.95), 1),
+            "p99": round(_percentile(latencies, 0.99), 1),
+            "max": round(max(latencies), 1) if latencies else 0.0,
+        },
+    }
+
+
+class MemorySampler:
+    """Peak RSS of this process, sampled on a thread while in use"""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.baseline_mb = memory_mb().get("rss_mb", 0.0)
+        self.peak_mb = self.baseline_mb
+        self._running = False
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while self._running:
+            self.peak_mb = max(self.peak_mb, memory_mb().get("rss_mb", 0.0))
+            time.sleep(self.interval)
+
+    def __enter__(self) -> "MemorySampler":
+        self._running = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._running = False
+        self._thread.join()
+
+    def report(self) -> Dict[str, float]:
+        return {"rss_mb_baseline": round(self.baseline_mb, 1), "rss_mb_peak": round(self.peak_mb, 1)}
+
+
+_SERIES = re.compile(r'^(ocr_stage_duration_seconds|ocr_queue_wait_seconds)_(sum|count)\{(.*)\} (\S+)$')
+
+
+async def _stage_totals(port: int) -> Dict[str, List[float]]:
+    """Seconds and count of every stage and queue wait in /metrics so far, by series"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /metrics HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n")
+    await writer.drain()
+    text = (await reader.read()).decode()
+    writer.close()
+    totals: Dict[str, List[float]] = {}
+    for line in text.splitlines():
+        match = _SERIES.match(line)
+        if match is None:
+            continue
+        name, kind, labels, value = match.groups()
+        labels = dict(re.findall(r'(\w+)="([^"]*)"', labels))
+        key = f"{labels['model']}/{labels['stage']}" if "stage" in labels else f"queue_wait/{labels['queue']}"
+        total = totals.setdefault(key, [0.0, 0.0])
+        total[0 if kind == "sum" else 1] = float(value)
+    return totals
+
+
+def _stage_means(before: Dict[str, List[float]], after: Dict[str, List[float]]) -> Dict[str, float]:
+    """Mean ms per series over the requests between two /metrics scrapes"""
+    means = {}
+    for key, (seconds, count) in sorted(after.items()):
+        previous = before.get(key, [0.0, 0.0])
+        if count > previous[1]:
+            means[key] = round((seconds - previous[0]) / (count - previous[1]) * 1000.0, 2)
+    return means
+
+
+def _page() -> bytes:
+    image, _ = _dense_page(1)
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def build_registry(args: argparse.Namespace) -> ModelRegistry:
+    costs = StubCosts(args.encode_ms, args.prefill_ms_per_token, args.decode_ms, args.tokens, args.jitter, args.seed)
+    return ModelRegistry(
+        factories={
+            "phi3": lambda use_gpu, executor: StubPhi3Service(costs, args.phi3_prompt_tokens, executor),
+            "qwen25": lambda use_gpu, executor: StubQwenService(costs, executor),
+            "tesseract": lambda use_gpu, executor: StubTesseractService(args.ocr_ms, args.ocr_confidence),
+        },
+        executor=InferenceExecutor(kind="thread", max_workers=args.workers, max_queue=settings.INFERENCE_MAX_QUEUE)
+    )
+
+
+async def _runs(port: int, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    request = _request(_page(), args.model)
+
+    def send() -> Awaitable[Optional[int]]:
+        return _send(port, request)
+
+    # Loads the stub models and warms up imports and the batcher
+    for _ in range(args.warmup):
+        await send()
+
+    runs = []
+    modes = ["closed", "open"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        before = await _stage_totals(port)
+        with MemorySampler() as memory:
+            if mode == "closed":
+                samples = await closed_loop(send, args.concurrency, args.requests)
+                run = {"name": f"closed c={args.concurrency}", "mode": mode, "concurrency": args.concurrency}
+            else:
+                samples = await open_loop(send, args.rate, args.requests, args.seed)
+                run = {"name": f"open rate={args.rate:g}", "mode": mode, "rate": args.rate}
+        run.update(summarize(samples))
+        run.update(memory.report())
+        run["server_stages_ms"] = _stage_means(before, await _stage_totals(port))
+        runs.append(run)
+    return runs
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _stub_app(args: argparse.Namespace) -> Any:
+    settings.RESULT_CACHE_ENABLED = args.cache
+    settings.NEAR_DUPLICATE_ENABLED = False
+    settings.JOBS_ENABLED = False
+    settings.WARMUP_MODELS = []
+    settings.LOAD_REPORT = False
+    settings.INFERENCE_MAX_QUEUE = args.max_queue
+
+    from app.app import app
+
+    app.state.model_registry = build_registry(args)
+    return app
+
+
+def serve(args: argparse.Namespace):
+    with InProcessServer(_stub_app(args), args.serve) as server:
+        print(f"Serving the API with stub models on http://127.0.0.1:{server.port}, Ctrl-C to stop")
+        try:
+            while server.thread.is_alive():
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            pass
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    with InProcessServer(_stub_app(args)) as server:
+        runs = asyncio.run(_runs(server.port, args))
+    return {
+        "benchmark": "load",
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("output", "baseline", "max_regression", "serve")
+        },
+        "runs": runs,
+    }
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Relative change of p50, p95, p99 and throughput of every run also in ``baseline``"""
+    previous = {run["name"]: run for run in baseline.get("runs", [])}
+    changes = {}
+    for current in result["runs"]:
+        old = previous.get(current["name"])
+        if old is None:
+            continue
+        change = {}
+        for key in ("p50", "p95", "p99"):
+            if old["latency_ms"][key]:
+                change[f"{key}_latency"] = round(current["latency_ms"][key] / old["latency_ms"][key] - 1.0, 3)
+        if old["throughput_rps"]:
+            change["throughput"] = round(current["throughput_rps"] / old["throughput_rps"] - 1.0, 3)
+        changes[current["name"]] = change
+    return changes
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser):
+    """Options of the stub models and the server, shared with the other benchmarks serving them"""
+    parser.add_argument("--workers", type=int, default=1, help="Inference workers")
+    parser.add_argument("--max-queue", type=int, default=settings.INFERENCE_MAX_QUEUE)
+    parser.add_argument("--cache", action="store_true", help="Keep the result cache on (every request is the same page)")
+    parser.add_argument("--encode-ms", type=float, default=5.0)
+    parser.add_argument("--prefill-ms-per-token", type=float, default=0.05)
+    parser.add_argument("--decode-ms", type=float, default=5.0, help="Time of one decode step")
+    parser.add_argument("--tokens", type=int, default=64, help="Tokens generated per request")
+    parser.add_argument("--jitter", type=float, default=0.25, help="Variation of the generated tokens")
+    parser.add_argument("--phi3-prompt-tokens", type=int, default=1024, help="Image and text tokens of a Phi-3 prompt")
+    parser.add_argument("--ocr-ms", type=float, default=50.0, help="Time of a Tesseract page")
+    parser.add_argument("--ocr-confidence", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=["phi3", "qwen25", "auto"], default="phi3")
+    parser.add_argument("--mode", choices=["closed", "open", "both"], default="both")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per run")
+    parser.add_argument("--concurrency", type=int, default=8, help="Clients of the closed loop")
+    parser.add_argument("--rate", type=float, default=8.0, help="Requests per second of the open loop")
+    parser.add_argument("--warmup", type=int, default=4)
+    add_stub_arguments(parser)
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    parser.add_argument("--baseline", help="Earlier report to compare with")
+    parser.add_argument("--max-regression", type=float, help="Fail when p95 latency or throughput is this much worse")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="Only serve the API with the stub models")
+    args = parser.parse_args()
+    if args.serve is not None:
+        serve(args)
+        return
+
+    result = run(args)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        result["baseline"] = {"commit": baseline.get("commit"), "change": compare(result, baseline)}
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline and args.max_regression is not None:
+        for name, change in result["baseline"]["change"].items():
+            if change.get("p95_latency", 0.0) > args.max_regression or change.get("throughput", 0.0) < -args.max_regression:
+                raise SystemExit(f"{name} regressed by more than {args.max_regression:.0%}: {change}")
+
+
+if __name__ == "__main__":
+    main()
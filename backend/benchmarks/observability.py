@@ -0,0 +1,250 @@
+"""
+Check of what the API exports about its requests: /metrics and the span
+trees written to TRACE_EXPORT_PATH.
+
+Serves the API with the stub models of benchmarks.load, exporting traces to
+a temporary file, sends --requests extract-text requests, then scrapes
+/metrics and parses the exported span trees. The run fails unless:
+
+- every sample of /metrics belongs to a family with a HELP and a TYPE line,
+  and parses as a name, labels and a number,
+- histogram buckets are cumulative, their bounds increase up to +Inf, and
+  the +Inf bucket equals _count,
+- the stages of a request (upload_read, the model's generation stages,
+  serialize) and its HTTP request are counted once per request,
+- one span tree is exported per request, rooted at extract_text, with every
+  span inside its parent and every stage of it a series of
+  ocr_stage_duration_seconds.
+
+Usage (from the backend directory):
+    python -m benchmarks.observability --requests 4
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import re
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+from .load import InProcessServer, _page, _request, _send, _stub_app, add_stub_arguments
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})? (\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+# Stages every stub Phi-3 request goes through
+STAGES = [
+    ("phi3", "upload_read"),
+    ("phi3", "generate"),
+    ("phi3", "encode"),
+    ("phi3", "prefill"),
+    ("phi3", "decode_tokens"),
+    ("phi3", "postprocess"),
+    ("phi3", "serialize"),
+]
+
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def parse_exposition(text: str) -> Tuple[Dict[str, Dict[str, str]], List[Sample], List[str]]:
+    """Families (name -> HELP and TYPE), samples and the lines that do not parse"""
+    families: Dict[str, Dict[str, str]] = {}
+    samples: List[Sample] = []
+    errors = []
+    for line in text.splitlines():
+        if not line:
+            continue
+        if line.startswith("# "):
+            parts = line.split(" ", 3)
+            if len(parts) < 3 or parts[1] not in ("HELP", "TYPE"):
+                errors.append(line)
+                continue
+            families.setdefault(parts[2], {})[parts[1]] = parts[3] if len(parts) > 3 else ""
+            continue
+        match = _SAMPLE.match(line)
+        if match is None:
+            errors.append(line)
+            continue
+        name, labels, value = match.groups()
+        try:
+            number = float(value)
+        except ValueError:
+            errors.append(line)
+            continue
+        samples.append((name, dict(_LABEL.findall(labels or "")), number))
+    return families, samples, errors
+
+
+def _family(name: str, families: Dict[str, Dict[str, str]]) -> Optional[str]:
+    if name in families:
+        return name
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix) and families.get(name[:-len(suffix)], {}).get("TYPE") == "histogram":
+            return name[:-len(suffix)]
+    return None
+
+
+def check_exposition(families: Dict[str, Dict[str, str]], samples: List[Sample]) -> List[str]:
+    """What is wrong with the families and samples of a scrape"""
+    problems = []
+    for name, lines in families.items():
+        if set(lines) != {"HELP", "TYPE"} or not lines["HELP"]:
+            problems.append(f"{name}: lacks a HELP or TYPE line")
+    buckets: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], List[Tuple[float, float]]] = {}
+    counts: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+    for name, labels, value in samples:
+        family = _family(name, families)
+        if family is None:
+            problems.append(f"{name}: sample without a family")
+            continue
+        if families[family].get("TYPE") == "counter" and value < 0:
+            problems.append(f"{name}{labels}: negative counter")
+        series = tuple(sorted((key, label) for key, label in labels.items() if key != "le"))
+        if name == family + "_bucket":
+            bound = math.inf if labels.get("le") == "+Inf" else float(labels["le"])
+            buckets.setdefault((family, series), []).append((bound, value))
+        elif name == family + "_count":
+            counts[(family, series)] = value
+    for key, bounds in buckets.items():
+        family, series = key
+        if [bound for bound, _ in bounds] != sorted(bound for bound, _ in bounds) or bounds[-1][0] != math.inf:
+            problems.append(f"{family}{dict(series)}: bucket bounds do not increase up to +Inf")
+        if any(later < earlier for (_, earlier), (_, later) in zip(bounds, bounds[1:])):
+            problems.append(f"{family}{dict(series)}: buckets are not cumulative")
+        if counts.get(key) != bounds[-1][1]:
+            problems.append(f"{family}{dict(series)}: +Inf bucket {bounds[-1][1]} is not _count {counts.get(key)}")
+    return problems
+
+
+def check_span(span: Dict[str, Any], parent: Optional[Dict[str, Any]] = None, path: str = "") -> List[str]:
+    """What is wrong with a span tree: spans outside their parent, missing fields"""
+    path = f"{path}/{span.get('name')}"
+    problems = []
+    if not isinstance(span.get("start_ms"), (int, float)) or not isinstance(span.get("duration_ms"), (int, float)):
+        return [f"{path}: lacks start_ms or duration_ms"]
+    if span["duration_ms"] < 0:
+        problems.append(f"{path}: negative duration")
+    if parent is not None:
+        # Times are rounded to the microsecond
+        slack = 0.002
+        start, end = span["start_ms"], span["start_ms"] + span["duration_ms"]
+        if start < parent["start_ms"] - slack or end > parent["start_ms"] + parent["duration_ms"] + slack:
+            problems.append(f"{path}: {start}-{end} ms lies outside its parent")
+    for child in span.get("children", []):
+        problems.extend(check_span(child, span, path))
+    return problems
+
+
+def span_names(span: Dict[str, Any]) -> List[str]:
+    names = [span["name"]]
+    for child in span.get("children", []):
+        names.extend(span_names(child))
+    return names
+
+
+async def _scrape(port: int) -> str:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /metrics HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n")
+    await writer.drain()
+    response = (await reader.read()).decode()
+    writer.close()
+    return response.split("\r\n\r\n", 1)[1]
+
+
+def _stage_counts(samples: List[Sample]) -> Dict[Tuple[str, str], float]:
+    return {
+        (labels.get("model", ""), labels.get("stage", "")): value
+        for name, labels, value in samples if name == "ocr_stage_duration_seconds_count"
+    }
+
+
+def _http_count(samples: List[Sample]) -> float:
+    return sum(
+        value for name, labels, value in samples
+        if name == "ocr_http_requests_total" and labels.get("path", "").endswith("/extract-text")
+        and labels.get("status") == "200"
+    )
+
+
+async def _runs(port: int, requests: int) -> Dict[str, Any]:
+    request = _request(_page(), "phi3")
+    # Loads the stub model, so that its load is not part of the counts
+    await _send(port, request)
+    _, before, _ = parse_exposition(await _scrape(port))
+    statuses = [await _send(port, request) for _ in range(requests)]
+    families, samples, errors = parse_exposition(await _scrape(port))
+    stages_before, stages_after = _stage_counts(before), _stage_counts(samples)
+    return {
+        "statuses": statuses,
+        "families": len(families),
+        "samples": len(samples),
+        "unparsed_lines": errors,
+        "exposition_problems": check_exposition(families, samples),
+        "stage_counts": {
+            f"{model}/{stage}": stages_after.get((model, stage), 0) - stages_before.get((model, stage), 0)
+            for model, stage in STAGES
+        },
+        "http_requests": _http_count(samples) - _http_count(before),
+        "stage_series": sorted({stage for _, stage in stages_after}),
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "traces.jsonl")
+        settings.TRACE_EXPORT_PATH = path
+        try:
+            with InProcessServer(_stub_app(args)) as server:
+                result = asyncio.run(_runs(server.port, args.requests))
+        finally:
+            settings.TRACE_EXPORT_PATH = None
+        with open(path, encoding="utf-8") as file:
+            traces = [json.loads(line) for line in file]
+    # The first trace is the request that loaded the model
+    checked = traces[1:]
+    result["traces"] = len(checked)
+    result["trace_roots"] = sorted({trace["name"] for trace in checked})
+    result["trace_ids_unique"] = len({trace.get("trace_id") for trace in traces}) == len(traces)
+    result["trace_problems"] = [problem for trace in checked for problem in check_span(trace)]
+    names = {name for trace in checked for name in span_names(trace)[1:]}
+    result["spans_without_series"] = sorted(names - set(result.pop("stage_series")))
+    # The first tree with a problem, or else the first one
+    result["example_trace"] = next((trace for trace in checked if check_span(trace)), checked[0] if checked else None)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=4, help="Requests checked after the one loading the model")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    result = run(args)
+    print(json.dumps(result, indent=2))
+
+    failures = []
+    if result["statuses"] != [200] * args.requests:
+        failures.append(f"requests answered {result['statuses']}")
+    if result["unparsed_lines"]:
+        failures.append(f"/metrics: lines that do not parse: {result['unparsed_lines']}")
+    failures.extend(f"/metrics: {problem}" for problem in result["exposition_problems"])
+    for series, count in result["stage_counts"].items():
+        if count != args.requests:
+            failures.append(f"/metrics: stage {series} counted {count} times for {args.requests} requests")
+    if result["http_requests"] != args.requests:
+        failures.append(f"/metrics: {result['http_requests']} extract-text requests counted for {args.requests}")
+    if result["traces"] != args.requests or result["trace_roots"] != ["extract_text"]:
+        failures.append(f"traces: {result['traces']} exported with roots {result['trace_roots']}")
+    if not result["trace_ids_unique"]:
+        failures.append("traces: trace_id is not unique")
+    failures.extend(f"traces: {problem}" for problem in result["trace_problems"])
+    if result["spans_without_series"]:
+        failures.append(f"traces: spans without an ocr_stage_duration_seconds series: {result['spans_without_series']}")
+    if failures:
+        raise SystemExit("\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
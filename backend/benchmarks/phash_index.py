@@ -0,0 +1,164 @@
+"""
+Benchmark of the perceptual-hash near-duplicate index.
+
+Builds a HammingIndex over random 64-bit hashes, then measures lookup latency
+for perturbed copies of indexed hashes (which must all be found) against a
+NumPy brute-force scan, and the cost of hashing a synthetic scanned page.
+Fails when the p99 lookup latency exceeds --max-p99-us; the defaults check
+NEAR_DUPLICATE_MAX_DISTANCE over 2M pages.
+A pruning run wires a NearDuplicateIndex to a small ResultCache and fails
+when the index keeps entries whose results were evicted or expired.
+
+Usage (from the backend directory):
+    python -m benchmarks.phash_index --entries 2000000 --max-distance 3
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from app.core.config import settings
+from app.services.perceptual_index import HammingIndex, NearDuplicateIndex, _popcount64, dhash, phash
+from app.services.result_cache import ResultCache
+
+
+def _flip_bits(value: int, count: int, rng: np.random.Generator) -> int:
+    for bit in rng.choice(64, size=count, replace=False):
+        value ^= 1 << int(bit)
+    return value
+
+
+def _synthetic_page(width: int = 2480, height: int = 3508) -> Image.Image:
+    """A4 page at 300 DPI with lines of 'text' blocks"""
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    rng = np.random.default_rng(0)
+    for y in range(200, height - 200, 60):
+        x = 200
+        while x < width - 300:
+            word = int(rng.integers(40, 220))
+            draw.rectangle([x, y, x + word, y + 30], fill="black")
+            x += word + 25
+    return image
+
+
+def _timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def run(entries: int, queries: int, max_distance: int, num_chunks: int, seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    hashes = rng.integers(0, 2**63, size=entries, dtype=np.int64).astype(np.uint64) << np.uint64(1)
+    hashes |= rng.integers(0, 2, size=entries, dtype=np.int64).astype(np.uint64)
+
+    index = HammingIndex(num_chunks=num_chunks)
+    start = time.perf_counter()
+    for i, value in enumerate(hashes.tolist()):
+        index.add(value, i)
+    build_seconds = time.perf_counter() - start
+
+    targets = rng.integers(0, entries, size=queries)
+    probes = [
+        _flip_bits(int(hashes[t]), int(rng.integers(0, max_distance + 1)), rng)
+        for t in targets
+    ]
+
+    latencies = []
+    found = 0
+    for target, probe in zip(targets, probes):
+        start = time.perf_counter()
+        matches = index.query(probe, max_distance)
+        latencies.append(time.perf_counter() - start)
+        found += any(payload == int(target) for _, payload in matches)
+
+    brute = []
+    for probe in probes[: min(queries, 50)]:
+        start = time.perf_counter()
+        distances = _popcount64(hashes ^ np.uint64(probe))
+        np.nonzero(distances <= max_distance)
+        brute.append(time.perf_counter() - start)
+
+    page = _synthetic_page()
+    latencies_us = np.array(latencies) * 1e6
+    return {
+        "entries": entries,
+        "queries": queries,
+        "max_distance": max_distance,
+        "num_chunks": num_chunks,
+        "build_seconds": round(build_seconds, 3),
+        "recall": found / queries,
+        "query_us": {
+            "mean": round(float(latencies_us.mean()), 1),
+            "p50": round(float(np.percentile(latencies_us, 50)), 1),
+            "p99": round(float(np.percentile(latencies_us, 99)), 1),
+        },
+        "brute_force_us_mean": round(float(np.mean(brute)) * 1e6, 1),
+        "phash_ms_per_page": round(_timed(lambda: phash(page.copy()), 5) * 1e3, 2),
+        "dhash_ms_per_page": round(_timed(lambda: dhash(page.copy()), 5) * 1e3, 2),
+    }
+
+
+def pruning(entries: int = 1000, kept: int = 100, seed: int = 0) -> dict:
+    """Index and cache ``entries`` results in a cache that holds ``kept`` of them"""
+    rng = np.random.default_rng(seed)
+    hashes = [int(value) for value in rng.integers(0, 2**63, size=entries, dtype=np.int64)]
+    value = {"text": "x" * 100}
+    index = NearDuplicateIndex()
+    cache = ResultCache(max_bytes=kept * len(json.dumps(value)), ttl_seconds=3600, on_remove=index.discard)
+    for i, image_hash in enumerate(hashes):
+        cache.set(f"key-{i}", value)
+        index.add(image_hash, "context", f"key-{i}")
+    after_eviction = len(index.index)
+    # Every evicted page still finds itself in the index if pruning failed
+    stale = sum(
+        any(cache.get(key) is None for _, key in index.candidates(image_hash, "context", 0))
+        for image_hash in hashes
+    )
+
+    # Short-lived results push the rest out of the cache, then expire
+    cache.ttl_seconds = 1e-6
+    for i, image_hash in enumerate(hashes[:kept]):
+        cache.set(f"fresh-{i}", value)
+        index.add(image_hash, "context", f"fresh-{i}")
+    time.sleep(0.01)
+    for i in range(kept):
+        cache.get(f"fresh-{i}")
+    return {
+        "entries": entries,
+        "cache_entries": kept,
+        "index_entries_after_eviction": after_eviction,
+        "stale_matches": stale,
+        "index_entries_after_expiry": len(index.index),
+        "discarded": index.stats()["discarded"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=2_000_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--max-distance", type=int, default=settings.NEAR_DUPLICATE_MAX_DISTANCE)
+    parser.add_argument("--chunks", type=int, default=4)
+    parser.add_argument("--max-p99-us", type=float, default=1000.0, help="Highest p99 lookup latency")
+    args = parser.parse_args()
+    result = run(args.entries, args.queries, args.max_distance, args.chunks)
+    result["pruning"] = pruning()
+    print(json.dumps(result, indent=2))
+    if result["recall"] < 1.0:
+        raise SystemExit(f"Only {result['recall']:.1%} of the perturbed hashes were found")
+    if result["query_us"]["p99"] > args.max_p99_us:
+        raise SystemExit(f"p99 lookup latency is {result['query_us']['p99']} us, above {args.max_p99_us} us")
+    pruned = result["pruning"]
+    if pruned["index_entries_after_eviction"] > pruned["cache_entries"] or pruned["stale_matches"]:
+        raise SystemExit("The index kept entries whose results were evicted from the cache")
+    if pruned["index_entries_after_expiry"]:
+        raise SystemExit("The index kept entries whose results expired")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Check and benchmark of the prompt prefix key/value cache.
+
+Runs Qwen25Service on a small randomly initialized Qwen2 model (no download)
+with a byte-level tokenizer, with and without PROMPT_PREFIX_CACHE, and
+reports whether the greedy outputs are identical together with the prefill
+time and the prompt tokens that were not prefilled again.
+
+A second run does the same for Phi3VisionService. The processor of
+benchmarks.batching encodes the prompt followed by one image placeholder per
+crop, and a small Qwen2 model stands in for Phi-3: it reads each placeholder
+as a token of its image and decodes greedily. Pages with different crop
+counts are batched, so with the cache the padding sits between the cached
+prefix and the image tokens. The outputs must match those without the cache
+and those of each page generated on its own.
+
+Usage (from the backend directory):
+    python -m benchmarks.prefix_cache --runs 10 --hidden-size 256 --layers 4
+"""
+import argparse
+import asyncio
+import json
+import statistics
+
+import torch
+from PIL import Image
+from transformers import Qwen2Config, Qwen2ForCausalLM
+
+from app.core.config import settings
+from app.services.executor import InferenceExecutor
+from app.services.phi3_service import PROMPT, Phi3VisionService
+from app.services.qwen_service import Qwen25Service
+from benchmarks.batching import EOS, PAD, FakeProcessor
+
+SAMPLES = [
+    ("Th1s is s0me OCR t3xt with err0rs", ["en"]),
+    ("Bonjour le m0nde, ceci est un tes", ["fr"]),
+    ("Invoice No. 1234 Total: 56,78 EUR", ["en", "de"]),
+    ("", None),
+]
+
+
+class ByteTokenizer:
+    """One id per UTF-8 byte; id 256 is end of sequence"""
+    eos_token_id = 256
+    pad_token_id = 256
+
+    class _Encoding:
+        def __init__(self, input_ids):
+            self.input_ids = input_ids
+
+    def __call__(self, text, add_special_tokens=True, return_tensors=None):
+        return self._Encoding(list(text.encode()))
+
+    def decode(self, ids, skip_special_tokens=False):
+        if hasattr(ids, "tolist"):
+            ids = ids.tolist()
+        return bytes(token for token in ids if token < 256).decode(errors="replace")
+
+
+def _tiny_config(hidden_size: int, layers: int, vocab_size: int, eos_token_id: int) -> Qwen2Config:
+    torch.manual_seed(0)
+    return Qwen2Config(
+        vocab_size=vocab_size,
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 2,
+        num_hidden_layers=layers,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=4096,
+        eos_token_id=eos_token_id,
+        pad_token_id=PAD if eos_token_id == EOS else eos_token_id,
+    )
+
+
+def _tiny_service(hidden_size: int, layers: int, max_new_tokens: int) -> Qwen25Service:
+    config = _tiny_config(hidden_size, layers, 257, 256)
+    settings.QWEN25_MAX_NEW_TOKENS = max_new_tokens
+    service = Qwen25Service(use_gpu=False, executor=InferenceExecutor("thread", 1, 4, 5))
+    service.model = Qwen2ForCausalLM(config).eval()
+    service.tokenizer = ByteTokenizer()
+    return service
+
+
+async def _run_all(service: Qwen25Service, use_cache: bool, runs: int):
+    settings.PROMPT_PREFIX_CACHE = use_cache
+    texts, prefill, reused, prompt = [], [], [], []
+    for _ in range(runs):
+        for text, languages in SAMPLES:
+            result = await service.process_text(text, languages)
+            if "error" in result:
+                raise RuntimeError(result["error"])
+            texts.append(result["text"])
+            prefill.append(result["timings"]["prefill_ms"])
+            reused.append(result["timings"]["prefix_tokens_reused"])
+            prompt.append(result["timings"]["prompt_tokens"])
+    return texts, prefill, reused, prompt
+
+
+class TinyPhi3(Qwen2ForCausalLM):
+    """
+    Small Qwen2 model taking Phi-3's generate arguments. Each negative
+    placeholder id becomes a token of its row's image width, and decoding is
+    greedy so that outputs can be compared token for token.
+    """
+    IMAGE_TOKENS = 64
+
+    def generate(self, input_ids=None, attention_mask=None, pixel_values=None, image_sizes=None, **kwargs):
+        image_tokens = self.config.vocab_size - self.IMAGE_TOKENS + image_sizes[:, 1:] % self.IMAGE_TOKENS
+        input_ids = torch.where(input_ids < 0, image_tokens.expand_as(input_ids), input_ids)
+        for sampling in ("temperature", "top_p"):
+            kwargs.pop(sampling, None)
+        kwargs["do_sample"] = False
+        return super().generate(input_ids=input_ids, attention_mask=attention_mask, **kwargs)
+
+
+def _tiny_phi3(hidden_size: int, layers: int, max_new_tokens: int) -> Phi3VisionService:
+    settings.PHI3_MAX_NEW_TOKENS = max_new_tokens
+    service = Phi3VisionService(use_gpu=False, executor=InferenceExecutor("thread", 1, 4, 5))
+    service.model = TinyPhi3(_tiny_config(hidden_size, layers, 512, EOS)).eval()
+    service.processor = FakeProcessor()
+    return service
+
+
+def run_phi3(hidden_size: int, layers: int, max_new_tokens: int) -> dict:
+    """Greedy Phi-3 outputs of a batch of pages with 1 to 12 crops, with and without the prefix cache"""
+    service = _tiny_phi3(hidden_size, layers, max_new_tokens)
+    pages = [Image.new("L", size) for size in [(300, 200), (700, 500), (1000, 1300), (1200, 1000)]]
+    items = [(PROMPT, page, None, None) for page in pages]
+
+    def texts(use_cache: bool, batch):
+        settings.PROMPT_PREFIX_CACHE = use_cache
+        return [text for text, _, _ in service._generate_batch(batch)]
+
+    alone = [texts(False, [item])[0] for item in items]
+    plain = texts(False, items)
+    cached = texts(True, items)
+    cached_alone = [texts(True, [item])[0] for item in items]
+    crops = [FakeProcessor()(PROMPT, page)["pixel_values"].shape[1] - 1 for page in pages]
+    return {
+        "model": {"hidden_size": hidden_size, "layers": layers, "max_new_tokens": max_new_tokens},
+        "pages": len(pages),
+        "crops": crops,
+        "identical_outputs": cached == plain,
+        "identical_to_unbatched": plain == alone and cached_alone == alone,
+        "prefix_cache": service.prefix_cache.stats(),
+    }
+
+
+def run(runs: int, hidden_size: int, layers: int, max_new_tokens: int) -> dict:
+    service = _tiny_service(hidden_size, layers, max_new_tokens)
+
+    async def both():
+        # Warm up so neither side pays for first-call allocations
+        await _run_all(service, True, 1)
+        return await _run_all(service, False, runs), await _run_all(service, True, runs)
+
+    (plain_texts, plain_prefill, _, prompt), (cached_texts, cached_prefill, reused, _) = asyncio.run(both())
+    return {
+        "model": {"hidden_size": hidden_size, "layers": layers, "max_new_tokens": max_new_tokens},
+        "generations": len(plain_texts),
+        "identical_outputs": plain_texts == cached_texts,
+        "prompt_tokens_mean": statistics.mean(prompt),
+        "prefix_tokens_reused": reused[0],
+        "prefill_ms": {
+            "without_cache": round(statistics.median(plain_prefill), 2),
+            "with_cache": round(statistics.median(cached_prefill), 2),
+        },
+        "prefix_cache": service.prefix_cache.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--hidden-size", type=int, default=256)
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    args = parser.parse_args()
+    result = run(args.runs, args.hidden_size, args.layers, args.max_new_tokens)
+    result["phi3"] = run_phi3(args.hidden_size, args.layers, args.max_new_tokens)
+    print(json.dumps(result, indent=2))
+    if not result["identical_outputs"]:
+        raise SystemExit("Outputs differ with the prefix cache enabled")
+    if not result["phi3"]["identical_outputs"]:
+        raise SystemExit("Phi-3 outputs differ with the prefix cache enabled")
+    if not result["phi3"]["identical_to_unbatched"]:
+        raise SystemExit("Batched Phi-3 outputs differ from those of each page on its own")
+
+
+if __name__ == "__main__":
+    main()
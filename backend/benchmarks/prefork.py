@@ -0,0 +1,242 @@
+"""
+Memory and throughput of pre-fork serving as the worker count grows.
+
+Starts the API with N workers in two modes:
+  prefork      the parent loads the model once and forks the workers, which
+               share the weights copy-on-write
+  independent  every worker loads its own copy after the fork, as
+               ``uvicorn --workers N`` would
+then sends /extract-text requests from --concurrency clients for --duration
+seconds and reports requests per second, latency, and the total RSS and PSS
+(proportional set size, which counts shared pages once) of all processes.
+
+The "phi3" model is replaced by a randomly initialized Qwen2 that generates
+--new-tokens tokens per request, so no weights are downloaded; its size is
+set with --hidden-size and --layers.
+
+Usage (from the backend directory):
+    python -m benchmarks.prefork --workers 1 2 4 --duration 10
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import torch
+from PIL import Image
+
+BOUNDARY = uuid.uuid4().hex
+
+
+class TinyModelService:
+    """Stands in for Phi3VisionService: a random Qwen2 generating a fixed number of tokens"""
+
+    def __init__(self, executor: Any, hidden_size: int, layers: int, new_tokens: int):
+        self.model_id = "tiny-qwen2"
+        self.device = "cpu"
+        self.dtype_name = "float32"
+        self.executor = executor
+        self.hidden_size = hidden_size
+        self.layers = layers
+        self.new_tokens = new_tokens
+        self.model = None
+
+    async def load(self):
+        from transformers import Qwen2Config, Qwen2ForCausalLM
+
+        torch.manual_seed(0)
+        config = Qwen2Config(
+            vocab_size=32000,
+            hidden_size=self.hidden_size,
+            intermediate_size=self.hidden_size * 3,
+            num_hidden_layers=self.layers,
+            num_attention_heads=8,
+            num_key_value_heads=4,
+        )
+        self.model = Qwen2ForCausalLM(config).eval()
+        # Like the load report of the real services, generate once while loading,
+        # i.e. in the parent before the fork in prefork mode
+        self._generate()
+
+    def unload(self):
+        self.model = None
+
+    def _generate(self) -> str:
+        input_ids = torch.arange(1, 33)[None]
+        with torch.no_grad():
+            outputs = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                max_new_tokens=self.new_tokens,
+                min_new_tokens=self.new_tokens,
+                do_sample=False
+            )
+        return " ".join(str(token) for token in outputs[0, 32:].tolist())
+
+    async def process_image(self, image: Any, languages: Optional[List[str]] = None, **kwargs):
+        start = time.time()
+        generated = await self.executor.run(self._generate)
+        return {"text": generated, "confidence": 1.0, "processing_time": time.time() - start}
+
+    async def process_text_and_image(self, text: str, image_bytes: bytes, languages: Optional[List[str]] = None, **kwargs):
+        return await self.process_image(None, languages)
+
+
+def serve(mode: str, workers: int, port: int, hidden_size: int, layers: int, new_tokens: int):
+    """Runs in the server subprocess"""
+    from app.core.config import settings
+
+    settings.RESULT_CACHE_ENABLED = False
+    settings.JOBS_ENABLED = False
+    settings.WARMUP_MODELS = ["phi3"]
+    settings.INFERENCE_MAX_QUEUE = 1024
+    settings.SERVER_HEALTH_INTERVAL = 1.0
+
+    from app.app import app
+    from app.prefork import PreforkServer
+    from app.services.executor import InferenceExecutor
+    from app.services.model_registry import ModelRegistry
+
+    factories = {"phi3": lambda use_gpu, executor: TinyModelService(executor, hidden_size, layers, new_tokens)}
+    registry = ModelRegistry(factories=factories, executor=InferenceExecutor.from_settings())
+    PreforkServer(app, host="127.0.0.1", port=port, workers=workers, registry=registry, preload=mode == "prefork").run()
+
+
+def _multipart(image_bytes: bytes) -> bytes:
+    parts = [
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="model"\r\n\r\nphi3\r\n',
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="use_cache"\r\n\r\nfalse\r\n',
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="page.png"\r\n'
+        'Content-Type: image/png\r\n\r\n',
+    ]
+    return "".join(parts).encode() + image_bytes + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def _get(port: int, path: str) -> Dict[str, Any]:
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    connection.request("GET", path)
+    return json.loads(connection.getresponse().read())
+
+
+def _wait_ready(port: int, workers: int, timeout: float = 300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if all(_get(port + 1 + i, "/health")["models"] for i in range(workers)):
+                return
+        except (OSError, ValueError, http.client.HTTPException):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("Workers did not become ready")
+
+
+def _load(port: int, concurrency: int, duration: float) -> Dict[str, Any]:
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), "white").save(buffer, "PNG")
+    body = _multipart(buffer.getvalue())
+    headers = {"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}
+    latencies: List[float] = []
+    per_worker: Dict[str, int] = {}
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def client():
+        nonlocal errors
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        while time.time() < deadline:
+            start = time.perf_counter()
+            connection.request("POST", "/api/v1/ocr/extract-text", body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            with lock:
+                if response.status != 200:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+                worker = response.getheader("X-Worker", "?")
+                per_worker[worker] = per_worker.get(worker, 0) + 1
+
+    start = time.time()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": round(len(latencies) / elapsed, 2),
+        "latency_ms_p50": round(1000 * latencies[len(latencies) // 2], 1) if latencies else None,
+        "requests_per_worker": dict(sorted(per_worker.items())),
+    }
+
+
+def _process_tree_memory(pid: int) -> Dict[str, float]:
+    from app.prefork import memory_mb
+
+    pids = [pid]
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        pids += [int(child) for child in f.read().split()]
+    usage = [memory_mb(p) for p in pids]
+    return {
+        "processes": len(pids),
+        "rss_mb_total": round(sum(u.get("rss_mb", 0.0) for u in usage), 1),
+        "pss_mb_total": round(sum(u.get("pss_mb", 0.0) for u in usage), 1),
+    }
+
+
+def run(workers: List[int], concurrency: int, duration: float, hidden_size: int, layers: int, new_tokens: int) -> list:
+    results = []
+    port = 18000
+    for count in workers:
+        for mode in ("prefork", "independent"):
+            port += 100
+            server = subprocess.Popen(
+                [sys.executable, "-m", "benchmarks.prefork", "--serve", mode, str(count), str(port),
+                 "--hidden-size", str(hidden_size), "--layers", str(layers), "--new-tokens", str(new_tokens)],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                env=dict(os.environ, PYTHONWARNINGS="ignore")
+            )
+            try:
+                _wait_ready(port, count)
+                load = _load(port, concurrency, duration)
+                results.append({"workers": count, "mode": mode, **load, **_process_tree_memory(server.pid)})
+            finally:
+                server.terminate()
+                server.wait(timeout=60)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--hidden-size", type=int, default=512)
+    parser.add_argument("--layers", type=int, default=8)
+    parser.add_argument("--new-tokens", type=int, default=8)
+    parser.add_argument("--serve", nargs=3, metavar=("MODE", "WORKERS", "PORT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        mode, count, port = args.serve
+        serve(mode, int(count), int(port), args.hidden_size, args.layers, args.new_tokens)
+        return
+    result = run(args.workers, args.concurrency, args.duration, args.hidden_size, args.layers, args.new_tokens)
+    print(json.dumps(result, indent=2))
+    for entry in result:
+        if entry["requests"] == 0:
+            raise SystemExit(f"No request succeeded with {entry['workers']} {entry['mode']} workers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Benchmark of the image preprocessing pipeline.
+
+Scans two synthetic 300 DPI colour A4 pages (slightly skewed, with a scanner
+border): one full of text and a short letter with text on its top third
+only. For each it compares decoding the upload and preparing the Phi-3 input
+at full resolution against doing the same after preprocess_image. The Phi-3
+side is approximated without the model: an RGB conversion, the processor's
+HD resize and float normalization, plus the image token count the
+processor would produce for the resulting size. A full-resolution page gets
+the processor's 16 crops; a preprocessed one only the crops it covers.
+
+Fails when preprocessing gives a page more image tokens than the full scan,
+or does not cut the short letter's tokens by at least --min-short-saving.
+
+Usage (from the backend directory):
+    python -m benchmarks.preprocessing --repeat 5 --format jpeg
+"""
+import argparse
+import io
+import json
+import math
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from app.services.phi3_service import covered_crops
+from app.services.preprocessing import preprocess_image
+from benchmarks.phash_index import _synthetic_page
+
+
+def phi3_image_tokens(width: int, height: int, num_crops: int = 16) -> Tuple[int, Tuple[int, int]]:
+    """Image tokens and HD-transformed size the Phi-3-vision processor produces for an image"""
+    transposed = width < height
+    if transposed:
+        width, height = height, width
+    ratio = width / height
+    scale = 1
+    while scale * math.ceil(scale / ratio) <= num_crops:
+        scale += 1
+    scale -= 1
+    new_w = int(scale * 336)
+    new_h = math.ceil(int(new_w / ratio) / 336) * 336
+    h, w = (new_w, new_h) if transposed else (new_h, new_w)
+    tokens = (h // 336 * (w // 336) + 1) * 144 + 1 + (h // 336 + 1) * 12
+    return tokens, (w, h)
+
+
+def _scanned_page(skew: float = 1.5, text_fraction: float = 1.0) -> Image.Image:
+    page = _synthetic_page().convert("RGB")
+    if text_fraction < 1.0:
+        # Blank paper below the first text_fraction of the page
+        draw = ImageDraw.Draw(page)
+        draw.rectangle([0, int(page.height * text_fraction), page.width, page.height], fill="white")
+    # Off-white paper
+    page = Image.eval(page, lambda v: int(v * 0.93) + 8)
+    page = page.rotate(skew, resample=Image.Resampling.BILINEAR, expand=True, fillcolor=(245, 242, 230))
+    # Dark lid shadow along two edges, as flatbed scans often have
+    draw = ImageDraw.Draw(page)
+    draw.rectangle([0, 0, page.width, 40], fill=(30, 30, 30))
+    draw.rectangle([0, 0, 40, page.height], fill=(30, 30, 30))
+    return page
+
+
+def _encode(image: Image.Image, fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == "jpeg":
+        image.save(buffer, "JPEG", quality=90, dpi=(300, 300))
+    else:
+        image.save(buffer, "PNG", dpi=(300, 300))
+    return buffer.getvalue()
+
+
+def _model_input(image: Image.Image, num_crops: int = 16) -> Tuple[float, int]:
+    """Approximate Phi-3 processor work; returns its time in ms and the image token count"""
+    start = time.perf_counter()
+    rgb = image.convert("RGB")
+    tokens, size = phi3_image_tokens(*rgb.size, num_crops=num_crops)
+    resized = rgb.resize(size, Image.Resampling.BILINEAR)
+    (np.asarray(resized, dtype=np.float32) / 255.0 - 0.5) / 0.5
+    return (time.perf_counter() - start) * 1000.0, tokens
+
+
+def _mean(values: List[float]) -> float:
+    return round(float(np.mean(values)), 1)
+
+
+def run_page(page: Image.Image, repeat: int, fmt: str) -> Dict:
+    data = _encode(page, fmt)
+
+    baseline_decode, baseline_model = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        baseline_decode.append((time.perf_counter() - start) * 1000.0)
+        model_ms, baseline_tokens = _model_input(image)
+        baseline_model.append(model_ms)
+
+    steps: Dict[str, List[float]] = {}
+    prepared_model = []
+    for _ in range(repeat):
+        result = preprocess_image(Image.open(io.BytesIO(data)))
+        for step, ms in result.timings_ms.items():
+            steps.setdefault(step, []).append(ms)
+        # As Phi3VisionService passes it to the processor, which caps it at 16
+        num_crops = min(16, covered_crops(result.image))
+        model_ms, prepared_tokens = _model_input(result.image, num_crops)
+        prepared_model.append(model_ms)
+
+    baseline_total = _mean(np.add(baseline_decode, baseline_model))
+    prepared_total = _mean(np.add(steps["total"], prepared_model))
+    return {
+        "format": fmt,
+        "upload_bytes": len(data),
+        "original_size": list(result.original_size),
+        "preprocessed_size": list(result.image.size),
+        "skew_corrected": result.skew_angle,
+        "baseline_ms": {
+            "decode": _mean(baseline_decode),
+            "model_input": _mean(baseline_model),
+            "total": baseline_total,
+        },
+        "preprocessed_ms": {
+            **{step: _mean(values) for step, values in steps.items()},
+            "model_input": _mean(prepared_model),
+            "end_to_end": prepared_total,
+        },
+        "speedup": round(baseline_total / prepared_total, 2) if prepared_total else None,
+        "num_crops": num_crops,
+        "image_tokens": {"baseline": baseline_tokens, "preprocessed": prepared_tokens},
+    }
+
+
+def run(repeat: int, fmt: str) -> Dict:
+    return {
+        "full_page": run_page(_scanned_page(), repeat, fmt),
+        "short_letter": run_page(_scanned_page(text_fraction=0.33), repeat, fmt),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--format", choices=["jpeg", "png"], default="jpeg")
+    parser.add_argument("--min-short-saving", type=float, default=0.3, help="Least share of image tokens saved on the short letter")
+    args = parser.parse_args()
+    result = run(args.repeat, args.format)
+    print(json.dumps(result, indent=2))
+
+    failures = []
+    for name, page in result.items():
+        tokens = page["image_tokens"]
+        if tokens["preprocessed"] > tokens["baseline"]:
+            failures.append(f"{name}: {tokens['preprocessed']} image tokens preprocessed, {tokens['baseline']} without")
+    short = result["short_letter"]["image_tokens"]
+    if short["preprocessed"] > short["baseline"] * (1.0 - args.min_short_saving):
+        failures.append(f"short letter: preprocessing saved too few image tokens: {short}")
+    if failures:
+        raise SystemExit("\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
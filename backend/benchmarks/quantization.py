@@ -0,0 +1,156 @@
+"""
+Accuracy regression check and benchmark of the CPU precision modes.
+
+Loads the model once per precision, fp32 first as the reference, and runs a
+fixed input set through each. Reports the load-time weight memory and decode
+speed, the mean latency per input and, for every other precision, the
+character error rate of its outputs against the fp32 outputs. Exits with an
+error when a precision's CER exceeds --max-cer.
+
+Phi-3 reads a fixed image set: the images in --images, or rendered text pages
+when omitted. Phi-3 samples, so the generator is reseeded before every image.
+Qwen2.5 only sees text, so its fixed set is the OCR text of the prefix cache
+benchmark. --tiny runs a small randomly initialized Qwen2 model instead of the
+real weights (no download); it exercises the quantization code paths and
+reports memory and speed, but a random model's near-uniform token
+distributions flip under any rounding, so --max-cer is not enforced.
+
+Usage (from the backend directory):
+    python -m benchmarks.quantization --model qwen25 --tiny
+    python -m benchmarks.quantization --model phi3 --images ./pages --precisions fp32 bf16 int8
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+
+import torch
+from PIL import Image, ImageDraw, ImageFont
+
+from app.core.config import settings
+from app.services.executor import InferenceExecutor
+from app.services.phi3_service import Phi3VisionService
+from app.services.quantization import load_dtype, quantize_model
+from app.services.qwen_service import Qwen25Service
+from benchmarks.prefix_cache import SAMPLES, _tiny_service
+
+
+def _text_pages() -> List[Image.Image]:
+    """One rendered page per sample text, so runs without --images are reproducible"""
+    font = ImageFont.load_default(size=28)
+    pages = []
+    for text, _ in SAMPLES:
+        page = Image.new("RGB", (1240, 400), "white")
+        ImageDraw.Draw(page).multiline_text((60, 60), text or " ", fill="black", font=font, spacing=12)
+        pages.append(page)
+    return pages
+
+
+def _load_images(directory: Optional[str]) -> List[Image.Image]:
+    if directory is None:
+        return _text_pages()
+    names = sorted(name for name in os.listdir(directory) if name.lower().endswith((".png", ".jpg", ".jpeg", ".tif", ".tiff")))
+    return [Image.open(os.path.join(directory, name)).convert("RGB") for name in names]
+
+
+def character_error_rate(reference: str, hypothesis: str) -> float:
+    """Levenshtein distance between the texts, divided by the reference length"""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_char in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_char in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_char != hyp_char)))
+        previous = current
+    return previous[-1] / max(len(reference), 1)
+
+
+async def _service(model: str, precision: str, tiny: bool, max_new_tokens: int) -> Any:
+    executor = InferenceExecutor("thread", 1, 16, 5)
+    if model == "phi3":
+        settings.PHI3_CPU_PRECISION = precision
+        settings.PHI3_MAX_NEW_TOKENS = max_new_tokens
+        service = Phi3VisionService(use_gpu=False, executor=executor)
+        await service.load()
+        return service
+
+    settings.QWEN25_CPU_PRECISION = precision
+    if not tiny:
+        settings.QWEN25_MAX_NEW_TOKENS = max_new_tokens
+        service = Qwen25Service(use_gpu=False, executor=executor)
+        await service.load()
+        return service
+
+    service = _tiny_service(hidden_size=256, layers=4, max_new_tokens=max_new_tokens)
+    start = time.perf_counter()
+    service.model = quantize_model(service.model.to(load_dtype(service.precision)), service.precision)
+    service._report_load(time.perf_counter() - start)
+    return service
+
+
+async def _outputs(service: Any, model: str, images: List[Image.Image]) -> Dict[str, Any]:
+    texts, latencies = [], []
+    inputs = images if model == "phi3" else SAMPLES
+    for item in inputs:
+        start = time.perf_counter()
+        if model == "phi3":
+            torch.manual_seed(0)
+            result = await service.process_image(item)
+        else:
+            result = await service.process_text(*item)
+        latencies.append(time.perf_counter() - start)
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        texts.append(result["text"])
+    return {"texts": texts, "mean_latency_s": statistics.mean(latencies)}
+
+
+def run(model: str, precisions: List[str], images: Optional[str], tiny: bool, max_new_tokens: int) -> dict:
+    pages = _load_images(images) if model == "phi3" else []
+    precisions = ["fp32"] + [precision for precision in precisions if precision != "fp32"]
+
+    async def all_precisions():
+        results = {}
+        for precision in precisions:
+            service = await _service(model, precision, tiny, max_new_tokens)
+            results[precision] = {"load_report": service.load_report, **await _outputs(service, model, pages)}
+            service.unload()
+        return results
+
+    results = asyncio.run(all_precisions())
+    reference = results["fp32"]["texts"]
+    report = {}
+    for precision, result in results.items():
+        rates = [character_error_rate(ref, text) for ref, text in zip(reference, result["texts"])]
+        report[precision] = {
+            "load_report": result["load_report"],
+            "mean_latency_s": round(result["mean_latency_s"], 4),
+            "cer_vs_fp32": round(statistics.mean(rates), 4),
+            "exact_matches": sum(ref == text for ref, text in zip(reference, result["texts"])),
+        }
+    return {"model": model, "tiny": tiny, "inputs": len(reference), "precisions": report}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=["phi3", "qwen25"], default="qwen25")
+    parser.add_argument("--precisions", nargs="+", default=["bf16", "int8", "int4"])
+    parser.add_argument("--images", help="Directory of page images for phi3 (default: rendered text pages)")
+    parser.add_argument("--tiny", action="store_true", help="Random tiny Qwen2 model instead of the real weights")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--max-cer", type=float, default=0.05)
+    args = parser.parse_args()
+    if args.tiny and args.model != "qwen25":
+        parser.error("--tiny is only available for qwen25")
+
+    result = run(args.model, args.precisions, args.images, args.tiny, args.max_new_tokens)
+    print(json.dumps(result, indent=2))
+    failed = [p for p, r in result["precisions"].items() if r["cer_vs_fp32"] > args.max_cer]
+    if failed and not args.tiny:
+        raise SystemExit(f"CER against fp32 above {args.max_cer} for: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Self-check of the result cache: hits, TTL expiry, the disk tier and its cap.
+
+Runs ResultCache against a SQLite file in a temporary directory and fails
+unless:
+
+- a stored entry is a memory hit, and after a restart a disk hit,
+- an expired entry is a miss in both tiers and is reported to on_remove,
+- expired rows are pruned by the next write, not only by a lookup of them,
+- the disk tier never holds more than --max-rows rows, the oldest go first,
+  and writes stay fast once it is full,
+- cache keys differ by the device and dtype the model resolves to (on a
+  host without CUDA, use_gpu resolves to the CPU and shares its entries).
+
+Usage (from the backend directory):
+    python -m benchmarks.result_cache --max-rows 2000 --writes 10000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import torch
+
+from app.core.config import settings
+from app.routers.ocr import generation_params
+from app.services.quantization import resolve_runtime
+from app.services.result_cache import ResultCache, make_cache_key
+
+VALUE = {"raw_text": "text", "enhanced_text": "text", "model_used": "phi3", "confidence": 0.9}
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def hits_and_restart(path: str) -> Dict[str, Any]:
+    cache = ResultCache(max_bytes=1024 * 1024, ttl_seconds=3600, disk_path=path)
+    cache.set("page", VALUE)
+    memory_hit = cache.get("page") == VALUE
+    cache.close()
+    restarted = ResultCache(max_bytes=1024 * 1024, ttl_seconds=3600, disk_path=path)
+    disk_hit = restarted.get("page") == VALUE
+    promoted = restarted.get("page") == VALUE
+    stats = restarted.stats()
+    restarted.close()
+    return {
+        "memory_hit": memory_hit,
+        "disk_hit_after_restart": disk_hit and stats["disk_hits"] == 1,
+        "promoted_to_memory": promoted and stats["memory_hits"] == 1,
+    }
+
+
+def expiry(path: str, ttl: float) -> Dict[str, Any]:
+    removed = []
+    cache = ResultCache(max_bytes=1024 * 1024, ttl_seconds=ttl, disk_path=path, on_remove=removed.append)
+    cache.set("looked-up", VALUE)
+    cache.set("never-looked-up", VALUE)
+    time.sleep(ttl * 1.5)
+    missed = cache.get("looked-up") is None
+    # A write prunes the expired rows nobody asks for
+    cache.set("fresh", VALUE)
+    rows = [key for (key,) in cache._db.execute("SELECT key FROM results ORDER BY key")]
+    stats = cache.stats()
+    cache.close()
+    return {
+        "expired_is_miss": missed,
+        "rows_after_write": rows,
+        "removed": sorted(removed),
+        "expirations": stats["expirations"],
+    }
+
+
+def disk_cap(path: str, max_rows: int, writes: int) -> Dict[str, Any]:
+    removed = []
+    cache = ResultCache(
+        max_bytes=64 * 1024, ttl_seconds=3600, disk_path=path, on_remove=removed.append, disk_max_rows=max_rows
+    )
+    write_ms = []
+    most_rows = 0
+    for index in range(writes):
+        start = time.perf_counter()
+        cache.set(f"page-{index}", VALUE)
+        write_ms.append((time.perf_counter() - start) * 1000.0)
+        if index % 97 == 0:
+            most_rows = max(most_rows, cache._db.execute("SELECT COUNT(*) FROM results").fetchone()[0])
+    rows = cache._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+    oldest = cache._db.execute("SELECT key FROM results ORDER BY created LIMIT 1").fetchone()[0]
+    kept_newest = cache.get(f"page-{writes - 1}") == VALUE
+    dropped_oldest = cache.get("page-0") is None
+    stats = cache.stats()
+    cache.close()
+    return {
+        "rows": rows,
+        "most_rows": max(most_rows, rows),
+        "counted_rows": stats["disk_entries"],
+        "oldest_kept": oldest,
+        "kept_newest": kept_newest,
+        "dropped_oldest": dropped_oldest,
+        "removed": len(removed),
+        "disk_evictions": stats["disk_evictions"],
+        "write_p50_ms": round(_percentile(write_ms, 0.5), 3),
+        "write_p99_ms": round(_percentile(write_ms, 0.99), 3),
+    }
+
+
+def keys() -> Dict[str, Any]:
+    def key(model: str, use_gpu: bool) -> str:
+        return make_cache_key("0" * 64, model, ["en"], generation_params(model, use_gpu=use_gpu))
+
+    precision = settings.PHI3_CPU_PRECISION
+    cpu = key("phi3", False)
+    settings.PHI3_CPU_PRECISION = "bf16" if resolve_runtime(False, precision)[1] != "bf16" else "fp32"
+    other_dtype = key("phi3", False)
+    settings.PHI3_CPU_PRECISION = precision
+    return {
+        "cuda_available": torch.cuda.is_available(),
+        "use_gpu_key_differs": key("phi3", True) != cpu,
+        "dtype_key_differs": other_dtype != cpu,
+        "auto_use_gpu_key_differs": key("auto", True) != key("auto", False),
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as directory:
+        return {
+            "hits": hits_and_restart(os.path.join(directory, "hits.db")),
+            "expiry": expiry(os.path.join(directory, "expiry.db"), args.ttl),
+            "disk_cap": disk_cap(os.path.join(directory, "cap.db"), args.max_rows, args.writes),
+            "keys": keys(),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ttl", type=float, default=0.2, help="TTL of the expiry run, in seconds")
+    parser.add_argument("--max-rows", type=int, default=2000, help="disk_max_rows of the cap run")
+    parser.add_argument("--writes", type=int, default=10000, help="Entries written in the cap run")
+    parser.add_argument("--max-write-p99-ms", type=float, default=20.0, help="Slowest p99 write once the disk is full")
+    args = parser.parse_args()
+    result = run(args)
+    print(json.dumps(result, indent=2))
+
+    failures = []
+    hits = result["hits"]
+    if not all(hits.values()):
+        failures.append(f"hits: {hits}")
+    expired = result["expiry"]
+    if not expired["expired_is_miss"] or expired["rows_after_write"] != ["fresh"]:
+        failures.append(f"expiry: expired rows were not pruned on write: {expired}")
+    if expired["removed"] != ["looked-up", "never-looked-up"]:
+        failures.append(f"expiry: on_remove got {expired['removed']}")
+    cap = result["disk_cap"]
+    if cap["most_rows"] > args.max_rows or cap["counted_rows"] != cap["rows"]:
+        failures.append(f"disk cap: {cap['most_rows']} rows for a cap of {args.max_rows}")
+    if not cap["kept_newest"] or not cap["dropped_oldest"] or cap["removed"] != args.writes - args.max_rows:
+        failures.append(f"disk cap: the oldest rows were not the ones dropped: {cap}")
+    if cap["write_p99_ms"] > args.max_write_p99_ms:
+        failures.append(f"disk cap: p99 write of {cap['write_p99_ms']} ms")
+    key_check = result["keys"]
+    if key_check["use_gpu_key_differs"] != key_check["cuda_available"]:
+        failures.append(f"keys: use_gpu does not follow the resolved device: {key_check}")
+    if not key_check["dtype_key_differs"]:
+        failures.append("keys: the dtype is not part of the key")
+    if key_check["auto_use_gpu_key_differs"] != key_check["cuda_available"]:
+        failures.append(f"keys: the cascade key does not follow the resolved device: {key_check}")
+    if failures:
+        raise SystemExit("\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
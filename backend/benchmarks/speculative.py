@@ -0,0 +1,185 @@
+"""
+Check and benchmark of speculative decoding for the Qwen2.5 correction.
+
+Runs Qwen25Service on a small randomly initialized Qwen2 model (no download)
+with a byte-level tokenizer, with QWEN25_SPECULATIVE "off", "prompt_lookup"
+and "draft_model" (an even smaller random draft model), and reports whether
+the greedy outputs are identical together with the acceptance rate and
+tokens per second of each mode.
+
+A random model does not copy its prompt the way Qwen2.5 copies the raw OCR
+text, so its drafts are rarely accepted. The second part therefore replays
+the reference output as drafts, with a given share of the drafted tokens
+replaced by wrong ones, and reports tokens per second against the resulting
+acceptance rate.
+
+Usage (from the backend directory):
+    python -m benchmarks.speculative --runs 3 --hidden-size 512 --layers 8
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+import torch
+from transformers import LogitsProcessorList, Qwen2Config, Qwen2ForCausalLM
+
+from app.core.config import settings
+from app.services.confidence import TokenLogprobs
+from app.services.qwen_service import Qwen25Service
+from app.services.speculative import speculative_generate
+
+from .prefix_cache import SAMPLES, _tiny_service
+
+DRAFT_ACCURACIES = [0.0, 0.5, 0.8, 0.9, 1.0]
+
+
+class ReplayDrafter:
+    """Drafts the known greedy continuation, with each token wrong at the given rate"""
+
+    def __init__(self, reference, prompt_length: int, accuracy: float, seed: int = 0):
+        self.reference = reference
+        self.prompt_length = prompt_length
+        self.accuracy = accuracy
+        self.random = random.Random(seed)
+
+    def draft(self, sequence, count):
+        start = len(sequence) - self.prompt_length
+        tokens = self.reference[start:start + count]
+        return [token if self.random.random() < self.accuracy else (token + 1) % 256 for token in tokens]
+
+    def accepted(self, count):
+        pass
+
+
+async def _run_mode(service: Qwen25Service, mode: str, runs: int):
+    service.speculative = mode
+    texts, tokens, seconds, stats = [], 0, 0.0, []
+    for _ in range(runs):
+        for text, languages in SAMPLES:
+            result = await service.process_text(text, languages)
+            if "error" in result:
+                raise RuntimeError(result["error"])
+            texts.append(result["text"])
+            seconds += result["processing_time"]
+            tokens += len(service.tokenizer(result["text"]).input_ids)
+            if "speculative" in result["timings"]:
+                stats.append(result["timings"]["speculative"])
+    drafted = sum(s["drafted"] for s in stats)
+    return texts, {
+        "tokens_per_second": round(tokens / seconds, 1),
+        "acceptance_rate": round(sum(s["accepted"] for s in stats) / drafted, 3) if drafted else None,
+        "tokens_per_pass": round(statistics.mean(s["tokens_per_pass"] for s in stats), 2) if stats else 1.0,
+    }
+
+
+def _modes(service: Qwen25Service, runs: int) -> dict:
+    async def all_modes():
+        await _run_mode(service, "off", 1)
+        return {mode: await _run_mode(service, mode, runs) for mode in ("off", "prompt_lookup", "draft_model")}
+
+    results = asyncio.run(all_modes())
+    reference = results["off"][0]
+    return {
+        "identical_outputs": all(texts == reference for texts, _ in results.values()),
+        **{mode: summary for mode, (_, summary) in results.items()},
+    }
+
+
+def _sweep(service: Qwen25Service, runs: int, lookahead: int) -> dict:
+    text, languages = SAMPLES[0]
+    input_ids, _ = service._encode(service._build_prompt(text, languages))
+    eos = [service.tokenizer.eos_token_id]
+    with torch.no_grad():
+        reference = service.model.generate(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            max_new_tokens=settings.QWEN25_MAX_NEW_TOKENS,
+            do_sample=False
+        )
+    generated = reference[0, input_ids.shape[1]:].tolist()
+
+    def timed(accuracy):
+        best, identical, stats = None, True, None
+        for seed in range(runs):
+            drafter = ReplayDrafter(generated, input_ids.shape[1], accuracy, seed)
+            start = time.perf_counter()
+            with torch.no_grad():
+                outputs, stats = speculative_generate(
+                    service.model, input_ids, drafter, settings.QWEN25_MAX_NEW_TOKENS, eos,
+                    lookahead=lookahead, logits_processor=LogitsProcessorList([TokenLogprobs()])
+                )
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+            identical = identical and outputs[0].tolist() == reference[0].tolist()
+        return best, identical, stats
+
+    timed(1.0)
+    start = time.perf_counter()
+    for _ in range(runs):
+        with torch.no_grad():
+            service.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                max_new_tokens=settings.QWEN25_MAX_NEW_TOKENS,
+                do_sample=False,
+                logits_processor=LogitsProcessorList([TokenLogprobs()])
+            )
+    plain = (time.perf_counter() - start) / runs
+
+    sweep = {"generate": {"tokens_per_second": round(len(generated) / plain, 1)}}
+    for accuracy in DRAFT_ACCURACIES:
+        elapsed, identical, stats = timed(accuracy)
+        sweep[f"draft_accuracy_{accuracy}"] = {
+            "acceptance_rate": round(stats["acceptance_rate"], 3),
+            "tokens_per_pass": round(stats["tokens_per_pass"], 2),
+            "tokens_per_second": round(len(generated) / elapsed, 1),
+            "speedup": round(plain / elapsed, 2),
+            "identical_output": identical,
+        }
+    return sweep
+
+
+def run(runs: int, hidden_size: int, layers: int, max_new_tokens: int, lookahead: int) -> dict:
+    settings.QWEN25_SPECULATIVE_LOOKAHEAD = lookahead
+    service = _tiny_service(hidden_size, layers, max_new_tokens)
+    torch.manual_seed(1)
+    service.draft_model = Qwen2ForCausalLM(Qwen2Config(
+        vocab_size=257,
+        hidden_size=64,
+        intermediate_size=128,
+        num_hidden_layers=1,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=4096,
+        eos_token_id=256,
+    )).eval()
+    return {
+        "model": {"hidden_size": hidden_size, "layers": layers, "max_new_tokens": max_new_tokens},
+        "lookahead": lookahead,
+        "modes": _modes(service, runs),
+        "replayed_drafts": _sweep(service, runs, lookahead),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--hidden-size", type=int, default=512)
+    parser.add_argument("--layers", type=int, default=8)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--lookahead", type=int, default=8)
+    args = parser.parse_args()
+    result = run(args.runs, args.hidden_size, args.layers, args.max_new_tokens, args.lookahead)
+    print(json.dumps(result, indent=2))
+    identical = result["modes"]["identical_outputs"] and all(
+        entry.get("identical_output", True) for entry in result["replayed_drafts"].values()
+    )
+    if not identical:
+        raise SystemExit("Outputs differ with speculative decoding")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Check of the streaming endpoint against a stub Phi-3 generator.
+
+Serves the API on a local port with a Phi3VisionService whose model is a
+stub: it hands a known UTF-8 text (with multi-byte characters) to the
+streamer one byte-level token every --token-ms, like generate does. The
+endpoint is read over a socket in both formats, NDJSON and SSE, and the run
+fails unless:
+
+- the first delta arrives before generation ends,
+- the deltas joined together are the final text,
+- the final message carries time_to_first_token and confidence,
+- the streamer decodes a bounded number of token ids per token, i.e. the
+  work of streaming grows linearly with the length of the text.
+
+Usage (from the backend directory):
+    python -m benchmarks.streaming --token-ms 5
+"""
+import argparse
+import asyncio
+import io
+import json
+import time
+from typing import Any, Dict, List, Tuple
+
+import torch
+from PIL import Image
+
+from app.core.config import settings
+from app.services.executor import InferenceExecutor
+from app.services.model_registry import ModelRegistry
+from app.services.phi3_service import Phi3VisionService
+
+from .batching import FakeProcessor
+from .load import BOUNDARY, InProcessServer
+from .prefix_cache import ByteTokenizer
+
+TEXT = "\n".join(
+    f"Ligne {index}: Café Müller, reçu n° {index * 37} — total {index * 3},50 €"
+    for index in range(1, 13)
+)
+
+
+class CountingTokenizer(ByteTokenizer):
+    """Byte tokenizer counting the ids it is asked to decode"""
+
+    def __init__(self):
+        self.decoded_ids = 0
+
+    def decode(self, ids, skip_special_tokens=False):
+        if hasattr(ids, "tolist"):
+            ids = ids.tolist()
+        self.decoded_ids += len(ids)
+        return super().decode(ids, skip_special_tokens)
+
+
+class StreamProcessor(FakeProcessor):
+    def __init__(self):
+        self.tokenizer = CountingTokenizer()
+
+    def decode(self, ids, skip_special_tokens=False):
+        return ByteTokenizer.decode(self.tokenizer, ids, skip_special_tokens)
+
+
+class StubModel:
+    """Generates the bytes of TEXT, then end of sequence, one every ``token_ms``"""
+
+    def __init__(self, token_ms: float):
+        self.token_ms = token_ms
+        self.finished_at = None
+
+    def generate(self, input_ids, logits_processor=None, stopping_criteria=None, streamer=None, **kwargs):
+        eos = ByteTokenizer.eos_token_id
+        streamer.put(input_ids)
+        sequences = input_ids
+        for token in list(TEXT.encode()) + [eos]:
+            time.sleep(self.token_ms / 1000.0)
+            scores = torch.zeros(1, eos + 1)
+            scores[0, token] = 10.0
+            for processor in logits_processor or []:
+                scores = processor(sequences, scores)
+            sequences = torch.cat([sequences, torch.tensor([[token]])], dim=1)
+            streamer.put(torch.tensor([token]))
+            if stopping_criteria is not None and stopping_criteria(sequences, scores).all():
+                break
+        self.finished_at = time.perf_counter()
+        return sequences
+
+
+def _service(token_ms: float, use_gpu: bool, executor: InferenceExecutor) -> Phi3VisionService:
+    service = Phi3VisionService(use_gpu=use_gpu, executor=executor)
+    service.model = StubModel(token_ms)
+    service.processor = StreamProcessor()
+    return service
+
+
+def _app(token_ms: float) -> Tuple[Any, ModelRegistry]:
+    settings.RESULT_CACHE_ENABLED = False
+    settings.JOBS_ENABLED = False
+    settings.WARMUP_MODELS = []
+    settings.LOAD_REPORT = False
+    settings.ADAPTIVE_MAX_NEW_TOKENS = False
+    # The stub has no forward pass to build the prefix key/values with
+    settings.PROMPT_PREFIX_CACHE = False
+    settings.PHI3_MAX_NEW_TOKENS = len(TEXT.encode()) + 8
+
+    from app.app import app
+
+    registry = ModelRegistry(
+        factories={"phi3": lambda use_gpu, executor: _service(token_ms, use_gpu, executor)},
+        executor=InferenceExecutor("thread", 1, 4)
+    )
+    app.state.model_registry = registry
+    return app, registry
+
+
+def _request(format: str) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("L", (600, 400), 255).save(buffer, "PNG")
+    body = (
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="model"\r\n\r\nphi3\r\n'
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="format"\r\n\r\n{format}\r\n'
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="page.png"\r\n'
+        'Content-Type: image/png\r\n\r\n'
+    ).encode() + buffer.getvalue() + f"\r\n--{BOUNDARY}--\r\n".encode()
+    headers = (
+        "POST /api/v1/ocr/extract-text/stream HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n"
+        f"Content-Type: multipart/form-data; boundary={BOUNDARY}\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n"
+    ).encode()
+    return headers + body
+
+
+async def _events(port: int, format: str) -> Tuple[int, List[Tuple[float, str, Dict[str, Any]]]]:
+    """Status and (arrival time, event, payload) of every message of a chunked streaming response"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write(_request(format))
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        while (await reader.readline()) not in (b"\r\n", b""):
+            pass
+        if status != 200:
+            print((await reader.read()).decode(errors="replace"))
+            return status, []
+        events, pending = [], b""
+        while True:
+            size = int((await reader.readline()).strip() or b"0", 16)
+            if size == 0:
+                break
+            pending += await reader.readexactly(size)
+            await reader.readexactly(2)
+            arrived = time.perf_counter()
+            separator = b"\n\n" if format == "sse" else b"\n"
+            while separator in pending:
+                message, pending = pending.split(separator, 1)
+                if format == "sse":
+                    event, data = message.decode().split("\n", 1)
+                    events.append((arrived, event[len("event: "):], json.loads(data[len("data: "):])))
+                else:
+                    payload = json.loads(message)
+                    events.append((arrived, "done" if payload.get("done") else "delta", payload))
+        return status, events
+    finally:
+        writer.close()
+
+
+def _check(status: int, events, finished_at: float, generated: int, decoded_ids: int) -> Dict[str, Any]:
+    deltas = [(arrived, payload["delta"]) for arrived, event, payload in events if event == "delta"]
+    done = [payload for _, event, payload in events if event == "done"]
+    final = done[-1] if done else {}
+    return {
+        "status": status,
+        "deltas": len(deltas),
+        "first_delta_before_end_ms": round((finished_at - deltas[0][0]) * 1000.0, 1) if deltas else None,
+        "deltas_are_final_text": bool(done) and "".join(delta for _, delta in deltas).strip() == final["enhanced_text"],
+        "final_text_is_generated_text": final.get("enhanced_text") == TEXT,
+        "time_to_first_token": final.get("time_to_first_token"),
+        "confidence": final.get("confidence"),
+        "decoded_ids_per_token": round(decoded_ids / max(1, generated), 2),
+    }
+
+
+async def _runs(port: int, registry: ModelRegistry) -> Dict[str, Any]:
+    results = {}
+    for format in ("ndjson", "sse"):
+        status, events = await _events(port, format)
+        service = await registry.get("phi3")
+        # The final decode of the whole text is not part of streaming
+        decoded = service.processor.tokenizer.decoded_ids - len(TEXT.encode())
+        results[format] = _check(status, events, service.model.finished_at, len(TEXT.encode()) + 1, decoded)
+        service.processor.tokenizer.decoded_ids = 0
+    return results
+
+
+def run(token_ms: float) -> Dict[str, Any]:
+    app, registry = _app(token_ms)
+    with InProcessServer(app) as server:
+        return asyncio.run(_runs(server.port, registry))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--token-ms", type=float, default=5.0, help="Time of a decode step")
+    parser.add_argument("--max-decoded-ids", type=float, default=8.0, help="Most ids decoded per streamed token")
+    args = parser.parse_args()
+    result = run(args.token_ms)
+    print(json.dumps(result, indent=2))
+    failures = []
+    for format, check in result.items():
+        if check["status"] != 200 or not check["deltas"]:
+            failures.append(f"{format}: no deltas were streamed: {check}")
+            continue
+        if check["first_delta_before_end_ms"] <= 0:
+            failures.append(f"{format}: the first delta arrived only after generation ended")
+        if not check["deltas_are_final_text"] or not check["final_text_is_generated_text"]:
+            failures.append(f"{format}: the deltas joined together are not the final text")
+        if not check["time_to_first_token"] or check["confidence"] is None:
+            failures.append(f"{format}: the final message lacks time_to_first_token or confidence")
+        if check["decoded_ids_per_token"] > args.max_decoded_ids:
+            failures.append(f"{format}: {check['decoded_ids_per_token']} ids decoded per token")
+    if failures:
+        raise SystemExit("\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
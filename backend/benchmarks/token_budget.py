@@ -0,0 +1,167 @@
+"""
+Check and benchmark of the adaptive generation budgets and repetition stop.
+
+Phi-3: renders synthetic pages whose text is known, a sparse receipt,
+dense pages of one to three columns (see benchmarks.layout), one of them
+inverted to light text on a dark background, and a blank page, and compares
+the budget estimated from their segmented text lines with the tokens of
+their text: whether the budget holds the whole text, how many tokens the
+fixed PHI3_MAX_NEW_TOKENS budget cuts off, and the most decode steps a
+generation that does not stop by itself can take with either budget. Fails
+when a text does not fit its budget, when the receipt is not given fewer
+decode steps than the fixed budget, or when the blank page, which has no
+text lines to go by, does not keep the fixed budget.
+
+Qwen2.5: runs Qwen25Service on a small randomly initialized Qwen2 model (no
+download), which never ends its text and soon repeats itself like a
+degenerate generation, with the fixed QWEN25_MAX_NEW_TOKENS budget, the
+adaptive budget, and the adaptive budget with the repetition stop, and
+reports decode steps, stop reasons and time per request.
+
+Usage (from the backend directory):
+    python -m benchmarks.token_budget --runs 3
+"""
+import argparse
+import asyncio
+import json
+import math
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageOps
+
+from app.core.config import settings
+from app.services.layout import segment_page
+from app.services.phi3_service import Phi3VisionService
+
+from .layout import TOKENS_PER_CHAR, _dense_page
+from .prefix_cache import SAMPLES, _tiny_service
+
+
+def _receipt(width: int = 950, height: int = 1344, seed: int = 0) -> Tuple[Image.Image, List[int]]:
+    """A till receipt: a narrow column of short item lines. Returns it with the characters of each line"""
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    rng = np.random.default_rng(seed)
+    glyph, advance, pitch = 16, 8, 26
+    left, right = width // 3, 2 * width // 3
+    lines = []
+    for index in range(28):
+        y = 120 + index * pitch
+        # An item name on the left and its price on the right
+        name = int(rng.integers(6, 16))
+        draw.rectangle([left, y, left + name * advance, y + glyph], fill=0)
+        draw.rectangle([right - 5 * advance, y, right, y + glyph], fill=0)
+        lines.append(name + 1 + 5)
+    return image, lines
+
+
+def _tokens(characters: int) -> int:
+    return int(math.ceil(characters * TOKENS_PER_CHAR))
+
+
+def _phi3_pages() -> Dict:
+    pages = {"receipt": _receipt()}
+    for columns in (1, 2, 3):
+        image, lines = _dense_page(columns)
+        pages[f"{columns}_columns"] = (image, [line[4] for line in lines])
+    # Light text on a dark background, and a page without text
+    image, lines = _dense_page(1)
+    pages["1_column_inverted"] = (ImageOps.invert(image), [line[4] for line in lines])
+    pages["blank"] = (Image.new("L", image.size, 255), [])
+
+    fixed = settings.PHI3_MAX_NEW_TOKENS
+    results = {}
+    for name, (image, lines) in pages.items():
+        layout = segment_page(image)
+        budget = Phi3VisionService._max_new_tokens(layout.blocks) or fixed
+        # Text plus a line break per line
+        text_tokens = sum(_tokens(characters) for characters in lines) + len(lines)
+        results[name] = {
+            "text_tokens": text_tokens,
+            "budget": budget,
+            "fits": budget >= text_tokens,
+            "truncated_tokens": {"fixed": max(0, text_tokens - fixed), "adaptive": max(0, text_tokens - budget)},
+            "max_decode_steps": {"fixed": fixed, "adaptive": budget},
+            "layout_ms": round(layout.segment_ms, 1),
+        }
+    return results
+
+
+async def _qwen_run(service, runs: int) -> Dict:
+    steps, reasons, seconds, requests = 0, {}, 0.0, 0
+    for _ in range(runs):
+        for text, languages in SAMPLES:
+            start = time.perf_counter()
+            result = await service.process_text(text, languages)
+            seconds += time.perf_counter() - start
+            if "error" in result:
+                raise RuntimeError(result["error"])
+            timings = result["timings"]
+            steps += timings["generated_tokens"]
+            reasons[timings["stop_reason"]] = reasons.get(timings["stop_reason"], 0) + 1
+            requests += 1
+    return {
+        "decode_steps_per_request": round(steps / requests, 1),
+        "ms_per_request": round(seconds / requests * 1000.0, 1),
+        "stop_reasons": reasons,
+    }
+
+
+def _qwen(runs: int, hidden_size: int, layers: int) -> Dict:
+    service = _tiny_service(hidden_size, layers, 1024)
+    repetition = settings.REPETITION_MAX_PERIOD
+
+    async def all_modes():
+        results = {}
+        for name, adaptive, max_period in (
+            ("fixed", False, 0),
+            ("adaptive", True, 0),
+            ("adaptive_repetition_stop", True, repetition),
+        ):
+            settings.ADAPTIVE_MAX_NEW_TOKENS = adaptive
+            settings.REPETITION_MAX_PERIOD = max_period
+            results[name] = await _qwen_run(service, runs)
+        return results
+
+    try:
+        return asyncio.run(all_modes())
+    finally:
+        settings.ADAPTIVE_MAX_NEW_TOKENS = True
+        settings.REPETITION_MAX_PERIOD = repetition
+
+
+def run(runs: int, hidden_size: int, layers: int) -> Dict:
+    return {
+        "budget": {
+            "margin": settings.GENERATION_BUDGET_MARGIN,
+            "extra": settings.GENERATION_BUDGET_EXTRA,
+            "phi3_tokens_per_char": settings.PHI3_TOKENS_PER_CHAR,
+        },
+        "phi3_pages": _phi3_pages(),
+        "qwen25": _qwen(runs, hidden_size, layers),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--hidden-size", type=int, default=128)
+    parser.add_argument("--layers", type=int, default=2)
+    args = parser.parse_args()
+    result = run(args.runs, args.hidden_size, args.layers)
+    print(json.dumps(result, indent=2))
+    if not all(page["fits"] for page in result["phi3_pages"].values()):
+        raise SystemExit("A page's text does not fit its estimated budget")
+    pages = result["phi3_pages"]
+    if pages["receipt"]["budget"] >= settings.PHI3_MAX_NEW_TOKENS:
+        raise SystemExit("The receipt's budget is not below PHI3_MAX_NEW_TOKENS")
+    if pages["blank"]["budget"] != settings.PHI3_MAX_NEW_TOKENS:
+        raise SystemExit("A page without text lines did not keep PHI3_MAX_NEW_TOKENS")
+    if any(page["budget"] < settings.PHI3_MIN_NEW_TOKENS for page in pages.values()):
+        raise SystemExit("A page's budget is below PHI3_MIN_NEW_TOKENS")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Upload load test: memory of the API process under many concurrent large uploads.
+
+Starts the API in a subprocess with a stub "phi3" model that only decodes the
+image, then sends --concurrency simultaneous uploads of a PNG of about
+--size-mb megabytes, --rounds times over, while sampling the server's RSS.
+Uploads are hashed as they are received, spooled to disk past 1 MB and
+decoded from there, so peak memory should stay flat instead of growing with
+the bytes in flight.
+
+It also sends an oversized upload and a non-image one, and reports how much of
+each body was sent before the server answered 413 or 415.
+
+Usage (from the backend directory):
+    python -m benchmarks.uploads --concurrency 16 --rounds 3
+"""
+import argparse
+import io
+import json
+import os
+import select
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from app.prefork import memory_mb
+
+BOUNDARY = uuid.uuid4().hex
+CHUNK = 64 * 1024
+
+
+class DecodeOnlyService:
+    """Stands in for Phi3VisionService: decodes the image on the inference executor"""
+
+    def __init__(self, executor: Any):
+        self.model_id = "decode-only"
+        self.device = "cpu"
+        self.dtype_name = "float32"
+        self.executor = executor
+
+    async def load(self):
+        pass
+
+    def unload(self):
+        pass
+
+    async def process_image(self, image: Image.Image, languages: Optional[List[str]] = None, layout=None):
+        start = time.time()
+
+        def decode():
+            image.load()
+            return f"{image.size[0]}x{image.size[1]}"
+
+        text = await self.executor.run(decode)
+        return {"text": text, "confidence": 1.0, "processing_time": time.time() - start}
+
+
+def serve(port: int):
+    """Runs in the server subprocess"""
+    import uvicorn
+    from app.core.config import settings
+
+    settings.RESULT_CACHE_ENABLED = False
+    settings.NEAR_DUPLICATE_ENABLED = False
+    settings.JOBS_ENABLED = False
+    settings.INFERENCE_MAX_QUEUE = 1024
+
+    from app.app import app
+    from app.services.executor import InferenceExecutor
+    from app.services.model_registry import ModelRegistry
+
+    app.state.model_registry = ModelRegistry(
+        factories={"phi3": lambda use_gpu, executor: DecodeOnlyService(executor)},
+        executor=InferenceExecutor.from_settings()
+    )
+    uvicorn.run(app, host="127.0.0.1", port=port, access_log=False, log_level="warning")
+
+
+def _png(size_mb: float) -> bytes:
+    # Noise does not compress, so the PNG is about as large as its pixels
+    side = int((size_mb * 2**20 / 3) ** 0.5)
+    pixels = np.random.default_rng(0).integers(0, 256, (side, side, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def _post(port: int, payload: bytes, filename: str = "page.png") -> Dict[str, Any]:
+    """
+    Send a multipart upload in chunks, stopping as soon as the server answers.
+    Returns the status and how many payload bytes were sent.
+    """
+    head = (
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="model"\r\n\r\nphi3\r\n'
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        'Content-Type: image/png\r\n\r\n'
+    ).encode()
+    tail = f"\r\n--{BOUNDARY}--\r\n".encode()
+    headers = (
+        "POST /api/v1/ocr/extract-text HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n"
+        f"Content-Type: multipart/form-data; boundary={BOUNDARY}\r\n"
+        f"Content-Length: {len(head) + len(payload) + len(tail)}\r\n\r\n"
+    ).encode()
+
+    sock = socket.create_connection(("127.0.0.1", port), timeout=120)
+    sent = 0
+    try:
+        sock.sendall(headers + head)
+        view = memoryview(payload)
+        while sent < len(payload):
+            readable, _, _ = select.select([sock], [], [], 0)
+            if readable:
+                break
+            sock.sendall(view[sent:sent + CHUNK])
+            sent += min(CHUNK, len(payload) - sent)
+        else:
+            sock.sendall(tail)
+    except (BrokenPipeError, ConnectionResetError):
+        pass
+    response = b""
+    try:
+        while b"\r\n" not in response:
+            data = sock.recv(4096)
+            if not data:
+                break
+            response += data
+    except (ConnectionResetError, socket.timeout):
+        pass
+    finally:
+        sock.close()
+    status = int(response.split(b" ", 2)[1]) if response.startswith(b"HTTP/") else None
+    return {"status": status, "bytes_sent": sent, "payload_bytes": len(payload)}
+
+
+def _wait_ready(port: int, timeout: float = 120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("Server did not start")
+
+
+def run(concurrency: int, rounds: int, size_mb: float, port: int) -> Dict[str, Any]:
+    payload = _png(size_mb)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.uploads", "--serve", str(port)],
+        env=dict(os.environ, PYTHONWARNINGS="ignore")
+    )
+    try:
+        _wait_ready(port)
+        # One request first so the baseline includes the imports it triggers
+        _post(port, payload)
+        baseline = memory_mb(server.pid).get("rss_mb", 0.0)
+
+        peak = baseline
+        sampling = True
+
+        def sample():
+            nonlocal peak
+            while sampling:
+                peak = max(peak, memory_mb(server.pid).get("rss_mb", 0.0))
+                time.sleep(0.02)
+
+        sampler = threading.Thread(target=sample)
+        sampler.start()
+        statuses: List[Optional[int]] = []
+        start = time.time()
+        for _ in range(rounds):
+            threads = [
+                threading.Thread(target=lambda: statuses.append(_post(port, payload)["status"]))
+                for _ in range(concurrency)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elapsed = time.time() - start
+        sampling = False
+        sampler.join()
+
+        oversized = _post(port, payload + payload)
+        not_image = _post(port, os.urandom(len(payload)), filename="page.bin")
+        return {
+            "upload_mb": round(len(payload) / 2**20, 2),
+            "concurrency": concurrency,
+            "requests": len(statuses),
+            "ok": statuses.count(200),
+            "seconds": round(elapsed, 2),
+            "uploaded_mb_in_flight": round(concurrency * len(payload) / 2**20, 1),
+            "rss_mb_baseline": round(baseline, 1),
+            "rss_mb_peak": round(peak, 1),
+            "rss_mb_growth": round(peak - baseline, 1),
+            "oversized": oversized,
+            "not_image": not_image,
+        }
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--size-mb", type=float, default=9.5, help="Upload size; MAX_UPLOAD_SIZE is 10 MB by default")
+    parser.add_argument("--port", type=int, default=18765)
+    parser.add_argument("--serve", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve)
+        return
+    print(json.dumps(run(args.concurrency, args.rounds, args.size_mb, args.port), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Compile the Phi-3 and Qwen2.5 snapshots into the memory-mapped layout the
+services load at startup (see MODEL_SNAPSHOT_DIR).
+
+Each model is loaded once with from_pretrained in the dtype its service uses
+(float16 with --use-gpu, otherwise the dtype of its *_CPU_PRECISION), then
+written as one safetensors file next to its configs, tokenizer files and
+remote code, with a manifest of file sizes and sha256 checksums. Run it again
+after changing the model or the precision.
+
+Usage (from the backend directory):
+    python compile_models.py phi3 qwen25
+    python compile_models.py --verify phi3 qwen25
+"""
+import argparse
+import time
+
+from app.services.phi3_service import Phi3VisionService
+from app.services.qwen_service import Qwen25Service
+from app.services.snapshots import read_manifest, snapshot_dir, verify_snapshot, write_snapshot
+
+SERVICES = {"phi3": Phi3VisionService, "qwen25": Qwen25Service}
+
+
+def compile_model(name: str, use_gpu: bool):
+    service = SERVICES[name](use_gpu=use_gpu)
+    start = time.perf_counter()
+    source = service.source_path()
+    model = service._from_pretrained(source)
+    output_dir = snapshot_dir(name, service.torch_dtype)
+    manifest = write_snapshot(model, source, output_dir, name, service.model_id)
+    size = sum(f["size"] for f in manifest["files"].values())
+    print(
+        f"Compiled {name} ({manifest['dtype']}) into {output_dir}: {size / 2**30:.2f} GB "
+        f"in {time.perf_counter() - start:.0f} s, checksum {manifest['checksum'][:12]}"
+    )
+
+
+def verify_model(name: str, use_gpu: bool):
+    service = SERVICES[name](use_gpu=use_gpu)
+    path = snapshot_dir(name, service.torch_dtype)
+    verify_snapshot(path, read_manifest(path), full=True)
+    print(f"{path} matches its manifest")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("models", nargs="+", choices=sorted(SERVICES))
+    parser.add_argument("--use-gpu", action="store_true", help="Compile the float16 snapshot used on GPU")
+    parser.add_argument("--verify", action="store_true", help="Check existing snapshots against their checksums")
+    args = parser.parse_args()
+    for name in args.models:
+        if args.verify:
+            verify_model(name, args.use_gpu)
+        else:
+            compile_model(name, args.use_gpu)
+
+
+if __name__ == "__main__":
+    main()
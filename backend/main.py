@@ -1,5 +1,27 @@
+import argparse
+
 import uvicorn
 
+from app.core.config import settings
+
 
 if __name__ == "__main__":
-    uvicorn.run("app.app:app", host="0.0.0.0", port=8000, reload=True)
+    parser = argparse.ArgumentParser(description="Run the OCR API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=settings.SERVER_WORKERS)
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        # Models in WARMUP_MODELS are loaded once and shared by the forked workers
+        from app.app import app
+        from app.prefork import PreforkServer
+        PreforkServer(
+            app,
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            worker_port_base=settings.SERVER_WORKER_PORT_BASE
+        ).run()
+    else:
+        uvicorn.run("app.app:app", host=args.host, port=args.port, reload=True)
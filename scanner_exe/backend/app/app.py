@@ -1,10 +1,11 @@
 from pathlib import Path as PathLib
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Path
 from fastapi.middleware.cors import CORSMiddleware
+from app.core.config import settings
 from app.services.scanner import ScannerService
 import logging
 import json
-from typing import Dict, List, Any
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -46,6 +47,24 @@ def serialize_response(response_data: Any) -> Dict[str, Any]:
         # Return primitive types directly
         return response_data
 
+async def send_image(websocket: WebSocket, header: Dict[str, Any], data: bytes):
+    """Send an encoded image as a JSON header followed by its bytes in binary frames"""
+    chunk_size = settings.SCAN_CHUNK_SIZE
+    chunks = -(-len(data) // chunk_size)
+    await websocket.send_json({**header, "size": len(data), "chunks": chunks})
+    view = memoryview(data)
+    for offset in range(0, len(data), chunk_size):
+        await websocket.send_bytes(bytes(view[offset:offset + chunk_size]))
+    logger.debug(f"Sent {header.get('kind', header['action'])} {header.get('format')} image: {len(data)} bytes in {chunks} frames")
+
+async def send_replies(websocket: WebSocket, replies: AsyncIterator[Tuple[Dict[str, Any], Optional[bytes]]]):
+    """Send (message, payload) pairs: messages as JSON, payloads with send_image"""
+    async for reply, payload in replies:
+        if payload is None:
+            await websocket.send_json(reply)
+        else:
+            await send_image(websocket, reply, payload)
+
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
     logger.info(f"Client connecting with ID: {client_id}")
@@ -69,14 +88,52 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
                     "status": "Scanning in progress..."
                 })
 
-                result = await scanner_service.handle_scan_request(scanner_id, resolution, color_mode)
-
-                # Serialize the result to ensure it's JSON compatible
-                serialized_result = serialize_response(result)
-
-                # Add action to the response for the client to recognize it
-                serialized_result["action"] = "scan"
-                await websocket.send_json(serialized_result)
+                if scan_data.get("transport") == "json":
+                    # Legacy transport: the PNG base64-encoded in the "scan" message
+                    result = await scanner_service.handle_scan_request(scanner_id, resolution, color_mode)
+
+                    # Serialize the result to ensure it's JSON compatible
+                    serialized_result = serialize_response(result)
+
+                    # Add action to the response for the client to recognize it
+                    serialized_result["action"] = "scan"
+                    await websocket.send_json(serialized_result)
+                    continue
+
+                # Binary transport: each band, preview and the full image are a
+                # "band" or "image" header followed by "chunks" binary frames, then
+                # the "scan" result
+                scans = scanner_service.stream_scan(
+                    scanner_id,
+                    resolution,
+                    color_mode,
+                    encoding=scan_data.get("encoding"),
+                    quality=scan_data.get("quality"),
+                    previews=scan_data.get("previews", True),
+                    stream=scan_data.get("stream", False),
+                    ocr_preprocess=scan_data.get("ocr_preprocess", False)
+                )
+                await send_replies(websocket, scans)
+
+            elif message.get("action") == "scan_batch":
+                # Every page in the document feeder: "batch_progress" events and
+                # an "image" of kind "page" per page, then the "scan_batch" result
+                batch_data = message.get("data", {})
+                await websocket.send_json({
+                    "action": "ping",
+                    "status": "Batch scanning in progress..."
+                })
+                batch = scanner_service.scan_batch(
+                    batch_data.get("scanner_id", ""),
+                    batch_data.get("resolution", 300),
+                    batch_data.get("color_mode", "color"),
+                    encoding=batch_data.get("encoding"),
+                    quality=batch_data.get("quality"),
+                    max_pages=batch_data.get("max_pages"),
+                    ocr=batch_data.get("ocr", False),
+                    ocr_model=batch_data.get("ocr_model")
+                )
+                await send_replies(websocket, batch)
 
             elif message.get("action") == "list_scanners":
                 scanners = await scanner_service.handle_list_scanners_request()
@@ -115,6 +172,15 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
         except:
             logger.error("Could not send error message to client - connection may be closed")
 
+@app.on_event("shutdown")
+async def close_scanner():
+    await scanner_service.close()
+
+@app.get("/stats")
+async def stats():
+    """Scanner driver statistics, e.g. cached device list and list, open and scan latencies"""
+    return scanner_service.scanner.stats()
+
 @app.get("/")
 async def root():
     return {
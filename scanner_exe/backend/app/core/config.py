@@ -12,5 +12,47 @@ class Settings(BaseModel):
     # CORS settings
     BACKEND_CORS_ORIGINS: List[str] = ["*"]
 
+    # "auto" (TWAIN on Windows, SANE elsewhere), "sane", "twain" or "fake", a
+    # synthetic scanner for development that needs no hardware
+    SCANNER_BACKEND: str = "auto"
+    FAKE_SCANNER_LINES_PER_SECOND: float = 1000.0
+    # SANE: one session for the service, with a cached device list refreshed
+    # in the background and opened devices kept for reuse
+    SANE_DEVICE_LIST_TTL: float = 60.0  # seconds
+    SANE_IDLE_TIMEOUT: float = 120.0  # seconds an unused device stays open
+    SANE_WORKERS: int = 4
+
+    # Streaming acquisition: SANE pages are read through scanimage, which
+    # writes rows as the device delivers them, in bands of this many lines
+    SCANIMAGE_COMMAND: str = "scanimage"
+    SCAN_BAND_LINES: int = 128
+    SCAN_BAND_QUALITY: int = 80
+    # Resolution of the grayscale OCR copy built from the bands
+    SCAN_OCR_TARGET_DPI: int = 150
+
+    # ADF batch scanning: acquisition, encoding and OCR upload are pipeline
+    # stages; a stage holds at most this many pages waiting for the next one,
+    # and at most this many messages wait to be sent to the client, before
+    # the feeder is paused
+    SCAN_BATCH_QUEUE_SIZE: int = 2
+    SCAN_BATCH_MAX_PAGES: int = 200
+    # Sheets in the feeder of the fake scanner
+    FAKE_FEEDER_PAGES: int = 5
+    # OCR backend that batch pages are uploaded to with "ocr": true
+    OCR_BACKEND_URL: str = "http://localhost:8000/api/v1/ocr/extract-text"
+    OCR_MODEL: str = "phi3"
+    OCR_UPLOAD_TIMEOUT: float = 300.0
+
+    # Scan image transport: a JSON header followed by binary WebSocket frames.
+    # Encoding is "png", "webp" (lossless) or "jpeg"; clients may override it per scan
+    SCAN_IMAGE_ENCODING: str = "png"
+    SCAN_JPEG_QUALITY: int = 90
+    # zlib level 3 is within 1% of level 6 on scans at less than half the encode time
+    SCAN_PNG_COMPRESS_LEVEL: int = 3
+    SCAN_CHUNK_SIZE: int = 256 * 1024
+    # Long sides of the JPEG previews sent, smallest first, before the full image
+    SCAN_PREVIEW_SIZES: List[int] = [256, 1024]
+    SCAN_PREVIEW_QUALITY: int = 70
+
 # Create global settings object
 settings = Settings()
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+from typing import AsyncIterator, NamedTuple, Optional, Tuple
+from PIL import Image
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# scanimage --mode values for the color modes of a scan request
+SCANIMAGE_MODES = {"color": "Color", "grayscale": "Gray", "black_and_white": "Lineart"}
+
+# PNM magic number: (image mode, raw decoder mode); PBM stores 1 for black
+_PNM_MODES = {b"P4": ("1", "1;I"), b"P5": ("L", "L"), b"P6": ("RGB", "RGB")}
+
+
+class ScanBand(NamedTuple):
+    """A horizontal strip of a page, ``top`` rows from its top edge"""
+    top: int
+    image: Image.Image
+    page_height: int
+
+
+async def split_bands(image: Image.Image, band_lines: int) -> AsyncIterator[ScanBand]:
+    """Bands of an already acquired page"""
+    for top in range(0, image.height, band_lines):
+        yield ScanBand(top, image.crop((0, top, image.width, min(top + band_lines, image.height))), image.height)
+
+
+async def _read_pnm_header(stream: asyncio.StreamReader) -> Tuple[bytes, int, int, int]:
+    tokens = []
+    needed = 4
+    while len(tokens) < needed:
+        token = b""
+        while True:
+            char = await stream.readexactly(1)
+            if char == b"#":
+                await stream.readline()
+                if token:
+                    break
+                continue
+            if char.isspace():
+                if token:
+                    break
+                continue
+            token += char
+        tokens.append(token)
+        if tokens[0] == b"P4":
+            # Bitmaps have no maxval
+            needed = 3
+    magic = tokens[0]
+    if magic not in _PNM_MODES:
+        raise ValueError(f"Unsupported PNM format {magic!r}")
+    maxval = int(tokens[3]) if magic != b"P4" else 1
+    if maxval > 255:
+        raise ValueError("16-bit scans cannot be streamed, scan at depth 8")
+    return magic, int(tokens[1]), int(tokens[2]), maxval
+
+
+async def scanimage_bands(
+    command: str,
+    device: str,
+    resolution: int,
+    color_mode: str,
+    band_lines: int
+) -> AsyncIterator[ScanBand]:
+    """
+    Read a page from ``scanimage --format=pnm`` in bands of ``band_lines``
+    rows while the device is still scanning. scanimage writes each block it
+    gets from sane_read straight to its output, so the first band is ready
+    after its rows have passed the sensor rather than after the whole page.
+    """
+    process = await asyncio.create_subprocess_exec(
+        command,
+        "--device-name", device,
+        "--mode", SCANIMAGE_MODES.get(color_mode, color_mode),
+        "--resolution", str(resolution),
+        "--format=pnm",
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        try:
+            magic, width, height, _ = await _read_pnm_header(process.stdout)
+        except asyncio.IncompleteReadError:
+            await process.wait()
+            error = (await process.stderr.read()).decode(errors="replace").strip()
+            raise RuntimeError(f"scanimage failed: {error or f'exit status {process.returncode}'}")
+
+        mode, raw_mode = _PNM_MODES[magic]
+        bytes_per_line = (width + 7) // 8 if mode == "1" else width * len(mode)
+        logger.info(f"Streaming {width}x{height} {mode} scan from {device} in bands of {band_lines} lines")
+        for top in range(0, height, band_lines):
+            rows = min(band_lines, height - top)
+            data = await process.stdout.readexactly(rows * bytes_per_line)
+            yield ScanBand(top, Image.frombytes(mode, (width, rows), data, "raw", raw_mode), height)
+
+        if await process.wait() != 0:
+            error = (await process.stderr.read()).decode(errors="replace").strip()
+            raise RuntimeError(f"scanimage failed: {error}")
+    finally:
+        # Also reached when the consumer stops early, e.g. the client disconnected
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+
+class BandPreprocessor:
+    """
+    Prepares the OCR input while the page is still being scanned: every band
+    is converted to grayscale and box-downscaled to about ``target_dpi`` as it
+    arrives. Both steps only look at the rows of the band, so the OCR image is
+    complete as soon as the last band is in.
+    """
+
+    def __init__(self, resolution: int, target_dpi: Optional[int] = None):
+        self.factor = max(1, round(resolution / (target_dpi or settings.SCAN_OCR_TARGET_DPI)))
+        self.dpi = resolution // self.factor
+        self.page: Optional[Image.Image] = None
+        # Rows held back until a whole block of ``factor`` rows is available
+        self._pending: Optional[ScanBand] = None
+
+    def add(self, band: ScanBand):
+        gray = band.image.convert("L")
+        top = band.top
+        if self.page is None:
+            self.page = Image.new(
+                "L", (-(-gray.width // self.factor), -(-band.page_height // self.factor)), 255
+            )
+        if self._pending is not None:
+            joined = Image.new("L", (gray.width, self._pending.image.height + gray.height))
+            joined.paste(self._pending.image, (0, 0))
+            joined.paste(gray, (0, self._pending.image.height))
+            top, gray = self._pending.top, joined
+            self._pending = None
+
+        usable = gray.height
+        if top + gray.height < band.page_height:
+            usable -= gray.height % self.factor
+            if usable < gray.height:
+                self._pending = ScanBand(top + usable, gray.crop((0, usable, gray.width, gray.height)), band.page_height)
+        if usable:
+            block = gray.crop((0, 0, gray.width, usable)) if usable < gray.height else gray
+            self.page.paste(block.reduce(self.factor) if self.factor > 1 else block, (0, top // self.factor))
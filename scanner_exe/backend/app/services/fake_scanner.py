@@ -0,0 +1,83 @@
+import asyncio
+import random
+from typing import AsyncIterator, List, Optional
+from PIL import Image, ImageDraw
+from app.core.config import settings
+from app.services.acquisition import ScanBand
+from app.services.scanner import ScannerInterface
+from app.types.scanner import Scanner
+
+_MODES = {"color": "RGB", "grayscale": "L", "black_and_white": "1"}
+
+
+class FakeScanner(ScannerInterface):
+    """
+    Synthetic scanner for development and benchmarks (SCANNER_BACKEND="fake").
+    Renders an A4 page of text-like lines and delivers it band by band at
+    FAKE_SCANNER_LINES_PER_SECOND, like a sheet moving past the sensor. Its
+    feeder holds FAKE_FEEDER_PAGES different pages.
+    """
+
+    async def get_scanners(self) -> List[Scanner]:
+        return [Scanner(id="fake:0", name="Synthetic scanner", manufacturer="Fake", model="Bands", type="virtual")]
+
+    @staticmethod
+    def _render_rows(top: int, rows: int, width: int, resolution: int, mode: str, page: int = 0) -> Image.Image:
+        band = Image.new(mode, (width, rows), "white")
+        draw = ImageDraw.Draw(band)
+        margin = resolution
+        line_pitch = max(4, resolution // 6)
+        first = max(0, (top - margin) // line_pitch)
+        last = (top + rows - margin) // line_pitch + 1
+        for line in range(first, last + 1):
+            y = margin + line * line_pitch
+            if y + line_pitch // 2 < top or y >= top + rows:
+                continue
+            # Same words for a line whichever band it falls in
+            words = random.Random(page * 100003 + line)
+            x = margin
+            while x < width - margin:
+                word = words.randint(resolution // 6, resolution // 2)
+                draw.rectangle([x, y - top, min(x + word, width - margin), y - top + line_pitch // 2 - 1], fill="black")
+                x += word + resolution // 12
+        return band
+
+    async def _sheet_bands(self, resolution: int, color_mode: str, band_lines: int, page: int) -> AsyncIterator[ScanBand]:
+        width, height = int(8.27 * resolution), int(11.69 * resolution)
+        mode = _MODES.get(color_mode, "RGB")
+        for top in range(0, height, band_lines):
+            rows = min(band_lines, height - top)
+            await asyncio.sleep(rows / settings.FAKE_SCANNER_LINES_PER_SECOND)
+            yield ScanBand(top, self._render_rows(top, rows, width, resolution, mode, page), height)
+
+    async def _sheet(self, resolution: int, color_mode: str, page: int) -> Image.Image:
+        image = None
+        async for band in self._sheet_bands(resolution, color_mode, settings.SCAN_BAND_LINES, page):
+            if image is None:
+                image = Image.new(band.image.mode, (band.image.width, band.page_height), "white")
+            image.paste(band.image, (0, band.top))
+        return image
+
+    async def scan_bands(
+        self,
+        scanner_id: str,
+        resolution: int,
+        color_mode: str,
+        band_lines: Optional[int] = None
+    ) -> AsyncIterator[ScanBand]:
+        async for band in self._sheet_bands(resolution, color_mode, band_lines or settings.SCAN_BAND_LINES, 0):
+            yield band
+
+    async def scan(self, scanner_id: str, resolution: int, color_mode: str) -> Optional[Image.Image]:
+        return await self._sheet(resolution, color_mode, 0)
+
+    async def scan_pages(
+        self,
+        scanner_id: str,
+        resolution: int,
+        color_mode: str,
+        max_pages: Optional[int] = None
+    ) -> AsyncIterator[Image.Image]:
+        sheets = settings.FAKE_FEEDER_PAGES if max_pages is None else min(max_pages, settings.FAKE_FEEDER_PAGES)
+        for page in range(sheets):
+            yield await self._sheet(resolution, color_mode, page)
@@ -0,0 +1,53 @@
+import json
+import logging
+import urllib.error
+import urllib.request
+import uuid
+from typing import Any, Dict, Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Scan encodings the OCR backend accepts as uploads
+OCR_UPLOAD_ENCODINGS = {"png", "jpeg"}
+
+
+def extract_text(data: bytes, filename: str, mime_type: str, model: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Upload an encoded page to the OCR backend's extract-text endpoint.
+    Blocking; run it on a worker thread.
+    Args:
+        data (bytes): The encoded image.
+        filename (str): File name sent with the upload.
+        mime_type (str): MIME type of ``data``.
+        model (str): OCR model; defaults to settings.OCR_MODEL.
+    Returns:
+        The OCR response: text, confidence and processing_time.
+    """
+    boundary = uuid.uuid4().hex
+    body = b"".join([
+        f'--{boundary}\r\nContent-Disposition: form-data; name="model"\r\n\r\n'.encode(),
+        (model or settings.OCR_MODEL).encode(),
+        f'\r\n--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'.encode(),
+        f"Content-Type: {mime_type}\r\n\r\n".encode(),
+        data,
+        f"\r\n--{boundary}--\r\n".encode(),
+    ])
+    request = urllib.request.Request(
+        settings.OCR_BACKEND_URL,
+        data=body,
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+        method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=settings.OCR_UPLOAD_TIMEOUT) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        detail = e.read().decode(errors="replace")
+        try:
+            detail = json.loads(detail).get("detail", detail)
+        except ValueError:
+            pass
+        raise RuntimeError(f"OCR backend returned {e.code}: {detail}")
+    except urllib.error.URLError as e:
+        raise RuntimeError(f"OCR backend at {settings.OCR_BACKEND_URL} is not reachable: {e.reason}")
@@ -0,0 +1,286 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+
+from PIL import Image
+# The OCR backend (backend/app/services/sane_devices.py) links to this file,
+# so it may only use the settings both app packages define
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class DeviceNotFound(Exception):
+    """The requested scanner is not in the SANE device list"""
+
+
+class _DeviceHandle:
+    """An opened SANE device and the lock that serializes its users"""
+
+    def __init__(self):
+        self.device: Any = None
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+class SaneDeviceManager:
+    """
+    Long-lived SANE session shared by all requests.
+
+    SANE is initialized once. The device list is cached and refreshed in the
+    background every ``list_ttl`` seconds, so listing scanners never waits for
+    USB or network discovery once the first enumeration is done. Opened device
+    handles are kept for the next request and closed after ``idle_timeout``
+    seconds without use; a per-device lock lets only one request use a device
+    at a time. Blocking SANE calls run on a small thread pool.
+    """
+
+    OPERATIONS = ("list", "enumerate", "open", "scan")
+
+    def __init__(
+        self,
+        list_ttl: float = 60.0,
+        idle_timeout: float = 120.0,
+        max_workers: int = 4,
+        stats_window: int = 256
+    ):
+        """
+        Args:
+            list_ttl (float): Seconds between background refreshes of the device list.
+            idle_timeout (float): Seconds an unused device stays open; 0 closes it after every use.
+            max_workers (int): Threads for blocking SANE calls.
+            stats_window (int): Number of recent latencies kept per operation for percentiles.
+        """
+        self.list_ttl = list_ttl
+        self.idle_timeout = idle_timeout
+        self.max_workers = max_workers
+
+        self._devices: Optional[List[Tuple[str, ...]]] = None
+        self._listed_at = 0.0
+        self._refreshing: Optional[asyncio.Future] = None
+        self._handles: Dict[str, _DeviceHandle] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._maintainer: Optional[asyncio.Task] = None
+        self._latencies: Dict[str, Deque[float]] = {op: deque(maxlen=stats_window) for op in self.OPERATIONS}
+        self._calls: Dict[str, int] = {op: 0 for op in self.OPERATIONS}
+        self._list_cache_hits = 0
+        self._closes = 0
+        self._errors = 0
+
+    @classmethod
+    def from_settings(cls) -> "SaneDeviceManager":
+        return cls(
+            list_ttl=settings.SANE_DEVICE_LIST_TTL,
+            idle_timeout=settings.SANE_IDLE_TIMEOUT,
+            max_workers=settings.SANE_WORKERS
+        )
+
+    async def call(self, function: Callable, *args) -> Any:
+        """Run a blocking SANE call on the manager's threads"""
+        if self._pool is None:
+            raise RuntimeError("SANE device manager is not started")
+        return await asyncio.get_running_loop().run_in_executor(self._pool, function, *args)
+
+    def _record(self, operation: str, start: float):
+        self._calls[operation] += 1
+        self._latencies[operation].append(time.perf_counter() - start)
+
+    async def start(self):
+        """Initialize SANE and start enumerating devices in the background"""
+        if self._pool is not None:
+            return
+        import sane
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sane")
+        await self.call(sane.init)
+        self._maintainer = asyncio.create_task(self._maintain())
+
+    async def close(self):
+        """Close every device, waiting for requests still using one, and exit SANE"""
+        if self._pool is None:
+            return
+        if self._maintainer is not None:
+            self._maintainer.cancel()
+            self._maintainer = None
+        for handle in list(self._handles.values()):
+            async with handle.lock:
+                await self._close_handle(handle)
+        import sane
+        try:
+            await self.call(sane.exit)
+        finally:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+            self._devices = None
+
+    async def _maintain(self):
+        tick = max(1.0, min(self.list_ttl, self.idle_timeout) / 2)
+        while True:
+            if self._devices is None or time.monotonic() - self._listed_at >= self.list_ttl:
+                try:
+                    await self._refresh()
+                except Exception as e:
+                    logger.error(f"Refreshing the SANE device list failed: {str(e)}")
+            await self._close_idle()
+            await asyncio.sleep(tick)
+
+    async def _enumerate(self) -> List[Tuple[str, ...]]:
+        import sane
+        start = time.perf_counter()
+        try:
+            devices = await self.call(sane.get_devices)
+        except Exception:
+            self._errors += 1
+            raise
+        self._record("enumerate", start)
+        self._devices = devices
+        self._listed_at = time.monotonic()
+        return devices
+
+    async def _refresh(self) -> List[Tuple[str, ...]]:
+        # Concurrent callers share one enumeration
+        if self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self._enumerate())
+            self._refreshing.add_done_callback(lambda _: setattr(self, "_refreshing", None))
+        return await asyncio.shield(self._refreshing)
+
+    async def list_devices(self, refresh: bool = False) -> List[Tuple[str, ...]]:
+        """
+        SANE devices as (name, vendor, model, type) tuples.
+        Args:
+            refresh (bool): Enumerate now instead of returning the cached list.
+        """
+        start = time.perf_counter()
+        if refresh or self._devices is None:
+            devices = await self._refresh()
+        else:
+            self._list_cache_hits += 1
+            devices = self._devices
+        self._record("list", start)
+        return devices
+
+    async def _require_device(self, device_id: str):
+        devices = await self.list_devices()
+        if not any(device[0] == device_id for device in devices):
+            # It may have been plugged in since the last refresh
+            devices = await self.list_devices(refresh=True)
+            if not any(device[0] == device_id for device in devices):
+                raise DeviceNotFound(
+                    f"Scanner {device_id} not found. Available devices: {[device[0] for device in devices]}"
+                )
+
+    async def _close_handle(self, handle: _DeviceHandle):
+        if handle.device is None:
+            return
+        device, handle.device = handle.device, None
+        self._closes += 1
+        try:
+            await self.call(device.close)
+        except Exception as e:
+            logger.error(f"Closing SANE device failed: {str(e)}")
+
+    async def _close_idle(self):
+        now = time.monotonic()
+        for device_id, handle in list(self._handles.items()):
+            if handle.device is None or handle.lock.locked() or now - handle.last_used < self.idle_timeout:
+                continue
+            async with handle.lock:
+                if handle.device is not None and time.monotonic() - handle.last_used >= self.idle_timeout:
+                    logger.info(f"Closing idle scanner {device_id}")
+                    await self._close_handle(handle)
+
+    @asynccontextmanager
+    async def device(self, device_id: str) -> AsyncIterator[Any]:
+        """
+        Exclusive use of an opened device, which stays open for the next request.
+        A device that raised is closed, so the next request reopens it.
+        Raises:
+            DeviceNotFound: If the device is not in the device list.
+        """
+        import sane
+        handle = self._handles.setdefault(device_id, _DeviceHandle())
+        async with handle.lock:
+            if handle.device is None:
+                await self._require_device(device_id)
+                start = time.perf_counter()
+                try:
+                    handle.device = await self.call(sane.open, device_id)
+                except Exception:
+                    self._errors += 1
+                    raise
+                self._record("open", start)
+            try:
+                yield handle.device
+            except Exception:
+                self._errors += 1
+                await self._close_handle(handle)
+                raise
+            finally:
+                handle.last_used = time.monotonic()
+                if self.idle_timeout <= 0:
+                    await self._close_handle(handle)
+
+    @asynccontextmanager
+    async def exclusive(self, device_id: str) -> AsyncIterator[None]:
+        """
+        Exclusive use of a device with its pooled handle closed, so another
+        program such as scanimage can open it.
+        """
+        handle = self._handles.setdefault(device_id, _DeviceHandle())
+        async with handle.lock:
+            await self._close_handle(handle)
+            try:
+                yield
+            finally:
+                handle.last_used = time.monotonic()
+
+    async def scan(self, device_id: str, resolution: int = 300, mode: str = "color") -> Image.Image:
+        """
+        Scan a page with a pooled device.
+        Args:
+            device_id (str): SANE device name.
+            resolution (int): Resolution in DPI.
+            mode (str): SANE scan mode.
+        """
+        async with self.device(device_id) as device:
+            def run() -> Image.Image:
+                device.mode = mode
+                device.resolution = resolution
+                return device.scan()
+
+            start = time.perf_counter()
+            image = await self.call(run)
+            self._record("scan", start)
+            return image
+
+    def stats(self) -> Dict[str, Any]:
+        """Device cache state, open devices and call latencies (in milliseconds)"""
+        latency = {}
+        for operation, values in self._latencies.items():
+            values = list(values)
+            latency[operation] = {
+                "calls": self._calls[operation],
+                "mean": 1000.0 * sum(values) / len(values) if values else 0.0,
+                "p50": 1000.0 * _percentile(values, 0.50),
+                "p95": 1000.0 * _percentile(values, 0.95),
+                "max": 1000.0 * max(values) if values else 0.0,
+            }
+        return {
+            "devices": len(self._devices) if self._devices is not None else None,
+            "list_age_s": time.monotonic() - self._listed_at if self._devices is not None else None,
+            "list_cache_hits": self._list_cache_hits,
+            "open_devices": [device_id for device_id, handle in self._handles.items() if handle.device is not None],
+            "closes": self._closes,
+            "errors": self._errors,
+            "latency_ms": latency,
+        }
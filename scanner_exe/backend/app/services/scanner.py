@@ -1,9 +1,15 @@
 import io
 import platform
 import logging
-from typing import List, Optional
+import asyncio
+import shutil
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from PIL import Image
-from fastapi import HTTPException
+from app.core.config import settings
+from app.services.acquisition import SCANIMAGE_MODES, BandPreprocessor, ScanBand, scanimage_bands, split_bands
+from app.services.ocr_client import OCR_UPLOAD_ENCODINGS, extract_text
+from app.services.sane_devices import DeviceNotFound, SaneDeviceManager
 from app.types.scanner import Scanner, ListScannersResponse, ScanRequest, ScanResponse
 import base64
 
@@ -12,21 +18,72 @@ logger = logging.getLogger(__name__)
 
 class ScannerInterface:
     """Abstract base class defining scanner interface"""
-    def get_scanners(self) -> List[Scanner]:
+    async def get_scanners(self) -> List[Scanner]:
         raise NotImplementedError
 
     async def scan(self, scanner_id: str, resolution: int, color_mode: str) -> Optional[Image.Image]:
         raise NotImplementedError
 
+    async def close(self):
+        """Release the devices the driver holds"""
+
+    def stats(self) -> Dict[str, Any]:
+        """Driver statistics such as device call latencies"""
+        return {}
+
+    async def scan_bands(
+        self,
+        scanner_id: str,
+        resolution: int,
+        color_mode: str,
+        band_lines: Optional[int] = None
+    ) -> AsyncIterator[ScanBand]:
+        """
+        The page in bands of ``band_lines`` rows, as they are read. Drivers that
+        only hand over whole pages yield all bands once the scan is done.
+        """
+        image = await self.scan(scanner_id, resolution, color_mode)
+        if image is None:
+            raise RuntimeError("Failed to acquire image from scanner")
+        async for band in split_bands(image, band_lines or settings.SCAN_BAND_LINES):
+            yield band
+
+    async def scan_pages(
+        self,
+        scanner_id: str,
+        resolution: int,
+        color_mode: str,
+        max_pages: Optional[int] = None
+    ) -> AsyncIterator[Image.Image]:
+        """
+        Pages from the document feeder, read in one device session until the
+        feeder is empty or ``max_pages`` pages were scanned. The next page is
+        only scanned when it is asked for. Drivers without feeder support scan
+        a single page.
+        """
+        image = await self.scan(scanner_id, resolution, color_mode)
+        if image is None:
+            raise RuntimeError("Failed to acquire image from scanner")
+        yield image
+
 class SaneScanner(ScannerInterface):
     """SANE scanner implementation for Linux"""
-    def get_scanners(self) -> List[Scanner]:
+    def __init__(self):
+        # One SANE session for the service: a cached device list and pooled device handles
+        self.devices = SaneDeviceManager.from_settings()
+
+    async def close(self):
+        await self.devices.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return self.devices.stats()
+
+    async def get_scanners(self) -> List[Scanner]:
         try:
-            import sane
-            sane.init()
-            devices = sane.get_devices()
+            await self.devices.start()
+            devices = await self.devices.list_devices()
 
-            scanners = [
+            return [
                 Scanner(
                     id=device[0] if len(device) > 0 else "Unknown",
                     name=device[1] if len(device) > 1 else "Unknown",
@@ -36,53 +93,90 @@ class SaneScanner(ScannerInterface):
                 )
                 for device in devices
             ]
-            sane.exit()
-            return scanners
         except Exception as e:
             logger.error(f"Error getting SANE scanners: {str(e)}")
             return []
 
     async def scan(self, scanner_id: str, resolution: int, color_mode: str) -> Optional[Image.Image]:
         try:
-            import sane
-            sane.init()
-            devices = sane.get_devices()
-
-            if not any(device[0] == scanner_id for device in devices):
-                logger.error(f"Scanner {scanner_id} not found. Available devices: {[device[0] for device in devices]}")
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"Scanner {scanner_id} not found. Available devices: {[device[0] for device in devices]}"
-                )
-
-            logger.info(f"Opening scanner {scanner_id}...")
-            scanner = sane.open(scanner_id)
-
-            logger.info("Setting scanner parameters...")
-            scanner.mode = color_mode
-            scanner.resolution = resolution
-
+            await self.devices.start()
             logger.info(f"Starting scan with scanner {scanner_id}...")
-            try:
-                image = scanner.scan()
-                logger.info("Scan completed successfully")
-                return image
-            except Exception as scan_error:
-                logger.error(f"Error during scanning: {str(scan_error)}")
-                sane.exit()
-                return None
-
+            image = await self.devices.scan(scanner_id, resolution, SCANIMAGE_MODES.get(color_mode, color_mode))
+            logger.info("Scan completed successfully")
+            return image
+        except DeviceNotFound as e:
+            logger.error(str(e))
+            return None
         except Exception as e:
             logger.error(f"Error scanning with SANE: {str(e)}")
-            try:
-                sane.exit()
-            except:
-                pass
             return None
 
+    async def scan_bands(
+        self,
+        scanner_id: str,
+        resolution: int,
+        color_mode: str,
+        band_lines: Optional[int] = None
+    ) -> AsyncIterator[ScanBand]:
+        # python-sane only reads whole pages; scanimage streams the rows it reads
+        command = shutil.which(settings.SCANIMAGE_COMMAND)
+        if command is None:
+            logger.info("scanimage not found, bands are sent after the whole page is scanned")
+            async for band in super().scan_bands(scanner_id, resolution, color_mode, band_lines):
+                yield band
+            return
+        # scanimage opens the device itself, so the pooled handle is closed meanwhile
+        async with self.devices.exclusive(scanner_id):
+            async for band in scanimage_bands(
+                command, scanner_id, resolution, color_mode, band_lines or settings.SCAN_BAND_LINES
+            ):
+                yield band
+
+    @staticmethod
+    def _select_feeder(device, resolution: int, color_mode: str) -> Optional[str]:
+        """Set up an opened device for batch scanning and return its previous source"""
+        device.mode = SCANIMAGE_MODES.get(color_mode, color_mode)
+        device.resolution = resolution
+        source = device.opt.get("source")
+        if source is None or not source.constraint:
+            return None
+        previous = device.source
+        feeders = [name for name in source.constraint if "adf" in name.lower() or "feeder" in name.lower()]
+        if feeders:
+            device.source = feeders[0]
+        return previous
+
+    async def scan_pages(
+        self,
+        scanner_id: str,
+        resolution: int,
+        color_mode: str,
+        max_pages: Optional[int] = None
+    ) -> AsyncIterator[Image.Image]:
+        await self.devices.start()
+        # The device stays locked for the whole batch
+        async with self.devices.device(scanner_id) as device:
+            previous_source = await self.devices.call(self._select_feeder, device, resolution, color_mode)
+            logger.info(f"Batch scanning with {scanner_id}, source {getattr(device, 'source', 'default')}")
+            try:
+                # Starts the next sheet on each step and stops when the feeder is empty
+                pages = device.multi_scan()
+                count = 0
+                while max_pages is None or count < max_pages:
+                    image = await self.devices.call(next, pages, None)
+                    if image is None:
+                        break
+                    count += 1
+                    yield image
+            finally:
+                # Also reached when the batch is cancelled with a sheet still in the feeder
+                await self.devices.call(device.cancel)
+                if previous_source is not None:
+                    await self.devices.call(setattr, device, "source", previous_source)
+
 class TwainScanner(ScannerInterface):
     """TWAIN scanner implementation for Windows"""
-    def get_scanners(self) -> List[Scanner]:
+    async def get_scanners(self) -> List[Scanner]:
         try:
             import twain
             source_manager = twain.SourceManager()
@@ -135,20 +229,66 @@ class ScannerFactory:
     """Factory for creating appropriate scanner implementation"""
     @staticmethod
     def create_scanner() -> ScannerInterface:
+        backend = settings.SCANNER_BACKEND.lower()
+        if backend == "fake":
+            from app.services.fake_scanner import FakeScanner
+            return FakeScanner()
+        if backend == "twain":
+            return TwainScanner()
+        if backend == "sane":
+            return SaneScanner()
         system = platform.system().lower()
         if system == "windows":
             return TwainScanner()
         return SaneScanner()
 
+ENCODINGS = {"png": "image/png", "webp": "image/webp", "jpeg": "image/jpeg"}
+
+
+_BATCH_DONE = object()
+
+
 class ImageConverter:
     """Handles image format conversions"""
+    @staticmethod
+    def encode(image: Image.Image, encoding: str = "png", quality: Optional[int] = None) -> bytes:
+        """
+        Encode a scan for the wire.
+        Args:
+            image: The scanned image.
+            encoding (str): "png", "webp" (lossless) or "jpeg".
+            quality (int): JPEG quality; defaults to settings.SCAN_JPEG_QUALITY.
+        """
+        buffer = io.BytesIO()
+        if encoding == "png":
+            image.save(buffer, format="PNG", compress_level=settings.SCAN_PNG_COMPRESS_LEVEL)
+        elif encoding == "webp":
+            image.save(buffer, format="WEBP", lossless=True)
+        elif encoding == "jpeg":
+            # JPEG has no 1-bit or palette modes
+            if image.mode not in ("RGB", "L", "CMYK"):
+                image = image.convert("RGB" if image.mode in ("P", "RGBA") else "L")
+            image.save(buffer, format="JPEG", quality=quality or settings.SCAN_JPEG_QUALITY)
+        else:
+            raise ValueError(f"Unknown image encoding {encoding!r}, use one of {list(ENCODINGS)}")
+        return buffer.getvalue()
+
+    @staticmethod
+    def preview(image: Image.Image, max_side: int, quality: Optional[int] = None) -> Tuple[bytes, Tuple[int, int]]:
+        """A downscaled JPEG of the scan and its size"""
+        preview = image.convert("RGB" if image.mode in ("RGB", "RGBA", "P", "CMYK") else "L")
+        preview.thumbnail((max_side, max_side), Image.BILINEAR)
+        buffer = io.BytesIO()
+        preview.save(buffer, format="JPEG", quality=quality or settings.SCAN_PREVIEW_QUALITY)
+        return buffer.getvalue(), preview.size
+
     @staticmethod
     def to_base64(image: Image.Image) -> str:
         img_byte_arr = io.BytesIO()
         image.save(img_byte_arr, format='PNG')
         img_byte_arr = img_byte_arr.getvalue()
         img_base64 = base64.b64encode(img_byte_arr).decode()
-        logger.info(f"Image base64: {img_base64}")
+        logger.info(f"Encoded image: {len(img_byte_arr)} bytes PNG, {len(img_base64)} bytes base64")
         return img_base64
 
 class ScannerService:
@@ -157,9 +297,12 @@ class ScannerService:
         self.scanner = ScannerFactory.create_scanner()
         self.image_converter = ImageConverter()
 
+    async def close(self):
+        await self.scanner.close()
+
     async def handle_list_scanners_request(self) -> ListScannersResponse:
         try:
-            scanners = self.scanner.get_scanners()
+            scanners = await self.scanner.get_scanners()
             return ListScannersResponse(scanners=scanners)
         except Exception as e:
             logger.error(f"Error listing scanners: {str(e)}")
@@ -196,3 +339,375 @@ class ScannerService:
                 success=False,
                 message=f"Scan failed: {str(e)}"
             )
+
+    async def _acquire_bands(self, scanner_id: str, resolution: int, color_mode: str, queue: asyncio.Queue):
+        """Read bands into a queue, so sending them to the client never holds up the scanner"""
+        try:
+            async for band in self.scanner.scan_bands(scanner_id, resolution, color_mode, settings.SCAN_BAND_LINES):
+                queue.put_nowait(band)
+            queue.put_nowait(None)
+        except Exception as e:
+            queue.put_nowait(e)
+
+    async def stream_scan(
+        self,
+        scanner_id: str,
+        resolution: int,
+        color_mode: str,
+        encoding: Optional[str] = None,
+        quality: Optional[int] = None,
+        previews: bool = True,
+        stream: bool = False,
+        ocr_preprocess: bool = False
+    ) -> AsyncIterator[Tuple[Dict[str, Any], Optional[bytes]]]:
+        """
+        Scan and yield the messages of the binary transport as (message, payload)
+        pairs: an "image" header with its encoded bytes for each preview and for
+        the full image, then the final "scan" result without payload.
+        Encoding runs on a worker thread so other connections are not blocked.
+
+        With ``stream`` the page is read in bands of SCAN_BAND_LINES rows and each
+        band is sent as a JPEG "band" message as soon as it is read, instead of
+        previews after the whole page. With ``ocr_preprocess`` a grayscale copy at
+        SCAN_OCR_TARGET_DPI is built band by band and sent as an "ocr" image.
+        """
+        encoding = (encoding or settings.SCAN_IMAGE_ENCODING).lower()
+        if encoding not in ENCODINGS:
+            yield {
+                "action": "scan",
+                "success": False,
+                "message": f"Unknown image encoding {encoding!r}, use one of {list(ENCODINGS)}"
+            }, None
+            return
+
+        logger.info(f"Starting {'streaming ' if stream else ''}scan request for scanner {scanner_id}")
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        first_pixel_ms = None
+        bands = 0
+        preprocessor = BandPreprocessor(resolution) if ocr_preprocess else None
+        image = None
+        try:
+            if stream:
+                queue: asyncio.Queue = asyncio.Queue()
+                reader = asyncio.ensure_future(self._acquire_bands(scanner_id, resolution, color_mode, queue))
+                try:
+                    while True:
+                        band = await queue.get()
+                        if band is None:
+                            break
+                        if isinstance(band, Exception):
+                            raise band
+                        if image is None:
+                            image = Image.new(band.image.mode, (band.image.width, band.page_height), "white")
+                        image.paste(band.image, (0, band.top))
+                        if preprocessor:
+                            await loop.run_in_executor(None, preprocessor.add, band)
+                        data = await loop.run_in_executor(
+                            None, self.image_converter.encode, band.image, "jpeg", settings.SCAN_BAND_QUALITY
+                        )
+                        if first_pixel_ms is None:
+                            first_pixel_ms = (time.perf_counter() - start) * 1000
+                        yield {
+                            "action": "band",
+                            "index": bands,
+                            "top": band.top,
+                            "width": band.image.width,
+                            "height": band.image.height,
+                            "page_height": band.page_height,
+                            "format": "jpeg",
+                            "mime_type": ENCODINGS["jpeg"],
+                        }, data
+                        bands += 1
+                finally:
+                    # Stops the scan if the client went away mid-page
+                    reader.cancel()
+            else:
+                image = await self.scanner.scan(scanner_id, resolution, color_mode)
+                if image and preprocessor:
+                    await loop.run_in_executor(None, preprocessor.add, ScanBand(0, image, image.height))
+        except Exception as e:
+            logger.error(f"Error during scanning: {str(e)}")
+            yield {"action": "scan", "success": False, "message": f"Scan failed: {str(e)}"}, None
+            return
+        acquire_ms = (time.perf_counter() - start) * 1000
+        if not image:
+            yield {
+                "action": "scan",
+                "success": False,
+                "message": "Failed to acquire image from scanner. Please check if the scanner is properly connected and try again."
+            }, None
+            return
+
+        try:
+            # Streamed bands already showed the page as it was scanned
+            if previews and not stream:
+                for max_side in settings.SCAN_PREVIEW_SIZES:
+                    if max_side >= max(image.size):
+                        break
+                    data, size = await loop.run_in_executor(None, self.image_converter.preview, image, max_side)
+                    if first_pixel_ms is None:
+                        first_pixel_ms = (time.perf_counter() - start) * 1000
+                    yield {
+                        "action": "image",
+                        "kind": "preview",
+                        "format": "jpeg",
+                        "mime_type": ENCODINGS["jpeg"],
+                        "width": size[0],
+                        "height": size[1],
+                    }, data
+
+            encode_start = time.perf_counter()
+            data = await loop.run_in_executor(None, self.image_converter.encode, image, encoding, quality)
+            encode_ms = (time.perf_counter() - encode_start) * 1000
+        except Exception as e:
+            logger.error(f"Error encoding scan: {str(e)}")
+            yield {"action": "scan", "success": False, "message": f"Scan failed: {str(e)}"}, None
+            return
+
+        logger.info(
+            f"Encoded {image.size[0]}x{image.size[1]} {image.mode} scan as {encoding}: "
+            f"{len(data)} bytes in {encode_ms:.0f} ms"
+        )
+        if first_pixel_ms is None:
+            first_pixel_ms = (time.perf_counter() - start) * 1000
+        header = {
+            "action": "image",
+            "kind": "full",
+            "format": encoding,
+            "mime_type": ENCODINGS[encoding],
+            "width": image.size[0],
+            "height": image.size[1],
+        }
+        yield header, data
+
+        if preprocessor:
+            ocr_data = await loop.run_in_executor(None, self.image_converter.encode, preprocessor.page, "png")
+            yield {
+                "action": "image",
+                "kind": "ocr",
+                "format": "png",
+                "mime_type": ENCODINGS["png"],
+                "width": preprocessor.page.width,
+                "height": preprocessor.page.height,
+                "dpi": preprocessor.dpi,
+            }, ocr_data
+
+        yield {
+            "action": "scan",
+            "success": True,
+            "message": "Scan completed successfully",
+            "format": encoding,
+            "size": len(data),
+            "encode_ms": round(encode_ms, 1),
+            "acquire_ms": round(acquire_ms, 1),
+            "time_to_first_pixel_ms": round(first_pixel_ms, 1),
+            "bands": bands,
+        }, None
+
+    async def _feed_pages(
+        self,
+        scanner_id: str,
+        resolution: int,
+        color_mode: str,
+        max_pages: int,
+        pages: asyncio.Queue,
+        events: asyncio.Queue,
+        stats: Dict[str, Any]
+    ):
+        """Acquisition stage: scan pages into ``pages``, waiting while it is full"""
+        feeder = self.scanner.scan_pages(scanner_id, resolution, color_mode, max_pages)
+        try:
+            start = time.perf_counter()
+            async for image in feeder:
+                stats["pages"] += 1
+                await events.put(({
+                    "action": "batch_progress",
+                    "page": stats["pages"],
+                    "stage": "acquired",
+                    "width": image.size[0],
+                    "height": image.size[1],
+                    "acquire_ms": round((time.perf_counter() - start) * 1000, 1),
+                }, None))
+                await pages.put((stats["pages"], image))
+                start = time.perf_counter()
+        except Exception as e:
+            logger.error(f"Batch scan stopped after {stats['pages']} pages: {str(e)}")
+            stats["error"] = str(e)
+        finally:
+            await feeder.aclose()
+        await pages.put(None)
+
+    async def _encode_pages(
+        self,
+        pages: asyncio.Queue,
+        uploads: Optional[asyncio.Queue],
+        events: asyncio.Queue,
+        encoding: str,
+        quality: Optional[int]
+    ):
+        """Encoding stage: send each page to the client and pass it on for OCR"""
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await pages.get()
+            if item is None:
+                break
+            number, image = item
+            try:
+                start = time.perf_counter()
+                data = await loop.run_in_executor(None, self.image_converter.encode, image, encoding, quality)
+                encode_ms = (time.perf_counter() - start) * 1000
+                upload_encoding, upload = encoding, data
+                if uploads is not None and encoding not in OCR_UPLOAD_ENCODINGS:
+                    upload_encoding = "png"
+                    upload = await loop.run_in_executor(None, self.image_converter.encode, image, "png")
+            except Exception as e:
+                logger.error(f"Error encoding page {number}: {str(e)}")
+                await events.put(({
+                    "action": "batch_progress", "page": number, "stage": "error", "message": f"Encoding failed: {str(e)}"
+                }, None))
+                continue
+            await events.put(({
+                "action": "batch_progress",
+                "page": number,
+                "stage": "encoded",
+                "size": len(data),
+                "encode_ms": round(encode_ms, 1),
+            }, None))
+            await events.put(({
+                "action": "image",
+                "kind": "page",
+                "page": number,
+                "format": encoding,
+                "mime_type": ENCODINGS[encoding],
+                "width": image.size[0],
+                "height": image.size[1],
+            }, data))
+            if uploads is not None:
+                await uploads.put((number, upload_encoding, upload))
+        if uploads is not None:
+            await uploads.put(None)
+
+    async def _upload_pages(
+        self,
+        uploads: asyncio.Queue,
+        events: asyncio.Queue,
+        model: Optional[str],
+        stats: Dict[str, Any]
+    ):
+        """OCR stage: upload each page to the OCR backend and send its text"""
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await uploads.get()
+            if item is None:
+                break
+            number, encoding, data = item
+            try:
+                start = time.perf_counter()
+                result = await loop.run_in_executor(
+                    None, extract_text, data, f"page-{number}.{encoding}", ENCODINGS[encoding], model
+                )
+            except Exception as e:
+                logger.error(f"OCR of page {number} failed: {str(e)}")
+                await events.put(({
+                    "action": "batch_progress", "page": number, "stage": "error", "message": f"OCR failed: {str(e)}"
+                }, None))
+                continue
+            stats["ocr_pages"] += 1
+            await events.put(({
+                "action": "batch_progress",
+                "page": number,
+                "stage": "ocr",
+                "text": result.get("text", ""),
+                "confidence": result.get("confidence"),
+                "ocr_ms": round((time.perf_counter() - start) * 1000, 1),
+            }, None))
+
+    async def scan_batch(
+        self,
+        scanner_id: str,
+        resolution: int,
+        color_mode: str,
+        encoding: Optional[str] = None,
+        quality: Optional[int] = None,
+        max_pages: Optional[int] = None,
+        ocr: bool = False,
+        ocr_model: Optional[str] = None
+    ) -> AsyncIterator[Tuple[Dict[str, Any], Optional[bytes]]]:
+        """
+        Scan every page in the document feeder in one device session and yield
+        the batch messages as (message, payload) pairs: "batch_progress" events
+        for each page and stage, an "image" of kind "page" with the encoded bytes
+        of each page, and a final "scan_batch" result.
+
+        Acquisition, encoding and the optional OCR upload run as concurrent
+        stages connected by queues of SCAN_BATCH_QUEUE_SIZE pages, so the next
+        page is scanned while the previous ones are encoded and recognised.
+        When a later stage or the client falls behind, the feeder waits instead
+        of piling up pages in memory: the messages waiting to be sent are
+        bounded by SCAN_BATCH_QUEUE_SIZE too.
+        """
+        encoding = (encoding or settings.SCAN_IMAGE_ENCODING).lower()
+        if encoding not in ENCODINGS:
+            yield {
+                "action": "scan_batch",
+                "success": False,
+                "message": f"Unknown image encoding {encoding!r}, use one of {list(ENCODINGS)}"
+            }, None
+            return
+        max_pages = min(max_pages or settings.SCAN_BATCH_MAX_PAGES, settings.SCAN_BATCH_MAX_PAGES)
+
+        logger.info(f"Starting batch scan of up to {max_pages} pages with scanner {scanner_id}")
+        start = time.perf_counter()
+        stats: Dict[str, Any] = {"pages": 0, "ocr_pages": 0, "error": None}
+        events: asyncio.Queue = asyncio.Queue(maxsize=settings.SCAN_BATCH_QUEUE_SIZE)
+        pages: asyncio.Queue = asyncio.Queue(maxsize=settings.SCAN_BATCH_QUEUE_SIZE)
+        uploads: Optional[asyncio.Queue] = asyncio.Queue(maxsize=settings.SCAN_BATCH_QUEUE_SIZE) if ocr else None
+        stages = [
+            self._feed_pages(scanner_id, resolution, color_mode, max_pages, pages, events, stats),
+            self._encode_pages(pages, uploads, events, encoding, quality),
+        ]
+        if uploads is not None:
+            stages.append(self._upload_pages(uploads, events, ocr_model, stats))
+        tasks = [asyncio.ensure_future(stage) for stage in stages]
+
+        async def run():
+            try:
+                await asyncio.gather(*tasks)
+            except Exception as e:
+                logger.error(f"Batch pipeline failed: {str(e)}")
+                stats["error"] = stats["error"] or str(e)
+            # Not in a finally: once the client is gone nobody makes room for it
+            await events.put(_BATCH_DONE)
+
+        pipeline = asyncio.ensure_future(run())
+        try:
+            while True:
+                event = await events.get()
+                if event is _BATCH_DONE:
+                    break
+                yield event
+        finally:
+            # Stops the feeder if the client went away mid-batch
+            for task in tasks + [pipeline]:
+                task.cancel()
+
+        total_ms = (time.perf_counter() - start) * 1000
+        count = stats["pages"]
+        if stats["error"]:
+            message = f"Batch stopped after {count} pages: {stats['error']}"
+        elif count == 0:
+            message = "No pages in the document feeder"
+        else:
+            message = f"Scanned {count} pages"
+        result = {
+            "action": "scan_batch",
+            "success": stats["error"] is None and count > 0,
+            "message": message,
+            "pages": count,
+            "total_ms": round(total_ms, 1),
+            "pages_per_minute": round(count * 60000 / total_ms, 1),
+        }
+        if ocr:
+            result["ocr_pages"] = stats["ocr_pages"]
+        yield result, None
@@ -0,0 +1,71 @@
+"""
+Acquisition benchmark: time to first pixel of a blocking scan against a
+streaming one.
+
+The fake scanner delivers an A4 page at --dpi at --lines-per-second, like a
+sheet moving past the sensor. A blocking scan sends previews once the whole
+page is in; a streaming scan sends each band of SCAN_BAND_LINES rows as soon
+as it is read. Both go through the real WebSocket code paths with a recording
+socket, optionally building the OCR input from the bands as they arrive.
+
+Usage (from the scanner_exe/backend directory):
+    python -m benchmarks.acquisition --dpi 300 --lines-per-second 1500
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Dict, List
+
+from app.app import send_image
+from app.core.config import settings
+from app.services.fake_scanner import FakeScanner
+from app.services.scanner import ScannerService
+from benchmarks.transport import RecordingWebSocket
+
+
+async def _scan(service: ScannerService, dpi: int, stream: bool, ocr_preprocess: bool) -> Dict[str, Any]:
+    socket = RecordingWebSocket()
+    result: Dict[str, Any] = {}
+    async for reply, payload in service.stream_scan(
+        "fake:0", dpi, "color", encoding="jpeg", stream=stream, ocr_preprocess=ocr_preprocess
+    ):
+        if payload is None:
+            await socket.send_json(reply)
+            result = reply
+        else:
+            await send_image(socket, reply, payload)
+    return {
+        "mode": ("streaming" if stream else "blocking") + (" + ocr preprocess" if ocr_preprocess else ""),
+        "time_to_first_pixel_ms": round(socket.first_image_ms, 1),
+        "acquire_ms": result.get("acquire_ms"),
+        "total_ms": round((time.perf_counter() - socket.start) * 1000, 1),
+        "bands": result.get("bands"),
+        "wire_bytes": socket.text_bytes + socket.binary_bytes,
+    }
+
+
+async def run(dpi: int, lines_per_second: float, band_lines: int) -> List[Dict[str, Any]]:
+    settings.FAKE_SCANNER_LINES_PER_SECOND = lines_per_second
+    settings.SCAN_BAND_LINES = band_lines
+    service = ScannerService()
+    service.scanner = FakeScanner()
+    return [
+        await _scan(service, dpi, stream=False, ocr_preprocess=False),
+        await _scan(service, dpi, stream=True, ocr_preprocess=False),
+        await _scan(service, dpi, stream=False, ocr_preprocess=True),
+        await _scan(service, dpi, stream=True, ocr_preprocess=True),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--lines-per-second", type=float, default=1500.0)
+    parser.add_argument("--band-lines", type=int, default=settings.SCAN_BAND_LINES)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.dpi, args.lines_per_second, args.band_lines)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
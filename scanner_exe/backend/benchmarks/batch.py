@@ -0,0 +1,115 @@
+"""
+ADF batch benchmark: pages per minute of the pipelined scan_batch against
+scanning, encoding and recognising one page after the other.
+
+The fake scanner's feeder holds --pages A4 pages at --dpi, scanned at
+--lines-per-second. OCR uploads go to a stub backend on a local port that
+answers after --ocr-ms, so the numbers only depend on how the stages overlap.
+Both runs go through the real WebSocket code paths with a recording socket.
+
+Usage (from the scanner_exe/backend directory):
+    python -m benchmarks.batch --pages 5 --dpi 200 --ocr-ms 800
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+from app.app import send_image
+from app.core.config import settings
+from app.services.fake_scanner import FakeScanner
+from app.services.ocr_client import extract_text
+from app.services.scanner import ENCODINGS, ScannerService
+from benchmarks.transport import RecordingWebSocket
+
+
+def stub_ocr_backend(delay_ms: float) -> ThreadingHTTPServer:
+    """An extract-text endpoint that reads the upload and answers after ``delay_ms``"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            time.sleep(delay_ms / 1000)
+            body = json.dumps({"text": "stub", "confidence": 1.0, "processing_time": delay_ms / 1000}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def _pipelined(service: ScannerService, dpi: int, encoding: str) -> Dict[str, Any]:
+    socket = RecordingWebSocket()
+    result: Dict[str, Any] = {}
+    async for reply, payload in service.scan_batch("fake:0", dpi, "color", encoding=encoding, ocr=True):
+        if payload is None:
+            await socket.send_json(reply)
+            result = reply
+        else:
+            await send_image(socket, reply, payload)
+    return {
+        "mode": "pipelined scan_batch",
+        "pages": result["pages"],
+        "ocr_pages": result["ocr_pages"],
+        "total_ms": result["total_ms"],
+        "pages_per_minute": result["pages_per_minute"],
+        "first_page_ms": round(socket.first_image_ms, 1),
+    }
+
+
+async def _sequential(service: ScannerService, dpi: int, encoding: str) -> Dict[str, Any]:
+    socket = RecordingWebSocket()
+    loop = asyncio.get_running_loop()
+    pages = 0
+    async for image in service.scanner.scan_pages("fake:0", dpi, "color"):
+        pages += 1
+        data = await loop.run_in_executor(None, service.image_converter.encode, image, encoding)
+        await send_image(socket, {"action": "image", "kind": "page", "page": pages}, data)
+        await loop.run_in_executor(None, extract_text, data, f"page-{pages}.{encoding}", ENCODINGS[encoding])
+    total_ms = (time.perf_counter() - socket.start) * 1000
+    return {
+        "mode": "sequential",
+        "pages": pages,
+        "ocr_pages": pages,
+        "total_ms": round(total_ms, 1),
+        "pages_per_minute": round(pages * 60000 / total_ms, 1),
+        "first_page_ms": round(socket.first_image_ms, 1),
+    }
+
+
+async def run(pages: int, dpi: int, lines_per_second: float, ocr_ms: float, encoding: str) -> List[Dict[str, Any]]:
+    server = stub_ocr_backend(ocr_ms)
+    settings.OCR_BACKEND_URL = f"http://127.0.0.1:{server.server_address[1]}/api/v1/ocr/extract-text"
+    settings.FAKE_FEEDER_PAGES = pages
+    settings.FAKE_SCANNER_LINES_PER_SECOND = lines_per_second
+    service = ScannerService()
+    service.scanner = FakeScanner()
+    try:
+        return [await _sequential(service, dpi, encoding), await _pipelined(service, dpi, encoding)]
+    finally:
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--dpi", type=int, default=200)
+    parser.add_argument("--lines-per-second", type=float, default=1500.0)
+    parser.add_argument("--ocr-ms", type=float, default=800.0)
+    parser.add_argument("--encoding", choices=list(ENCODINGS), default="png")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.pages, args.dpi, args.lines_per_second, args.ocr_ms, args.encoding)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+Load test of the scanner WebSocket: latency percentiles, time to the first
+image, throughput and memory of scans under closed- and open-loop load.
+
+Serves app.app:app with uvicorn on a thread of this process, on a local
+port, with the fake scanner (SCANNER_BACKEND="fake"), which delivers A4
+pages at --dpi at --lines-per-second. Clients connect to /ws/{client_id}
+with the websockets library and send --action "scan" (one page in the
+binary transport) or "scan_batch" (--pages pages from the feeder). With
+--ocr, batch pages are uploaded to a stub OCR backend on a local port that
+answers after a simulated model call of --prefill-ms plus --tokens decode
+steps of --decode-ms, or to --ocr-url, e.g. a backend started with
+`python -m benchmarks.load --serve 8000` from the backend directory.
+
+Load generators:
+- closed: --concurrency clients, each on its own connection, sending their
+  next scan once the previous one is done.
+- open: scans start at --rate per second with Poisson arrivals, each on a
+  new connection. Latency is counted from the scheduled start.
+
+Each run reports the mean, p50, p95, p99 and max latency of successful
+scans and of their first image (or band), the throughput, how many scans
+failed, the bytes received and the RSS of the process (server and load
+generator) before and at its peak. The report is written to --output as
+JSON with the git commit, so runs can be compared across commits.
+
+Usage (from the scanner_exe/backend directory):
+    python -m benchmarks.load --mode closed --concurrency 4 --requests 20
+    python -m benchmarks.load --action scan_batch --pages 3 --ocr --mode open --rate 0.5 --requests 6
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import socket
+import subprocess
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+import websockets
+
+from app.core.config import settings
+from app.services.scanner import ENCODINGS
+
+# Result of a scan: start, latency, time to the first image (seconds),
+# success (None on a connection error) and bytes received
+Sample = Dict[str, Any]
+
+
+def memory_mb() -> float:
+    """RSS of this process in MB, 0 where /proc is not available"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+class InProcessServer:
+    """app.app:app served by uvicorn on a thread of this process"""
+
+    def __init__(self, app: Any):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.bind(("127.0.0.1", 0))
+        self.port = self.socket.getsockname()[1]
+        self.server = uvicorn.Server(uvicorn.Config(app, lifespan="on", access_log=False, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, kwargs={"sockets": [self.socket]}, daemon=True)
+
+    def __enter__(self) -> "InProcessServer":
+        self.thread.start()
+        deadline = time.time() + 60
+        while not self.server.started:
+            if not self.thread.is_alive() or time.time() > deadline:
+                raise RuntimeError("Server did not start")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self.thread.join(timeout=30)
+        self.socket.close()
+
+
+async def _scan(connection: Any, message: str, action: str) -> Sample:
+    """Send one scan request and read its messages up to the final result"""
+    start = time.perf_counter()
+    first_image = None
+    received = 0
+    await connection.send(message)
+    while True:
+        frame = await connection.recv()
+        received += len(frame)
+        if isinstance(frame, bytes):
+            continue
+        reply = json.loads(frame)
+        if first_image is None and reply.get("action") in ("band", "image"):
+            first_image = time.perf_counter() - start
+        if reply.get("action") in (action, "error"):
+            return {
+                "start": start,
+                "latency": time.perf_counter() - start,
+                "first_image": first_image,
+                "success": bool(reply.get("success", False)),
+                "bytes": received,
+            }
+
+
+def _failed(start: float) -> Sample:
+    return {"start": start, "latency": time.perf_counter() - start, "first_image": None, "success": None, "bytes": 0}
+
+
+async def closed_loop(url: str, message: str, action: str, concurrency: int, requests: int) -> List[Sample]:
+    """``concurrency`` clients on their own connections, ``requests`` scans in all"""
+    samples: List[Sample] = []
+    remaining = requests
+
+    async def client():
+        nonlocal remaining
+        async with websockets.connect(f"{url}/{uuid.uuid4().hex}", max_size=None) as connection:
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                try:
+                    samples.append(await _scan(connection, message, action))
+                except (OSError, websockets.ConnectionClosed):
+                    samples.append(_failed(start))
+                    return
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return samples
+
+
+async def open_loop(url: str, message: str, action: str, rate: float, requests: int, seed: int = 0) -> List[Sample]:
+    """``requests`` scans started at ``rate`` per second on average, each on a new connection"""
+    arrivals = random.Random(seed)
+    samples: List[Sample] = []
+
+    async def timed(scheduled: float):
+        try:
+            async with websockets.connect(f"{url}/{uuid.uuid4().hex}", max_size=None) as connection:
+                sample = await _scan(connection, message, action)
+        except (OSError, websockets.ConnectionClosed):
+            samples.append(_failed(scheduled))
+            return
+        # From the scheduled start, including the connection setup
+        sample["latency"] += sample["start"] - scheduled
+        if sample["first_image"] is not None:
+            sample["first_image"] += sample["start"] - scheduled
+        sample["start"] = scheduled
+        samples.append(sample)
+
+    tasks = []
+    scheduled = time.perf_counter()
+    for _ in range(requests):
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(timed(scheduled)))
+        scheduled += arrivals.expovariate(rate)
+    await asyncio.gather(*tasks)
+    return samples
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _distribution(values: List[float]) -> Dict[str, float]:
+    return {
+        "mean": round(sum(values) / len(values), 1) if values else 0.0,
+        "p50": round(_percentile(values, 0.50), 1),
+        "p95": round(_percentile(values, 0.95), 1),
+        "p99": round(_percentile(values, 0.99), 1),
+        "max": round(max(values), 1) if values else 0.0,
+    }
+
+
+def summarize(samples: List[Sample]) -> Dict[str, Any]:
+    """Latency and time to the first image of the successful scans, throughput and failures of a run"""
+    done = [sample for sample in samples if sample["success"]]
+    first = min(sample["start"] for sample in samples)
+    last = max(sample["start"] + sample["latency"] for sample in samples)
+    return {
+        "requests": len(samples),
+        "succeeded": len(done),
+        "failed": sum(1 for sample in samples if sample["success"] is False),
+        "connection_errors": sum(1 for sample in samples if sample["success"] is None),
+        "seconds": round(last - first, 3),
+        "throughput_per_second": round(len(done) / (last - first), 3) if last > first else 0.0,
+        "received_mb": round(sum(sample["bytes"] for sample in samples) / 2**20, 1),
+        "latency_ms": _distribution([sample["latency"] * 1000.0 for sample in done]),
+        "first_image_ms": _distribution([
+            sample["first_image"] * 1000.0 for sample in done if sample["first_image"] is not None
+        ]),
+    }
+
+
+class MemorySampler:
+    """Peak RSS of this process, sampled on a thread while in use"""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.baseline_mb = memory_mb()
+        self.peak_mb = self.baseline_mb
+        self._running = False
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while self._running:
+            self.peak_mb = max(self.peak_mb, memory_mb())
+            time.sleep(self.interval)
+
+    def __enter__(self) -> "MemorySampler":
+        self._running = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._running = False
+        self._thread.join()
+
+    def report(self) -> Dict[str, float]:
+        return {"rss_mb_baseline": round(self.baseline_mb, 1), "rss_mb_peak": round(self.peak_mb, 1)}
+
+
+def _message(args: argparse.Namespace) -> str:
+    data = {"scanner_id": "fake:0", "resolution": args.dpi, "color_mode": args.color_mode, "encoding": args.encoding}
+    if args.action == "scan":
+        data.update({"previews": not args.no_previews, "stream": args.stream})
+    else:
+        data.update({"max_pages": args.pages, "ocr": args.ocr})
+    return json.dumps({"action": args.action, "data": data})
+
+
+async def _runs(port: int, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    url = f"ws://127.0.0.1:{port}/ws"
+    message = _message(args)
+    for _ in range(args.warmup):
+        await closed_loop(url, message, args.action, 1, 1)
+
+    runs = []
+    modes = ["closed", "open"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        with MemorySampler() as memory:
+            if mode == "closed":
+                samples = await closed_loop(url, message, args.action, args.concurrency, args.requests)
+                run = {"name": f"{args.action} closed c={args.concurrency}", "mode": mode, "concurrency": args.concurrency}
+            else:
+                samples = await open_loop(url, message, args.action, args.rate, args.requests, args.seed)
+                run = {"name": f"{args.action} open rate={args.rate:g}", "mode": mode, "rate": args.rate}
+        run.update(summarize(samples))
+        run.update(memory.report())
+        runs.append(run)
+    return runs
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    settings.SCANNER_BACKEND = "fake"
+    settings.FAKE_SCANNER_LINES_PER_SECOND = args.lines_per_second
+    settings.FAKE_FEEDER_PAGES = args.pages
+
+    # The scanner is created when the app is imported
+    from app.app import app
+    from benchmarks.batch import stub_ocr_backend
+
+    # The app logs every message at INFO
+    logging.getLogger().setLevel(logging.WARNING)
+
+    ocr_backend = None
+    if args.ocr:
+        if args.ocr_url:
+            settings.OCR_BACKEND_URL = args.ocr_url
+        else:
+            ocr_backend = stub_ocr_backend(args.prefill_ms + args.tokens * args.decode_ms)
+            settings.OCR_BACKEND_URL = f"http://127.0.0.1:{ocr_backend.server_address[1]}/api/v1/ocr/extract-text"
+    try:
+        with InProcessServer(app) as server:
+            runs = asyncio.run(_runs(server.port, args))
+    finally:
+        if ocr_backend is not None:
+            ocr_backend.shutdown()
+    return {
+        "benchmark": "scanner_load",
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "runs": runs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--action", choices=["scan", "scan_batch"], default="scan")
+    parser.add_argument("--mode", choices=["closed", "open", "both"], default="both")
+    parser.add_argument("--requests", type=int, default=20, help="Scans per run")
+    parser.add_argument("--concurrency", type=int, default=4, help="Clients of the closed loop")
+    parser.add_argument("--rate", type=float, default=2.0, help="Scans per second of the open loop")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--dpi", type=int, default=150)
+    parser.add_argument("--color-mode", choices=["color", "grayscale"], default="color")
+    parser.add_argument("--encoding", choices=list(ENCODINGS), default="jpeg")
+    parser.add_argument("--lines-per-second", type=float, default=20000.0)
+    parser.add_argument("--stream", action="store_true", help="Send the page in bands as it is read")
+    parser.add_argument("--no-previews", action="store_true")
+    parser.add_argument("--pages", type=int, default=3, help="Pages per scan_batch")
+    parser.add_argument("--ocr", action="store_true", help="Upload batch pages to the OCR backend")
+    parser.add_argument("--ocr-url", help="OCR backend extract-text URL instead of the stub backend")
+    parser.add_argument("--prefill-ms", type=float, default=50.0, help="Prefill time of the stub backend")
+    parser.add_argument("--decode-ms", type=float, default=5.0, help="Decode step time of the stub backend")
+    parser.add_argument("--tokens", type=int, default=64, help="Decode steps per page of the stub backend")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    args = parser.parse_args()
+
+    result = run(args)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Check and benchmark of the SANE device manager against a fake SANE module.
+
+A fake ``sane`` module (installed in sys.modules, so python-sane is not
+needed) enumerates devices in --enumerate-ms, opens one in --open-ms and
+scans a page in --scan-ms, and records how devices are used. Runs:
+
+- per_request: what every request did before the manager: init, enumerate,
+  open, scan, close and exit, one request after the other.
+- pooled: the same requests through SaneDeviceManager, which enumerates
+  once, keeps the device open and answers list calls from its cache.
+- concurrent: --concurrency scans of one device at once, which must take
+  turns on a single open handle.
+- recovery: a scan that raises closes the device and the next scan reopens
+  it; an unknown device is enumerated once more before DeviceNotFound; with
+  idle_timeout 0 the device is closed after every scan.
+
+Fails when one of these does not hold.
+
+The same module serves the OCR backend's /api/v1/scanner routes.
+
+Usage (from the scanner_exe/backend directory):
+    python -m benchmarks.sane_devices --requests 20 --enumerate-ms 500
+"""
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+import types
+from typing import Any, Dict, List
+
+from PIL import Image
+
+from app.services.sane_devices import DeviceNotFound, SaneDeviceManager, _percentile
+
+DEVICE = "fake:scanner"
+
+
+class FakeSane:
+    """Timings and counters of the fake ``sane`` module"""
+
+    def __init__(self, enumerate_ms: float, open_ms: float, scan_ms: float):
+        self.enumerate_ms = enumerate_ms
+        self.open_ms = open_ms
+        self.scan_ms = scan_ms
+        self.devices = [(DEVICE, "Fake", "Scanner", "flatbed scanner")]
+        self.counts = {"init": 0, "enumerate": 0, "open": 0, "close": 0, "scan": 0, "overlapping_scans": 0}
+        self.fail_next_scan = False
+        self._in_use = set()
+        self._lock = threading.Lock()
+
+    def module(self) -> types.ModuleType:
+        module = types.ModuleType("sane")
+        module.init = self.init
+        module.exit = lambda: None
+        module.get_devices = self.get_devices
+        module.open = self.open
+        return module
+
+    def init(self):
+        self.counts["init"] += 1
+
+    def get_devices(self) -> List[tuple]:
+        time.sleep(self.enumerate_ms / 1000.0)
+        self.counts["enumerate"] += 1
+        return list(self.devices)
+
+    def open(self, name: str) -> "FakeDevice":
+        time.sleep(self.open_ms / 1000.0)
+        self.counts["open"] += 1
+        return FakeDevice(self, name)
+
+    def _scan(self, name: str) -> Image.Image:
+        with self._lock:
+            if name in self._in_use:
+                self.counts["overlapping_scans"] += 1
+            self._in_use.add(name)
+        try:
+            time.sleep(self.scan_ms / 1000.0)
+            self.counts["scan"] += 1
+            if self.fail_next_scan:
+                self.fail_next_scan = False
+                raise RuntimeError("Device I/O error")
+            return Image.new("L", (85, 110), 255)
+        finally:
+            with self._lock:
+                self._in_use.discard(name)
+
+
+class FakeDevice:
+    def __init__(self, sane: FakeSane, name: str):
+        self.sane = sane
+        self.name = name
+        self.mode = None
+        self.resolution = None
+
+    def scan(self) -> Image.Image:
+        return self.sane._scan(self.name)
+
+    def close(self):
+        self.sane.counts["close"] += 1
+
+
+def _ms(values: List[float]) -> Dict[str, float]:
+    return {
+        "p50": round(1000.0 * _percentile(values, 0.50), 1),
+        "p95": round(1000.0 * _percentile(values, 0.95), 1),
+        "max": round(1000.0 * max(values), 1) if values else 0.0,
+    }
+
+
+def _per_request(fake: FakeSane, requests: int) -> Dict[str, Any]:
+    """The request path before the manager: a full SANE session per scan"""
+    sane = fake.module()
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        sane.init()
+        sane.get_devices()
+        device = sane.open(DEVICE)
+        device.mode, device.resolution = "color", 300
+        device.scan()
+        device.close()
+        sane.exit()
+        latencies.append(time.perf_counter() - start)
+    return {"scan_ms": _ms(latencies)}
+
+
+async def _pooled(requests: int) -> Dict[str, Any]:
+    manager = SaneDeviceManager(list_ttl=3600, idle_timeout=3600)
+    await manager.start()
+    try:
+        list_latencies, scan_latencies = [], []
+        for _ in range(requests):
+            start = time.perf_counter()
+            await manager.list_devices()
+            list_latencies.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            await manager.scan(DEVICE)
+            scan_latencies.append(time.perf_counter() - start)
+        return {"list_ms": _ms(list_latencies), "scan_ms": _ms(scan_latencies), "stats": manager.stats()}
+    finally:
+        await manager.close()
+
+
+async def _concurrent(fake: FakeSane, concurrency: int) -> Dict[str, Any]:
+    manager = SaneDeviceManager(list_ttl=3600, idle_timeout=3600)
+    await manager.start()
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*(manager.scan(DEVICE) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    finally:
+        await manager.close()
+    return {
+        "scans": concurrency,
+        "seconds": round(elapsed, 3),
+        "overlapping_scans": fake.counts["overlapping_scans"],
+        "opens": fake.counts["open"],
+    }
+
+
+async def _recovery(fake: FakeSane) -> Dict[str, Any]:
+    manager = SaneDeviceManager(list_ttl=3600, idle_timeout=3600)
+    await manager.start()
+    try:
+        await manager.scan(DEVICE)
+        fake.fail_next_scan = True
+        try:
+            await manager.scan(DEVICE)
+            failed = False
+        except RuntimeError:
+            failed = True
+        await manager.scan(DEVICE)
+        opens_after_failure = fake.counts["open"]
+
+        enumerations = fake.counts["enumerate"]
+        try:
+            await manager.scan("fake:missing")
+            not_found = False
+        except DeviceNotFound:
+            not_found = True
+        extra_enumerations = fake.counts["enumerate"] - enumerations
+
+        # A device plugged in after the last enumeration is found by the extra one
+        fake.devices.append(("fake:plugged-in", "Fake", "Scanner", "flatbed scanner"))
+        try:
+            await manager.scan("fake:plugged-in")
+            plugged_in = True
+        except DeviceNotFound:
+            plugged_in = False
+    finally:
+        await manager.close()
+
+    closing = SaneDeviceManager(list_ttl=3600, idle_timeout=0)
+    await closing.start()
+    try:
+        closes = fake.counts["close"]
+        await closing.scan(DEVICE)
+        await closing.scan(DEVICE)
+        closes_per_scan = (fake.counts["close"] - closes) / 2
+    finally:
+        await closing.close()
+
+    return {
+        "failed_scan_raised": failed,
+        "opens_after_failure": opens_after_failure,
+        "unknown_device_not_found": not_found,
+        "unknown_device_enumerations": extra_enumerations,
+        "plugged_in_device_found": plugged_in,
+        "closes_per_scan_without_idle_timeout": closes_per_scan,
+    }
+
+
+def run(requests: int, concurrency: int, enumerate_ms: float, open_ms: float, scan_ms: float) -> Dict[str, Any]:
+    def install() -> FakeSane:
+        fake = FakeSane(enumerate_ms, open_ms, scan_ms)
+        sys.modules["sane"] = fake.module()
+        return fake
+
+    results: Dict[str, Any] = {"per_request": _per_request(install(), requests)}
+    fake = install()
+    results["pooled"] = asyncio.run(_pooled(requests))
+    results["pooled"]["sane_calls"] = dict(fake.counts)
+    results["concurrent"] = asyncio.run(_concurrent(install(), concurrency))
+    results["recovery"] = asyncio.run(_recovery(install()))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--enumerate-ms", type=float, default=500.0, help="Time of sane.get_devices")
+    parser.add_argument("--open-ms", type=float, default=100.0, help="Time of sane.open")
+    parser.add_argument("--scan-ms", type=float, default=20.0, help="Time of a scan")
+    args = parser.parse_args()
+    result = run(args.requests, args.concurrency, args.enumerate_ms, args.open_ms, args.scan_ms)
+    print(json.dumps(result, indent=2))
+
+    calls = result["pooled"]["sane_calls"]
+    recovery = result["recovery"]
+    failures = []
+    if calls["enumerate"] != 1 or calls["open"] != 1 or calls["init"] != 1:
+        failures.append(f"pooled requests should init, enumerate and open once: {calls}")
+    if result["concurrent"]["overlapping_scans"] or result["concurrent"]["opens"] != 1:
+        failures.append(f"concurrent scans of one device should take turns on one handle: {result['concurrent']}")
+    if not recovery["failed_scan_raised"] or recovery["opens_after_failure"] != 2:
+        failures.append(f"a device that raised should be reopened by the next scan: {recovery}")
+    if not recovery["unknown_device_not_found"] or recovery["unknown_device_enumerations"] != 1:
+        failures.append(f"an unknown device should be enumerated once more, then not found: {recovery}")
+    if not recovery["plugged_in_device_found"]:
+        failures.append("a device plugged in since the last enumeration should be found")
+    if recovery["closes_per_scan_without_idle_timeout"] != 1:
+        failures.append(f"idle_timeout 0 should close the device after every scan: {recovery}")
+    if failures:
+        raise SystemExit("\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
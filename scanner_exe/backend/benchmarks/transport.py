@@ -0,0 +1,128 @@
+"""
+Scan transport benchmark: bytes on the wire and encode time of the base64 PNG
+JSON message against the binary frame protocol in each encoding.
+
+A synthetic A4 page at --dpi (text-like strokes on paper with scanner noise)
+is sent through the real WebSocket code paths with a recording socket, so the
+counts include the JSON headers, the previews and every binary frame.
+
+Usage (from the scanner_exe/backend directory):
+    python -m benchmarks.transport --dpi 300
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+from PIL import Image
+
+from app.app import send_image, serialize_response
+from app.services.scanner import ENCODINGS, ScannerInterface, ScannerService
+
+
+class RecordingWebSocket:
+    """Counts what would be written to the client, with the time of the first frame"""
+
+    def __init__(self):
+        self.text_bytes = 0
+        self.binary_bytes = 0
+        self.frames = 0
+        self.start = time.perf_counter()
+        self.first_image_ms = None
+
+    async def send_json(self, message: Dict[str, Any]):
+        self.text_bytes += len(json.dumps(message, separators=(",", ":")).encode())
+        self.frames += 1
+        if self.first_image_ms is None and message.get("action") in ("band", "image", "scan"):
+            self.first_image_ms = (time.perf_counter() - self.start) * 1000
+
+    async def send_bytes(self, data: bytes):
+        self.binary_bytes += len(data)
+        self.frames += 1
+
+
+class SyntheticScanner(ScannerInterface):
+    def __init__(self, image: Image.Image):
+        self.image = image
+
+    async def scan(self, scanner_id: str, resolution: int, color_mode: str):
+        return self.image
+
+
+def synthetic_page(dpi: int, color_mode: str) -> Image.Image:
+    width, height = int(8.27 * dpi), int(11.69 * dpi)
+    rng = np.random.default_rng(0)
+    page = np.full((height, width), 235, dtype=np.int16)
+    line_height = max(4, dpi // 6)
+    for top in range(dpi, height - dpi, line_height):
+        left = dpi
+        while left < width - dpi:
+            word = int(rng.integers(dpi // 6, dpi // 2))
+            page[top:top + line_height // 2, left:left + word] = 40
+            left += word + dpi // 12
+    page += rng.integers(-12, 13, page.shape, dtype=np.int16)
+    image = Image.fromarray(np.clip(page, 0, 255).astype(np.uint8), "L")
+    return image.convert("RGB") if color_mode == "color" else image
+
+
+async def _binary(service: ScannerService, encoding: str, previews: bool) -> Dict[str, Any]:
+    socket = RecordingWebSocket()
+    result: Dict[str, Any] = {}
+    async for reply, payload in service.stream_scan("synthetic", 300, "color", encoding=encoding, previews=previews):
+        if payload is None:
+            await socket.send_json(reply)
+            result = reply
+        else:
+            await send_image(socket, reply, payload)
+    return {
+        "transport": f"binary {encoding}" + (" + previews" if previews else ""),
+        "wire_bytes": socket.text_bytes + socket.binary_bytes,
+        "frames": socket.frames,
+        "encode_ms": result.get("encode_ms"),
+        "first_image_ms": round(socket.first_image_ms, 1),
+        "total_ms": round((time.perf_counter() - socket.start) * 1000, 1),
+    }
+
+
+async def _legacy(service: ScannerService) -> Dict[str, Any]:
+    socket = RecordingWebSocket()
+    result = serialize_response(await service.handle_scan_request("synthetic", 300, "color"))
+    result["action"] = "scan"
+    await socket.send_json(result)
+    elapsed = (time.perf_counter() - socket.start) * 1000
+    return {
+        "transport": "json base64 png",
+        "wire_bytes": socket.text_bytes,
+        "frames": socket.frames,
+        "encode_ms": round(elapsed, 1),
+        "first_image_ms": round(elapsed, 1),
+        "total_ms": round(elapsed, 1),
+    }
+
+
+async def run(dpi: int, color_mode: str) -> List[Dict[str, Any]]:
+    image = synthetic_page(dpi, color_mode)
+    service = ScannerService()
+    service.scanner = SyntheticScanner(image)
+    results = [await _legacy(service)]
+    for encoding in ENCODINGS:
+        results.append(await _binary(service, encoding, previews=False))
+    results.append(await _binary(service, "png", previews=True))
+    raw = image.size[0] * image.size[1] * len(image.getbands())
+    for result in results:
+        result["ratio_to_raw_pixels"] = round(result["wire_bytes"] / raw, 3)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--color-mode", choices=["color", "gray"], default="color")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.dpi, args.color_mode)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
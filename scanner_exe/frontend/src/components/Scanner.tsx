@@ -11,9 +11,13 @@ import {
   SelectChangeEvent,
   Typography,
 } from "@mui/material";
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 
-import { Scanner as ScannerType } from "../types/scanner";
+import {
+  BandHeader,
+  BatchProgress,
+  Scanner as ScannerType,
+} from "../types/scanner";
 import { scannerService } from "../services/scannerService";
 import { styled } from "@mui/material/styles";
 
@@ -28,16 +32,32 @@ const StyledPaper = styled(Paper)(({ theme }) => ({
 interface ScanResult {
   status: string;
   message: string;
-  image_data?: string;
+  image_url?: string;
   format?: string;
   demo?: boolean;
 }
 
+// A page of a document feeder batch and how far it has got
+interface BatchPage {
+  page: number;
+  stage: BatchProgress["stage"];
+  image_url?: string;
+  text?: string;
+  message?: string;
+}
+
 const Scanner: React.FC = () => {
   const [isConnected, setIsConnected] = useState(false);
   const [isScanning, setIsScanning] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [scanResult, setScanResult] = useState<ScanResult | null>(null);
+  // Low-resolution preview shown until the full image has arrived
+  const [previewUrl, setPreviewUrl] = useState<string | null>(null);
+  // Bands drawn on a canvas as the page is scanned
+  const canvasRef = useRef<HTMLCanvasElement>(null);
+  const [hasBands, setHasBands] = useState(false);
+  const [batchPages, setBatchPages] = useState<BatchPage[]>([]);
+  const [batchMessage, setBatchMessage] = useState<string | null>(null);
   const [scanners, setScanners] = useState<ScannerType[]>([]);
   const [selectedScanner, setSelectedScanner] = useState<string>("");
   const [isLoadingScanners, setIsLoadingScanners] = useState(false);
@@ -129,24 +149,59 @@ const Scanner: React.FC = () => {
 
     setIsScanning(true);
     setError(null);
+    if (scanResult?.image_url) {
+      URL.revokeObjectURL(scanResult.image_url);
+    }
+    setScanResult(null);
+    const showPreview = (url: string | null) =>
+      setPreviewUrl((previous) => {
+        if (previous) {
+          URL.revokeObjectURL(previous);
+        }
+        return url;
+      });
+    setHasBands(false);
+    const drawBand = async (header: BandHeader, image: Blob) => {
+      const canvas = canvasRef.current;
+      const context = canvas?.getContext("2d");
+      if (!canvas || !context) {
+        return;
+      }
+      const bitmap = await createImageBitmap(image);
+      if (header.index === 0) {
+        canvas.width = header.width;
+        canvas.height = header.page_height;
+        context.fillStyle = "white";
+        context.fillRect(0, 0, canvas.width, canvas.height);
+        setHasBands(true);
+      }
+      context.drawImage(bitmap, 0, header.top);
+      bitmap.close();
+    };
 
     try {
       console.log(`Starting scan with scanner ID: ${selectedScanner}`);
 
-      const result = await scannerService.scan({
-        scanner_id: selectedScanner,
-        resolution: 300,
-        color_mode: "color",
-      });
+      const result = await scannerService.scan(
+        {
+          scanner_id: selectedScanner,
+          resolution: 300,
+          color_mode: "color",
+          stream: true,
+        },
+        showPreview,
+        drawBand
+      );
 
       // Convert the scan response to our expected format
       setScanResult({
         status: result.status,
         message: result.message || "",
-        image_data: result.image_data,
+        image_url: result.image_url,
         format: result.format || "png",
         demo: result.demo,
       });
+      showPreview(null);
     } catch (err) {
       setError(
         "Failed to scan document. Please check your scanner connection."
@@ -157,6 +212,58 @@ const Scanner: React.FC = () => {
     }
   };
 
+  const handleBatchScan = async () => {
+    if (!isConnected || !selectedScanner) {
+      setError("Please select a scanner first");
+      return;
+    }
+
+    setIsScanning(true);
+    setError(null);
+    batchPages.forEach(
+      (page) => page.image_url && URL.revokeObjectURL(page.image_url)
+    );
+    setBatchPages([]);
+    setBatchMessage(null);
+    const updatePage = (page: number, update: Partial<BatchPage>) =>
+      setBatchPages((pages) => {
+        const existing = pages.find((item) => item.page === page);
+        if (!existing) {
+          return [...pages, { page, stage: "acquired", ...update }];
+        }
+        return pages.map((item) =>
+          item.page === page ? { ...item, ...update } : item
+        );
+      });
+
+    try {
+      const result = await scannerService.scanBatch(
+        {
+          scanner_id: selectedScanner,
+          resolution: 300,
+          color_mode: "color",
+          encoding: "jpeg",
+        },
+        (page, imageUrl) => updatePage(page, { image_url: imageUrl }),
+        (progress) =>
+          updatePage(progress.page, {
+            stage: progress.stage,
+            text: progress.text,
+            message: progress.message,
+          })
+      );
+      setBatchMessage(result.message);
+      if (!result.success) {
+        setError(result.message);
+      }
+    } catch (err) {
+      setError("Batch scan failed. Please check your scanner connection.");
+      console.error(err);
+    } finally {
+      setIsScanning(false);
+    }
+  };
+
   const handleScannerChange = (event: SelectChangeEvent) => {
     setSelectedScanner(event.target.value);
   };
@@ -202,6 +309,14 @@ const Scanner: React.FC = () => {
               {isScanning ? "Scanning..." : "Scan Document"}
             </Button>
 
+            <Button
+              variant="outlined"
+              onClick={handleBatchScan}
+              disabled={!isConnected || isScanning}
+            >
+              Scan Feeder
+            </Button>
+
             <Button
               variant="outlined"
               onClick={() => listScanners()}
@@ -225,15 +340,64 @@ const Scanner: React.FC = () => {
           </Typography>
         )}
 
-        {scanResult?.image_data && (
+        {batchPages.length > 0 && (
+          <Box sx={{ mt: 3, width: "100%" }}>
+            <Divider sx={{ mb: 2 }} />
+            <Typography variant="h6" gutterBottom>
+              Feeder Batch {batchMessage ? `(${batchMessage})` : ""}
+            </Typography>
+            <Box sx={{ display: "flex", flexWrap: "wrap", gap: 2 }}>
+              {batchPages.map((page) => (
+                <Box key={page.page} sx={{ width: 160 }}>
+                  {page.image_url && (
+                    <a href={page.image_url} download={`page-${page.page}.jpg`}>
+                      <img
+                        src={page.image_url}
+                        alt={`Page ${page.page}`}
+                        style={{ width: "100%" }}
+                      />
+                    </a>
+                  )}
+                  <Typography variant="body2">
+                    Page {page.page}: {page.message || page.stage}
+                  </Typography>
+                  {page.text && (
+                    <Typography variant="caption" noWrap component="div">
+                      {page.text}
+                    </Typography>
+                  )}
+                </Box>
+              ))}
+            </Box>
+          </Box>
+        )}
+
+        {isScanning && !previewUrl && (
+          <Box
+            sx={{
+              mt: 3,
+              width: "100%",
+              display: hasBands ? "flex" : "none",
+              justifyContent: "center",
+            }}
+          >
+            <canvas
+              ref={canvasRef}
+              style={{ maxWidth: "100%", maxHeight: "600px" }}
+            />
+          </Box>
+        )}
+
+        {(scanResult?.image_url || previewUrl) && (
           <Box sx={{ mt: 3, width: "100%" }}>
             <Divider sx={{ mb: 2 }} />
             <Typography variant="h6" gutterBottom>
-              Scanned Document {scanResult.demo ? "(Demo)" : ""}
+              Scanned Document {scanResult?.demo ? "(Demo)" : ""}
+              {!scanResult?.image_url ? "(Preview)" : ""}
             </Typography>
             <Box sx={{ display: "flex", justifyContent: "center", mb: 2 }}>
               <img
-                src={`data:image/${scanResult.format};base64,${scanResult.image_data}`}
+                src={scanResult?.image_url || previewUrl || undefined}
                 alt="Scanned document"
                 style={{
                   maxWidth: "100%",
@@ -244,9 +408,13 @@ const Scanner: React.FC = () => {
             </Box>
             <Button
               variant="outlined"
+              disabled={!scanResult?.image_url}
               onClick={() => {
+                if (!scanResult?.image_url) {
+                  return;
+                }
                 const link = document.createElement("a");
-                link.href = `data:image/${scanResult.format};base64,${scanResult.image_data}`;
+                link.href = scanResult.image_url;
                 link.download = `scan-${new Date().getTime()}.${
                   scanResult.format
                 }`;
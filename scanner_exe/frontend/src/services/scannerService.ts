@@ -1,4 +1,13 @@
-import { ScanRequest, ScanResponse, Scanner } from "../types/scanner";
+import {
+  BandHeader,
+  BatchProgress,
+  BatchScanRequest,
+  BatchScanResponse,
+  ImageHeader,
+  ScanRequest,
+  ScanResponse,
+  Scanner,
+} from "../types/scanner";
 
 class ScannerService {
   private ws: WebSocket | null = null;
@@ -46,6 +55,8 @@ class ScannerService {
       const wsUrl = `ws://localhost:8765/ws/${this.clientId}`;
       console.log(`Creating new WebSocket connection to: ${wsUrl}`);
       this.ws = new WebSocket(wsUrl);
+      // Scanned images arrive as binary frames
+      this.ws.binaryType = "arraybuffer";
 
       this.ws.onopen = () => {
         console.log("WebSocket connection established successfully");
@@ -91,6 +102,9 @@ class ScannerService {
 
     return new Promise((resolve, reject) => {
       const messageHandler = (event: MessageEvent) => {
+        if (typeof event.data !== "string") {
+          return;
+        }
         try {
           console.log("Received message:", event.data);
           const response = JSON.parse(event.data);
@@ -131,7 +145,11 @@ class ScannerService {
     });
   }
 
-  async scan(settings: ScanRequest["data"]): Promise<ScanResponse> {
+  async scan(
+    settings: ScanRequest["data"],
+    onPreview?: (imageUrl: string) => void,
+    onBand?: (header: BandHeader, image: Blob) => void
+  ): Promise<ScanResponse> {
     console.log("Starting scan operation with settings:", settings);
     if (!this.ws) {
       console.error("Cannot scan: WebSocket not connected");
@@ -142,9 +160,35 @@ class ScannerService {
 
     return new Promise((resolve, reject) => {
       let isResolved = false;
+      // Image whose binary frames are being received
+      let pending: {
+        header: ImageHeader | BandHeader;
+        parts: ArrayBuffer[];
+      } | null = null;
+      let imageUrl: string | undefined;
 
       const messageHandler = (event: MessageEvent) => {
         try {
+          if (typeof event.data !== "string") {
+            if (!pending) {
+              return;
+            }
+            pending.parts.push(event.data as ArrayBuffer);
+            if (pending.parts.length === pending.header.chunks) {
+              const header = pending.header;
+              const blob = new Blob(pending.parts, { type: header.mime_type });
+              pending = null;
+              if (header.action === "band") {
+                onBand?.(header, blob);
+              } else if (header.kind === "preview") {
+                onPreview?.(URL.createObjectURL(blob));
+              } else if (header.kind === "full") {
+                imageUrl = URL.createObjectURL(blob);
+              }
+            }
+            return;
+          }
+
           console.log("Received message during scan:", event.data);
           const response = JSON.parse(event.data);
 
@@ -154,6 +198,12 @@ class ScannerService {
             return;
           }
 
+          // Header of an image sent in binary frames
+          if (response.action === "image" || response.action === "band") {
+            pending = { header: response, parts: [] };
+            return;
+          }
+
           // Handle scan response
           if (response.action === "scan" && !isResolved) {
             console.log("Received scan response:", response);
@@ -161,7 +211,11 @@ class ScannerService {
             if (this.ws) {
               this.ws.removeEventListener("message", messageHandler);
             }
-            resolve(response);
+            resolve({
+              ...response,
+              status: response.status || (response.success ? "success" : "error"),
+              image_url: imageUrl,
+            });
           }
         } catch (error) {
           console.error("Error parsing scan response:", error);
@@ -211,6 +265,74 @@ class ScannerService {
       ws.send(JSON.stringify(request));
     });
   }
+
+  async scanBatch(
+    settings: BatchScanRequest["data"],
+    onPage: (page: number, imageUrl: string) => void,
+    onProgress?: (progress: BatchProgress) => void
+  ): Promise<BatchScanResponse> {
+    console.log("Starting batch scan with settings:", settings);
+    if (!this.ws) {
+      throw new Error(
+        "WebSocket not connected. Please ensure the scanner service is running."
+      );
+    }
+    const ws = this.ws;
+
+    return new Promise((resolve, reject) => {
+      let pending: { header: ImageHeader; parts: ArrayBuffer[] } | null = null;
+
+      const cleanup = () => {
+        ws.removeEventListener("message", messageHandler);
+        ws.removeEventListener("close", closeHandler);
+      };
+
+      const messageHandler = (event: MessageEvent) => {
+        if (typeof event.data !== "string") {
+          if (!pending) {
+            return;
+          }
+          pending.parts.push(event.data as ArrayBuffer);
+          if (pending.parts.length === pending.header.chunks) {
+            const blob = new Blob(pending.parts, {
+              type: pending.header.mime_type,
+            });
+            onPage(pending.header.page ?? 0, URL.createObjectURL(blob));
+            pending = null;
+          }
+          return;
+        }
+
+        const response = JSON.parse(event.data);
+        if (response.action === "image") {
+          pending = { header: response as ImageHeader, parts: [] };
+        } else if (response.action === "batch_progress") {
+          onProgress?.(response as BatchProgress);
+        } else if (response.action === "scan_batch") {
+          cleanup();
+          resolve(response as BatchScanResponse);
+        }
+      };
+
+      const closeHandler = () => {
+        cleanup();
+        reject(new Error("WebSocket connection closed during batch scan"));
+      };
+
+      ws.addEventListener("message", messageHandler);
+      ws.addEventListener("close", closeHandler);
+
+      const request: BatchScanRequest = {
+        action: "scan_batch",
+        data: {
+          ...settings,
+          client_id: this.clientId,
+        },
+      };
+      console.log("Sending batch scan request:", request);
+      ws.send(JSON.stringify(request));
+    });
+  }
 }
 
 export const scannerService = new ScannerService();
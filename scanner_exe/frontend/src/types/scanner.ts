@@ -12,15 +12,105 @@ export interface ScanRequest {
     resolution: number;
     color_mode: string;
     client_id?: string;
+    // Encoding of the full image sent in binary frames (default set by the service)
+    encoding?: "png" | "webp" | "jpeg";
+    // JPEG quality
+    quality?: number;
+    // Send downscaled JPEG previews before the full image (default: true)
+    previews?: boolean;
+    // Send the page in "band" messages while it is being scanned (default: false)
+    stream?: boolean;
+    // Also send a grayscale copy prepared for OCR, built from the bands
+    ocr_preprocess?: boolean;
   };
 }
 
+// JSON header announcing an image; its bytes follow in `chunks` binary frames
+export interface ImageHeader {
+  action: "image";
+  kind: "preview" | "full" | "ocr" | "page";
+  // Page number of a batch page
+  page?: number;
+  format: string;
+  mime_type: string;
+  width: number;
+  height: number;
+  size: number;
+  chunks: number;
+  // Resolution of the "ocr" image
+  dpi?: number;
+}
+
+// JSON header of a band of rows, `top` rows from the top of the page
+export interface BandHeader {
+  action: "band";
+  index: number;
+  top: number;
+  width: number;
+  height: number;
+  page_height: number;
+  format: string;
+  mime_type: string;
+  size: number;
+  chunks: number;
+}
+
 export interface ScanResponse {
   action?: string;
   status: string;
   message?: string;
   image_data?: string;
+  // Object URL of the full image received in binary frames
+  image_url?: string;
   format?: string;
+  size?: number;
+  encode_ms?: number;
+  acquire_ms?: number;
+  time_to_first_pixel_ms?: number;
+  bands?: number;
   demo?: boolean;
   success?: boolean;
 }
+
+export interface BatchScanRequest {
+  action: "scan_batch";
+  data: {
+    scanner_id: string;
+    resolution: number;
+    color_mode: string;
+    client_id?: string;
+    encoding?: "png" | "webp" | "jpeg";
+    quality?: number;
+    // Stop after this many pages (default: the service's SCAN_BATCH_MAX_PAGES)
+    max_pages?: number;
+    // Upload each page to the OCR backend and send back its text
+    ocr?: boolean;
+    ocr_model?: string;
+  };
+}
+
+// Progress of one page through the acquire, encode and OCR stages
+export interface BatchProgress {
+  action: "batch_progress";
+  page: number;
+  stage: "acquired" | "encoded" | "ocr" | "error";
+  width?: number;
+  height?: number;
+  acquire_ms?: number;
+  size?: number;
+  encode_ms?: number;
+  text?: string;
+  confidence?: number;
+  ocr_ms?: number;
+  message?: string;
+}
+
+export interface BatchScanResponse {
+  action: "scan_batch";
+  success: boolean;
+  message: string;
+  pages?: number;
+  ocr_pages?: number;
+  total_ms?: number;
+  pages_per_minute?: number;
+}